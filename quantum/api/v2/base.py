@@ -25,6 +25,7 @@ from quantum.api.rpc.agentnotifiers import dhcp_rpc_agent_api
 from quantum.api.v2 import attributes
 from quantum.api.v2 import resource as wsgi_resource
 from quantum.common import exceptions
+from quantum.openstack.common import excutils
 from quantum.openstack.common import log as logging
 from quantum.openstack.common.notifier import api as notifier_api
 from quantum import policy
@@ -52,9 +53,12 @@ class Controller(object):
 
     def __init__(self, plugin, collection, resource, attr_info,
                  allow_bulk=False, member_actions=None, parent=None,
-                 allow_pagination=False, allow_sorting=False):
+                 allow_pagination=False, allow_sorting=False,
+                 collection_actions=None):
         if member_actions is None:
             member_actions = []
+        if collection_actions is None:
+            collection_actions = []
         self._plugin = plugin
         self._collection = collection.replace('-', '_')
         self._resource = resource.replace('-', '_')
@@ -70,7 +74,10 @@ class Controller(object):
         self._publisher_id = notifier_api.publisher_id('network')
         self._dhcp_agent_notifier = dhcp_rpc_agent_api.DhcpAgentNotifyAPI()
         self._member_actions = member_actions
+        self._collection_actions = collection_actions
         self._primary_key = self._get_primary_key()
+        # the rows deleted before the first create count as well
+        quota.QUOTAS.track_usage(plugin, self._collection, self._resource)
         if self._allow_pagination and self._native_pagination:
             # Native pagination need native sorting support
             if not self._native_sorting:
@@ -139,8 +146,16 @@ class Controller(object):
         return original_fields, fields_to_add
 
     def __getattr__(self, name):
-        if name in self._member_actions:
-            def _handle_action(request, id, **kwargs):
+        if name in self._member_actions or name in self._collection_actions:
+            def _handle_action(request, id=None, **kwargs):
+                if id is None:
+                    # A collection action is invoked on the resources the
+                    # caller can see, the plugin scopes them by context
+                    policy.enforce(request.context, name,
+                                   {'tenant_id': request.context.tenant_id},
+                                   plugin=self._plugin)
+                    return getattr(self._plugin, name)(request.context,
+                                                       **kwargs)
                 arg_list = [request.context, id]
                 # Fetch the resource and verify if the user can access it
                 try:
@@ -201,20 +216,26 @@ class Controller(object):
         if parent_id:
             kwargs[self._parent_id_name] = parent_id
         obj_getter = getattr(self._plugin, self._plugin_handlers[self.LIST])
-        obj_list = obj_getter(request.context, **kwargs)
-        obj_list = sorting_helper.sort(obj_list)
-        obj_list = pagination_helper.paginate(obj_list)
-
         # Check authz
         if do_authz:
             # FIXME(salvatore-orlando): obj_getter might return references to
             # other resources. Must check authZ on them too.
-            # Omit items from list that should not be visible
-            obj_list = [obj for obj in obj_list
-                        if policy.check(request.context,
-                                        self._plugin_handlers[self.SHOW],
-                                        obj,
-                                        plugin=self._plugin)]
+            # The plugin restricts its query to the items visible to the
+            # caller when it can, otherwise they are omitted from the list
+            # before it is paginated
+            action = self._plugin_handlers[self.SHOW]
+            with policy.list_filter(request.context, action,
+                                    self._collection) as list_filter:
+                obj_list = obj_getter(request.context, **kwargs)
+            if not list_filter.applied:
+                obj_list = policy.filter_allowed(request.context, action,
+                                                 obj_list,
+                                                 plugin=self._plugin)
+        else:
+            obj_list = obj_getter(request.context, **kwargs)
+        obj_list = sorting_helper.sort(obj_list)
+        obj_list = pagination_helper.paginate(obj_list)
+
         collection = {self._collection:
                       [self._view(obj,
                                   fields_to_strip=fields_to_add)
@@ -319,11 +340,10 @@ class Controller(object):
         if self._collection in body:
             # Have to account for bulk create
             items = body[self._collection]
-            deltas = {}
-            bulk = True
         else:
             items = [body]
-            bulk = False
+        # tenant id -> number of items created for the tenant
+        deltas = {}
         for item in items:
             self._validate_network_tenant_ownership(request,
                                                     item[self._resource])
@@ -331,24 +351,21 @@ class Controller(object):
                            action,
                            item[self._resource],
                            plugin=self._plugin)
-            try:
-                tenant_id = item[self._resource]['tenant_id']
-                count = quota.QUOTAS.count(request.context, self._resource,
-                                           self._plugin, self._collection,
-                                           tenant_id)
-                if bulk:
-                    delta = deltas.get(tenant_id, 0) + 1
-                    deltas[tenant_id] = delta
-                else:
-                    delta = 1
-                kwargs = {self._resource: count + delta}
-            except exceptions.QuotaResourceUnknown as e:
-                # We don't want to quota this resource
-                LOG.debug(e)
-            else:
-                quota.QUOTAS.limit_check(request.context,
-                                         item[self._resource]['tenant_id'],
-                                         **kwargs)
+            tenant_id = item[self._resource]['tenant_id']
+            deltas[tenant_id] = deltas.get(tenant_id, 0) + 1
+        reservations = []
+        try:
+            for tenant_id, delta in deltas.iteritems():
+                kwargs = {self._resource: delta}
+                reservations.extend(quota.QUOTAS.reserve(
+                    request.context, tenant_id, self._plugin,
+                    self._collection, **kwargs))
+        except exceptions.QuotaResourceUnknown as e:
+            # We don't want to quota this resource
+            LOG.debug(e)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                quota.QUOTAS.rollback(request.context, reservations)
 
         def notify(create_result):
             notifier_method = self._resource + '.create.end'
@@ -363,23 +380,29 @@ class Controller(object):
             return create_result
 
         kwargs = {self._parent_id_name: parent_id} if parent_id else {}
-        if self._collection in body and self._native_bulk:
-            # plugin does atomic bulk create operations
-            obj_creator = getattr(self._plugin, "%s_bulk" % action)
-            objs = obj_creator(request.context, body, **kwargs)
-            return notify({self._collection: [self._view(obj)
-                                              for obj in objs]})
-        else:
-            obj_creator = getattr(self._plugin, action)
-            if self._collection in body:
-                # Emulate atomic bulk behavior
-                objs = self._emulate_bulk_create(obj_creator, request,
-                                                 body, parent_id)
-                return notify({self._collection: objs})
+        try:
+            if self._collection in body and self._native_bulk:
+                # plugin does atomic bulk create operations
+                obj_creator = getattr(self._plugin, "%s_bulk" % action)
+                objs = obj_creator(request.context, body, **kwargs)
+                result = {self._collection: [self._view(obj)
+                                             for obj in objs]}
             else:
-                kwargs.update({self._resource: body})
-                obj = obj_creator(request.context, **kwargs)
-                return notify({self._resource: self._view(obj)})
+                obj_creator = getattr(self._plugin, action)
+                if self._collection in body:
+                    # Emulate atomic bulk behavior
+                    objs = self._emulate_bulk_create(obj_creator, request,
+                                                     body, parent_id)
+                    result = {self._collection: objs}
+                else:
+                    kwargs.update({self._resource: body})
+                    obj = obj_creator(request.context, **kwargs)
+                    result = {self._resource: self._view(obj)}
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                quota.QUOTAS.rollback(request.context, reservations)
+        quota.QUOTAS.commit(request.context, reservations)
+        return notify(result)
 
     def delete(self, request, id, **kwargs):
         """Deletes the specified entity"""
@@ -601,10 +624,11 @@ class Controller(object):
 
 def create_resource(collection, resource, plugin, params, allow_bulk=False,
                     member_actions=None, parent=None, allow_pagination=False,
-                    allow_sorting=False):
+                    allow_sorting=False, collection_actions=None):
     controller = Controller(plugin, collection, resource, params, allow_bulk,
                             member_actions=member_actions, parent=parent,
                             allow_pagination=allow_pagination,
-                            allow_sorting=allow_sorting)
+                            allow_sorting=allow_sorting,
+                            collection_actions=collection_actions)
 
     return wsgi_resource.Resource(controller, FAULT_MAP)
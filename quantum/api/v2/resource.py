@@ -105,13 +105,18 @@ def Resource(controller, faults=None, deserializers=None, serializers=None):
             raise webob.exc.HTTPInternalServerError(**kwargs)
 
         status = action_status.get(action, 200)
-        body = serializer.serialize(result)
         # NOTE(jkoelker) Comply with RFC2616 section 9.7
         if status == 204:
-            content_type = ''
-            body = None
-
+            return webob.Response(request=request, status=status,
+                                  content_type='', body=None)
+
+        if action == 'index':
+            # a listed collection is sent as it is encoded, without a
+            # content length, so a large one goes out in chunks
+            return webob.Response(request=request, status=status,
+                                  content_type=content_type,
+                                  app_iter=serializer.serialize_iter(result))
         return webob.Response(request=request, status=status,
                               content_type=content_type,
-                              body=body)
+                              body=serializer.serialize(result))
     return resource
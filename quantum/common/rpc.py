@@ -15,6 +15,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import sys
+
+from oslo.config import cfg
+
 from quantum import context
 from quantum.openstack.common import log as logging
 from quantum.openstack.common.rpc import dispatcher
@@ -22,6 +26,24 @@ from quantum.openstack.common.rpc import dispatcher
 
 LOG = logging.getLogger(__name__)
 
+# the connection pools inherited from a parent process, kept so that their
+# connections are not closed when collected
+_inherited_pools = []
+
+
+def forget_connections():
+    """Drop the pooled connections of the rpc backend without closing them.
+
+    Meant for a forked process: the connections it inherited are still
+    used by its parent, closing them would close them for the parent too.
+    New ones are opened as they are needed.
+    """
+    impl = sys.modules.get(cfg.CONF.rpc_backend)
+    connection_cls = getattr(impl, 'Connection', None)
+    if getattr(connection_cls, 'pool', None) is not None:
+        _inherited_pools.append(connection_cls.pool)
+        connection_cls.pool = None
+
 
 class PluginRpcDispatcher(dispatcher.RpcDispatcher):
     """This class is used to convert RPC common context into
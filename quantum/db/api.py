@@ -73,6 +73,9 @@ cfg.CONF.register_opts(database_opts, "DATABASE")
 
 _ENGINE = None
 _MAKER = None
+# the connection pools inherited from a parent process, kept so that their
+# connections are not closed when collected
+_INHERITED_POOLS = []
 BASE = model_base.BASEV2
 
 
@@ -184,6 +187,18 @@ def clear_db(base=BASE):
     _ENGINE = None
 
 
+def forget_connections():
+    """Drop the pooled connections to the database without closing them.
+
+    Meant for a forked process: the connections it inherited are still
+    used by its parent, closing them would close them for the parent too.
+    New ones are opened as they are needed.
+    """
+    if _ENGINE:
+        _INHERITED_POOLS.append(_ENGINE.pool)
+        _ENGINE.pool = _ENGINE.pool.recreate()
+
+
 def get_session(autocommit=True, expire_on_commit=False):
     """Helper method to grab session"""
     global _MAKER, _ENGINE
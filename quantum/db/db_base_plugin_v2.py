@@ -20,6 +20,7 @@ import random
 
 import netaddr
 from oslo.config import cfg
+import sqlalchemy as sa
 from sqlalchemy import orm
 from sqlalchemy.orm import exc
 
@@ -32,6 +33,7 @@ from quantum.db import sqlalchemyutils
 from quantum.openstack.common import log as logging
 from quantum.openstack.common import timeutils
 from quantum.openstack.common import uuidutils
+from quantum import policy
 from quantum import quantum_plugin_base_v2
 
 
@@ -70,6 +72,9 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
     # To this aim, the register_model_query_hook and unregister_query_hook
     # from this class should be invoked
     _model_query_hooks = {}
+    # The usage of the resources of the plugin is tracked in the quota usage
+    # table, following the rows of their models
+    _quota_usage_tracked = True
 
     def __init__(self):
         # NOTE(jkoelker) This is an incomlete implementation. Subclasses
@@ -115,11 +120,50 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         # condition, raising an exception
         if query_filter is not None:
             query = query.filter(query_filter)
+        policy_condition = self._policy_condition(context, model)
+        if policy_condition is not None:
+            query = query.filter(policy_condition)
         return query
 
+    def _policy_condition(self, context, model):
+        """Return the condition of the read rule of the collection listed
+        with context, if model is the model of the collection and the rule
+        can be translated into one."""
+        list_filter = policy.current_list_filter(context)
+        # NOTE: elevated copies of the context carry the filter of the
+        # request, they are not restricted by it
+        if (list_filter is None or list_filter.context is not context or
+                getattr(model, '__tablename__', None) !=
+                list_filter.collection):
+            return None
+
+        def field_condition(field, value):
+            return self._policy_field_condition(model, field, value)
+        condition = policy.query_condition(context, list_filter.action,
+                                           field_condition)
+        if condition is not None:
+            list_filter.applied = True
+        return condition
+
+    def _policy_field_condition(self, model, field, value):
+        for _name, hooks in self._model_query_hooks.get(model,
+                                                        {}).iteritems():
+            policy_fields = hooks.get('policy_fields') or {}
+            if field in policy_fields:
+                return policy_fields[field](self, model, value)
+        column = model.__table__.columns.get(field)
+        if column is None:
+            return None
+        # the value the policy compares the field with must be of the type
+        # of the column, e.g. tenant ids are compared as strings
+        if (isinstance(column.type, sa.String) !=
+                isinstance(value, basestring)):
+            return None
+        return getattr(model, field) == value
+
     @classmethod
     def register_model_query_hook(cls, model, name, query_hook, filter_hook,
-                                  result_filters=None):
+                                  result_filters=None, policy_fields=None):
         """ register an hook to be invoked when a query is executed.
 
         Add the hooks to the _model_query_hooks dict. Models are the keys
@@ -133,6 +177,11 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
 
         Filter hooks take as input the filter expression being built and return
         a transformed filter expression
+
+        Policy fields map the names of the target fields which are not
+        columns of the model to callables taking the model and a value, and
+        returning the condition for the field to equal the value in the
+        read policy of the model
         """
         model_hooks = cls._model_query_hooks.get(model)
         if not model_hooks:
@@ -140,7 +189,8 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
             model_hooks = {}
             cls._model_query_hooks[model] = model_hooks
         model_hooks[name] = {'query': query_hook, 'filter': filter_hook,
-                             'result_filters': result_filters}
+                             'result_filters': result_filters,
+                             'policy_fields': policy_fields}
 
     def _get_by_id(self, context, model, id):
         query = self._model_query(context, model)
@@ -997,9 +1047,11 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
             for port in ports:
                 self._delete_port(context, port['id'])
 
-            # clean up subnets
+            # clean up subnets, one by one so that their quota usage
+            # follows
             subnets_qry = context.session.query(models_v2.Subnet)
-            subnets_qry.filter_by(network_id=id).delete()
+            for subnet in subnets_qry.filter_by(network_id=id):
+                context.session.delete(subnet)
             context.session.delete(network)
 
     def get_network(self, context, id, fields=None):
@@ -29,6 +29,7 @@ from quantum.common import exceptions as q_exc
 from quantum.db import db_base_plugin_v2
 from quantum.db import model_base
 from quantum.db import models_v2
+from quantum.db import sqlalchemyutils
 from quantum.extensions.firewall import FirewallPluginBase
 from quantum import manager
 from quantum.openstack.common import log as logging
@@ -167,15 +168,18 @@ class Rule(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
                                   secondary=RuleServiceObjBinding.__tablename__,
                                   uselist=True,
                                   cascade="all")
+    # order of the rule among the rules of its tenant, see RULE_POSITION_GAP
+    position = sa.Column(sa.BigInteger, nullable=False)
+
+
+sa.Index('ix_rules_tenant_id_position', Rule.tenant_id, Rule.position)
+
+# Rules are numbered RULE_POSITION_GAP apart, so a rule inserted between two
+# others takes the middle of their positions without renumbering any other
+# rule. Only when two neighbours end up next to each other are the rules of
+# the tenant spread out again.
+RULE_POSITION_GAP = 1 << 16
 
-class RuleLinkNode(model_base.BASEV2, models_v2.HasTenant):
-    rule_id = sa.Column(sa.String(36),
-                        sa.ForeignKey('rules.id'),
-                        primary_key=True)
-    prev_id = sa.Column(sa.String(36),
-                        sa.ForeignKey('rules.id'))
-    next_id = sa.Column(sa.String(36),
-                        sa.ForeignKey('rules.id'))
 
 class FirewallPluginDb(FirewallPluginBase):
     """
@@ -183,6 +187,10 @@ class FirewallPluginDb(FirewallPluginBase):
     loadbalancer plugin database access interface using SQLAlchemy models.
     """
 
+    # the usage of the resources of the plugin is tracked in the quota usage
+    # table, following the rows of their models
+    _quota_usage_tracked = True
+
     @property
     def _core_plugin(self):
         return manager.QuantumManager.get_plugin()
@@ -217,16 +225,49 @@ class FirewallPluginDb(FirewallPluginBase):
                     query = query.filter(column.in_(value))
         return query
 
-    def _get_collection_query(self, context, model, filters=None):
+    def _get_collection_query(self, context, model, filters=None,
+                              sorts=None, limit=None, marker_obj=None,
+                              page_reverse=False):
         collection = self._model_query(context, model)
         collection = self._apply_filters_to_query(collection, model, filters)
+        if limit and page_reverse and sorts:
+            sorts = [(s[0], not s[1]) for s in sorts]
+        collection = sqlalchemyutils.paginate_query(collection, model, limit,
+                                                    sorts,
+                                                    marker_obj=marker_obj)
         return collection
 
     def _get_collection(self, context, model, dict_func, filters=None,
                         fields=None, sorts=None, limit=None, marker_obj=None,
-                        page_reverse=False):
-        query = self._get_collection_query(context, model, filters)
-        return [dict_func(c, fields) for c in query.all()]
+                        page_reverse=False, options=()):
+        query = self._get_collection_query(context, model, filters=filters,
+                                           sorts=sorts,
+                                           limit=limit,
+                                           marker_obj=marker_obj,
+                                           page_reverse=page_reverse)
+        items = [dict_func(c, fields) for c in query.options(*options)]
+        if limit and page_reverse:
+            items.reverse()
+        return items
+
+    def _get_tenant_collection(self, context, model, dict_func, filters=None,
+                               fields=None, sorts=None, limit=None,
+                               marker=None, page_reverse=False, options=()):
+        """Return a page of the objects of the tenant of the context.
+
+        The objects are scoped to the tenant even for an admin context, as
+        the firewall config of an edge is built from them.
+        """
+        tenant_id = self._get_tenant_id_for_create(context)
+        filters = dict(filters or {}, tenant_id=[tenant_id])
+        with context.session.begin(subtransactions=True):
+            marker_obj = self._get_marker_obj(context, model, limit, marker)
+            return self._get_collection(context, model, dict_func,
+                                        filters=filters, fields=fields,
+                                        sorts=sorts, limit=limit,
+                                        marker_obj=marker_obj,
+                                        page_reverse=page_reverse,
+                                        options=options)
 
     def _get_collection_count(self, context, model, filters=None):
         return self._get_collection_query(context, model, filters).count()
@@ -249,6 +290,11 @@ class FirewallPluginDb(FirewallPluginBase):
         query = self._model_query(context, model)
         return query.filter(model.id == id).one()
 
+    def _get_marker_obj(self, context, model, limit, marker):
+        if limit and marker:
+            return self._get_by_id(context, model, marker)
+        return None
+
     def _get_optional_attrs(self, dst, src, attrs):
         for attr in attrs:
             if src.get(attr):
@@ -257,6 +303,7 @@ class FirewallPluginDb(FirewallPluginBase):
     def _make_rule_dict(self, rule, fields=None):
         res = {
             'id': rule['id'],
+            'tenant_id': rule['tenant_id'],
             'name': rule['name'],
             'description': rule.get('description'),
             'enabled': rule['enabled']
@@ -271,7 +318,7 @@ class FirewallPluginDb(FirewallPluginBase):
             res['action'] = 'drop'
 
         src = {}
-       if rule.get('sourceAddress'):
+        if rule.get('sourceAddress'):
             src['addresses'] = []
             for address in rule['sourceAddress']:
                 src['addresses'].append(address['address'])
@@ -309,153 +356,162 @@ class FirewallPluginDb(FirewallPluginBase):
 
         return self._fields(res, fields)
 
-    def _get_last_rule(self, context, tenant_id):
-        query = context.session.query(RuleLinkNode)
-        return query.filter(RuleLinkNode.tenant_id == tenant_id,
-                             RuleLinkNode.next_id == None).first()
-
-    def _get_rule_link_node(self, context, rule_id):
-        return context.session.query(RuleLinkNode).filter(
-            RuleLinkNode.rule_id == rule_id).one()
+    def _get_rule_position(self, context, tenant_id, rule_id):
+        return context.session.query(Rule.position).filter(
+            Rule.tenant_id == tenant_id, Rule.id == rule_id).one()[0]
+
+    def _rebalance_rules(self, context, tenant_id):
+        """Spread the positions of the rules of a tenant out evenly."""
+        LOG.debug(_("Renumbering the firewall rules of tenant %s"),
+                  tenant_id)
+        query = context.session.query(Rule).filter(
+            Rule.tenant_id == tenant_id).order_by(Rule.position, Rule.id)
+        for index, rule_db in enumerate(query):
+            rule_db.position = (index + 1) * RULE_POSITION_GAP
+
+    def _new_rule_position(self, context, tenant_id, location=None):
+        """Return the position of a new rule.
+
+        The rule goes right before the rule location when given, after
+        the last rule of the tenant otherwise.
+        """
+        query = context.session.query(Rule.position).filter(
+            Rule.tenant_id == tenant_id)
+        if not location:
+            last = query.order_by(Rule.position.desc()).first()
+            return (last[0] if last else 0) + RULE_POSITION_GAP
+        target = self._get_rule_position(context, tenant_id, location)
+        prev = query.filter(Rule.position < target).order_by(
+            Rule.position.desc()).first()
+        low = prev[0] if prev else target - 2 * RULE_POSITION_GAP
+        if target - low < 2:
+            self._rebalance_rules(context, tenant_id)
+            return self._new_rule_position(context, tenant_id, location)
+        return (low + target) // 2
+
+    def _get_rule_objs(self, context, bodies):
+        """Load the ip and service objects referred to by rule bodies.
+
+        Returns an (ipobjs, svcobjs) tuple of dicts keyed by id, each read
+        in one query.
+        """
+        ipobj_ids = set()
+        svcobj_ids = set()
+        for body in bodies:
+            for end in (body.get('source'), body.get('destination')):
+                ipobj_ids.update((end or {}).get('ipobjs') or [])
+            svcobj_ids.update((body.get('service') or {}).get(
+                'serviceobjs') or [])
+        objs = []
+        for model, ids in ((IPObj, ipobj_ids), (ServiceObj, svcobj_ids)):
+            found = {}
+            if ids:
+                query = self._model_query(context, model)
+                found = dict((obj['id'], obj)
+                             for obj in query.filter(model.id.in_(ids)))
+            if len(found) != len(ids):
+                raise exc.NoResultFound()
+            objs.append(found)
+        return tuple(objs)
 
     def create_rule(self, context, rule):
         body = rule['rule']
         with context.session.begin(subtransactions=True):
-            src = body.get('source')
-            dst = body.get('destination')
-            svc = body.get('service')
-            if not src:
-                src = {}
-            if not dst:
-                dst = {}
-            if not svc:
-                svc = {}
-
-            print "src: {}".format(src)
-            print "dst: {}".format(dst)
-            print "svc: {}".format(svc)
-            rule_id = uuidutils.generate_uuid()
-            tenant_id = self._get_tenant_id_for_create(context, body)
-            rule_db = Rule(
-                id=rule_id,
-                tenant_id=tenant_id,
-                name=body['name'],
-                description=body['description'],
-                sourceZone=src.get('zone'),
-                destinationZone=dst.get('zone'),
-                action=(body['action'] == "accept"),
-                log=(body.get('log') == "enabled"),
-                enabled=body['enabled']
-            )
-            if src.get('addresses'):
-                rule_db.sourceAddress = []
-                for address in src['addresses']:
-                    addr = RuleSourceAddress(address=address)
-                    rule_db.sourceAddress.append(addr)
-            if src.get('ipobjs'):
-                rule_db.sourceIPObj = []
-                for ipobj_id in src['ipobjs']:
-                    ipobj = self._get_by_id(context, IPObj, ipobj_id)
-                    rule_db.sourceIPObj.append(ipobj)
-            if dst.get('addresses'):
-                rule_db.destinationAddress = []
-                for address in dst['addresses']:
-                    addr = RuleDestinationAddress(address=address)
-                    rule_db.destinationAddress.append(addr)
-            if dst.get('ipobjs'):
-                rule_db.destinationIPObj = []
-                for ipobj_id in dst['ipobjs']:
-                    ipobj = self._get_by_id(context, IPObj, ipobj_id)
-                    rule_db.destinationIPObj.append(ipobj)
-            if svc.get('services'):
-                rule_db.serviceConfig = []
-                for service in svc['services']:
-                    svcobj = self._dict2serviceobj(service)
-                    svcCfg = RuleServiceConfig(
-                        protocol=svcobj['protocol'],
-                        values=svcobj.get('values'),
-                        sourcePorts=svcobj.get('sourcePorts')
-                    )
-                    rule_db.serviceConfig.append(svcCfg)
-            if svc.get('serviceobjs'):
-                rule_db.serviceObj = []
-                for svcobj_id in svc['serviceobjs']:
-                    svcobj = self._get_by_id(context, ServiceObj, svcobj_id)
-                    rule_db.serviceObj.append(svcobj)
-
-           print rule_db
-            print rule_db.sourceAddress
-            context.session.add(rule_db)
-
-            prev_id = None
-            next_id = None
-            if body.get('location'):
-                target_node = self._get_rule_link_node(context, body['location'])
-                prev_id = target_node['prev_id']
-                next_id = target_node['rule_id']
-                if prev_id:
-                    prev_node = self._get_rule_link_node(context, prev_id)
-                    prev_node.update({'next_id': rule_id})
-                target_node.update({'prev_id': rule_id})
-            else:
-                last_rule = self._get_last_rule(context, tenant_id)
-                if last_rule:
-                    last_rule.update({'next_id': rule_id})
-                    prev_id = last_rule['rule_id']
-
-            rule_link_node = RuleLinkNode(tenant_id=tenant_id,
-                                          rule_id=rule_id,
-                                          prev_id=prev_id,
-                                          next_id=next_id)
-            context.session.add(rule_link_node)
-
+            ipobjs, svcobjs = self._get_rule_objs(context, [body])
+            rule_db = self._create_rule(context, body, ipobjs, svcobjs)
         return self._make_rule_dict(rule_db)
 
-    def get_rules(self, context, filters=None, fields=None):
-        tenant_id = self._get_tenant_id_for_create(context)
+    def create_rule_bulk(self, context, rules):
+        """Create rules in one transaction, in the order given."""
+        bodies = [rule['rule'] for rule in rules['rules']]
         with context.session.begin(subtransactions=True):
-            query = context.session.query(Rule, RuleLinkNode).options(
-                orm.subqueryload(Rule.sourceAddress),
-                orm.subqueryload(Rule.sourceIPObj),
-                orm.subqueryload(Rule.destinationAddress),
-                orm.subqueryload(Rule.destinationIPObj),
-                orm.subqueryload(Rule.serviceConfig),
-                orm.subqueryload(Rule.serviceObj)).filter(
-                Rule.tenant_id == tenant_id,
-                Rule.id == RuleLinkNode.rule_id)
-            rule_tuples = query.all()
-        ruleHash = {}
-        first_tuple = None
-        for rule_tuple in rule_tuples:
-            rule = rule_tuple[0]
-            node = rule_tuple[1]
-            ruleHash[rule['id']] = rule_tuple
-            if node['prev_id'] is None:
-                if first_tuple is not None:
-                    raise Exception("unable to determine the first rule")
-                first_tuple = rule_tuple
-        if first_tuple is None:
-            if len(rule_tuples) == 0:
-                return []
-            raise Exception("unable to locate the first rule")
-
-        rules = [self._make_rule_dict(first_tuple[0])]
-        curr_tuple = first_tuple
-        while True:
-            curr_rule = curr_tuple[0]
-            curr_node = curr_tuple[1]
-            next_rule_id = curr_node['next_id']
-            if next_rule_id is None:
-                break
-            next_tuple = ruleHash[next_rule_id]
-            next_rule = next_tuple[0]
-            next_node = next_tuple[1]
-            if next_node['prev_id'] != curr_rule['id']:
-                raise Exception("rule order corrupted")
-            rules.append(self._make_rule_dict(next_rule))
-            curr_tuple = next_tuple
-
-        return rules
+            ipobjs, svcobjs = self._get_rule_objs(context, bodies)
+            rules_db = [self._create_rule(context, body, ipobjs, svcobjs)
+                        for body in bodies]
+        return [self._make_rule_dict(rule_db) for rule_db in rules_db]
+
+    def _create_rule(self, context, body, ipobjs, svcobjs):
+        src = body.get('source')
+        dst = body.get('destination')
+        svc = body.get('service')
+        if not src:
+            src = {}
+        if not dst:
+            dst = {}
+        if not svc:
+            svc = {}
+
+        rule_id = uuidutils.generate_uuid()
+        tenant_id = self._get_tenant_id_for_create(context, body)
+        position = self._new_rule_position(context, tenant_id,
+                                           body.get('location'))
+        rule_db = Rule(
+            id=rule_id,
+            tenant_id=tenant_id,
+            name=body['name'],
+            description=body['description'],
+            sourceZone=src.get('zone'),
+            destinationZone=dst.get('zone'),
+            action=(body['action'] == "accept"),
+            log=(body.get('log') == "enabled"),
+            enabled=body['enabled'],
+            position=position
+        )
+        if src.get('addresses'):
+            rule_db.sourceAddress = []
+            for address in src['addresses']:
+                addr = RuleSourceAddress(address=address)
+                rule_db.sourceAddress.append(addr)
+        if src.get('ipobjs'):
+            rule_db.sourceIPObj = []
+            for ipobj_id in src['ipobjs']:
+                rule_db.sourceIPObj.append(ipobjs[ipobj_id])
+        if dst.get('addresses'):
+            rule_db.destinationAddress = []
+            for address in dst['addresses']:
+                addr = RuleDestinationAddress(address=address)
+                rule_db.destinationAddress.append(addr)
+        if dst.get('ipobjs'):
+            rule_db.destinationIPObj = []
+            for ipobj_id in dst['ipobjs']:
+                rule_db.destinationIPObj.append(ipobjs[ipobj_id])
+        if svc.get('services'):
+            rule_db.serviceConfig = []
+            for service in svc['services']:
+                svcobj = self._dict2serviceobj(service)
+                svcCfg = RuleServiceConfig(
+                    protocol=svcobj['protocol'],
+                    values=svcobj.get('values'),
+                    sourcePorts=svcobj.get('sourcePorts')
+                )
+                rule_db.serviceConfig.append(svcCfg)
+        if svc.get('serviceobjs'):
+            rule_db.serviceObj = []
+            for svcobj_id in svc['serviceobjs']:
+                rule_db.serviceObj.append(svcobjs[svcobj_id])
+
+        context.session.add(rule_db)
+        return rule_db
+
+    def get_rules(self, context, filters=None, fields=None, sorts=None,
+                  limit=None, marker=None, page_reverse=False):
+        """Return the rules of the tenant, in order unless sorted.
+
+        Only the rule id is added to the sort keys by pagination, without
+        another sort key the rules are listed in the order they apply in.
+        """
+        if not [key for key, direction in sorts or [] if key != 'id']:
+            sorts = [('position', True), ('id', True)]
+        return self._get_tenant_collection(
+            context, Rule, self._make_rule_dict, filters=filters,
+            fields=fields, sorts=sorts, limit=limit, marker=marker,
+            page_reverse=page_reverse,
+            options=(orm.subqueryload(Rule.sourceAddress),
+                     orm.subqueryload(Rule.sourceIPObj),
+                     orm.subqueryload(Rule.destinationAddress),
+                     orm.subqueryload(Rule.destinationIPObj),
+                     orm.subqueryload(Rule.serviceConfig),
+                     orm.subqueryload(Rule.serviceObj)))
 
     def get_rule(self, context, id, fields=None):
         tenant_id = self._get_tenant_id_for_create(context)
@@ -478,21 +534,12 @@ class FirewallPluginDb(FirewallPluginBase):
         with context.session.begin(subtransactions=True):
             rule_db = context.session.query(Rule).filter(
                 Rule.tenant_id == tenant_id, Rule.id == id).one()
-            rule_node = self._get_rule_link_node(context, id)
-            prev_id = rule_node['prev_id']
-            next_id = rule_node['next_id']
-            if prev_id:
-                prev_node = self._get_rule_link_node(context, prev_id)
-                prev_node.update({"next_id": next_id})
-            if next_id:
-                next_node = self._get_rule_link_node(context, next_id)
-                next_node.update({"prev_id": prev_id})
-            context.session.delete(rule_node)
             context.session.delete(rule_db)
 
     def _make_ipobj_dict(self, ipobj, fields=None):
         res = {
             'id': ipobj['id'],
+            'tenant_id': ipobj['tenant_id'],
             'name': ipobj.get('name'),
             'description': ipobj.get('description')
         }
@@ -518,17 +565,13 @@ class FirewallPluginDb(FirewallPluginBase):
 
         return self._make_ipobj_dict(ipobj_db)
 
-    def get_ipobjs(self, context, filters=None, fields=None):
-        tenant_id = self._get_tenant_id_for_create(context)
-        ipobjs = []
-        with context.session.begin(subtransactions=True):
-            query = context.session.query(IPObj).options(
-                orm.subqueryload(IPObj.value)).filter(
-                IPObj.tenant_id == tenant_id)
-            ipobjs_db = query.all()
-            for ipobj_db in ipobjs_db:
-                ipobjs.append(self._make_ipobj_dict(ipobj_db))
-        return ipobjs
+    def get_ipobjs(self, context, filters=None, fields=None, sorts=None,
+                   limit=None, marker=None, page_reverse=False):
+        return self._get_tenant_collection(
+            context, IPObj, self._make_ipobj_dict, filters=filters,
+            fields=fields, sorts=sorts, limit=limit, marker=marker,
+            page_reverse=page_reverse,
+            options=(orm.subqueryload(IPObj.value),))
 
     def get_ipobj(self, context, id, fields=None):
         tenant_id = self._get_tenant_id_for_create(context)
@@ -547,19 +590,21 @@ class FirewallPluginDb(FirewallPluginBase):
             context.session.delete(ipobj_db)
 
     def _serviceobj2dict_convert(self, svcobj, svcdict):
-        if svcobj['protocol'].lower() == "icmp":
-           svcdict['types'] = json.loads(svcobj['values'])
-        else:
-           svcdict['ports'] = json.loads(svcobj['values'])
+        if svcobj.get('values') is not None:
+            if svcobj['protocol'].lower() == "icmp":
+                svcdict['types'] = json.loads(svcobj['values'])
+            else:
+                svcdict['ports'] = json.loads(svcobj['values'])
 
         attrs = ['sourcePorts']
         for attr in attrs:
-            if attr in svcobj:
+            if svcobj.get(attr) is not None:
                 svcdict[attr] = json.loads(svcobj[attr])
 
     def _make_serviceobj_dict(self, svcobj, fields=None):
         res = {
             'id': svcobj['id'],
+            'tenant_id': svcobj['tenant_id'],
             'name': svcobj.get('name'),
             'description': svcobj.get('description'),
             'protocol': svcobj['protocol']
@@ -609,16 +654,12 @@ class FirewallPluginDb(FirewallPluginBase):
 
         return self._make_serviceobj_dict(svcobj_db)
 
-    def get_serviceobjs(self, context, filters=None, fields=None):
-        tenant_id = self._get_tenant_id_for_create(context)
-        svcobjs = []
-        with context.session.begin(subtransactions=True):
-            query = context.session.query(ServiceObj).filter(
-                ServiceObj.tenant_id == tenant_id)
-            svcobjs_db = query.all()
-            for svcobj_db in svcobjs_db:
-                svcobjs.append(self._make_serviceobj_dict(svcobj_db))
-        return svcobjs
+    def get_serviceobjs(self, context, filters=None, fields=None, sorts=None,
+                        limit=None, marker=None, page_reverse=False):
+        return self._get_tenant_collection(
+            context, ServiceObj, self._make_serviceobj_dict, filters=filters,
+            fields=fields, sorts=sorts, limit=limit, marker=marker,
+            page_reverse=page_reverse)
 
     def get_serviceobj(self, context, id, fields=None):
         tenant_id = self._get_tenant_id_for_create(context)
@@ -663,17 +704,13 @@ class FirewallPluginDb(FirewallPluginBase):
 
         return self._make_zone_dict(zone_db)
 
-    def get_zones(self, context, filters=None, fields=None):
-        tenant_id = self._get_tenant_id_for_create(context)
-        zones = []
-        with context.session.begin(subtransactions=True):
-            query = context.session.query(Zone).options(
-                orm.subqueryload(Zone.value)).filter(
-                Zone.tenant_id == tenant_id)
-            zones_db = query.all()
-            for zone_db in zones_db:
-                zones.append(self._make_zone_dict(zone_db))
-        return zones
+    def get_zones(self, context, filters=None, fields=None, sorts=None,
+                  limit=None, marker=None, page_reverse=False):
+        return self._get_tenant_collection(
+            context, Zone, self._make_zone_dict, filters=filters,
+            fields=fields, sorts=sorts, limit=limit, marker=marker,
+            page_reverse=page_reverse,
+            options=(orm.subqueryload(Zone.value),))
 
     def get_zone(self, context, id, fields=None):
         tenant_id = self._get_tenant_id_for_create(context)
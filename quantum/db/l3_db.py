@@ -100,6 +100,14 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             return query.filter((ExternalNetwork.network_id != expr.null()))
         return query.filter((ExternalNetwork.network_id == expr.null()))
 
+    def _network_external_condition(self, original_model, value):
+        # the field is compared with the converted value of the policy
+        if not isinstance(value, bool):
+            return None
+        if value:
+            return ExternalNetwork.network_id != expr.null()
+        return ExternalNetwork.network_id == expr.null()
+
     # TODO(salvatore-orlando): Perform this operation without explicitly
     # referring to db_base_plugin_v2, as plugins that do not extend from it
     # might exist in the future
@@ -108,7 +116,8 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
         "external_net",
         _network_model_hook,
         _network_filter_hook,
-        _network_result_filter_hook)
+        _network_result_filter_hook,
+        {'router:external': _network_external_condition})
 
     def _get_router(self, context, id):
         try:
@@ -149,6 +149,10 @@ class LoadBalancerPluginDb(LoadBalancerPluginBase):
     loadbalancer plugin database access interface using SQLAlchemy models.
     """
 
+    # the usage of the resources of the plugin is tracked in the quota usage
+    # table, following the rows of their models
+    _quota_usage_tracked = True
+
     @property
     def _core_plugin(self):
         return manager.QuantumManager.get_plugin()
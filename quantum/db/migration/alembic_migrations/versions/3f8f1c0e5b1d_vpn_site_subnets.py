@@ -0,0 +1,133 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""Store the private networks of VPN sites one subnet per row
+
+Revision ID: 3f8f1c0e5b1d
+Revises: grizzly
+Create Date: 2013-05-20 10:12:41.731029
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f8f1c0e5b1d'
+down_revision = 'grizzly'
+
+# The sites table is created by the VPN service plugin rather than by a
+# migration, so this runs for every plugin and does nothing where the table
+# does not exist.
+
+migration_for_plugins = ['*']
+
+from alembic import op
+import netaddr
+import sqlalchemy as sa
+from sqlalchemy.engine import reflection
+
+from quantum.db import migration
+
+
+sites = sa.sql.table('sites',
+                     sa.sql.column('id', sa.String(36)),
+                     sa.sql.column('pri_networks', sa.String(2048)))
+
+site_subnets = sa.sql.table('sitesubnets',
+                            sa.sql.column('site_id', sa.String(36)),
+                            sa.sql.column('pair', sa.Integer),
+                            sa.sql.column('side', sa.String(5)),
+                            sa.sql.column('position', sa.Integer),
+                            sa.sql.column('cidr', sa.String(64)))
+
+
+def _has_sites():
+    inspector = reflection.Inspector.from_engine(op.get_bind())
+    return 'sites' in inspector.get_table_names()
+
+
+def upgrade(active_plugin=None, options=None):
+    if not migration.should_run(active_plugin, migration_for_plugins):
+        return
+    if not _has_sites():
+        return
+
+    op.create_table(
+        'sitesubnets',
+        sa.Column('site_id', sa.String(36), nullable=False),
+        sa.Column('pair', sa.Integer(), autoincrement=False,
+                  nullable=False),
+        sa.Column('side', sa.Enum('local', 'peer',
+                                  name='vpn_site_subnet_sides'),
+                  nullable=False),
+        sa.Column('position', sa.Integer(), autoincrement=False,
+                  nullable=False),
+        sa.Column('cidr', sa.String(64), nullable=False),
+        sa.ForeignKeyConstraint(['site_id'], ['sites.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('site_id', 'pair', 'side', 'position')
+    )
+    op.create_index('ix_sitesubnets_cidr', 'sitesubnets', ['cidr'])
+
+    # pri_networks looks like
+    # "192.168.1.0/24,192.168.2.0/24-192.168.11.0/24;192.168.3.0/24-..."
+    rows = []
+    for site_id, pri_networks in op.get_bind().execute(
+            sa.select([sites.c.id, sites.c.pri_networks])):
+        pairs = [pair for pair in (pri_networks or '').split(';')
+                 if '-' in pair]
+        for index, pair in enumerate(pairs):
+            local, peer = pair.split('-', 1)
+            for side, cidrs in (('local', local), ('peer', peer)):
+                cidrs = [cidr for cidr in cidrs.split(',') if cidr.strip()]
+                for position, cidr in enumerate(cidrs):
+                    rows.append({
+                        'site_id': site_id, 'pair': index, 'side': side,
+                        'position': position,
+                        'cidr': str(netaddr.IPNetwork(cidr.strip()).cidr)})
+    if rows:
+        op.bulk_insert(site_subnets, rows)
+
+    op.drop_column('sites', 'pri_networks')
+
+
+def downgrade(active_plugin=None, options=None):
+    if not migration.should_run(active_plugin, migration_for_plugins):
+        return
+    if not _has_sites():
+        return
+
+    op.add_column('sites', sa.Column('pri_networks', sa.String(2048),
+                                     nullable=False, server_default=''))
+
+    pairs = {}
+    for site_id, pair, side, cidr in op.get_bind().execute(
+            sa.select([site_subnets.c.site_id, site_subnets.c.pair,
+                       site_subnets.c.side, site_subnets.c.cidr]).order_by(
+                site_subnets.c.site_id, site_subnets.c.pair,
+                site_subnets.c.position)):
+        site_pairs = pairs.setdefault(site_id, {})
+        site_pairs.setdefault(pair, {'local': [], 'peer': []})
+        site_pairs[pair][side].append(cidr)
+    for site_id, site_pairs in pairs.items():
+        pri_networks = ';'.join(
+            '%s-%s' % (','.join(site_pairs[pair]['local']),
+                       ','.join(site_pairs[pair]['peer']))
+            for pair in sorted(site_pairs))
+        op.execute(sites.update().where(sites.c.id == site_id).values(
+            pri_networks=pri_networks))
+
+    op.drop_index('ix_sitesubnets_cidr', 'sitesubnets')
+    op.drop_table('sitesubnets')
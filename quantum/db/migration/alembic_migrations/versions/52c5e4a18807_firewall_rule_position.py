@@ -0,0 +1,128 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""Order firewall rules by a position column instead of a linked list
+
+Revision ID: 52c5e4a18807
+Revises: 3f8f1c0e5b1d
+Create Date: 2013-05-27 14:02:19.204711
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '52c5e4a18807'
+down_revision = '3f8f1c0e5b1d'
+
+# The rules table is created by the firewall service plugin rather than by
+# a migration, so this runs for every plugin and does nothing where the
+# table does not exist.
+
+migration_for_plugins = ['*']
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine import reflection
+
+from quantum.db import migration
+
+# the gap between the positions of two rules, as in firewall_db
+GAP = 1 << 16
+
+rules = sa.sql.table('rules',
+                     sa.sql.column('id', sa.String(36)),
+                     sa.sql.column('tenant_id', sa.String(255)),
+                     sa.sql.column('position', sa.BigInteger))
+
+rulelinknodes = sa.sql.table('rulelinknodes',
+                             sa.sql.column('tenant_id', sa.String(255)),
+                             sa.sql.column('rule_id', sa.String(36)),
+                             sa.sql.column('prev_id', sa.String(36)),
+                             sa.sql.column('next_id', sa.String(36)))
+
+
+def _has_rules():
+    inspector = reflection.Inspector.from_engine(op.get_bind())
+    return 'rules' in inspector.get_table_names()
+
+
+def upgrade(active_plugin=None, options=None):
+    if not migration.should_run(active_plugin, migration_for_plugins):
+        return
+    if not _has_rules():
+        return
+
+    op.add_column('rules', sa.Column('position', sa.BigInteger(),
+                                     nullable=False, server_default='0'))
+    op.create_index('ix_rules_tenant_id_position', 'rules',
+                    ['tenant_id', 'position'])
+
+    # walk the list of every tenant from its head
+    next_ids = {}
+    heads = []
+    for rule_id, prev_id, next_id in op.get_bind().execute(
+            sa.select([rulelinknodes.c.rule_id, rulelinknodes.c.prev_id,
+                       rulelinknodes.c.next_id])):
+        next_ids[rule_id] = next_id
+        if prev_id is None:
+            heads.append(rule_id)
+    for rule_id in heads:
+        position = GAP
+        while rule_id is not None:
+            op.execute(rules.update().where(rules.c.id == rule_id).values(
+                position=position))
+            position += GAP
+            rule_id = next_ids.pop(rule_id, None)
+
+    op.drop_table('rulelinknodes')
+
+
+def downgrade(active_plugin=None, options=None):
+    if not migration.should_run(active_plugin, migration_for_plugins):
+        return
+    if not _has_rules():
+        return
+
+    op.create_table(
+        'rulelinknodes',
+        sa.Column('tenant_id', sa.String(255), nullable=True),
+        sa.Column('rule_id', sa.String(36), nullable=False),
+        sa.Column('prev_id', sa.String(36), nullable=True),
+        sa.Column('next_id', sa.String(36), nullable=True),
+        sa.ForeignKeyConstraint(['rule_id'], ['rules.id']),
+        sa.ForeignKeyConstraint(['prev_id'], ['rules.id']),
+        sa.ForeignKeyConstraint(['next_id'], ['rules.id']),
+        sa.PrimaryKeyConstraint('rule_id')
+    )
+
+    tenants = {}
+    for rule_id, tenant_id in op.get_bind().execute(
+            sa.select([rules.c.id, rules.c.tenant_id]).order_by(
+                rules.c.tenant_id, rules.c.position, rules.c.id)):
+        tenants.setdefault(tenant_id, []).append(rule_id)
+    rows = []
+    for tenant_id, rule_ids in tenants.items():
+        for index, rule_id in enumerate(rule_ids):
+            rows.append({
+                'tenant_id': tenant_id, 'rule_id': rule_id,
+                'prev_id': rule_ids[index - 1] if index else None,
+                'next_id': (rule_ids[index + 1]
+                            if index + 1 < len(rule_ids) else None)})
+    if rows:
+        op.bulk_insert(rulelinknodes, rows)
+
+    op.drop_index('ix_rules_tenant_id_position', 'rules')
+    op.drop_column('rules', 'position')
@@ -15,11 +15,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+
 import sqlalchemy as sa
+from sqlalchemy import event
 
 from quantum.common import exceptions
 from quantum.db import model_base
 from quantum.db import models_v2
+from quantum.openstack.common import timeutils
+from quantum.openstack.common import uuidutils
 
 
 class Quota(model_base.BASEV2, models_v2.HasId):
@@ -33,6 +38,160 @@ class Quota(model_base.BASEV2, models_v2.HasId):
     limit = sa.Column(sa.Integer)
 
 
+class QuotaUsage(model_base.BASEV2):
+    """The usage of a resource by a tenant.
+
+    in_use follows the rows of the resource created and deleted, reserved
+    is the sum of the deltas of the reservations not yet committed or
+    rolled back. Both are counted again once synced_at is too old.
+    """
+    __tablename__ = 'quotausages'
+    tenant_id = sa.Column(sa.String(255), primary_key=True)
+    resource = sa.Column(sa.String(255), primary_key=True)
+    in_use = sa.Column(sa.Integer, nullable=False, default=0)
+    reserved = sa.Column(sa.Integer, nullable=False, default=0)
+    synced_at = sa.Column(sa.DateTime, nullable=False)
+
+
+class Reservation(model_base.BASEV2, models_v2.HasId):
+    """Resources reserved by a tenant for a create in progress."""
+    tenant_id = sa.Column(sa.String(255), nullable=False)
+    resource = sa.Column(sa.String(255), nullable=False)
+    delta = sa.Column(sa.Integer, nullable=False)
+    expiration = sa.Column(sa.DateTime, nullable=False)
+    __table_args__ = (sa.Index('reservations_tenant_resource', 'tenant_id',
+                               'resource'),)
+
+
+# model -> name of the quota resource its rows are counted in
+_tracked_models = {}
+
+
+def tracked_model(collection):
+    """Return the model of the rows of a collection, None if it has none
+    with a tenant."""
+    for model in model_base.BASEV2._decl_class_registry.values():
+        if (getattr(model, '__tablename__', None) == collection and
+                hasattr(model, 'tenant_id')):
+            return model
+
+
+def track_usage(model, resource):
+    """Count the rows of model created and deleted in the usage of
+    resource, in the transaction creating or deleting them."""
+    if model in _tracked_models:
+        return
+    _tracked_models[model] = resource
+    event.listen(model, 'after_insert', _row_inserted)
+    event.listen(model, 'after_delete', _row_deleted)
+
+
+def _row_inserted(mapper, connection, target):
+    _add_in_use(connection, mapper.class_, target.tenant_id, 1)
+
+
+def _row_deleted(mapper, connection, target):
+    _add_in_use(connection, mapper.class_, target.tenant_id, -1)
+
+
+def _add_in_use(connection, model, tenant_id, delta):
+    # the usage of a tenant without a row is counted when it is read
+    usages = QuotaUsage.__table__
+    connection.execute(usages.update().where(
+        (usages.c.tenant_id == tenant_id) &
+        (usages.c.resource == _tracked_models[model])).values(
+            in_use=usages.c.in_use + delta))
+
+
+def _get_usages(context, tenant_id, resources, count, sync_interval):
+    """Return the locked usages of a tenant by resource name.
+
+    The usages without a row, or synced more than sync_interval seconds
+    ago, are counted again with count(resource), and the reservations
+    which expired are dropped.
+    """
+    now = timeutils.utcnow()
+    synced_after = now - datetime.timedelta(seconds=sync_interval)
+    usages = {}
+    query = context.session.query(QuotaUsage).with_lockmode('update')
+    for usage in query.filter(QuotaUsage.tenant_id == tenant_id,
+                              QuotaUsage.resource.in_(resources)):
+        usages[usage.resource] = usage
+    for resource in resources:
+        usage = usages.get(resource)
+        if usage is not None and usage.synced_at > synced_after:
+            continue
+        reserved = 0
+        for reservation in context.session.query(Reservation).filter_by(
+                tenant_id=tenant_id, resource=resource):
+            if reservation.expiration < now:
+                context.session.delete(reservation)
+            else:
+                reserved += reservation.delta
+        values = {'in_use': count(resource), 'reserved': reserved,
+                  'synced_at': now}
+        if usage is None:
+            usage = QuotaUsage(tenant_id=tenant_id, resource=resource,
+                               **values)
+            context.session.add(usage)
+            usages[resource] = usage
+        else:
+            usage.update(values)
+    return usages
+
+
+def reserve(context, tenant_id, deltas, count, check, sync_interval,
+            expiration):
+    """Reserve resources for a tenant.
+
+    :param deltas: A dictionary of the resources to reserve by name.
+    :param count: A callable counting the usage of a resource by name.
+    :param check: A callable checking the usages the reservations lead to
+                  against the quotas, raising OverQuota if one is over.
+    :param sync_interval: Seconds after which a usage is counted again.
+    :param expiration: Seconds after which the reservations expire.
+    :return: The ids of the reservations.
+    """
+    with context.session.begin(subtransactions=True):
+        usages = _get_usages(context, tenant_id, deltas.keys(), count,
+                             sync_interval)
+        check(dict((resource, usages[resource].in_use +
+                    usages[resource].reserved + delta)
+                   for resource, delta in deltas.iteritems()))
+        expire_at = timeutils.utcnow() + datetime.timedelta(
+            seconds=expiration)
+        reservation_ids = []
+        for resource, delta in deltas.iteritems():
+            usages[resource].reserved += delta
+            reservation = Reservation(id=uuidutils.generate_uuid(),
+                                      tenant_id=tenant_id,
+                                      resource=resource, delta=delta,
+                                      expiration=expire_at)
+            context.session.add(reservation)
+            reservation_ids.append(reservation.id)
+    return reservation_ids
+
+
+def release(context, reservation_ids):
+    """Drop reservations from the usages they were made in.
+
+    Committing and rolling back a reservation alike only release it: the
+    rows created, if any, are counted in the usage as they are inserted.
+    """
+    if not reservation_ids:
+        return
+    with context.session.begin(subtransactions=True):
+        reservations = context.session.query(Reservation).filter(
+            Reservation.id.in_(reservation_ids)).all()
+        for reservation in reservations:
+            usage = context.session.query(QuotaUsage).with_lockmode(
+                'update').filter_by(tenant_id=reservation.tenant_id,
+                                    resource=reservation.resource).first()
+            if usage is not None:
+                usage.reserved = max(usage.reserved - reservation.delta, 0)
+            context.session.delete(reservation)
+
+
 class DbQuotaDriver(object):
     """
     Driver to perform necessary checks to enforce quotas and obtain
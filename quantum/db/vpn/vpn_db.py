@@ -15,7 +15,10 @@
 #    under the License.
 #
 
-import re
+import itertools
+import json
+
+import netaddr
 from oslo.config import cfg
 import sqlalchemy as sa
 from sqlalchemy import exc as sa_exc
@@ -29,18 +32,38 @@ from quantum.common import exceptions as q_exc
 from quantum.db import db_base_plugin_v2
 from quantum.db import model_base
 from quantum.db import models_v2
+from quantum.db import sqlalchemyutils
 from quantum.extensions import vpn
 from quantum.extensions.vpn import VPNPluginBase
 from quantum import manager
+from quantum.openstack.common import excutils
 from quantum.openstack.common import log as logging
 from quantum.openstack.common import uuidutils
 from quantum.plugins.common import constants
 from quantum import policy
+from quantum import quota
 
 
 LOG = logging.getLogger(__name__)
 
 
+class SiteSubnet(model_base.BASEV2):
+    """Represents a subnet protected by a v2 quantum VPN site.
+
+    The pri_networks of a site are a list of local/peer subnet lists; each
+    subnet is one row, placed by the index of its pair in the list, its
+    side and its position in the subnet list of that side.
+    """
+    site_id = sa.Column(sa.String(36),
+                        sa.ForeignKey('sites.id', ondelete="CASCADE"),
+                        primary_key=True)
+    pair = sa.Column(sa.Integer, primary_key=True, autoincrement=False)
+    side = sa.Column(sa.Enum('local', 'peer', name='vpn_site_subnet_sides'),
+                     primary_key=True)
+    position = sa.Column(sa.Integer, primary_key=True, autoincrement=False)
+    cidr = sa.Column(sa.String(64), nullable=False, index=True)
+
+
 class Site(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
     """Represents a v2 quantum VPN site."""
     name = sa.Column(sa.String(255))
@@ -51,11 +74,42 @@ class Site(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
     peer_id = sa.Column(sa.String(128), nullable=False)
     psk = sa.Column(sa.String(64), nullable=True)
     mtu = sa.Column(sa.Integer, nullable=True)
-    pri_networks = sa.Column(sa.String(2048), nullable=False)
+    subnets = orm.relationship(SiteSubnet,
+                               order_by=[SiteSubnet.pair, SiteSubnet.side,
+                                         SiteSubnet.position],
+                               cascade="all, delete-orphan")
     subnet_id = sa.Column(sa.String(64), nullable=True)
     status = sa.Column(sa.String(16), nullable=False)
 
 
+class TopologySite(model_base.BASEV2):
+    """Represents a site created by a v2 quantum VPN topology."""
+    topology_id = sa.Column(sa.String(36),
+                            sa.ForeignKey('topologys.id', ondelete="CASCADE"),
+                            primary_key=True)
+    site_id = sa.Column(sa.String(36),
+                        sa.ForeignKey('sites.id', ondelete="CASCADE"),
+                        primary_key=True)
+
+
+class Topology(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
+    """Represents a v2 quantum VPN topology.
+
+    The hub and the endpoints are kept as they were given, in json; the
+    sites linking them are rows of their own.
+    """
+    name = sa.Column(sa.String(255))
+    description = sa.Column(sa.String(255))
+    type = sa.Column(sa.Enum('hub_and_spoke', 'full_mesh',
+                             name='vpn_topology_types'), nullable=False)
+    hub = sa.Column(sa.Text())
+    endpoints = sa.Column(sa.Text(), nullable=False)
+    psk = sa.Column(sa.String(64), nullable=True)
+    mtu = sa.Column(sa.Integer, nullable=True)
+    sites = orm.relationship(Site, secondary=TopologySite.__table__,
+                             order_by=Site.name)
+
+
 class IPSecPolicy(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
     """Represents a v2 quantum VPN Ipsec Policy."""
     name = sa.Column(sa.String(32))
@@ -96,6 +150,10 @@ class VPNPluginDb(VPNPluginBase):
     VPN plugin database access interface using SQLAlchemy models.
     """
 
+    # the usage of the resources of the plugin is tracked in the quota usage
+    # table, following the rows of their models
+    _quota_usage_tracked = True
+
     @property
     def _core_plugin(self):
         return manager.QuantumManager.get_plugin()
@@ -130,16 +188,30 @@ class VPNPluginDb(VPNPluginBase):
                     query = query.filter(column.in_(value))
         return query
 
-    def _get_collection_query(self, context, model, filters=None):
+    def _get_collection_query(self, context, model, filters=None,
+                              sorts=None, limit=None, marker_obj=None,
+                              page_reverse=False):
         collection = self._model_query(context, model)
         collection = self._apply_filters_to_query(collection, model, filters)
+        if limit and page_reverse and sorts:
+            sorts = [(s[0], not s[1]) for s in sorts]
+        collection = sqlalchemyutils.paginate_query(collection, model, limit,
+                                                    sorts,
+                                                    marker_obj=marker_obj)
         return collection
 
     def _get_collection(self, context, model, dict_func, filters=None,
                         fields=None, sorts=None, limit=None, marker_obj=None,
-                        page_reverse=False):
-        query = self._get_collection_query(context, model, filters)
-        return [dict_func(c, fields) for c in query.all()]
+                        page_reverse=False, options=()):
+        query = self._get_collection_query(context, model, filters=filters,
+                                           sorts=sorts,
+                                           limit=limit,
+                                           marker_obj=marker_obj,
+                                           page_reverse=page_reverse)
+        items = [dict_func(c, fields) for c in query.options(*options)]
+        if limit and page_reverse:
+            items.reverse()
+        return items
 
     def _get_collection_count(self, context, model, filters=None):
         return self._get_collection_query(context, model, filters).count()
@@ -162,6 +234,11 @@ class VPNPluginDb(VPNPluginBase):
         query = self._model_query(context, model)
         return query.filter(model.id == id).one()
 
+    def _get_marker_obj(self, context, model, limit, marker):
+        if limit and marker:
+            return self._get_resource(context, model, marker)
+        return None
+
     def update_status(self, context, model, id, status):
         with context.session.begin(subtransactions=True):
             v_db = self._get_resource(context, model, id)
@@ -179,6 +256,8 @@ class VPNPluginDb(VPNPluginBase):
                 raise vpn.IsakmpPolicyNotFound(isakmp_policy_id=id)
             elif issubclass(model, TrustProfile):
                 raise vpn.TrustProfileNotFound(trust_profile_id=id)
+            elif issubclass(model, Topology):
+                raise vpn.TopologyNotFound(topology_id=id)
             else:
                 raise
         return r
@@ -191,12 +270,9 @@ class VPNPluginDb(VPNPluginBase):
 
     ########################################################
     # Site DB access
-    def _make_site_dict(self, site, fields=None):
-        """
-        pri_networks in db looks like
-        "192.168.1.0/24,192.168.2.0/24-192.168.11.0/24;
-        192.168.3.0/24-192.168.33.0/24,192.168.44.0/24"
-        and be convert to JSON as
+    def _make_pri_networks(self, site):
+        """Rebuild the pri_networks of a site from its subnet rows, e.g.
+
         'pri_networks' : [
             {
                'local_subnets': "192.168.1.0/24,192.168.2.0/24",
@@ -207,14 +283,16 @@ class VPNPluginDb(VPNPluginBase):
             }
         ]
         """
-        pri_networks = []
-        pairs = site['pri_networks'].split(";")
-        for pair in pairs:
-            match = re.search("(.*?)-(.*)", pair)
-            if match:
-                pri_networks.append({
-                    'local_subnets': match.group(1),
-                    'peer_subnets': match.group(2)})
+        pairs = []
+        for subnet in site.subnets:
+            while len(pairs) <= subnet.pair:
+                pairs.append({'local': [], 'peer': []})
+            pairs[subnet.pair][subnet.side].append(subnet.cidr)
+        return [{'local_subnets': ','.join(pair['local']),
+                 'peer_subnets': ','.join(pair['peer'])}
+                for pair in pairs]
+
+    def _make_site_dict(self, site, fields=None):
         res = {'id': site['id'],
                'tenant_id': site['tenant_id'],
                'subnet_id': site['subnet_id'],
@@ -224,42 +302,48 @@ class VPNPluginDb(VPNPluginBase):
                'local_id': site['local_id'],
                'peer_endpoint': site['peer_endpoint'],
                'peer_id': site['peer_id'],
-               'pri_networks': pri_networks,
+               'pri_networks': self._make_pri_networks(site),
                'psk': site['psk'],
-               'mtu': site['mtu']}
+               'mtu': site['mtu'],
+               'status': site['status']}
 
         return self._fields(res, fields)
 
-    def _subnets_to_str(self, pri_networks):
-        res = ""
-        count = 0
-        for pair in pri_networks:
-            if (count > 0):
-                res += ';'
-            res += '{0}-{1}'.format(pair['local_subnets'],
-                                    pair['peer_subnets'])
-            count += 1
-        return res
+    def _make_site_subnets(self, pri_networks):
+        subnets = []
+        for index, pair in enumerate(pri_networks):
+            for side in ('local', 'peer'):
+                cidrs = [cidr for cidr in pair['%s_subnets' % side].split(',')
+                         if cidr.strip()]
+                for position, cidr in enumerate(cidrs):
+                    # stored in canonical form so lookups by cidr match
+                    cidr = str(netaddr.IPNetwork(cidr.strip()).cidr)
+                    subnets.append(SiteSubnet(pair=index, side=side,
+                                              position=position,
+                                              cidr=cidr))
+        return subnets
+
+    def _make_site_db(self, tenant_id, s):
+        return Site(id=uuidutils.generate_uuid(),
+                    tenant_id=tenant_id,
+                    subnet_id=s['subnet_id'],
+                    name=s['name'],
+                    description=s['description'],
+                    local_endpoint=s['local_endpoint'],
+                    peer_endpoint=s['peer_endpoint'],
+                    local_id=s['local_id'],
+                    peer_id=s['peer_id'],
+                    subnets=self._make_site_subnets(s['pri_networks']),
+                    psk=s['psk'],
+                    mtu=s['mtu'],
+                    status=constants.PENDING_CREATE)
 
     def create_site(self, context, site):
         s = site['site']
         tenant_id = self._get_tenant_id_for_create(context, s)
 
         with context.session.begin(subtransactions=True):
-            pri_networks = self._subnets_to_str(s['pri_networks'])
-            site_db = Site(id=uuidutils.generate_uuid(),
-                           tenant_id=tenant_id,
-                           subnet_id=s['subnet_id'],
-                           name=s['name'],
-                           description=s['description'],
-                           local_endpoint=s['local_endpoint'],
-                           peer_endpoint=s['peer_endpoint'],
-                           local_id=s['local_id'],
-                           peer_id=s['peer_id'],
-                           pri_networks=pri_networks,
-                           psk=s['psk'],
-                           mtu=s['mtu'],
-                           status=constants.PENDING_CREATE)
+            site_db = self._make_site_db(tenant_id, s)
 
             try:
                 context.session.add(site_db)
@@ -276,9 +360,9 @@ class VPNPluginDb(VPNPluginBase):
             site_db = self._get_resource(context, Site, id)
             self.assert_modification_allowed(site_db)
             if s:
-                if 'pri_networks' in s.keys():
-                    pri_networks = self._subnets_to_str(s['pri_networks'])
-                    s['pri_networks'] = pri_networks
+                if 'pri_networks' in s:
+                    site_db.subnets = self._make_site_subnets(
+                        s.pop('pri_networks'))
                 try:
                     site_db.update(s)
                     # To be add validation here
@@ -299,10 +383,182 @@ class VPNPluginDb(VPNPluginBase):
         site = self._get_resource(context, Site, id)
         return self._make_site_dict(site, fields)
 
-    def get_sites(self, context, filters=None, fields=None):
-        return self._get_collection(context, Site,
-                                    self._make_site_dict,
-                                    filters=filters, fields=fields)
+    def get_sites(self, context, filters=None, fields=None, sorts=None,
+                  limit=None, marker=None, page_reverse=False):
+        marker_obj = self._get_marker_obj(context, Site, limit, marker)
+        return self._get_collection(context, Site, self._make_site_dict,
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse,
+                                    options=(orm.subqueryload(Site.subnets),))
+
+    def get_sites_for_subnet(self, context, cidr, side='local', fields=None):
+        """Return the sites protecting a subnet on the given side.
+
+        A site protects a subnet if one of its subnets on that side is the
+        subnet itself or a supernet of it. Every supernet is looked up
+        through the cidr index rather than comparing ranges row by row.
+        """
+        try:
+            network = netaddr.IPNetwork(cidr).cidr
+        except (netaddr.AddrFormatError, ValueError):
+            raise q_exc.InvalidInput(
+                error_message=_("'%s' is not a valid IP subnet") % cidr)
+        supernets = [str(net) for net in network.supernet()]
+        supernets.append(str(network))
+        query = self._model_query(context, Site).join(Site.subnets)
+        query = query.filter(SiteSubnet.side == side,
+                             SiteSubnet.cidr.in_(supernets)).distinct()
+        query = query.options(orm.subqueryload(Site.subnets))
+        return [self._make_site_dict(site, fields) for site in query]
+
+    ########################################################
+    # Topology DB access
+    def _topology_status(self, topology):
+        statuses = set(site['status'] for site in topology.sites)
+        for status in (constants.ERROR, constants.PENDING_DELETE,
+                       constants.PENDING_CREATE, constants.PENDING_UPDATE):
+            if status in statuses:
+                return status
+        return constants.ACTIVE
+
+    def _make_topology_dict(self, topology, fields=None):
+        res = {'id': topology['id'],
+               'tenant_id': topology['tenant_id'],
+               'name': topology['name'],
+               'description': topology['description'],
+               'type': topology['type'],
+               'hub': json.loads(topology['hub'] or 'null'),
+               'endpoints': json.loads(topology['endpoints']),
+               'psk': topology['psk'],
+               'mtu': topology['mtu'],
+               'site_ids': [site['id'] for site in topology.sites],
+               'status': self._topology_status(topology)}
+
+        return self._fields(res, fields)
+
+    def _make_topology_links(self, t):
+        """Return the (local, peer) endpoint pairs of a topology.
+
+        Every pair is a site on the edge of its local endpoint, so a link
+        between two endpoints with a subnet_id makes a site on each side,
+        and endpoints without one only appear as peers.
+        """
+        if t['type'] == 'hub_and_spoke':
+            if not t['hub']:
+                raise vpn.InvalidTopology(
+                    reason=_("a hub_and_spoke topology needs a hub"))
+            links = [(t['hub'], spoke) for spoke in t['endpoints']]
+        else:
+            if t['hub']:
+                raise vpn.InvalidTopology(
+                    reason=_("a full_mesh topology has no hub"))
+            links = list(itertools.combinations(t['endpoints'], 2))
+        pairs = []
+        for one, other in links:
+            if one['endpoint'] == other['endpoint']:
+                raise vpn.InvalidTopology(
+                    reason=_("endpoint %s is linked to itself") %
+                    one['endpoint'])
+            for local, peer in ((one, other), (other, one)):
+                if local.get('subnet_id'):
+                    pairs.append((local, peer))
+        if not pairs:
+            raise vpn.InvalidTopology(
+                reason=_("no endpoint has a subnet_id"))
+        return pairs
+
+    def create_topology(self, context, topology):
+        """Create a topology and all of its sites in one transaction.
+
+        Only the topology is checked against its quota by the API, the
+        sites it creates are reserved here.
+        """
+        t = topology['topology']
+        tenant_id = self._get_tenant_id_for_create(context, t)
+        pairs = self._make_topology_links(t)
+
+        try:
+            reservations = quota.QUOTAS.reserve(context, tenant_id, self,
+                                                'sites', site=len(pairs))
+        except q_exc.QuotaResourceUnknown as e:
+            LOG.debug(e)
+            reservations = []
+        try:
+            topology_db = self._create_topology_db(context, tenant_id, t,
+                                                   pairs)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                quota.QUOTAS.rollback(context, reservations)
+        quota.QUOTAS.commit(context, reservations)
+        return self._make_topology_dict(topology_db)
+
+    def _create_topology_db(self, context, tenant_id, t, pairs):
+        with context.session.begin(subtransactions=True):
+            topology_db = Topology(id=uuidutils.generate_uuid(),
+                                   tenant_id=tenant_id,
+                                   name=t['name'],
+                                   description=t['description'],
+                                   type=t['type'],
+                                   hub=json.dumps(t['hub']),
+                                   endpoints=json.dumps(t['endpoints']),
+                                   psk=t['psk'],
+                                   mtu=t['mtu'])
+            for local, peer in pairs:
+                local_id = local.get('id') or local['endpoint']
+                peer_id = peer.get('id') or peer['endpoint']
+                topology_db.sites.append(self._make_site_db(tenant_id, {
+                    'subnet_id': local['subnet_id'],
+                    'name': '%s:%s-%s' % (t['name'], local_id, peer_id),
+                    'description': t['description'],
+                    'local_endpoint': local['endpoint'],
+                    'peer_endpoint': peer['endpoint'],
+                    'local_id': local_id,
+                    'peer_id': peer_id,
+                    'pri_networks': [{'local_subnets': local['subnets'],
+                                      'peer_subnets': peer['subnets']}],
+                    'psk': t['psk'],
+                    'mtu': t['mtu']}))
+
+            try:
+                context.session.add(topology_db)
+                context.session.flush()
+            except sa_exc.IntegrityError:
+                raise vpn.InvalidTopology(
+                    reason=_("a site of the topology exists already"))
+        return topology_db
+
+    def update_topology(self, context, id, topology):
+        t = topology['topology']
+        with context.session.begin(subtransactions=True):
+            topology_db = self._get_resource(context, Topology, id)
+            if t:
+                topology_db.update(t)
+                LOG.debug(_("update_topology: %s") % id)
+
+        return self._make_topology_dict(topology_db)
+
+    def delete_topology(self, context, id):
+        with context.session.begin(subtransactions=True):
+            topology = self._get_resource(context, Topology, id)
+            for site in topology.sites:
+                context.session.delete(site)
+            context.session.delete(topology)
+            context.session.flush()
+
+    def get_topology(self, context, id, fields=None):
+        topology = self._get_resource(context, Topology, id)
+        return self._make_topology_dict(topology, fields)
+
+    def get_topologys(self, context, filters=None, fields=None, sorts=None,
+                      limit=None, marker=None, page_reverse=False):
+        marker_obj = self._get_marker_obj(context, Topology, limit, marker)
+        return self._get_collection(
+            context, Topology, self._make_topology_dict,
+            filters=filters, fields=fields, sorts=sorts, limit=limit,
+            marker_obj=marker_obj, page_reverse=page_reverse,
+            options=(orm.subqueryload(Topology.sites),))
 
     ########################################################
     # Ipsec Policy DB access
@@ -366,10 +622,16 @@ class VPNPluginDb(VPNPluginBase):
         ipsecp = self._get_resource(context, IPSecPolicy, id)
         return self._make_ipsec_policy_dict(ipsecp, fields)
 
-    def get_ipsec_policys(self, context, filters=None, fields=None):
+    def get_ipsec_policys(self, context, filters=None, fields=None,
+                          sorts=None, limit=None, marker=None,
+                          page_reverse=False):
+        marker_obj = self._get_marker_obj(context, IPSecPolicy, limit, marker)
         return self._get_collection(context, IPSecPolicy,
                                     self._make_ipsec_policy_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     ########################################################
     # Isakmp Policy DB access
@@ -436,10 +698,16 @@ class VPNPluginDb(VPNPluginBase):
         isakmpp = self._get_resource(context, IsakmpPolicy, id)
         return self._make_isakmp_policy_dict(isakmpp, fields)
 
-    def get_isakmp_policys(self, context, filters=None, fields=None):
+    def get_isakmp_policys(self, context, filters=None, fields=None,
+                           sorts=None, limit=None, marker=None,
+                           page_reverse=False):
+        marker_obj = self._get_marker_obj(context, IsakmpPolicy, limit, marker)
         return self._get_collection(context, IsakmpPolicy,
                                     self._make_isakmp_policy_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     ########################################################
     # Trust Profile DB access
@@ -500,7 +768,13 @@ class VPNPluginDb(VPNPluginBase):
         trustp = self._get_resource(context, TrustProfile, id)
         return self._make_trust_profile_dict(trustp, fields)
 
-    def get_trust_profiles(self, context, filters=None, fields=None):
+    def get_trust_profiles(self, context, filters=None, fields=None,
+                           sorts=None, limit=None, marker=None,
+                           page_reverse=False):
+        marker_obj = self._get_marker_obj(context, TrustProfile, limit, marker)
         return self._get_collection(context, TrustProfile,
                                     self._make_trust_profile_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
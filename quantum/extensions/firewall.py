@@ -170,6 +170,7 @@ class Firewall(extensions.ExtensionDescriptor):
             controller = base.create_resource(
                 collection_name, resource_name, plugin, params,
                 member_actions=member_actions,
+                allow_bulk=cfg.CONF.allow_bulk,
                 allow_pagination=cfg.CONF.allow_pagination,
                 allow_sorting=cfg.CONF.allow_sorting)
 
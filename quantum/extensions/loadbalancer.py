@@ -301,6 +301,7 @@ class Loadbalancer(extensions.ExtensionDescriptor):
 
             controller = base.create_resource(
                 collection_name, resource_name, plugin, params,
+                allow_bulk=cfg.CONF.allow_bulk,
                 member_actions=member_actions,
                 allow_pagination=cfg.CONF.allow_pagination,
                 allow_sorting=cfg.CONF.allow_sorting)
@@ -65,6 +65,81 @@ class TrustProfileExists(qexception.QuantumException):
 class StateInvalid(qexception.QuantumException):
     message = _("Invalid state %(state)s of VPN resource %(id)s")
 
+
+class TopologyNotFound(qexception.NotFound):
+    message = _("Topology %(topology_id)s could not be found")
+
+
+class InvalidTopology(qexception.InvalidInput):
+    message = _("Invalid topology: %(reason)s")
+
+
+TOPOLOGY_TYPES = ['hub_and_spoke', 'full_mesh']
+
+
+def _validate_subnets(data, valid_values=None):
+    """Validate a comma separated list of cidrs."""
+    if not isinstance(data, basestring):
+        msg = _("'%s' is not a string") % data
+        return msg
+    for cidr in data.split(','):
+        if not cidr.strip():
+            continue
+        msg = attr._validate_subnet(cidr.strip())
+        if msg:
+            return msg
+
+
+attr.validators['type:vpn_subnets'] = _validate_subnets
+
+# the subnets on each side of a site, e.g.
+# {'local_subnets': "192.168.1.0/24,192.168.2.0/24",
+#  'peer_subnets': "192.168.11.0/24"}
+PRI_NETWORK_SPECS = {
+    'local_subnets': {'type:vpn_subnets': None, 'required': True},
+    'peer_subnets': {'type:vpn_subnets': None, 'required': True},
+}
+
+
+def _validate_pri_networks(data, valid_values=None):
+    if not isinstance(data, list):
+        msg = _("'%s' is not a list") % data
+        return msg
+    for pri_network in data:
+        msg = attr._validate_dict(pri_network, PRI_NETWORK_SPECS)
+        if msg:
+            return msg
+
+
+attr.validators['type:vpn_pri_networks'] = _validate_pri_networks
+
+# an endpoint of a topology; the sites of a topology are configured on the
+# edges of the endpoints which have a subnet_id, the other endpoints are
+# remote peers
+ENDPOINT_SPECS = {
+    'endpoint': {'type:ip_address': None, 'required': True},
+    'id': {'type:string': None},
+    'subnet_id': {'type:uuid_or_none': None},
+    'subnets': {'type:vpn_subnets': None, 'required': True},
+}
+
+
+def _validate_endpoints(data, valid_values=None):
+    if not isinstance(data, list):
+        msg = _("'%s' is not a list") % data
+        return msg
+    for endpoint in data:
+        msg = attr._validate_dict(endpoint, ENDPOINT_SPECS)
+        if msg:
+            return msg
+    addresses = [endpoint['endpoint'] for endpoint in data]
+    if len(set(addresses)) != len(addresses):
+        msg = _("Duplicate endpoint in '%s'") % addresses
+        return msg
+
+
+attr.validators['type:vpn_endpoints'] = _validate_endpoints
+
 RESOURCE_ATTRIBUTE_MAP = {
     'sites': {
         'id': {'allow_post': False, 'allow_put': False,
@@ -100,6 +175,7 @@ RESOURCE_ATTRIBUTE_MAP = {
                      'default': '',
                      'is_visible': True},
         'pri_networks': {'allow_post': True, 'allow_put': True,
+                         'validate': {'type:vpn_pri_networks': None},
                          'is_visible': True},
         'isakmp_policy_id': {'allow_post': True, 'allow_put': True,
                              'validate': {'type:uuid': None},
@@ -136,6 +212,8 @@ RESOURCE_ATTRIBUTE_MAP = {
                         'convert_to': attr.convert_to_int,
                         'default': 120,
                         'is_visible': True},
+        'status': {'allow_post': False, 'allow_put': False,
+                   'is_visible': True},
     },
     'isakmp_policys': {
         'id': {'allow_post': False, 'allow_put': False,
@@ -244,6 +322,47 @@ RESOURCE_ATTRIBUTE_MAP = {
                 'is_visible': True, 'default': ''},
         'server_cert': {'allow_post': True, 'allow_put': True,
                                'is_visible': True}
+    },
+    'topologys': {
+        'id': {'allow_post': False, 'allow_put': False,
+               'validate': {'type:uuid': None},
+               'is_visible': True,
+               'primary_key': True},
+        'tenant_id': {'allow_post': True, 'allow_put': False,
+                      'validate': {'type:string': None},
+                      'required_by_policy': True,
+                      'is_visible': True},
+        'name': {'allow_post': True, 'allow_put': True,
+                 'validate': {'type:string': None},
+                 'default': '',
+                 'is_visible': True},
+        'description': {'allow_post': True, 'allow_put': True,
+                        'validate': {'type:string': None},
+                        'is_visible': True, 'default': ''},
+        'type': {'allow_post': True, 'allow_put': False,
+                 'validate': {'type:values': TOPOLOGY_TYPES},
+                 'default': 'hub_and_spoke',
+                 'is_visible': True},
+        'hub': {'allow_post': True, 'allow_put': False,
+                'validate': {'type:dict_or_none': ENDPOINT_SPECS},
+                'default': None,
+                'is_visible': True},
+        'endpoints': {'allow_post': True, 'allow_put': False,
+                      'validate': {'type:vpn_endpoints': None},
+                      'is_visible': True},
+        'psk': {'allow_post': True, 'allow_put': False,
+                'validate': {'type:string': None},
+                'default': '',
+                'is_visible': True},
+        'mtu': {'allow_post': True, 'allow_put': False,
+                'validate': {'type:non_negative': None},
+                'convert_to': attr.convert_to_int,
+                'default': 1500,
+                'is_visible': True},
+        'site_ids': {'allow_post': False, 'allow_put': False,
+                     'is_visible': True},
+        'status': {'allow_post': False, 'allow_put': False,
+                   'is_visible': True},
     }
 
 }
@@ -285,19 +404,24 @@ class Vpn(extensions.ExtensionDescriptor):
             params = RESOURCE_ATTRIBUTE_MAP[collection_name]
 
             member_actions = {}
+            collection_actions = {}
             if resource_name == 'site':
                 member_actions = {'stats': 'GET'}
+                # statistics of all the sites of the tenant in one call
+                collection_actions = {'stats': 'GET'}
 
             controller = base.create_resource(
                 collection_name, resource_name, plugin, params,
                 member_actions=member_actions,
                 allow_pagination=cfg.CONF.allow_pagination,
-                allow_sorting=cfg.CONF.allow_sorting)
+                allow_sorting=cfg.CONF.allow_sorting,
+                collection_actions=collection_actions)
 
             resource = extensions.ResourceExtension(
                 collection_name,
                 controller,
                 path_prefix=constants.COMMON_PREFIXES[constants.VPN],
+                collection_actions=collection_actions,
                 member_actions=member_actions,
                 attr_map=params)
             resources.append(resource)
@@ -412,5 +536,35 @@ class VPNPluginBase(ServicePluginBase):
         pass
 
     @abc.abstractmethod
-    def stats(self, context, site_id):
+    def get_topologys(self, context, filters=None, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def get_topology(self, context, id, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def create_topology(self, context, topology):
+        """Create the sites linking the endpoints of a topology.
+
+        A hub_and_spoke topology links the hub to every endpoint, a
+        full_mesh links every endpoint to every other one.
+        """
+        pass
+
+    @abc.abstractmethod
+    def update_topology(self, context, id, topology):
+        pass
+
+    @abc.abstractmethod
+    def delete_topology(self, context, id):
+        pass
+
+    @abc.abstractmethod
+    def stats(self, context, site_id=None):
+        """Return the statistics of a site.
+
+        Without site_id, returns a {site_id: statistics} dict for all the
+        sites visible in the context.
+        """
         pass
@@ -0,0 +1,85 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from quantum.api import extensions
+from quantum.api.v2 import attributes as attr
+from quantum.api.v2 import base
+from quantum import manager
+
+
+RESOURCE_NAME = 'vshield_metric'
+RESOURCE_ATTRIBUTE_MAP = {
+    RESOURCE_NAME + 's': {
+        # the edge id
+        'id': {'allow_post': False, 'allow_put': False,
+               'is_visible': True},
+        'requests': {'allow_post': False, 'allow_put': False,
+                     'is_visible': True},
+        'retries': {'allow_post': False, 'allow_put': False,
+                    'is_visible': True},
+        'sample_rate': {'allow_post': False, 'allow_put': False,
+                        'is_visible': True},
+        'endpoints': {'allow_post': False, 'allow_put': False,
+                      'is_visible': True},
+    },
+}
+
+
+class Vshieldmetrics(extensions.ExtensionDescriptor):
+    """Metrics of the requests sent to vShield Manager, for every edge."""
+
+    @classmethod
+    def get_name(cls):
+        return "vShield metrics"
+
+    @classmethod
+    def get_alias(cls):
+        return "vshield-metrics"
+
+    @classmethod
+    def get_description(cls):
+        return ("Latency, payload size, status and retry metrics of the "
+                "requests to vShield Manager, per edge and endpoint")
+
+    @classmethod
+    def get_namespace(cls):
+        return "http://docs.openstack.org/ext/vshield-metrics/api/v2.0"
+
+    @classmethod
+    def get_updated(cls):
+        return "2013-05-20T10:00:00-00:00"
+
+    @classmethod
+    def get_resources(cls):
+        """ Returns Ext Resources """
+        attr.PLURALS[RESOURCE_NAME + 's'] = RESOURCE_NAME
+        # the metrics are shared by the vShield service plugins, any of
+        # them can serve them
+        plugin = [plugin for plugin in
+                  manager.QuantumManager.get_service_plugins().values()
+                  if cls.get_alias() in getattr(
+                      plugin, 'supported_extension_aliases', [])][0]
+        params = RESOURCE_ATTRIBUTE_MAP[RESOURCE_NAME + 's']
+        controller = base.create_resource(RESOURCE_NAME + 's',
+                                          RESOURCE_NAME, plugin, params)
+        return [extensions.ResourceExtension(RESOURCE_NAME + 's',
+                                             controller)]
+
+    def get_extended_resources(self, version):
+        if version == "2.0":
+            return RESOURCE_ATTRIBUTE_MAP
+        else:
+            return {}
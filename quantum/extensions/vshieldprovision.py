@@ -0,0 +1,91 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from quantum.api import extensions
+from quantum.api.v2 import attributes as attr
+from quantum.api.v2 import base
+from quantum import manager
+
+
+RESOURCE_NAME = 'vshield_provision'
+RESOURCE_ATTRIBUTE_MAP = {
+    RESOURCE_NAME + 's': {
+        'id': {'allow_post': False, 'allow_put': False,
+               'is_visible': True},
+        'tenant_id': {'allow_post': True, 'allow_put': False,
+                      'validate': {'type:string': None},
+                      'required_by_policy': True,
+                      'is_visible': True},
+        # the bodies of the objects to create, as posted to their own
+        # collections; members go to existing pools
+        'members': {'allow_post': True, 'allow_put': False,
+                    'default': [], 'is_visible': True},
+        'vips': {'allow_post': True, 'allow_put': False,
+                 'default': [], 'is_visible': True},
+        'rules': {'allow_post': True, 'allow_put': False,
+                  'default': [], 'is_visible': True},
+        'sites': {'allow_post': True, 'allow_put': False,
+                  'default': [], 'is_visible': True},
+    },
+}
+
+
+class Vshieldprovision(extensions.ExtensionDescriptor):
+    """Creates the load balancer, firewall and vpn objects of a tenant in
+    one request, on the edges all together or not at all."""
+
+    @classmethod
+    def get_name(cls):
+        return "vShield provision"
+
+    @classmethod
+    def get_alias(cls):
+        return "vshield-provision"
+
+    @classmethod
+    def get_description(cls):
+        return ("Create members, vips, firewall rules and ipsec sites in "
+                "one transaction, their edge changes applied together")
+
+    @classmethod
+    def get_namespace(cls):
+        return "http://docs.openstack.org/ext/vshield-provision/api/v2.0"
+
+    @classmethod
+    def get_updated(cls):
+        return "2013-06-10T10:00:00-00:00"
+
+    @classmethod
+    def get_resources(cls):
+        """ Returns Ext Resources """
+        attr.PLURALS[RESOURCE_NAME + 's'] = RESOURCE_NAME
+        # the objects are created by the vShield service plugins, any of
+        # them can take the request
+        plugin = [plugin for plugin in
+                  manager.QuantumManager.get_service_plugins().values()
+                  if cls.get_alias() in getattr(
+                      plugin, 'supported_extension_aliases', [])][0]
+        params = RESOURCE_ATTRIBUTE_MAP[RESOURCE_NAME + 's']
+        controller = base.create_resource(RESOURCE_NAME + 's',
+                                          RESOURCE_NAME, plugin, params)
+        return [extensions.ResourceExtension(RESOURCE_NAME + 's',
+                                             controller)]
+
+    def get_extended_resources(self, version):
+        if version == "2.0":
+            return RESOURCE_ATTRIBUTE_MAP
+        else:
+            return {}
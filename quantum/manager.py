@@ -151,3 +151,20 @@ class QuantumManager(object):
     @classmethod
     def get_service_plugins(cls):
         return cls.get_instance().service_plugins
+
+    @classmethod
+    def after_fork(cls):
+        """Let the loaded plugins re-create their state in a forked process.
+
+        Calls the after_fork() method of the core and service plugins which
+        have one.
+        """
+        if cls._instance is None:
+            return
+        plugins = [cls._instance.plugin]
+        plugins.extend(plugin for plugin in
+                       cls._instance.service_plugins.values()
+                       if plugin not in plugins)
+        for plugin in plugins:
+            if hasattr(plugin, 'after_fork'):
+                plugin.after_fork()
@@ -0,0 +1,67 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+import eventlet
+
+from quantum.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class PoolBatcher(object):
+    """Gathers the member changes of load balancer pools.
+
+    The edge takes a pool with all its members in one request, so instead
+    of pushing the pool for every member change the first change opens a
+    window of window seconds; when it ends a single sync(edge_id, pool_id)
+    is queued on the edge and pushes every change made in the meantime.
+
+    A pool is pending from its first change until its sync starts; changes
+    made while the sync runs open a new window.
+    """
+
+    def __init__(self, tasks, sync, window):
+        self.tasks = tasks
+        self.sync = sync
+        self.window = window
+        # ids of the pools whose window is open
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def add(self, edge_id, pool_id):
+        """Record a change to a pool, returns whether it opened a window."""
+        with self._lock:
+            if pool_id in self._pending:
+                return False
+            self._pending.add(pool_id)
+        LOG.debug(_("Gathering the member changes of pool %(pool)s for "
+                    "%(window).2f seconds"),
+                  {'pool': pool_id, 'window': self.window})
+        eventlet.spawn_after(self.window, self.tasks.add, edge_id,
+                             self._run, edge_id, pool_id)
+        return True
+
+    def _run(self, edge_id, pool_id):
+        with self._lock:
+            self._pending.discard(pool_id)
+        self.sync(edge_id, pool_id)
+
+    def is_pending(self, pool_id):
+        """Return whether changes to the pool wait for their window to end."""
+        with self._lock:
+            return pool_id in self._pending
@@ -0,0 +1,122 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo.config import cfg
+
+
+vshield_opts = [
+    cfg.StrOpt('manager_uri',
+               help=_("URI of the vShield Manager driving the edges, "
+                      "e.g. https://10.0.0.1")),
+    cfg.StrOpt('manager_user', default='admin',
+               help=_("User name for vShield Manager (default admin)")),
+    cfg.StrOpt('manager_password', default='default', secret=True,
+               help=_("Password for vShield Manager")),
+    cfg.StrOpt('default_edge',
+               help=_("Edge serving the resources not matched by any of "
+                      "the mappings below")),
+    cfg.ListOpt('tenant_edge_mappings', default=[],
+                help=_("List of <tenant_id>:<edge_id> serving every "
+                       "resource of a tenant on one edge")),
+    cfg.ListOpt('router_edge_mappings', default=[],
+                help=_("List of <router_id>:<edge_id> serving the "
+                       "resources on the subnets attached to a router on "
+                       "one edge")),
+    cfg.ListOpt('subnet_edge_mappings', default=[],
+                help=_("List of <subnet_id>:<edge_id> serving the "
+                       "resources on a subnet on one edge")),
+    cfg.IntOpt('concurrent_connections', default=5,
+               help=_("Maximum number of concurrent connections kept open "
+                      "to vShield Manager (default 5)")),
+    cfg.IntOpt('connection_idle_timeout', default=60,
+               help=_("Number of seconds an idle connection to vShield "
+                      "Manager is kept in the pool before it is closed "
+                      "(default 60)")),
+    cfg.IntOpt('http_timeout', default=75,
+               help=_("Timeout in seconds for a single request to vShield "
+                      "Manager (default 75)")),
+    cfg.IntOpt('max_retries', default=3,
+               help=_("Number of times a failed request to vShield Manager "
+                      "is retried when it is safe to (default 3)")),
+    cfg.IntOpt('foreground_retries', default=2,
+               help=_("Number of times a request of an API call, which "
+                      "holds a database transaction, is retried when "
+                      "vShield Manager rejects it as busy (default 2)")),
+    cfg.FloatOpt('retry_base_delay', default=0.5,
+                 help=_("Number of seconds before the first retry of a "
+                        "request to vShield Manager; the delay doubles with "
+                        "every retry and is jittered (default 0.5)")),
+    cfg.FloatOpt('retry_max_delay', default=10,
+                 help=_("Maximum number of seconds between two retries of "
+                        "a request to vShield Manager (default 10)")),
+    cfg.IntOpt('breaker_failure_threshold', default=5,
+               help=_("Number of consecutive failed requests for an edge "
+                      "after which requests for it fail at once, 0 "
+                      "disables it (default 5)")),
+    cfg.IntOpt('breaker_reset_timeout', default=30,
+               help=_("Number of seconds requests for an edge fail at once "
+                      "before one is let through to probe vShield Manager "
+                      "again (default 30)")),
+    cfg.FloatOpt('metrics_sample_rate', default=0.1,
+                 help=_("Share of the requests to vShield Manager whose "
+                        "latency and payload sizes are recorded and whose "
+                        "redacted bodies are logged at debug level, from 0 "
+                        "to 1 (default 0.1)")),
+    cfg.FloatOpt('coalesce_window', default=0,
+                 help=_("Number of seconds the config pushes to the ipsec, "
+                        "load balancer or firewall config of an edge are "
+                        "held so that they are sent as one push of the "
+                        "config, pushes made by API requests are sent at "
+                        "once; 0 disables it (default 0)")),
+    cfg.IntOpt('vpn_stats_ttl', default=30,
+               help=_("Number of seconds the ipsec statistics read from an "
+                      "edge are served from memory (default 30)")),
+    cfg.IntOpt('vpn_stats_interval', default=20,
+               help=_("Number of seconds between background polls of the "
+                      "ipsec statistics of the edges read recently, 0 "
+                      "disables polling (default 20)")),
+    cfg.IntOpt('resync_interval', default=300,
+               help=_("Number of seconds between checks of the VPN, load "
+                      "balancer and firewall config of the edges against "
+                      "the database, 0 disables the checks (default 300)")),
+    cfg.IntOpt('vseid_cache_size', default=4096,
+               help=_("Number of edge object ids of each kind, e.g. pools or "
+                      "ip sets, cached in memory, 0 disables the cache "
+                      "(default 4096)")),
+    cfg.IntOpt('task_workers', default=16,
+               help=_("Number of green threads pushing queued changes to "
+                      "the edges (default 16)")),
+    cfg.FloatOpt('job_poll_interval', default=0.5,
+                 help=_("Number of seconds between the first polls of the "
+                        "jobs vShield Manager runs for an edge, the "
+                        "interval doubles while no job ends (default 0.5)")),
+    cfg.FloatOpt('job_poll_max_interval', default=8,
+                 help=_("Maximum number of seconds between two polls of the "
+                        "jobs of an edge (default 8)")),
+    cfg.IntOpt('job_timeout', default=600,
+               help=_("Number of seconds after which a job of vShield "
+                      "Manager which has not ended is considered failed "
+                      "(default 600)")),
+    cfg.FloatOpt('member_batch_window', default=0,
+                 help=_("Number of seconds the member changes to a load "
+                        "balancer pool are gathered before the pool is "
+                        "pushed to the edge once with all of them, 0 pushes "
+                        "every change before the request returns "
+                        "(default 0)")),
+]
+
+# Register the configuration options
+cfg.CONF.register_opts(vshield_opts, "vshield")
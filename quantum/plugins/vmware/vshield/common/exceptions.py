@@ -0,0 +1,56 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from quantum.common import exceptions as qexc
+
+
+class VShieldException(qexc.QuantumException):
+    message = _("An unexpected error occurred in the vShield plugin: "
+                "%(reason)s")
+
+
+class InvalidEdgeConfig(VShieldException):
+    message = _("Invalid vShield edge configuration: %(reason)s")
+
+
+class EdgeNotFound(qexc.NotFound):
+    message = _("No vShield edge is configured for tenant %(tenant_id)s "
+                "and subnet %(subnet_id)s")
+
+
+class VsmRequestFailed(VShieldException):
+    message = _("vShield Manager request %(method)s %(uri)s failed with "
+                "status %(status)s: %(content)s")
+
+    def __init__(self, **kwargs):
+        super(VsmRequestFailed, self).__init__(**kwargs)
+        self.status = kwargs.get('status')
+        self.content = kwargs.get('content')
+
+
+class ManagerUnavailable(VShieldException):
+    message = _("vShield Manager is unavailable for edge %(edge_id)s, "
+                "retrying in %(retry_in)d seconds")
+
+
+class VsmJobFailed(VShieldException):
+    message = _("vShield Manager job %(job_id)s on edge %(edge_id)s ended "
+                "with status %(status)s")
+
+    def __init__(self, **kwargs):
+        super(VsmJobFailed, self).__init__(**kwargs)
+        self.job_id = kwargs.get('job_id')
+        self.status = kwargs.get('status')
@@ -0,0 +1,171 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from oslo.config import cfg
+
+from quantum.common import constants as l3_constants
+from quantum.db import models_v2
+from quantum.openstack.common import log as logging
+from quantum.plugins.vmware.vshield.common import config  # noqa
+from quantum.plugins.vmware.vshield.common import exceptions as vsh_exc
+from instrument import forget_instrumentation
+from jobs import forget_job_pollers
+from retry import forget_circuit_breakers
+from tasks import forget_task_manager
+from vseapi import forget_coalescer
+from vseapi import VseAPI
+from vseids import forget_vseid_maps
+from vsmapi import forget_connection_pools
+
+LOG = logging.getLogger(__name__)
+
+
+def parse_mappings(mappings, name):
+    """Parse a list of <key>:<edge_id> strings into a dict."""
+    result = {}
+    for mapping in mappings:
+        key, sep, edge_id = mapping.strip().partition(':')
+        key = key.strip()
+        edge_id = edge_id.strip()
+        if not sep or not key or not edge_id:
+            raise vsh_exc.InvalidEdgeConfig(
+                reason=_("%(name)s entry '%(mapping)s' is not of the form "
+                         "<id>:<edge_id>") % {'name': name,
+                                              'mapping': mapping})
+        if key in result:
+            raise vsh_exc.InvalidEdgeConfig(
+                reason=_("%(name)s maps %(key)s more than once") %
+                {'name': name, 'key': key})
+        result[key] = edge_id
+    return result
+
+
+class EdgeRegistry(object):
+    """Maps quantum resources to the edges serving them.
+
+    An edge is chosen for a resource by its subnet, then by the router the
+    subnet is attached to, then by its tenant, falling back to the default
+    edge. Every edge gets one VseAPI, which is shared by all the resources
+    served by the edge; the connections to the manager are shared by all
+    the edges.
+    """
+
+    def __init__(self, manager_uri, user, password, default_edge=None,
+                 tenant_edges=None, router_edges=None, subnet_edges=None):
+        self.manager_uri = manager_uri
+        self.user = user
+        self.password = password
+        self.default_edge = default_edge
+        self.tenant_edges = tenant_edges or {}
+        self.router_edges = router_edges or {}
+        self.subnet_edges = subnet_edges or {}
+        self._vses = {}
+        self._lock = threading.Lock()
+
+    def get_edges(self):
+        """Return the ids of every configured edge."""
+        edges = set(self.tenant_edges.values())
+        edges.update(self.router_edges.values())
+        edges.update(self.subnet_edges.values())
+        if self.default_edge:
+            edges.add(self.default_edge)
+        return edges
+
+    def get_vse(self, edge_id):
+        with self._lock:
+            vse = self._vses.get(edge_id)
+            if vse is None:
+                vse = VseAPI(self.manager_uri, self.user, self.password,
+                             edge_id)
+                self._vses[edge_id] = vse
+            return vse
+
+    def forget_vses(self):
+        """Drop the VseAPIs, new ones use the state of this process."""
+        with self._lock:
+            self._vses = {}
+
+    def _get_router_id(self, context, subnet_id):
+        query = context.session.query(models_v2.Port.device_id)
+        query = query.join(
+            models_v2.IPAllocation,
+            models_v2.IPAllocation.port_id == models_v2.Port.id)
+        query = query.filter(
+            models_v2.Port.device_owner ==
+            l3_constants.DEVICE_OWNER_ROUTER_INTF,
+            models_v2.IPAllocation.subnet_id == subnet_id)
+        port = query.first()
+        return port and port.device_id
+
+    def get_edge(self, context, tenant_id=None, subnet_id=None):
+        """Return the id of the edge serving a resource."""
+        if subnet_id:
+            edge_id = self.subnet_edges.get(subnet_id)
+            if edge_id:
+                return edge_id
+            if self.router_edges:
+                router_id = self._get_router_id(context, subnet_id)
+                edge_id = self.router_edges.get(router_id)
+                if edge_id:
+                    return edge_id
+        edge_id = self.tenant_edges.get(tenant_id) or self.default_edge
+        if not edge_id:
+            raise vsh_exc.EdgeNotFound(tenant_id=tenant_id,
+                                       subnet_id=subnet_id)
+        return edge_id
+
+
+def load_edge_registry():
+    """Build an EdgeRegistry from the [vshield] section of the config."""
+    conf = cfg.CONF.vshield
+    if not conf.manager_uri:
+        raise vsh_exc.InvalidEdgeConfig(
+            reason=_("manager_uri is not set"))
+    registry = EdgeRegistry(
+        conf.manager_uri, conf.manager_user, conf.manager_password,
+        default_edge=conf.default_edge,
+        tenant_edges=parse_mappings(conf.tenant_edge_mappings,
+                                    'tenant_edge_mappings'),
+        router_edges=parse_mappings(conf.router_edge_mappings,
+                                    'router_edge_mappings'),
+        subnet_edges=parse_mappings(conf.subnet_edge_mappings,
+                                    'subnet_edge_mappings'))
+    if not registry.get_edges():
+        raise vsh_exc.InvalidEdgeConfig(
+            reason=_("neither default_edge nor any edge mapping is set"))
+    LOG.info(_("Serving edges %(edges)s of vShield Manager %(uri)s"),
+             {'edges': ', '.join(sorted(registry.get_edges())),
+              'uri': conf.manager_uri})
+    return registry
+
+
+def forget_process_state():
+    """Drop the state the vShield plugins share within a process.
+
+    Meant for a forked API worker: the green threads serving the task
+    manager, job pollers and coalescer it inherited only run in its
+    parent, and the connections are used by the parent too. The next
+    users make new ones for this process.
+    """
+    forget_task_manager()
+    forget_job_pollers()
+    forget_circuit_breakers()
+    forget_coalescer()
+    forget_connection_pools()
+    forget_vseid_maps()
+    forget_instrumentation()
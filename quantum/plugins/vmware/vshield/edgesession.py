@@ -0,0 +1,278 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Edge changes made by the vShield plugins for one request.
+
+A call provisioning several services of a tenant at once, say a vip, the
+firewall rules opening it and an ipsec site, runs them in an edge session:
+
+    with context.session.begin(subtransactions=True):
+        with edge_session(context):
+            lb_plugin.create_vip(context, vip)
+            fw_plugin.create_rule(context, rule)
+            vpn_plugin.create_site(context, site)
+
+While the session is open the plugins stage the objects they create on
+the edges instead of pushing them. When it ends the changes are applied
+edge by edge in dependency order, changes which go in one document are
+pushed together, and if one fails the ones already applied are undone
+before the error is raised, so the database transaction is rolled back
+with no object left half created on the edges. Deletes are not staged.
+
+The vshield-provision extension, served by VShieldProvisionMixin, runs the
+creates posted to it that way.
+"""
+
+import collections
+import contextlib
+
+from quantum.api.v2 import base
+from quantum.common import exceptions as q_exc
+from quantum.extensions import firewall
+from quantum.extensions import loadbalancer
+from quantum.extensions import vpn
+from quantum import manager
+from quantum.openstack.common import excutils
+from quantum.openstack.common import log as logging
+from quantum.openstack.common import uuidutils
+from quantum.plugins.common import constants
+from quantum.plugins.vmware.vshield.common import exceptions
+from quantum import policy
+from quantum import quota
+
+LOG = logging.getLogger(__name__)
+
+# (collection, resource, service, attributes) of the objects a provision
+# creates, in creation order: members before the vips waiting for their
+# pool
+PROVISIONED = (
+    ('members', 'member', constants.LOADBALANCER,
+     loadbalancer.RESOURCE_ATTRIBUTE_MAP['members']),
+    ('vips', 'vip', constants.LOADBALANCER,
+     loadbalancer.RESOURCE_ATTRIBUTE_MAP['vips']),
+    ('rules', 'rule', constants.FIREWALL,
+     firewall.RESOURCE_ATTRIBUTE_MAP['rules']),
+    ('sites', 'site', constants.VPN, vpn.RESOURCE_ATTRIBUTE_MAP['sites']),
+)
+
+
+class _Change(object):
+
+    def __init__(self, kind, apply, undo, after, items=None):
+        self.kind = kind
+        self.apply = apply
+        self.undo = undo
+        self.after = frozenset(after)
+        # the items of a batch, given to apply and undo
+        self.items = items
+
+    def run(self):
+        if self.items is None:
+            self.apply()
+        else:
+            self.apply(self.items)
+
+    def revert(self):
+        if self.undo is None:
+            return
+        if self.items is None:
+            self.undo()
+        else:
+            self.undo(self.items)
+
+
+class EdgeSession(object):
+    """Changes staged for the edges, applied together by commit()."""
+
+    def __init__(self):
+        # edge id -> {(kind, name): _Change}, in staging order
+        self._edges = collections.OrderedDict()
+
+    def _changes(self, edge_id):
+        return self._edges.setdefault(edge_id, collections.OrderedDict())
+
+    def stage(self, edge_id, kind, name, apply, undo=None, after=()):
+        """Stage apply() for an edge, undone by undo() on failure.
+
+        The change is applied after every change of the edge whose kind is
+        in after. A change staged again under the same kind and name
+        replaces the one staged before.
+        """
+        changes = self._changes(edge_id)
+        changes.pop((kind, name), None)
+        changes[(kind, name)] = _Change(kind, apply, undo, after)
+
+    def append(self, edge_id, kind, item, apply, undo=None, after=()):
+        """Add item to the batch of its kind for an edge.
+
+        The items of a batch are applied by a single apply(items) call,
+        the first apply and undo given for the batch are the ones used.
+        """
+        changes = self._changes(edge_id)
+        change = changes.get((kind, None))
+        if change is None:
+            change = changes[(kind, None)] = _Change(kind, apply, undo,
+                                                     after, [])
+        change.items.append(item)
+
+    def __len__(self):
+        return sum(len(changes) for changes in self._edges.itervalues())
+
+    @staticmethod
+    def _ordered(edge_id, changes):
+        """Sort changes so each comes after the kinds it depends on,
+        keeping the staging order otherwise."""
+        pending = list(changes)
+        ordered = []
+        while pending:
+            for change in pending:
+                if not any(other.kind in change.after
+                           for other in pending if other is not change):
+                    break
+            else:
+                raise exceptions.VShieldException(
+                    reason=_("changes to edge %(edge)s depend on each "
+                             "other: %(kinds)s") %
+                    {'edge': edge_id,
+                     'kinds': ', '.join(sorted(set(
+                         change.kind for change in pending)))})
+            pending.remove(change)
+            ordered.append(change)
+        return ordered
+
+    def commit(self):
+        """Apply every staged change, undoing the applied ones if one
+        fails."""
+        edges, self._edges = self._edges, collections.OrderedDict()
+        applied = []
+        try:
+            for edge_id, changes in edges.iteritems():
+                for change in self._ordered(edge_id, changes.values()):
+                    change.run()
+                    applied.append((edge_id, change))
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self._rollback(applied)
+
+    @staticmethod
+    def _rollback(applied):
+        for edge_id, change in reversed(applied):
+            try:
+                change.revert()
+            except Exception:
+                LOG.exception(_("Failed to undo a %(kind)s change to edge "
+                                "%(edge)s"),
+                              {'kind': change.kind, 'edge': edge_id})
+
+
+def current(context):
+    """Return the edge session open for a request, or None."""
+    return getattr(context, 'edge_session', None)
+
+
+@contextlib.contextmanager
+def edge_session(context):
+    """Stage the edge changes made with context, apply them at the end.
+
+    Nested sessions join the outer one, which applies all the changes.
+    """
+    session = current(context)
+    if session is not None:
+        yield session
+        return
+    session = EdgeSession()
+    context.edge_session = session
+    try:
+        yield session
+    finally:
+        # the changes are applied with no session open, or they would be
+        # staged again
+        del context.edge_session
+    session.commit()
+
+
+def push(context, edge_id, kind, name, apply, undo=None, after=()):
+    """Apply a change to an edge now, or stage it if a session is open."""
+    session = current(context)
+    if session is None:
+        return apply()
+    session.stage(edge_id, kind, name, apply, undo, after)
+
+
+class VShieldProvisionMixin(object):
+    """Serves the vshield-provision extension from a service plugin."""
+
+    def _prepare_provision(self, context, provision, plugins):
+        """Validate the bodies of a provision like their own collections
+        would, and check the policy of their creates."""
+        items = []
+        for collection, resource, service, attr_info in PROVISIONED:
+            bodies = provision[collection] or []
+            if not isinstance(bodies, list):
+                raise q_exc.InvalidInput(
+                    error_message=_("%s must be a list") % collection)
+            if bodies and service not in plugins:
+                raise q_exc.InvalidInput(
+                    error_message=_("No service plugin creates %s") %
+                    collection)
+            for body in bodies:
+                body = dict(body)
+                body.setdefault('tenant_id', provision['tenant_id'])
+                body = base.Controller.prepare_request_body(
+                    context, {resource: body}, True, resource, attr_info)
+                policy.enforce(context, 'create_' + resource, body[resource],
+                               plugin=plugins[service])
+                items.append((collection, resource, plugins[service], body))
+        return items
+
+    def create_vshield_provision(self, context, vshield_provision):
+        """Create the objects of a provision in one transaction and one
+        edge session."""
+        provision = vshield_provision['vshield_provision']
+        plugins = manager.QuantumManager.get_service_plugins()
+        items = self._prepare_provision(context, provision, plugins)
+
+        reservations = []
+        try:
+            for collection, resource, plugin, body in items:
+                try:
+                    reservations.extend(quota.QUOTAS.reserve(
+                        context, body[resource]['tenant_id'], plugin,
+                        collection, **{resource: 1}))
+                except q_exc.QuotaResourceUnknown as e:
+                    LOG.debug(e)
+            created = []
+            with context.session.begin(subtransactions=True):
+                with edge_session(context):
+                    for collection, resource, plugin, body in items:
+                        obj = getattr(plugin, 'create_' + resource)(
+                            context, body)
+                        created.append((collection, resource, plugin, obj))
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                quota.QUOTAS.rollback(context, reservations)
+        quota.QUOTAS.commit(context, reservations)
+
+        res = {'id': uuidutils.generate_uuid(),
+               'tenant_id': provision['tenant_id']}
+        for collection, resource, service, attr_info in PROVISIONED:
+            res[collection] = []
+        # read back once the edges have the objects and their states
+        # are final
+        for collection, resource, plugin, obj in created:
+            res[collection].append(
+                getattr(plugin, 'get_' + resource)(context, obj['id']))
+        return res
@@ -1,6 +1,7 @@
 #!/usr/bin/python
 
 import copy
+import hashlib
 import json
 
 from vseapi import VseAPI
@@ -9,6 +10,12 @@ from sqlalchemy import orm
 from quantum.db import api as qdbapi
 from quantum.db import model_base
 from quantum.db.loadbalancer.loadbalancer_db import Pool
+from quantum.openstack.common import log as logging
+from quantum.plugins.vmware.vshield.common import exceptions
+import resync
+from vseids import get_vseid_map
+
+LOG = logging.getLogger(__name__)
 
 
 class IPObjUuid2Vseid(model_base.BASEV2):
@@ -35,25 +42,44 @@ class RuleUuid2Vseid(model_base.BASEV2):
     vseid = sa.Column(sa.String(36), nullable=False)
 
 
-def getuuid2vseid(context, uuid, model):
-    query = context.session.query(model)
-    query = query.filter(model.uuid == uuid)
-    if query.count() == 0:
-        return None
-    return query.one()
+class GroupingObject(model_base.BASEV2):
+    """An ip set or application on an edge.
+
+    The quantum objects of an edge with the same content share one, by the
+    digest of their content; it is removed from the edge once the last of
+    them is deleted.
+    """
+    __tablename__ = 'vsegroupingobjects'
+    edge_id = sa.Column(sa.String(36), primary_key=True)
+    # 'ipset' or 'application'
+    kind = sa.Column(sa.String(16), primary_key=True)
+    digest = sa.Column(sa.String(40), primary_key=True)
+    vseid = sa.Column(sa.String(36), nullable=False, index=True)
+    refcount = sa.Column(sa.Integer, nullable=False)
+
+
+def _digest(content):
+    return hashlib.sha1(json.dumps(content, sort_keys=True)).hexdigest()
+
+
+def _normalized(values):
+    return sorted(set(unicode(v).strip().lower() for v in values or []))
 
-def uuid2vseid(context, uuid, model):
-    uuid2vseid = getuuid2vseid(context, uuid, model)
-    if uuid2vseid is None:
-        return None
-    return uuid2vseid.vseid
 
-def deluuid2vseid(context, uuid, model):
-    uuid2vseid = getuuid2vseid(context, uuid, model)
-    if uuid2vseid is None:
-        raise Exception("{0} id for {1} not found".format(
-            model.__name__, uuid))
-    context.session.delete(uuid2vseid)
+def ipset_digest(ipobj):
+    """The digest of the addresses of an ip object, in any order."""
+    return _digest(_normalized(ipobj['value']))
+
+
+def application_digest(svcobj):
+    """The digest of the protocol and ports or types of a service
+    object."""
+    content = {'protocol': svcobj['protocol'].lower()}
+    for key in ('ports', 'types', 'sourcePorts'):
+        if key in svcobj:
+            content[key] = _normalized(svcobj[key])
+    return _digest(content)
+
 
 def getobj(context, model, id):
     query = context.session.query(model)
@@ -71,9 +97,19 @@ def list2str(value):
 
 
 class FirewallAPI():
+    """Drives the firewall of an edge.
+
+    Rules have no status which could stay pending, so the rule changes
+    wait for the jobs they are accepted as, API requests included, and a
+    failed job fails the change.
+    """
+
     def __init__(self, vse):
         qdbapi.register_models(base=model_base.BASEV2)
         self.vse = vse
+        self.rule_vseids = get_vseid_map(RuleUuid2Vseid)
+        self.ipobj_vseids = get_vseid_map(IPObjUuid2Vseid)
+        self.serviceobj_vseids = get_vseid_map(ServiceObjUuid2Vseid)
 #        self.uriprefix = '/api/3.0/edges/{0}/loadbalancer'.format(
         self.uriprefix = '/api/4.0/edges/{0}/firewall'.format(
             vse.get_edgeId())
@@ -111,34 +147,43 @@ class FirewallAPI():
 
         return services
 
-    def fwaas2vsmIPObjs(self, context, ipobjs):
-        rst = context.session.query(IPObjUuid2Vseid.vseid).filter(
-            IPObjUuid2Vseid.uuid.in_(ipobjs)).all()
-        print rst
-        ipsets = []
-        for ipset in rst:
-            ipsets.append(ipset.vseid)
-        print ipsets
-        return ipsets
-
-    def fwaas2vsmServiceObjs(self, context, svcobjs):
-        rst = context.session.query(ServiceObjUuid2Vseid.vseid).filter(
-            ServiceObjUuid2Vseid.uuid.in_(svcobjs)).all()
-        print rst
-        apps = []
-        for app in rst:
-            apps.append(app.vseid)
-        print apps
-        return apps
+    def fwaas2vsmIPObjs(self, context, ipobjs, ipsets=None):
+        if ipsets is None:
+            ipsets = self.ipobj_vseids.get_many(context, ipobjs)
+        return [ipsets[ipobj] for ipobj in ipobjs if ipobj in ipsets]
+
+    def fwaas2vsmServiceObjs(self, context, svcobjs, apps=None):
+        if apps is None:
+            apps = self.serviceobj_vseids.get_many(context, svcobjs)
+        return [apps[svcobj] for svcobj in svcobjs if svcobj in apps]
+
+    def fwaas2vsmRules(self, context, rules):
+        """Translate rules, resolving the edge ids of the ip sets and
+        applications of all of them at once."""
+        ipobjs = set()
+        svcobjs = set()
+        for rule in rules:
+            ipobjs.update(rule['source'].get('ipobjs') or [])
+            ipobjs.update(rule['destination'].get('ipobjs') or [])
+            svcobjs.update(rule['service'].get('serviceobjs') or [])
+        ipsets = self.ipobj_vseids.get_many(context, ipobjs)
+        apps = self.serviceobj_vseids.get_many(context, svcobjs)
+        return [self.__vsmRule(context, rule, ipsets, apps)
+                for rule in rules]
 
     def fwaas2vsmRule(self, context, rule):
-        if rule['action']:
+        return {
+            "firewallRules": self.fwaas2vsmRules(context, [rule])
+        }
+
+    def __vsmRule(self, context, rule, ipsets, apps):
+        if rule['action'] == 'accept':
             action = "accept"
         else:
             action = "drop"
         vsmRule = {
             "name": rule['name'],
-            "description": rule.get('descrption'),
+            "description": rule.get('description'),
             "enabled": rule['enabled'],
             "action": action
         }
@@ -148,15 +193,18 @@ class FirewallAPI():
 
         srcGroupObjIds = []
         if 'ipobjs' in src:
-            srcGroupObjIds = self.fwaas2vsmIPObjs(context, src['ipobjs'])
+            srcGroupObjIds = self.fwaas2vsmIPObjs(context, src['ipobjs'],
+                                                  ipsets)
 
         dstGroupObjIds = []
         if 'ipobjs' in dst:
-            dstGroupObjIds = self.fwaas2vsmIPObjs(context, dst['ipobjs'])
+            dstGroupObjIds = self.fwaas2vsmIPObjs(context, dst['ipobjs'],
+                                                  ipsets)
 
         appIds = []
         if 'serviceobjs' in svc:
-            appIds = self.fwaas2vsmServiceObjs(context, svc['serviceobjs'])
+            appIds = self.fwaas2vsmServiceObjs(context, svc['serviceobjs'],
+                                               apps)
 
         vsmSrc = {
             "ipAddress": src.get("addresses"),
@@ -175,25 +223,192 @@ class FirewallAPI():
         vsmRule['source'] = vsmSrc
         vsmRule['destination'] = vsmDst
         vsmRule['application'] = vsmApp
+        return vsmRule
 
-        return {
-            "firewallRules": [vsmRule]
-        }
+    def __rules_uri(self, context, location=None):
+        """The uri rules are posted to, to go right above the rule
+        location when given or after the last rule otherwise."""
+        uri = self.uriprefix + '/config/rules'
+        if location:
+            above = self.rule_vseids.get(context, location)
+            if above is None:
+                raise exceptions.VShieldException(
+                    reason=_("rule %(rule)s is not on edge %(edge)s") %
+                    {'rule': location, 'edge': self.vse.get_edgeId()})
+            uri += '?aboveRuleId={0}'.format(above)
+        return uri
 
     def create_rule(self, context, rule, location=None):
         request = self.fwaas2vsmRule(context, rule)
-        uri = self.uriprefix + '/config/rules'
-        header, response = self.vse.vsmconfig('POST', uri, request, decode=False)
+        uri = self.__rules_uri(context, location)
+        header, response = self.vse.vsmconfig('POST', uri, request,
+                                              wait=True, decode=False)
         objuri = header['location']
         ruleId = objuri[objuri.rfind("/")+1:]
-        uuid2vseid = RuleUuid2Vseid(uuid=rule['id'], vseid=ruleId)
-        context.session.add(uuid2vseid)
+        self.rule_vseids.add(context, rule['id'], ruleId)
+        return response
+
+    def __user_rules(self):
+        """The rules of the edge firewall, but its default and internal
+        ones."""
+        config = self.get_vsm_fw_config() or {}
+        return [vsmRule for vsmRule in
+                (config.get('firewallRules') or {}).get(
+                    'firewallRules') or []
+                if vsmRule.get('ruleType', 'user') == 'user']
+
+    def create_rules(self, context, rules, location=None):
+        """Create rules on the edge firewall in one request.
+
+        The rules go right above the rule location when given, after the
+        last rule otherwise. The edge only returns the location of the
+        last new rule, or of the job creating them, so the ids of the
+        rules are read back from the firewall config once the request is
+        done: the new rules are the ones which were not there before it,
+        told apart by their names. Rules without a name of their own in
+        the request are created one by one instead, and the new rules are
+        deleted from the edge again if they are not all found.
+        """
+        names = [rule['name'] for rule in rules]
+        if len(rules) == 1 or not all(names) or len(set(names)) < len(names):
+            for rule in rules:
+                self.create_rule(context, rule, location)
+            return
+        uri = self.__rules_uri(context, location)
+        before = set(unicode(vsmRule['ruleId'])
+                     for vsmRule in self.__user_rules())
+        request = {
+            "firewallRules": self.fwaas2vsmRules(context, rules)
+        }
+        # the rules are only in the config once their job completes
+        header, response = self.vse.vsmconfig('POST', uri, request,
+                                              wait=True, decode=False)
+        created = {}
+        for vsmRule in self.__user_rules():
+            ruleId = unicode(vsmRule['ruleId'])
+            if ruleId not in before:
+                created.setdefault(vsmRule.get('name'), []).append(ruleId)
+        found = [created.get(name) or [] for name in names]
+        if any(len(ruleIds) != 1 for ruleIds in found):
+            self.__delete_posted(found)
+            raise exceptions.VShieldException(
+                reason=_("rules created on edge %s not found in its "
+                         "firewall config") % self.vse.get_edgeId())
+        for rule, ruleIds in zip(rules, found):
+            self.rule_vseids.add(context, rule['id'], ruleIds[0])
+
+    def __delete_posted(self, found):
+        """Delete the rules of a create_rules request which could not all
+        be found on the edge.
+
+        found lists the ids of the new rules with the name of each rule
+        sent; only the rules found alone under their name are known to be
+        ours and deleted.
+        """
+        posted = [ruleIds[0] for ruleIds in reversed(found)
+                  if len(ruleIds) == 1]
+        for ruleId in posted:
+            uri = self.uriprefix + "/config/rules/{0}".format(ruleId)
+            try:
+                self.vse.vsmconfig('DELETE', uri)
+            except Exception:
+                LOG.exception(_("Failed to delete rule %(rule)s from edge "
+                                "%(edge)s"),
+                              {'rule': ruleId,
+                               'edge': self.vse.get_edgeId()})
+        if len(posted) < len(found):
+            LOG.error(_("%(count)d rules created on edge %(edge)s could "
+                        "not be found to be deleted"),
+                      {'count': len(found) - len(posted),
+                       'edge': self.vse.get_edgeId()})
+
+    def update_rule(self, context, rule):
+        ruleId = self.rule_vseids.get(context, rule['id'])
+        request = self.fwaas2vsmRule(context, rule)['firewallRules'][0]
+        uri = self.uriprefix + "/config/rules/{0}".format(ruleId)
+        header, response = self.vse.vsmconfig('PUT', uri, request,
+                                              wait=True)
         return response
 
+    def get_vsm_fw_config(self):
+        uri = self.uriprefix + '/config'
+        return self.vse.api('GET', uri)
+
+    def __repair(self, drift, method, context, rule, *args):
+        try:
+            with context.session.begin(subtransactions=True):
+                method(context, rule, *args)
+            drift['repaired'] += 1
+        except Exception:
+            LOG.exception(_("Failed to repair rule %(rule)s on edge "
+                            "%(edge)s"),
+                          {'rule': rule['id'], 'edge': self.vse.get_edgeId()})
+
+    def check_rules(self, context, rules):
+        """Repair the firewall rules which drifted on the edge.
+
+        rules are the rule dicts of every tenant served by the edge, in the
+        order they apply in. The rules missing on the edge are created
+        again at their place and the ones which differ are updated; user
+        rules on the edge which quantum does not know about are only
+        counted. Returns the drift counters.
+        """
+        config = self.get_vsm_fw_config() or {}
+        drift = {'missing': 0, 'changed': 0, 'orphaned': 0, 'repaired': 0}
+
+        desired = {}
+        rules_by_vseid = {}
+        vseids = self.rule_vseids.get_many(
+            context, [rule['id'] for rule in rules])
+        lost = set()
+        for rule in rules:
+            vseid = vseids.get(rule['id'])
+            if vseid is None:
+                drift['missing'] += 1
+                lost.add(rule['id'])
+                continue
+            desired[vseid] = self.fwaas2vsmRule(
+                context, rule)['firewallRules'][0]
+            rules_by_vseid[vseid] = rule
+        # the default and internal rules of the edge are not ours
+        actual = dict(
+            (unicode(vsmRule['ruleId']), vsmRule)
+            for vsmRule in (config.get('firewallRules') or {}).get(
+                'firewallRules') or []
+            if vsmRule.get('ruleType', 'user') == 'user')
+        missing, changed, orphaned = resync.diff(desired, actual)
+        drift['missing'] += len(missing)
+        drift['changed'] += len(changed)
+        drift['orphaned'] += len(orphaned)
+        for vseid in missing:
+            self.rule_vseids.delete(context, rules_by_vseid[vseid]['id'])
+            lost.add(rules_by_vseid[vseid]['id'])
+        for vseid in changed:
+            self.__repair(drift, self.update_rule, context,
+                          rules_by_vseid[vseid])
+        self.__recreate(drift, context, rules, lost)
+        return drift
+
+    def __recreate(self, drift, context, rules, missing):
+        """Create the missing rules again, each right above the next rule
+        of its tenant which is on the edge so that the rules apply in
+        their order."""
+        above = tenant_id = None
+        for rule in reversed(rules):
+            if rule.get('tenant_id') != tenant_id:
+                above, tenant_id = None, rule.get('tenant_id')
+            if rule['id'] not in missing:
+                above = rule['id']
+                continue
+            self.__repair(drift, self.create_rule, context, rule, above)
+            if self.rule_vseids.get(context, rule['id']) is not None:
+                above = rule['id']
+
     def delete_rule(self, context, rule):
-        ruleId = uuid2vseid(context, rule['id'], RuleUuid2Vseid)
+        ruleId = self.rule_vseids.get(context, rule['id'])
         uri = self.uriprefix + "/config/rules/{0}".format(ruleId)
-        header, response = self.vse.vsmconfig('DELETE', uri)
+        header, response = self.vse.vsmconfig('DELETE', uri, wait=True)
+        self.rule_vseids.forget(rule['id'])
 
     def fwaas2vsmIpset(self, ipset):
         ipset = {
@@ -203,18 +418,60 @@ class FirewallAPI():
         }
         return ipset
 
+    def __shared(self, context, kind, **kwargs):
+        query = context.session.query(GroupingObject).filter_by(
+            edge_id=self.vse.get_edgeId(), kind=kind, **kwargs)
+        return query.with_lockmode('update').first()
+
+    def __acquire(self, context, kind, digest):
+        """Take a reference to the edge object of a kind with a digest,
+        returns its id or None if there is none yet."""
+        shared = self.__shared(context, kind, digest=digest)
+        if shared is None:
+            return None
+        shared.refcount += 1
+        return shared.vseid
+
+    def __share(self, context, kind, digest, vseid):
+        context.session.add(GroupingObject(
+            edge_id=self.vse.get_edgeId(), kind=kind, digest=digest,
+            vseid=vseid, refcount=1))
+
+    def __release(self, context, kind, vseid):
+        """Drop a reference to an edge object, returns whether it is no
+        longer used."""
+        shared = self.__shared(context, kind, vseid=vseid)
+        if shared is None:
+            # created before edge objects were shared
+            return True
+        shared.refcount -= 1
+        if shared.refcount > 0:
+            return False
+        context.session.delete(shared)
+        return True
+
     def create_ipset(self, context, ipobj):
+        digest = ipset_digest(ipobj)
+        ipsetId = self.__acquire(context, 'ipset', digest)
+        if ipsetId is not None:
+            LOG.debug(_("ip object %(ipobj)s shares ip set %(ipset)s"),
+                      {'ipobj': ipobj['id'], 'ipset': ipsetId})
+            self.ipobj_vseids.add(context, ipobj['id'], ipsetId)
+            return None
         request = self.fwaas2vsmIpset(ipobj)
         uri = self.ipseturi + "/{0}".format(self.vse.get_edgeId())
         header, response = self.vse.vsmconfig('POST', uri, request, decode=False)
         objuri = header['location']
         ipsetId = objuri[objuri.rfind("/")+1:]
-        uuid2vseid = IPObjUuid2Vseid(uuid=ipobj['id'], vseid=ipsetId)
-        context.session.add(uuid2vseid)
+        self.__share(context, 'ipset', digest, ipsetId)
+        self.ipobj_vseids.add(context, ipobj['id'], ipsetId)
         return response
 
     def delete_ipset(self, context, ipobj):
-        ipsetId = uuid2vseid(context, ipobj['id'], IPObjUuid2Vseid)
+        ipsetId = self.ipobj_vseids.get(context, ipobj['id'])
+        self.ipobj_vseids.forget(ipobj['id'])
+        if not self.__release(context, 'ipset', ipsetId):
+            return
         uri = self.ipseturi + "/{0}".format(ipsetId)
         header, response = self.vse.vsmconfig('DELETE', uri)
 
@@ -237,17 +494,27 @@ class FirewallAPI():
         return app
 
     def create_application(self, context, svcobj):
+        digest = application_digest(svcobj)
+        appId = self.__acquire(context, 'application', digest)
+        if appId is not None:
+            LOG.debug(_("service object %(svcobj)s shares application "
+                        "%(app)s"), {'svcobj': svcobj['id'], 'app': appId})
+            self.serviceobj_vseids.add(context, svcobj['id'], appId)
+            return None
         request = self.fwaas2vsmApp(svcobj)
         uri = self.appuri + "/{0}".format(self.vse.get_edgeId())
         header, response = self.vse.vsmconfig('POST', uri, request, decode=False)
         objuri = header['location']
         appId = objuri[objuri.rfind("/")+1:]
-        uuid2vseid = ServiceObjUuid2Vseid(uuid=svcobj['id'], vseid=appId)
-        context.session.add(uuid2vseid)
+        self.__share(context, 'application', digest, appId)
+        self.serviceobj_vseids.add(context, svcobj['id'], appId)
         return response
 
     def delete_application(self, context, svcobj):
-        appId = uuid2vseid(context, svcobj['id'], ServiceObjUuid2Vseid)
+        appId = self.serviceobj_vseids.get(context, svcobj['id'])
+        self.serviceobj_vseids.forget(svcobj['id'])
+        if not self.__release(context, 'application', appId):
+            return
         uri = self.appuri + "/{0}".format(appId)
         header, response = self.vse.vsmconfig('DELETE', uri)
 
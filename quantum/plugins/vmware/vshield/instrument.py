@@ -0,0 +1,262 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bisect
+import json
+import logging as std_logging
+import random
+import re
+import threading
+
+from oslo.config import cfg
+
+from quantum.openstack.common import log as logging
+from quantum.plugins.vmware.vshield.common import config  # noqa
+
+LOG = logging.getLogger(__name__)
+
+# upper bounds in milliseconds of the latency histogram buckets, the last
+# bucket counts everything slower
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# fields whose values never go to the log
+SECRET_FIELDS = frozenset(['psk', 'password', 'authorization', 'privatekey',
+                           'privateKey'])
+REDACTED = '***'
+MAX_LOGGED_BODY = 2048
+
+# object ids in an URI, e.g. 42 or virtualServer-3
+_ID_SEGMENT = re.compile(r'^(\d+|[A-Za-z]+-\d+)$')
+
+
+def endpoint(uri, edge_id=None):
+    """Return the URI with the object ids replaced by placeholders.
+
+    The requests to every pool of every edge are then counted as requests
+    to the same endpoint.
+    """
+    segments = []
+    for segment in uri.split('?', 1)[0].split('/'):
+        if edge_id and segment == edge_id:
+            segment = '{edge}'
+        elif _ID_SEGMENT.match(segment):
+            segment = '{id}'
+        segments.append(segment)
+    return '/'.join(segments)
+
+
+def redact(obj):
+    """Return a copy of obj with the values of the secret fields hidden."""
+    if isinstance(obj, dict):
+        return dict((key, REDACTED if key in SECRET_FIELDS else redact(value))
+                    for key, value in obj.iteritems())
+    if isinstance(obj, list):
+        return [redact(value) for value in obj]
+    return obj
+
+
+def _loggable(body):
+    if not body:
+        return ''
+    try:
+        text = json.dumps(redact(json.loads(body)))
+    except ValueError:
+        # not JSON, we can't tell whether it holds secrets
+        return '<%d bytes>' % len(body)
+    if len(text) > MAX_LOGGED_BODY:
+        text = text[:MAX_LOGGED_BODY] + '...'
+    return text
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """Upper bound of the bucket holding the percentile."""
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        return {'buckets': dict(zip([str(bound) for bound in self.buckets] +
+                                    ['inf'], self.counts)),
+                'count': self.count,
+                'sum': self.total,
+                'max': self.max,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99)}
+
+
+class EndpointMetrics(object):
+    """Metrics of the requests to one endpoint of an edge.
+
+    Requests, statuses and retries are counted for every request; the
+    latency and payload sizes only for the sampled ones.
+    """
+
+    def __init__(self, method, endpoint):
+        self.method = method
+        self.endpoint = endpoint
+        self.requests = 0
+        self.retries = 0
+        self.statuses = {}
+        self.sampled = 0
+        self.latency = Histogram()
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def to_dict(self):
+        return {'method': self.method,
+                'endpoint': self.endpoint,
+                'requests': self.requests,
+                'retries': self.retries,
+                'statuses': dict(self.statuses),
+                'sampled': self.sampled,
+                'latency_ms': self.latency.to_dict(),
+                'request_bytes': self.request_bytes,
+                'response_bytes': self.response_bytes}
+
+
+class Instrumentation(object):
+    """Records the requests sent to vShield Manager for every edge.
+
+    A sample_rate share of the requests have their latency and payload
+    sizes recorded, and their redacted bodies logged at debug level.
+    """
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        # edge id -> {(method, endpoint): EndpointMetrics}
+        self.edges = {}
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """Return whether the next request is sampled."""
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(self, edge_id, method, uri, status, retries, elapsed=None,
+               request=None, response=None):
+        """Record a request, elapsed is None when it was not sampled.
+
+        status is the HTTP status of the last response, 'error' if no
+        response was received and 'unavailable' if the circuit breaker of
+        the edge did not let the request through.
+        """
+        key = (method, endpoint(uri, edge_id))
+        with self._lock:
+            metrics = self.edges.setdefault(edge_id, {}).get(key)
+            if metrics is None:
+                metrics = self.edges[edge_id][key] = EndpointMetrics(*key)
+            metrics.requests += 1
+            metrics.retries += retries
+            status = str(status)
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            if elapsed is not None:
+                metrics.sampled += 1
+                metrics.latency.observe(elapsed * 1000)
+                metrics.request_bytes += len(request or '')
+                metrics.response_bytes += len(response or '')
+        if elapsed is not None and LOG.isEnabledFor(std_logging.DEBUG):
+            LOG.debug(_("VSM %(method)s %(uri)s: %(status)s in %(elapsed)d "
+                        "ms after %(retries)d retries, request %(request)s, "
+                        "response %(response)s"),
+                      {'method': method, 'uri': uri, 'status': status,
+                       'elapsed': elapsed * 1000, 'retries': retries,
+                       'request': _loggable(request),
+                       'response': _loggable(response)})
+
+    def get_metrics(self, edge_id=None):
+        """Return {edge id: [endpoint metrics]}, slowest endpoints first.
+
+        The endpoints are sorted by the total time spent in their sampled
+        requests.
+        """
+        with self._lock:
+            edges = dict((edge, [metrics.to_dict()
+                                 for metrics in endpoints.values()])
+                         for edge, endpoints in self.edges.iteritems()
+                         if edge_id is None or edge == edge_id)
+        for endpoints in edges.values():
+            endpoints.sort(key=lambda metrics: metrics['latency_ms']['sum'],
+                           reverse=True)
+        return edges
+
+    def reset(self):
+        with self._lock:
+            self.edges.clear()
+
+
+_instrumentation = None
+
+
+def get_instrumentation():
+    """Return the instrumentation shared by every VseAPI."""
+    global _instrumentation
+    if _instrumentation is None:
+        _instrumentation = Instrumentation(
+            cfg.CONF.vshield.metrics_sample_rate)
+    return _instrumentation
+
+
+def forget_instrumentation():
+    """Drop the metrics, this process records its own from now on."""
+    global _instrumentation
+    _instrumentation = None
+
+
+class VShieldMetricsMixin(object):
+    """Serves the vshield-metrics extension from a service plugin."""
+
+    def _make_metrics_dict(self, edge_id, endpoints, fields=None):
+        instrumentation = get_instrumentation()
+        res = {'id': edge_id,
+               'requests': sum(e['requests'] for e in endpoints),
+               'retries': sum(e['retries'] for e in endpoints),
+               'sample_rate': instrumentation.sample_rate,
+               'endpoints': endpoints}
+        if fields:
+            res = dict((key, value) for key, value in res.iteritems()
+                       if key in fields)
+        return res
+
+    def get_vshield_metrics(self, context, filters=None, fields=None):
+        edges = get_instrumentation().get_metrics()
+        ids = (filters or {}).get('id')
+        return [self._make_metrics_dict(edge_id, endpoints, fields)
+                for edge_id, endpoints in sorted(edges.iteritems())
+                if not ids or edge_id in ids]
+
+    def get_vshield_metric(self, context, id, fields=None):
+        return self._make_metrics_dict(
+            id, get_instrumentation().get_metrics(id).get(id, []), fields)
@@ -0,0 +1,259 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import json
+import threading
+import time
+
+import eventlet
+from eventlet import corolocal
+from eventlet import event
+from oslo.config import cfg
+
+from quantum.openstack.common import log as logging
+from quantum.plugins.vmware.vshield.common import config  # noqa
+from quantum.plugins.vmware.vshield.common import exceptions
+
+LOG = logging.getLogger(__name__)
+
+JOB_COMPLETED = 'COMPLETED'
+JOB_FAILED = frozenset(['FAILED', 'ROLLBACK', 'TIMEOUT'])
+
+_local = corolocal.local()
+
+
+def job_id(header):
+    """Return the id of the job a change was accepted as, or None.
+
+    vShield Manager answers 202 with the job in the location header when
+    it queues a change instead of applying it before responding.
+    """
+    if str(header.get('status')) != '202':
+        return None
+    location = header.get('location') or ''
+    if '/jobs/' not in location:
+        return None
+    return location.rstrip('/').rsplit('/', 1)[1]
+
+
+@contextlib.contextmanager
+def collect_jobs():
+    """Gather the futures of the jobs the changes made within the block
+    are accepted as, in the list it is given.
+
+    API requests do not wait for the jobs of their changes, the objects
+    they change are completed once the jobs end.
+    """
+    previous = getattr(_local, 'futures', None)
+    _local.futures = futures = []
+    try:
+        yield futures
+    finally:
+        _local.futures = previous
+
+
+def collect_job(future):
+    """Add a job future to the collect_jobs block of the caller, if any.
+
+    Without one a failed job is only logged by the poller.
+    """
+    futures = getattr(_local, 'futures', None)
+    if futures is not None:
+        futures.append(future)
+
+
+class JobFuture(object):
+    """The outcome of a job, known once the poller has seen it end."""
+
+    def __init__(self, job_id, edge_id, deadline):
+        self.job_id = job_id
+        self.edge_id = edge_id
+        self.deadline = deadline
+        self.status = None
+        self._event = event.Event()
+
+    def done(self):
+        return self._event.ready()
+
+    def finish(self, status, exc=None):
+        self.status = status
+        if exc is None:
+            self._event.send(status)
+        else:
+            self._event.send_exception(exc)
+
+    def wait(self, timeout=None):
+        """Block until the job ends, raises VsmJobFailed unless it
+        completed.
+
+        Gives up once timeout seconds have passed, by default when the
+        deadline of the job is reached, whether the poller saw the job
+        end or not.
+        """
+        if timeout is None:
+            timeout = max(self.deadline - time.time(), 0)
+        with eventlet.Timeout(timeout, False):
+            return self._event.wait()
+        raise exceptions.VsmJobFailed(job_id=self.job_id,
+                                      edge_id=self.edge_id, status='TIMEOUT')
+
+
+class JobPoller(object):
+    """Polls the jobs of one edge until they end.
+
+    Every job pending on the edge is read with a single request per poll.
+    Polls start interval seconds apart; the interval doubles up to
+    max_interval while no job ends and starts over when one does, or when
+    a new job is registered. The poller only runs while jobs are pending.
+    """
+
+    def __init__(self, vse, interval, max_interval, timeout):
+        self.vse = vse
+        self.edge_id = vse.get_edgeId()
+        self.min_interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.interval = interval
+        # job id -> JobFuture
+        self._jobs = {}
+        self._running = False
+        self._lock = threading.Lock()
+
+    def register(self, job_id):
+        """Return the future of a job, polled until it ends."""
+        with self._lock:
+            future = self._jobs.get(job_id)
+            if future is None:
+                future = JobFuture(job_id, self.edge_id,
+                                   time.time() + self.timeout)
+                self._jobs[job_id] = future
+            self.interval = self.min_interval
+            start = not self._running
+            self._running = True
+        if start:
+            eventlet.spawn_n(self._run)
+        return future
+
+    def pending(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def _run(self):
+        while True:
+            eventlet.sleep(self.interval)
+            with self._lock:
+                if not self._jobs:
+                    self._running = False
+                    return
+            try:
+                ended = self.poll()
+            except Exception:
+                LOG.exception(_("Failed to poll the jobs of edge %s"),
+                              self.edge_id)
+                ended = 0
+            with self._lock:
+                if ended:
+                    self.interval = self.min_interval
+                else:
+                    self.interval = min(self.interval * 2, self.max_interval)
+
+    def _get(self, uri):
+        header, content = self.vse.send('GET', uri)
+        return json.loads(content) if content else {}
+
+    def _get_statuses(self, job_ids):
+        uri = '/api/4.0/edges/{0}/jobs?status=all'.format(self.edge_id)
+        statuses = dict((job['jobId'], job.get('status'))
+                        for job in self._get(uri).get('edgeJob') or []
+                        if job.get('jobId') in job_ids)
+        # jobs which aged out of the list of the edge are read one by one,
+        # one which cannot be read is left for the next poll
+        for job_id in set(job_ids) - set(statuses):
+            try:
+                job = self._get('/api/4.0/edges/jobs/{0}'.format(job_id))
+            except Exception:
+                LOG.exception(_("Failed to read job %(job)s of edge "
+                                "%(edge)s"),
+                              {'job': job_id, 'edge': self.edge_id})
+                continue
+            statuses[job_id] = job.get('status')
+        return statuses
+
+    def poll(self):
+        """Read the status of the pending jobs, returns how many ended.
+
+        The jobs past their deadline end with a TIMEOUT status even when
+        their status could not be read.
+        """
+        with self._lock:
+            jobs = dict(self._jobs)
+        if not jobs:
+            return 0
+        try:
+            statuses = self._get_statuses(jobs.keys())
+        except Exception:
+            LOG.exception(_("Failed to poll the jobs of edge %s"),
+                          self.edge_id)
+            statuses = {}
+        now = time.time()
+        ended = 0
+        for job_id, future in jobs.iteritems():
+            status = statuses.get(job_id)
+            if status not in JOB_FAILED and status != JOB_COMPLETED:
+                if now < future.deadline:
+                    continue
+                status = 'TIMEOUT'
+            with self._lock:
+                del self._jobs[job_id]
+            ended += 1
+            if status == JOB_COMPLETED:
+                future.finish(status)
+                continue
+            LOG.warn(_("Job %(job)s on edge %(edge)s ended with status "
+                       "%(status)s"),
+                     {'job': job_id, 'edge': self.edge_id, 'status': status})
+            future.finish(status, exceptions.VsmJobFailed(
+                job_id=job_id, edge_id=self.edge_id, status=status))
+        return ended
+
+
+_pollers = {}
+_pollers_lock = threading.Lock()
+
+
+def get_job_poller(vse):
+    """Return the job poller shared by every VseAPI of an edge."""
+    key = (vse.vsmapi.url, vse.get_edgeId())
+    with _pollers_lock:
+        poller = _pollers.get(key)
+        if poller is None:
+            poller = JobPoller(vse,
+                               cfg.CONF.vshield.job_poll_interval,
+                               cfg.CONF.vshield.job_poll_max_interval,
+                               cfg.CONF.vshield.job_timeout)
+            _pollers[key] = poller
+        return poller
+
+
+def forget_job_pollers():
+    """Drop the job pollers, new ones are made for this process.
+
+    Meant for a forked process: the jobs registered with the pollers it
+    inherited are polled and waited for in its parent.
+    """
+    with _pollers_lock:
+        _pollers.clear()
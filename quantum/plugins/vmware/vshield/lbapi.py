@@ -7,7 +7,13 @@ import sqlalchemy as sa
 from sqlalchemy import orm
 from quantum.db import api as qdbapi
 from quantum.db import model_base
-from quantum.db.loadbalancer.loadbalancer_db import Pool
+from quantum.db.loadbalancer import loadbalancer_db  # noqa
+from quantum.openstack.common import log as logging
+from quantum.plugins.common import constants
+import resync
+from vseids import get_vseid_map
+
+LOG = logging.getLogger(__name__)
 
 
 class PoolUuid2Vseid(model_base.BASEV2):
@@ -26,38 +32,18 @@ class VipUuid2Vseid(model_base.BASEV2):
     vseid = sa.Column(sa.String(36), nullable=False)
 
 
-def getuuid2vseid(context, uuid, model):
-    query = context.session.query(model)
-    query = query.filter(model.uuid == uuid)
-    if query.count() == 0:
-        return None
-    return query.one()
-
-
-def uuid2vseid(context, uuid, model):
-    uuid2vseid = getuuid2vseid(context, uuid, model)
-    if uuid2vseid is None:
-        return None
-    return uuid2vseid.vseid
-
-
-def deluuid2vseid(context, uuid, model):
-    uuid2vseid = getuuid2vseid(context, uuid, model)
-    if uuid2vseid is None:
-        raise Exception("{0} id for {1} not found".format(
-            model.__name__, uuid))
-    context.session.delete(uuid2vseid)
-
-
-def getobj(context, model, id):
-    query = context.session.query(model)
-    return query.filter(model.id == id).one()
+def live_members(pool):
+    """The members of a pool which are not being deleted."""
+    return [member for member in pool['members']
+            if member['status'] != constants.PENDING_DELETE]
 
 
 class LoadBalancerAPI():
     def __init__(self, vse):
         qdbapi.register_models(base=model_base.BASEV2)
         self.vse = vse
+        self.pool_vseids = get_vseid_map(PoolUuid2Vseid)
+        self.vip_vseids = get_vseid_map(VipUuid2Vseid)
 #        self.uriprefix = '/api/3.0/edges/{0}/loadbalancer'.format(
         self.uriprefix = '/api/4.0/edges/{0}/loadbalancer'.format(
             vse.get_edgeId())
@@ -88,7 +74,7 @@ class LoadBalancerAPI():
             'algorithm': pool['lb_method'],
             'member': []
         }
-        for member in pool['members']:
+        for member in live_members(pool):
             vsepool['member'].append({
                 'ipAddress': member['address'],
                 'port': member['protocol_port']
@@ -96,8 +82,7 @@ class LoadBalancerAPI():
         return vsepool
 
     def lbaas2vsmVSv3(self, context, vip):
-        print vip
-        vseid = uuid2vseid(context, vip['pool_id'], PoolUuid2Vseid)
+        vseid = self.pool_vseids.get(context, vip['pool_id'])
         if vseid is None:
             raise Exception("pool id for {0} not found".format(vip['pool_id']))
         vs = {
@@ -114,7 +99,7 @@ class LoadBalancerAPI():
         return vs
 
     def lbaas2vsmVS(self, context, vip):
-        vseid = uuid2vseid(context, vip['pool_id'], PoolUuid2Vseid)
+        vseid = self.pool_vseids.get(context, vip['pool_id'])
         if vseid is None:
             raise Exception("pool id for {0} not found".format(vip['pool_id']))
         vs = {
@@ -127,17 +112,18 @@ class LoadBalancerAPI():
         return vs
 
     def get_vip_vseid(self, context, uuid):
-        return uuid2vseid(context, uuid, VipUuid2Vseid)
+        return self.vip_vseids.get(context, uuid)
 
     def get_pool_vseid(self, context, uuid):
-        return uuid2vseid(context, uuid, PoolUuid2Vseid)
+        return self.pool_vseids.get(context, uuid)
 
     def __pool_ready(self, pool):
-        return len(pool['members']) > 0
+        return len(live_members(pool)) > 0
 
     def create_pool(self, context, pool):
         if not self.__pool_ready(pool):
-            print "no member. skip pool created"
+            LOG.debug(_("Pool %s has no member, not created on the "
+                        "edge yet"), pool['id'])
             return None
         request = self.lbaas2vsmPool(pool)
         uri = self.uriprefix + '/config/pools'
@@ -153,13 +139,11 @@ class LoadBalancerAPI():
                 self.__reconfigure(config)
                 self.enabled = True
 
-        uuid2vseid = PoolUuid2Vseid(uuid=pool['id'], vseid=poolId)
-        context.session.add(uuid2vseid)
-        print "create_pool: response '{0}'".format(response)
+        self.pool_vseids.add(context, pool['id'], poolId)
         return response
 
     def update_pool(self, context, pool):
-        vseid = uuid2vseid(context, pool['id'], PoolUuid2Vseid)
+        vseid = self.pool_vseids.get(context, pool['id'])
         if vseid is None:
             raise Exception("pool id for {0} not found".format(pool['id']))
         uri = self.uriprefix + '/config/pools/{0}'.format(vseid)
@@ -168,9 +152,9 @@ class LoadBalancerAPI():
         return response
 
     def delete_pool(self, context, pool):
-        vseid = uuid2vseid(context, pool['id'], PoolUuid2Vseid)
+        vseid = self.pool_vseids.get(context, pool['id'])
         if vseid is None:
-            print "VSM pool obj not exist for {0}".format(pool['id'])
+            LOG.debug(_("Pool %s is not on the edge"), pool['id'])
             return
         uri = self.uriprefix + '/config/pools/{0}'.format(vseid)
         response = None
@@ -178,52 +162,37 @@ class LoadBalancerAPI():
             header, response = self.vse.vsmconfig('DELETE', uri)
         except Exception:
             pass
-        deluuid2vseid(context, pool['id'], PoolUuid2Vseid)
+        self.pool_vseids.delete(context, pool['id'])
         return response
 
-    def __update_pool(self, context, pool):
-        vseid = uuid2vseid(context, pool['id'], PoolUuid2Vseid)
-        if vseid is None:
+    def sync_pool(self, context, pool):
+        """Push a pool with all its members in one request.
+
+        The edge takes no empty pool: the pool is created on the edge with
+        its first member and removed from it with its last one.
+        """
+        if not self.__pool_ready(pool):
+            return self.delete_pool(context, pool)
+        if self.pool_vseids.get(context, pool['id']) is None:
             return self.create_pool(context, pool)
         return self.update_pool(context, pool)
 
-    def __delete_pool(self, context, pool):
-        return self.delete_pool(context, pool)
-
-    def __update_member_pool(self, context, member):
-        pool = getobj(context, Pool, member['pool_id'])
-        if self.__pool_ready(pool):
-            return self.__update_pool(context, pool)
-        else:
-            return self.__delete_pool(context, pool)
-
-    def create_member(self, context, member):
-        return self.__update_member_pool(context, member)
-
-    def update_member(self, context, member):
-        return self.__update_member_pool(context, member)
-
-    def delete_member(self, context, member):
-        return self.__update_member_pool(context, member)
-
     def create_vip(self, context, vip):
         uri = self.uriprefix + '/config/virtualservers'
         request = self.lbaas2vsmVS(context, vip)
         header, response = self.vse.vsmconfig('POST', uri, request)
         objuri = header['location']
         vsId = objuri[objuri.rfind("/")+1:]
-        uuid2vseid = VipUuid2Vseid(uuid=vip['id'], vseid=vsId)
-        context.session.add(uuid2vseid)
+        self.vip_vseids.add(context, vip['id'], vsId)
         return response
 
     def update_vip(self, context, vip):
-        vseid = uuid2vseid(context, vip['id'], VipUuid2Vseid)
+        vseid = self.vip_vseids.get(context, vip['id'])
         if vseid is None:
             raise Exception("virtualserver id for {0} not found".format(
                 vip['id']))
         request = self.lbaas2vsmVS(context, vip)
         uri = self.uriprefix + '/config/virtualservers/{0}'.format(vseid)
-        request = self.quantum2VSM(vs, self.VirtualServerAttrs)
         response = self.vse.api('PUT', uri, request)
         return response
 
@@ -234,8 +203,93 @@ class LoadBalancerAPI():
                 vip['id']))
         uri = self.uriprefix + '/config/virtualservers/{0}'.format(vseid)
         response = self.vse.api('DELETE', uri)
+        self.vip_vseids.forget(vip['id'])
         return response
 
+    @staticmethod
+    def __sorted_members(vsepool):
+        # the edge does not keep the members in the order they were sent
+        vsepool['member'] = sorted(
+            vsepool.get('member') or [],
+            key=lambda m: (m.get('ipAddress'), unicode(m.get('port'))))
+        return vsepool
+
+    def __repair(self, drift, method, context, obj):
+        try:
+            with context.session.begin(subtransactions=True):
+                method(context, obj)
+            drift['repaired'] += 1
+        except Exception:
+            LOG.exception(_("Failed to repair %(obj)s on edge %(edge)s"),
+                          {'obj': obj['id'], 'edge': self.vse.get_edgeId()})
+
+    def check_config(self, context, pools, vips):
+        """Repair the pools and virtual servers which drifted on the edge.
+
+        pools are the Pool models and vips the vip dicts of all the objects
+        served by the edge. The objects missing on the edge are created
+        again and the ones which differ are updated; the objects on the
+        edge which quantum does not know about are only counted. Returns
+        the drift counters.
+        """
+        config = self.get_vsm_lb_config() or {}
+        drift = {'missing': 0, 'changed': 0, 'orphaned': 0, 'repaired': 0}
+
+        desired = {}
+        pools_by_vseid = {}
+        for pool in pools:
+            if not self.__pool_ready(pool):
+                continue
+            vseid = self.pool_vseids.get(context, pool['id'])
+            if vseid is None:
+                drift['missing'] += 1
+                self.__repair(drift, self.create_pool, context, pool)
+                continue
+            desired[vseid] = self.__sorted_members(self.lbaas2vsmPool(pool))
+            pools_by_vseid[vseid] = pool
+        actual = dict((vsepool['poolId'], self.__sorted_members(vsepool))
+                      for vsepool in config.get('pool') or [])
+        missing, changed, orphaned = resync.diff(desired, actual)
+        drift['missing'] += len(missing)
+        drift['changed'] += len(changed)
+        drift['orphaned'] += len(orphaned)
+        for vseid in missing:
+            pool = pools_by_vseid[vseid]
+            self.pool_vseids.delete(context, pool['id'])
+            self.__repair(drift, self.create_pool, context, pool)
+        for vseid in changed:
+            self.__repair(drift, self.update_pool, context,
+                          pools_by_vseid[vseid])
+
+        # built after the pools are repaired, since the virtual servers
+        # refer to the pool ids on the edge
+        desired = {}
+        vips_by_vseid = {}
+        for vip in vips:
+            if self.pool_vseids.get(context, vip['pool_id']) is None:
+                continue
+            vseid = self.vip_vseids.get(context, vip['id'])
+            if vseid is None:
+                drift['missing'] += 1
+                self.__repair(drift, self.create_vip, context, vip)
+                continue
+            desired[vseid] = self.lbaas2vsmVS(context, vip)
+            vips_by_vseid[vseid] = vip
+        actual = dict((vs['virtualServerId'], vs)
+                      for vs in config.get('virtualServer') or [])
+        missing, changed, orphaned = resync.diff(desired, actual)
+        drift['missing'] += len(missing)
+        drift['changed'] += len(changed)
+        drift['orphaned'] += len(orphaned)
+        for vseid in missing:
+            vip = vips_by_vseid[vseid]
+            self.vip_vseids.delete(context, vip['id'])
+            self.__repair(drift, self.create_vip, context, vip)
+        for vseid in changed:
+            self.__repair(drift, self.update_vip, context,
+                          vips_by_vseid[vseid])
+        return drift
+
     def get_vsm_lb_config(self):
         uri = self.uriprefix + '/config'
         return self.vse.api('GET', uri)
@@ -15,7 +15,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import functools
 
+import eventlet
+from oslo.config import cfg
+
+from quantum import context as q_context
 from quantum.db import api as qdbapi
 from quantum.db import model_base
 from quantum.db.loadbalancer import loadbalancer_db
@@ -23,19 +29,23 @@ from quantum.db import firewall_db as fw_db
 from quantum.extensions import loadbalancer
 from quantum.openstack.common import log as logging
 from quantum.plugins.common import constants
-from vseapi import VseAPI
+from batch import PoolBatcher
+import edgesession
+from edges import forget_process_state
+from edges import load_edge_registry
+from instrument import VShieldMetricsMixin
+from jobs import collect_jobs
 from lbapi import LoadBalancerAPI
 from fwapi import FirewallAPI
+from resync import EdgeResync
+from tasks import get_task_manager
 
 LOG = logging.getLogger(__name__)
 
-edgeUri = 'https://fank-dev2.eng.vmware.com'
-edgeId = 'edge-27'
-edgeUser = 'admin'
-edgePasswd = 'default'
-
 
-class VShieldEdgeLBPlugin(loadbalancer_db.LoadBalancerPluginDb):
+class VShieldEdgeLBPlugin(loadbalancer_db.LoadBalancerPluginDb,
+                          VShieldMetricsMixin,
+                          edgesession.VShieldProvisionMixin):
 
     """
     Implementation of the Quantum Loadbalancer Service Plugin.
@@ -44,16 +54,36 @@ class VShieldEdgeLBPlugin(loadbalancer_db.LoadBalancerPluginDb):
     Most DB related works are implemented in class
     loadbalancer_db.LoadBalancerPluginDb.
     """
-    supported_extension_aliases = ["lbaas"]
+    supported_extension_aliases = ["lbaas", "vshield-metrics",
+                                   "vshield-provision"]
+    # members are pushed to the edge once per pool
+    __native_bulk_support = True
 
     def __init__(self):
         """
         Do the initialization for the loadbalancer service plugin here.
         """
-        # Hard coded for now
-        vseapi = VseAPI(edgeUri, edgeUser, edgePasswd, edgeId)
-        self.vselb = LoadBalancerAPI(vseapi)
+        self.edges = load_edge_registry()
+        # edge id -> LoadBalancerAPI
+        self.lb_apis = {}
         qdbapi.register_models(base=model_base.BASEV2)
+        self.pool_batcher = PoolBatcher(get_task_manager(), self._sync_pool,
+                                        cfg.CONF.vshield.member_batch_window)
+        self.resync = EdgeResync('loadbalancer', self.edges.get_edges,
+                                 self._check_edge,
+                                 cfg.CONF.vshield.resync_interval)
+        self.resync.start()
+
+    def after_fork(self):
+        """Re-create the state of the plugin in a forked API worker.
+
+        The resync keeps running in the server process only.
+        """
+        forget_process_state()
+        self.edges.forget_vses()
+        self.lb_apis = {}
+        self.pool_batcher = PoolBatcher(get_task_manager(), self._sync_pool,
+                                        cfg.CONF.vshield.member_batch_window)
 
     def get_plugin_type(self):
         return constants.LOADBALANCER
@@ -61,15 +91,266 @@ class VShieldEdgeLBPlugin(loadbalancer_db.LoadBalancerPluginDb):
     def get_plugin_description(self):
         return "Quantum LoadBalancer Service Plugin"
 
+    def _get_lb_api(self, context, pool_id):
+        """Return the API of the edge serving a pool.
+
+        Vips and members go to the edge of their pool.
+        """
+        pool = self.get_pool(context, pool_id,
+                             fields=['tenant_id', 'subnet_id'])
+        return self._get_edge_lb_api(self._get_pool_edge(context, pool))
+
+    def _get_pool_edge(self, context, pool):
+        return self.edges.get_edge(context, tenant_id=pool['tenant_id'],
+                                   subnet_id=pool['subnet_id'])
+
+    def _get_edge_lb_api(self, edge_id):
+        lb_api = self.lb_apis.get(edge_id)
+        if lb_api is None:
+            lb_api = LoadBalancerAPI(self.edges.get_vse(edge_id))
+            self.lb_apis[edge_id] = lb_api
+        return lb_api
+
+    def _check_edge(self, edge_id):
+        """Repair the pools and vips which drifted on an edge."""
+        context = q_context.get_admin_context()
+        # pools with member changes on the way are pushed by their batch,
+        # vips waiting for their pool are created by it
+        pools = [pool for pool in context.session.query(loadbalancer_db.Pool)
+                 if pool['status'] != constants.PENDING_DELETE and
+                 not self.pool_batcher.is_pending(pool['id']) and
+                 self._get_pool_edge(context, pool) == edge_id]
+        pool_ids = set(pool['id'] for pool in pools)
+        vips = [vip for vip in self.get_vips(context)
+                if vip['pool_id'] in pool_ids and
+                vip['status'] not in (constants.PENDING_CREATE,
+                                      constants.PENDING_DELETE)]
+        return self._get_edge_lb_api(edge_id).check_config(context, pools,
+                                                           vips)
+
+    def _pool_changed(self, context, pool_id):
+        """Push the members of a pool now, or at the end of its window.
+
+        In an edge session the pool is pushed when the session ends, with
+        the context of the request so the members it has not committed yet
+        go too.
+        """
+        pool = self.get_pool(context, pool_id,
+                             fields=['tenant_id', 'subnet_id'])
+        edge_id = self._get_pool_edge(context, pool)
+        session = edgesession.current(context)
+        if session is not None:
+            self._stage_pool(context, session,
+                             self._get_edge_lb_api(edge_id), pool_id)
+        elif self.pool_batcher.window > 0:
+            self.pool_batcher.add(edge_id, pool_id)
+        else:
+            self._sync_pool(edge_id, pool_id)
+
+    def _stage_pool(self, context, session, lb_api, pool_id):
+        """Stage the push of a pool and of the vips waiting for it."""
+        # a pool the session creates on the edge is deleted again if the
+        # session fails, one the edge had already is repaired by the resync
+        undo = None
+        if lb_api.get_pool_vseid(context, pool_id) is None:
+            undo = functools.partial(self._unpush_pool, context, lb_api,
+                                     pool_id)
+        session.stage(lb_api.vse.get_edgeId(), 'pool', pool_id,
+                      functools.partial(self._push_pool, context, lb_api,
+                                        pool_id),
+                      undo=undo)
+        query = context.session.query(loadbalancer_db.Vip).filter_by(
+            pool_id=pool_id, status=constants.PENDING_CREATE)
+        for vip_db in query.all():
+            self._stage_vip(context, session, lb_api,
+                            self._make_vip_dict(vip_db))
+
+    def _push_pool(self, context, lb_api, pool_id):
+        pool = self._get_resource(context, loadbalancer_db.Pool, pool_id)
+        members = [(member['id'], member['status'])
+                   for member in pool['members']]
+        with collect_jobs() as futures:
+            lb_api.sync_pool(context, pool)
+        self._settle_after_jobs(
+            context, futures,
+            lambda context, status: self._settle_members(context, members,
+                                                         status))
+
+    @staticmethod
+    def _unpush_pool(context, lb_api, pool_id):
+        lb_api.delete_pool(context, {'id': pool_id})
+
+    def _sync_pool(self, edge_id, pool_id):
+        """Push a pool and complete the pending states of its members.
+
+        Every member change made since the last push goes in the one
+        request: PENDING_CREATE and PENDING_UPDATE members become ACTIVE
+        and PENDING_DELETE members are removed, or they all go to ERROR if
+        the edge rejects the pool or its job fails. The vips waiting for
+        the pool to be on the edge are created once it is.
+        """
+        context = q_context.get_admin_context()
+        try:
+            pool = self._get_resource(context, loadbalancer_db.Pool, pool_id)
+        except loadbalancer.PoolNotFound:
+            # deleted while its changes were waiting
+            return
+        members = [(member['id'], member['status'])
+                   for member in pool['members']]
+        lb_api = self._get_edge_lb_api(edge_id)
+        try:
+            with collect_jobs() as futures:
+                lb_api.sync_pool(context, pool)
+        except Exception:
+            LOG.exception(_("Failed to push pool %(pool)s to edge "
+                            "%(edge)s"), {'pool': pool_id, 'edge': edge_id})
+            self._settle_members(context, members, constants.ERROR)
+        else:
+            self._settle_after_jobs(
+                context, futures,
+                lambda context, status: self._settle_members(
+                    context, members, status))
+        if lb_api.get_pool_vseid(context, pool_id) is not None:
+            self._create_waiting_vips(context, lb_api, pool_id)
+
+    @staticmethod
+    def _settle_members(context, members, status):
+        """Complete the pending states of the (id, status) members."""
+        with context.session.begin(subtransactions=True):
+            for member_id, member_status in members:
+                if member_status not in (constants.PENDING_CREATE,
+                                         constants.PENDING_UPDATE,
+                                         constants.PENDING_DELETE):
+                    continue
+                # leave alone members changed again since they were read,
+                # the next push settles them
+                member_db = context.session.query(
+                    loadbalancer_db.Member).filter_by(
+                        id=member_id, status=member_status).first()
+                if member_db is None:
+                    continue
+                if (member_status == constants.PENDING_DELETE and
+                        status == constants.ACTIVE):
+                    context.session.delete(member_db)
+                else:
+                    member_db.status = status
+
+    @staticmethod
+    def _status_settler(model, id, pending):
+        """Return a settle() completing the pending status of an object,
+        left alone if it was deleted or changed again meanwhile."""
+        def settle(context, status):
+            with context.session.begin(subtransactions=True):
+                obj = context.session.query(model).filter_by(id=id).first()
+                if obj is not None and obj.status == pending:
+                    obj.status = status
+        return settle
+
+    @staticmethod
+    def _settle_after_jobs(context, futures, settle):
+        """Complete a change once the jobs it was accepted as end.
+
+        settle(context, status) gets ACTIVE, or ERROR if one of the jobs
+        failed. Without a job it is called at once with the context of
+        the request; otherwise the object stays pending, and a green
+        thread of its own calls it once the poller has seen every job end.
+        """
+        if not futures:
+            settle(context, constants.ACTIVE)
+            return
+        eventlet.spawn_n(VShieldEdgeLBPlugin._settle_jobs, futures, settle)
+
+    @staticmethod
+    def _settle_jobs(futures, settle):
+        status = constants.ACTIVE
+        for future in futures:
+            try:
+                future.wait()
+            except Exception:
+                # the poller logged how the job ended
+                status = constants.ERROR
+        try:
+            settle(q_context.get_admin_context(), status)
+        except Exception:
+            LOG.exception(_("Failed to complete a change after its jobs"))
+
+    def _create_waiting_vips(self, context, lb_api, pool_id):
+        query = context.session.query(loadbalancer_db.Vip).filter_by(
+            pool_id=pool_id, status=constants.PENDING_CREATE)
+        for vip_db in query.all():
+            vip = self._make_vip_dict(vip_db)
+            if lb_api.get_vip_vseid(context, vip['id']) is not None:
+                continue
+            try:
+                with collect_jobs() as futures:
+                    lb_api.create_vip(context, vip)
+            except Exception:
+                LOG.exception(_("Failed to create vip %s on the edge"),
+                              vip['id'])
+                self.update_status(context, loadbalancer_db.Vip, vip['id'],
+                                   constants.ERROR)
+                continue
+            self._settle_after_jobs(
+                context, futures,
+                self._status_settler(loadbalancer_db.Vip, vip['id'],
+                                     constants.PENDING_CREATE))
+
+    def _create_bulk(self, resource, context, items, **kwargs):
+        create = getattr(self, 'create_%s' % resource)
+        with context.session.begin(subtransactions=True):
+            return [create(context, item, **kwargs) for item in items]
+
+    def _create_edge_vip(self, context, lb_api, vip):
+        if (lb_api.get_vip_vseid(context, vip['id']) is not None or
+                lb_api.get_pool_vseid(context, vip['pool_id']) is None):
+            # created with its pool already, or still waiting for it
+            return
+        with collect_jobs() as futures:
+            lb_api.create_vip(context, vip)
+        self._settle_after_jobs(
+            context, futures,
+            self._status_settler(loadbalancer_db.Vip, vip['id'],
+                                 constants.PENDING_CREATE))
+
+    @staticmethod
+    def _delete_edge_vip(context, lb_api, vip):
+        vseid = lb_api.get_vip_vseid(context, vip['id'])
+        if vseid is not None:
+            lb_api.delete_vip(context, dict(vip, vseid=vseid))
+
+    def _stage_vip(self, context, session, lb_api, vip):
+        # whether the pool is on the edge is only known once the pool
+        # changes staged before are applied
+        session.stage(lb_api.vse.get_edgeId(), 'vip', vip['id'],
+                      functools.partial(self._create_edge_vip, context,
+                                        lb_api, vip),
+                      undo=functools.partial(self._delete_edge_vip, context,
+                                             lb_api, vip),
+                      after=('pool',))
+
     def create_vip(self, context, vip):
         with context.session.begin(subtransactions=True):
             v = super(VShieldEdgeLBPlugin, self).create_vip(context, vip)
             self.update_status(context, loadbalancer_db.Vip, v['id'],
                                constants.PENDING_CREATE)
             LOG.debug(_("Create vip: %s") % v['id'])
-            self.vselb.create_vip(context, v)
-            self.update_status(context, loadbalancer_db.Vip, v['id'],
-                               constants.ACTIVE)
+            lb_api = self._get_lb_api(context, v['pool_id'])
+            waiting = lb_api.get_pool_vseid(context, v['pool_id']) is None
+            session = edgesession.current(context)
+            if session is not None:
+                # in an edge session the vip stays PENDING_CREATE until the
+                # session ends, and goes with its pool if the session
+                # pushes it
+                self._stage_vip(context, session, lb_api, v)
+            elif not waiting:
+                self._create_edge_vip(context, lb_api, v)
+        if waiting:
+            # the pool is not on the edge until it has a member, or until
+            # its pending members are pushed; the vip stays PENDING_CREATE
+            # and is created right after the pool
+            LOG.debug(_("Vip %(vip)s waits for pool %(pool)s"),
+                      {'vip': v['id'], 'pool': v['pool_id']})
+            self._pool_changed(context, v['pool_id'])
 
         # If we adopt asynchronous mode, this method should return immediately
         # and let client to query the object status. The plugin will listen on
@@ -94,9 +375,13 @@ class VShieldEdgeLBPlugin(loadbalancer_db.LoadBalancerPluginDb):
             self.update_status(context, loadbalancer_db.Vip, id,
                                constants.PENDING_UPDATE)
             LOG.debug(_("Update vip: %s"), id)
-            self.vselb.update_vip(context, v)
-            self.update_status(context, loadbalancer_db.Vip, id,
-                               constants.ACTIVE)
+            with collect_jobs() as futures:
+                self._get_lb_api(context, v['pool_id']).update_vip(context,
+                                                                   v)
+            self._settle_after_jobs(
+                context, futures,
+                self._status_settler(loadbalancer_db.Vip, id,
+                                     constants.PENDING_UPDATE))
 
         v_rt = self.get_vip(context, id)
         return v_rt
@@ -104,14 +389,15 @@ class VShieldEdgeLBPlugin(loadbalancer_db.LoadBalancerPluginDb):
     def delete_vip(self, context, id):
         with context.session.begin(subtransactions=True):
             vip = self.get_vip(context, id)
-            uuid2vseid = self.vselb.get_vip_vseid(context, vip['id'])
+            lb_api = self._get_lb_api(context, vip['pool_id'])
+            uuid2vseid = lb_api.get_vip_vseid(context, vip['id'])
             self.update_status(context, loadbalancer_db.Vip, id,
                                constants.PENDING_DELETE)
             LOG.debug(_("Delete vip: %s"), id)
 
             super(VShieldEdgeLBPlugin, self).delete_vip(context, id)
             vip['vseid'] = uuid2vseid
-            self.vselb.delete_vip(context, vip)
+            lb_api.delete_vip(context, vip)
 
     def get_vip(self, context, id, fields=None):
         res = super(VShieldEdgeLBPlugin, self).get_vip(context, id, fields)
@@ -130,12 +416,20 @@ class VShieldEdgeLBPlugin(loadbalancer_db.LoadBalancerPluginDb):
             self.update_status(context, loadbalancer_db.Pool, p['id'],
                                constants.PENDING_CREATE)
             LOG.debug(_("Create pool: %s"), p['id'])
-            self.vselb.create_pool(context, p)
+            lb_api = self._get_lb_api(context, p['id'])
+            session = edgesession.current(context)
+            with collect_jobs() as futures:
+                if session is not None:
+                    self._stage_pool(context, session, lb_api, p['id'])
+                else:
+                    lb_api.create_pool(context, p)
             # pool may not be created if no member is specified, however we
             # still update the status to ACTIVE in case the client is waiting
             # for the pool to be created before pusing create member request
-            self.update_status(context, loadbalancer_db.Pool, p['id'],
-                               constants.ACTIVE)
+            self._settle_after_jobs(
+                context, futures,
+                self._status_settler(loadbalancer_db.Pool, p['id'],
+                                     constants.PENDING_CREATE))
 
         p_rt = self.get_pool(context, p['id'])
         return p_rt
@@ -149,7 +443,17 @@ class VShieldEdgeLBPlugin(loadbalancer_db.LoadBalancerPluginDb):
                                                 state=p_query['status'])
             p = super(VShieldEdgeLBPlugin, self).update_pool(context, id, pool)
             LOG.debug(_("Update pool: %s"), p['id'])
-            self.vselb.update_pool(context, pool)
+            with collect_jobs() as futures:
+                self._get_lb_api(context, id).sync_pool(
+                    context,
+                    self._get_resource(context, loadbalancer_db.Pool, id))
+            if futures:
+                self.update_status(context, loadbalancer_db.Pool, id,
+                                   constants.PENDING_UPDATE)
+                self._settle_after_jobs(
+                    context, futures,
+                    self._status_settler(loadbalancer_db.Pool, id,
+                                         constants.PENDING_UPDATE))
 
         p_rt = self.get_pool(context, id)
         return p_rt
@@ -159,7 +463,7 @@ class VShieldEdgeLBPlugin(loadbalancer_db.LoadBalancerPluginDb):
             pool = self.get_pool(context, id)
             self.update_status(context, loadbalancer_db.Pool, id,
                                constants.PENDING_DELETE)
-            self.vselb.delete_pool(context, pool)
+            self._get_lb_api(context, id).delete_pool(context, pool)
             super(VShieldEdgeLBPlugin, self).delete_pool(context, id)
             LOG.debug(_("Delete pool: %s"), id)
 
@@ -215,15 +519,29 @@ class VShieldEdgeLBPlugin(loadbalancer_db.LoadBalancerPluginDb):
             self.update_status(context, loadbalancer_db.Member, m['id'],
                                constants.PENDING_CREATE)
             LOG.debug(_("Create member: %s"), m['id'])
-            self.vselb.create_member(context, m)
-            self.update_status(context, loadbalancer_db.Member, m['id'],
-                               constants.ACTIVE)
+        self._pool_changed(context, m['pool_id'])
         m_rt = self.get_member(context, m['id'])
         return m_rt
 
+    def create_member_bulk(self, context, members):
+        """Create members, pushing each of their pools once."""
+        with context.session.begin(subtransactions=True):
+            ms = [super(VShieldEdgeLBPlugin, self).create_member(context,
+                                                                 member)
+                  for member in members['members']]
+            for m in ms:
+                self.update_status(context, loadbalancer_db.Member, m['id'],
+                                   constants.PENDING_CREATE)
+            LOG.debug(_("Create %d members"), len(ms))
+        for pool_id in collections.OrderedDict.fromkeys(
+                m['pool_id'] for m in ms):
+            self._pool_changed(context, pool_id)
+        return [self.get_member(context, m['id']) for m in ms]
+
     def update_member(self, context, id, member):
         with context.session.begin(subtransactions=True):
-            m_query = self.get_member(context, id, fields=["status"])
+            m_query = self.get_member(context, id,
+                                      fields=["status", "pool_id"])
             if m_query['status'] in [
                 constants.PENDING_DELETE, constants.ERROR]:
                 raise loadbalancer.StateInvalid(id=id,
@@ -233,20 +551,37 @@ class VShieldEdgeLBPlugin(loadbalancer_db.LoadBalancerPluginDb):
             self.update_status(context, loadbalancer_db.Member, id,
                                constants.PENDING_UPDATE)
             LOG.debug(_("Update member: %s"), m['id'])
-            self.vselb.update_member(context, m)
-            self.update_status(context, loadbalancer_db.Member, id,
-                               constants.ACTIVE)
+        if m_query['pool_id'] != m['pool_id']:
+            # moved to another pool
+            self._pool_changed(context, m_query['pool_id'])
+        self._pool_changed(context, m['pool_id'])
         m_rt = self.get_member(context, id)
         return m_rt
 
     def delete_member(self, context, id):
+        # the member is removed once its pool is pushed without it
         with context.session.begin(subtransactions=True):
             m = self.get_member(context, id)
             self.update_status(context, loadbalancer_db.Member, id,
                                constants.PENDING_DELETE)
             LOG.debug(_("Delete member: %s"), id)
-            super(VShieldEdgeLBPlugin, self).delete_member(context, id)
-            self.vselb.delete_member(context, m)
+        self._pool_changed(context, m['pool_id'])
+
+    def create_vip_bulk(self, context, vips):
+        return self._create_bulk('vip', context, vips['vips'])
+
+    def create_pool_bulk(self, context, pools):
+        return self._create_bulk('pool', context, pools['pools'])
+
+    def create_health_monitor_bulk(self, context, health_monitors):
+        return self._create_bulk('health_monitor', context,
+                                 health_monitors['health_monitors'])
+
+    def create_pool_health_monitor_bulk(self, context, health_monitors,
+                                        pool_id):
+        return self._create_bulk('pool_health_monitor', context,
+                                 health_monitors['health_monitors'],
+                                 pool_id=pool_id)
 
     def get_health_monitor(self, context, id, fields=None):
         res = super(VShieldEdgeLBPlugin, self).get_health_monitor(
@@ -292,18 +627,38 @@ class VShieldEdgeLBPlugin(loadbalancer_db.LoadBalancerPluginDb):
         super(VShieldEdgeLBPlugin, self).delete_health_monitor(context, id)
 
 
-class VShieldEdgeFWPlugin(fw_db.FirewallPluginDb):
+class VShieldEdgeFWPlugin(fw_db.FirewallPluginDb, VShieldMetricsMixin,
+                          edgesession.VShieldProvisionMixin):
 
-    supported_extension_aliases = ["fwaas"]
+    supported_extension_aliases = ["fwaas", "vshield-metrics",
+                                   "vshield-provision"]
+    # rules are created on the edge in one request
+    __native_bulk_support = True
+    # listings are sorted and paged by the database
+    __native_pagination_support = True
+    __native_sorting_support = True
 
     def __init__(self):
         """
         Do the initialization for the firewall service plugin here.
         """
-        # Hard coded for now
-        vseapi = VseAPI(edgeUri, edgeUser, edgePasswd, edgeId)
-        self.vsefw = FirewallAPI(vseapi)
+        self.edges = load_edge_registry()
+        # edge id -> FirewallAPI
+        self.fw_apis = {}
         qdbapi.register_models(base=model_base.BASEV2)
+        self.resync = EdgeResync('firewall', self.edges.get_edges,
+                                 self._check_edge,
+                                 cfg.CONF.vshield.resync_interval)
+        self.resync.start()
+
+    def after_fork(self):
+        """Re-create the state of the plugin in a forked API worker.
+
+        The resync keeps running in the server process only.
+        """
+        forget_process_state()
+        self.edges.forget_vses()
+        self.fw_apis = {}
 
     def get_plugin_type(self):
         return constants.FIREWALL
@@ -311,41 +666,137 @@ class VShieldEdgeFWPlugin(fw_db.FirewallPluginDb):
     def get_plugin_description(self):
         return "Quantum Firewall Service Plugin"
 
+    def _get_fw_api(self, context, tenant_id):
+        """Return the API of the edge serving the firewall of a tenant.
+
+        Rules refer to the ip sets and applications of their tenant, so
+        all the firewall objects of a tenant live on the same edge.
+        """
+        return self._get_edge_fw_api(
+            self.edges.get_edge(context, tenant_id=tenant_id))
+
+    def _get_edge_fw_api(self, edge_id):
+        fw_api = self.fw_apis.get(edge_id)
+        if fw_api is None:
+            fw_api = FirewallAPI(self.edges.get_vse(edge_id))
+            self.fw_apis[edge_id] = fw_api
+        return fw_api
+
+    def _check_edge(self, edge_id):
+        """Repair the firewall rules which drifted on an edge."""
+        admin_context = q_context.get_admin_context()
+        rules = []
+        query = admin_context.session.query(fw_db.Rule.tenant_id).distinct()
+        for (tenant_id,) in query:
+            if self.edges.get_edge(admin_context,
+                                   tenant_id=tenant_id) != edge_id:
+                continue
+            # the rules are scoped to the tenant owning them
+            context = q_context.Context(None, tenant_id, is_admin=True)
+            rules.extend(self.get_rules(context))
+        return self._get_edge_fw_api(edge_id).check_rules(admin_context,
+                                                          rules)
+
+    @staticmethod
+    def _delete_edge_rules(context, fw_api, rules):
+        for rule in reversed(rules):
+            fw_api.delete_rule(context, rule)
+
+    def _create_edge_rules(self, context, fw_api, rules, location, create):
+        """Create rules on the edge with create(), or stage them in the
+        edge session of the request, where the rules of the edge are
+        created after the ip sets and applications. The rules appended
+        after the last one are created in one request."""
+        session = edgesession.current(context)
+        if session is None:
+            return create()
+        if location:
+            session.stage(
+                fw_api.vse.get_edgeId(), 'rule', rules[0]['id'],
+                functools.partial(fw_api.create_rules, context, rules,
+                                  location),
+                undo=functools.partial(self._delete_edge_rules, context,
+                                       fw_api, rules),
+                after=('ipset', 'application'))
+            return
+        for rule in rules:
+            session.append(
+                fw_api.vse.get_edgeId(), 'rule', rule,
+                functools.partial(fw_api.create_rules, context),
+                undo=functools.partial(self._delete_edge_rules, context,
+                                       fw_api),
+                after=('ipset', 'application'))
+
     def create_rule(self, context, rule):
+        location = rule['rule'].get('location')
         with context.session.begin(subtransactions=True):
-            print rule
             rule = super(VShieldEdgeFWPlugin, self).create_rule(context, rule)
-            print rule
-            self.vsefw.create_rule(context, rule)
+            fw_api = self._get_fw_api(context, rule['tenant_id'])
+            self._create_edge_rules(
+                context, fw_api, [rule], location,
+                functools.partial(fw_api.create_rule, context, rule,
+                                  location))
         return rule
 
+    def create_rule_bulk(self, context, rules):
+        locations = [body['rule'].get('location') for body in rules['rules']]
+        with context.session.begin(subtransactions=True):
+            rules = super(VShieldEdgeFWPlugin, self).create_rule_bulk(
+                context, rules)
+            # one request for the rules of each tenant going to the same
+            # place: the rules above a given rule keep their order there,
+            # and so do the ones after the last rule
+            batches = collections.OrderedDict()
+            for rule, location in zip(rules, locations):
+                batches.setdefault((rule['tenant_id'], location),
+                                   []).append(rule)
+            for (tenant_id, location), new_rules in batches.iteritems():
+                fw_api = self._get_fw_api(context, tenant_id)
+                self._create_edge_rules(
+                    context, fw_api, new_rules, location,
+                    functools.partial(fw_api.create_rules, context,
+                                      new_rules, location))
+        return rules
+
     def delete_rule(self, context, id):
         with context.session.begin(subtransactions=True):
             rule = self.get_rule(context, id)
-            self.vsefw.delete_rule(context, rule)
+            self._get_fw_api(
+                context, rule['tenant_id']).delete_rule(context, rule)
             super(VShieldEdgeFWPlugin, self).delete_rule(context, id)
 
     def create_ipobj(self, context, ipobj):
         with context.session.begin(subtransactions=True):
             ipobj = super(VShieldEdgeFWPlugin, self).create_ipobj(context, ipobj)
-            self.vsefw.create_ipset(context, ipobj)
+            fw_api = self._get_fw_api(context, ipobj['tenant_id'])
+            edgesession.push(
+                context, fw_api.vse.get_edgeId(), 'ipset', ipobj['id'],
+                functools.partial(fw_api.create_ipset, context, ipobj),
+                undo=functools.partial(fw_api.delete_ipset, context, ipobj))
         return ipobj
 
     def delete_ipobj(self, context, id):
         with context.session.begin(subtransactions=True):
             ipobj = self.get_ipobj(context, id)
-            self.vsefw.delete_ipset(context, ipobj)
+            self._get_fw_api(
+                context, ipobj['tenant_id']).delete_ipset(context, ipobj)
             super(VShieldEdgeFWPlugin, self).delete_ipobj(context, id)
 
     def create_serviceobj(self, context, serviceobj):
         with context.session.begin(subtransactions=True):
             svcobj = super(VShieldEdgeFWPlugin, self).create_serviceobj(context, serviceobj)
-            self.vsefw.create_application(context, svcobj)
+            fw_api = self._get_fw_api(context, svcobj['tenant_id'])
+            edgesession.push(
+                context, fw_api.vse.get_edgeId(), 'application', svcobj['id'],
+                functools.partial(fw_api.create_application, context, svcobj),
+                undo=functools.partial(fw_api.delete_application, context,
+                                       svcobj))
         return svcobj
 
     def delete_serviceobj(self, context, id):
         with context.session.begin(subtransactions=True):
             svcobj = self.get_serviceobj(context, id)
-            self.vsefw.delete_application(context, svcobj)
+            self._get_fw_api(context, svcobj['tenant_id']).delete_application(
+                context, svcobj)
             super(VShieldEdgeFWPlugin, self).delete_serviceobj(context, id)
 
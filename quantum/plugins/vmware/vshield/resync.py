@@ -0,0 +1,142 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import eventlet
+
+from quantum.openstack.common import log as logging
+from quantum.openstack.common import loopingcall
+
+LOG = logging.getLogger(__name__)
+
+DRIFT_COUNTERS = ('missing', 'changed', 'orphaned', 'repaired')
+
+
+def _scalar(value):
+    # the edge reports some fields as strings which we send as booleans or
+    # numbers, and leaves out the ones which are not set
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return str(value).lower()
+    return unicode(value)
+
+
+def matches(desired, actual, ignore=()):
+    """Check that every field set in desired has the same value in actual.
+
+    Fields the edge adds, such as object ids, are not compared, nor are
+    the fields named in ignore, e.g. secrets the edge does not return.
+    """
+    if not desired and not actual:
+        return True
+    if isinstance(desired, dict):
+        if not isinstance(actual, dict):
+            return False
+        return all(key in ignore or matches(value, actual.get(key), ignore)
+                   for key, value in desired.iteritems())
+    if isinstance(desired, (list, tuple)):
+        if not isinstance(actual, (list, tuple)):
+            return False
+        return (len(desired) == len(actual) and
+                all(matches(d, a, ignore) for d, a in zip(desired, actual)))
+    return _scalar(desired) == _scalar(actual)
+
+
+def diff(desired, actual, ignore=()):
+    """Compare the desired and actual objects of an edge.
+
+    Both are dicts keyed by the same object key, e.g. the edge object id.
+    Returns a (missing, changed, orphaned) tuple of key lists: the objects
+    not on the edge, the ones differing from the desired state and the
+    ones on the edge that quantum does not know about.
+    """
+    missing = [key for key in desired if key not in actual]
+    changed = [key for key in desired
+               if key in actual and
+               not matches(desired[key], actual[key], ignore)]
+    orphaned = [key for key in actual if key not in desired]
+    return missing, changed, orphaned
+
+
+class EdgeResync(object):
+    """Periodically compares the config of every edge with the database.
+
+    check_edge(edge_id) fetches the config of one edge, repairs the objects
+    which drifted and returns a dict of drift counters; the edges are
+    checked in parallel. The counters of the last check of each edge and
+    their totals since startup are kept as metrics.
+    """
+
+    def __init__(self, service, get_edges, check_edge, interval):
+        self.service = service
+        self.get_edges = get_edges
+        self.check_edge = check_edge
+        self.interval = interval
+        self.metrics = {}
+        self.totals = dict((counter, 0) for counter in DRIFT_COUNTERS)
+        self.totals['errors'] = 0
+        self._poller = None
+
+    def run(self):
+        pool = eventlet.GreenPool()
+        for edge_id in self.get_edges():
+            pool.spawn_n(self._check_edge, edge_id)
+        pool.waitall()
+
+    def _check_edge(self, edge_id):
+        metrics = {'checked_at': time.time()}
+        try:
+            drift = self.check_edge(edge_id)
+        except Exception as e:
+            LOG.exception(_("Failed to check %(service)s config of edge "
+                            "%(edge)s"),
+                          {'service': self.service, 'edge': edge_id})
+            metrics['error'] = unicode(e)
+            self.totals['errors'] += 1
+        else:
+            for counter in DRIFT_COUNTERS:
+                metrics[counter] = drift.get(counter, 0)
+                self.totals[counter] += metrics[counter]
+            if any(metrics[counter] for counter in DRIFT_COUNTERS):
+                LOG.warn(_("%(service)s config of edge %(edge)s drifted: "
+                           "%(missing)d missing, %(changed)d changed, "
+                           "%(orphaned)d unknown objects, %(repaired)d "
+                           "repaired"),
+                         dict(metrics, service=self.service, edge=edge_id))
+        self.metrics[edge_id] = metrics
+
+    def add_repaired(self, edge_id, count):
+        """Count objects of the edge as repaired, by a push queued when
+        the edge was checked which has run since."""
+        metrics = self.metrics.setdefault(edge_id, {})
+        metrics['repaired'] = metrics.get('repaired', 0) + count
+        self.totals['repaired'] += count
+
+    def get_metrics(self):
+        return {'edges': dict(self.metrics), 'totals': dict(self.totals)}
+
+    def start(self):
+        if self.interval > 0 and self._poller is None:
+            self._poller = loopingcall.LoopingCall(self.run)
+            self._poller.start(interval=self.interval,
+                               initial_delay=self.interval)
+
+    def stop(self):
+        if self._poller is not None:
+            self._poller.stop()
+            self._poller = None
@@ -0,0 +1,174 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import random
+import threading
+import time
+
+from oslo.config import cfg
+
+from quantum.openstack.common import log as logging
+from quantum.plugins.vmware.vshield.common import config  # noqa
+from quantum.plugins.vmware.vshield.common import exceptions
+
+LOG = logging.getLogger(__name__)
+
+# methods which have the same effect however many times they are sent
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE'])
+# the manager did not act on the request: it is busy, or another change
+# holds the config lock of the edge
+REJECTED_STATUSES = frozenset([409, 429, 503])
+# the manager may have failed half way through the request
+FAILED_STATUSES = frozenset([500, 502, 504])
+
+
+class RetryPolicy(object):
+    """Decides which failed requests are retried and when.
+
+    A request rejected by the manager is always retried. One which failed
+    in the middle, either on the connection or with a server error, is
+    only retried if sending it again is harmless: a POST creates a new
+    object every time it goes through.
+
+    The requests made in the foreground, by API calls holding a database
+    transaction, are only retried when rejected, at most
+    foreground_retries times and never more than base_delay apart.
+    """
+
+    def __init__(self, max_retries, base_delay, max_delay,
+                 foreground_retries=0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.foreground_retries = foreground_retries
+
+    def should_retry(self, method, attempt, status=None, background=True):
+        """status is None when no response was received."""
+        if not background:
+            return (attempt < self.foreground_retries and
+                    status in REJECTED_STATUSES)
+        if attempt >= self.max_retries:
+            return False
+        if status in REJECTED_STATUSES:
+            return True
+        if status is None or status in FAILED_STATUSES:
+            return method.upper() in IDEMPOTENT_METHODS
+        return False
+
+    def delay(self, attempt, background=True):
+        """Exponential backoff with full jitter, spreads out the retries of
+        requests which failed together."""
+        if not background:
+            return random.uniform(0, self.base_delay)
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+
+def get_retry_policy():
+    return RetryPolicy(cfg.CONF.vshield.max_retries,
+                       cfg.CONF.vshield.retry_base_delay,
+                       cfg.CONF.vshield.retry_max_delay,
+                       cfg.CONF.vshield.foreground_retries)
+
+
+class CircuitBreaker(object):
+    """Fails the requests for an edge at once while its manager is down.
+
+    After threshold consecutive failures the breaker opens, and requests
+    raise ManagerUnavailable without waiting on a connection timeout.
+    Once reset_timeout has passed a single request is let through; the
+    breaker closes again if it succeeds and stays open otherwise. Another
+    request is let through when the probe has not told how it went after
+    reset_timeout, in case it ended some other way.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, edge_id, threshold, reset_timeout):
+        self.edge_id = edge_id
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Raise ManagerUnavailable unless a request may be sent."""
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            retry_in = self.opened_at + self.reset_timeout - time.time()
+            if retry_in <= 0:
+                # let this request probe the manager
+                self.state = self.HALF_OPEN
+                self.opened_at = time.time()
+                return
+        raise exceptions.ManagerUnavailable(edge_id=self.edge_id,
+                                            retry_in=max(retry_in, 0))
+
+    def success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                LOG.info(_("vShield Manager is available again for edge "
+                           "%s"), self.edge_id)
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN or
+                    self.failures >= self.threshold):
+                if self.state == self.CLOSED:
+                    LOG.warn(_("vShield Manager failed %(failures)d "
+                               "requests for edge %(edge)s in a row, "
+                               "failing requests for %(timeout)d seconds"),
+                             {'failures': self.failures,
+                              'edge': self.edge_id,
+                              'timeout': self.reset_timeout})
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(url, edge_id):
+    """Return the circuit breaker shared by every VseAPI of an edge."""
+    key = (url, edge_id)
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                edge_id,
+                cfg.CONF.vshield.breaker_failure_threshold,
+                cfg.CONF.vshield.breaker_reset_timeout)
+            _breakers[key] = breaker
+        return breaker
+
+
+def forget_circuit_breakers():
+    """Drop the circuit breakers, new ones are made for this process."""
+    with _breakers_lock:
+        _breakers.clear()
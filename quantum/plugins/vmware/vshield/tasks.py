@@ -0,0 +1,130 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import threading
+
+import eventlet
+from eventlet import corolocal
+from oslo.config import cfg
+
+from quantum.openstack.common import log as logging
+from quantum.plugins.vmware.vshield.common import config  # noqa
+
+LOG = logging.getLogger(__name__)
+
+_local = corolocal.local()
+
+
+def in_background():
+    """Whether the caller is an operation run by an EdgeTaskManager."""
+    return getattr(_local, 'edge_id', None) is not None
+
+
+class EdgeTaskManager(object):
+    """Runs edge operations in the background.
+
+    Operations are queued per edge and drained in order by a pool of green
+    threads, so that different edges are configured in parallel while at
+    most one operation runs against a given edge at a time.
+    """
+
+    def __init__(self, workers):
+        self._pool = eventlet.GreenPool(workers)
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def _add(self, edge_id, task, unique):
+        with self._lock:
+            queue = self._queues.get(edge_id)
+            start = queue is None
+            if start:
+                queue = self._queues[edge_id] = collections.deque()
+            elif unique and task in list(queue)[1:]:
+                # the head of the queue is already running
+                return
+            queue.append(task)
+        if start:
+            self._pool.spawn_n(self._drain, edge_id)
+
+    def add(self, edge_id, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) to run against edge_id."""
+        self._add(edge_id, (func, args, kwargs), False)
+
+    def add_unique(self, edge_id, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) unless it is already waiting.
+
+        Meant for operations pushing the current state of the edge: when
+        several changes are queued while the edge is busy, the one waiting
+        operation picks all of them up.
+        """
+        self._add(edge_id, (func, args, kwargs), True)
+
+    def pending(self, edge_id):
+        """Number of operations queued, or running, for edge_id."""
+        with self._lock:
+            return len(self._queues.get(edge_id, ()))
+
+    def _drain(self, edge_id):
+        _local.edge_id = edge_id
+        try:
+            self._run_queue(edge_id)
+        finally:
+            _local.edge_id = None
+
+    def _run_queue(self, edge_id):
+        while True:
+            with self._lock:
+                queue = self._queues[edge_id]
+                if not queue:
+                    del self._queues[edge_id]
+                    return
+                func, args, kwargs = queue[0]
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                LOG.exception(_("Operation %(func)s on edge %(edge)s "
+                                "failed"),
+                              {'func': getattr(func, '__name__', func),
+                               'edge': edge_id})
+            with self._lock:
+                queue.popleft()
+
+    def wait(self):
+        """Block until every queued operation has run."""
+        self._pool.waitall()
+
+
+_task_manager = None
+
+
+def get_task_manager():
+    """Return the task manager shared by the vShield plugins."""
+    global _task_manager
+    if _task_manager is None:
+        _task_manager = EdgeTaskManager(cfg.CONF.vshield.task_workers)
+    return _task_manager
+
+
+def forget_task_manager():
+    """Drop the task manager, the next one is made for this process.
+
+    Meant for a forked process: the green threads draining the queues of
+    the task manager it inherited only run in its parent.
+    """
+    global _task_manager
+    _task_manager = None
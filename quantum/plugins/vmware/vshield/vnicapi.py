@@ -32,4 +32,3 @@ class VNicAPI():
         uri = '/api/3.0/edges/{}/vnics/?action=patch'.format(
             self.vse.get_edgeId())
         content = self.vse.api('POST', uri, request)
-        print "VNicAPI.preconfig: '{}'".format(content)
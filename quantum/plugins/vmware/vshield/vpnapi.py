@@ -1,9 +1,18 @@
 #!/usr/bin/python
 
+import copy
 import re
+import threading
+
 import sqlalchemy as sa
 from quantum.db import api as qdbapi
 from quantum.db import model_base
+from quantum.db.vpn import vpn_db  # noqa
+from quantum.openstack.common import log as logging
+import resync
+from vseids import get_vseid_map
+
+LOG = logging.getLogger(__name__)
 
 
 class SiteUuid2Vseid(model_base.BASEV2):
@@ -14,45 +23,27 @@ class SiteUuid2Vseid(model_base.BASEV2):
     vseid = sa.Column(sa.String(36), nullable=False)
 
 
-def getuuid2vseid(context, uuid, model):
-    query = context.session.query(model)
-    query = query.filter(model.uuid == uuid)
-    if query.count() == 0:
-        return None
-    return query.one()
-
-
-def uuid2vseid(context, uuid, model):
-    uuid2vseid = getuuid2vseid(context, uuid, model)
-    if uuid2vseid is None:
-        return None
-    return uuid2vseid.vseid
-
-
-def deluuid2vseid(context, uuid, model):
-    uuid2vseid = getuuid2vseid(context, uuid, model)
-    if uuid2vseid is None:
-        raise Exception("{0} id for {1} not found".format(
-            model.__name__, uuid))
-    context.session.delete(uuid2vseid)
-
-
 def getobj(context, model, id):
     query = context.session.query(model)
     return query.filter(model.id == id).one()
 
 
 class VPNAPI():
-    def __init__(self, vse):
+    def __init__(self, vse, cache_sites=True):
         qdbapi.register_models(base=model_base.BASEV2)
         self.vse = vse
+        self.site_vseids = get_vseid_map(SiteUuid2Vseid)
         #self.uriprefix = '/api/3.0/edges/{0}/ipsec'.format(
         self.uriprefix = '/api/4.0/edges/{0}/ipsec'.format(
             vse.get_edgeId())
         self.enabled = False
+        # sites of the last ipsec config pushed to the edge, keyed by site
+        # uuid; None until the first push, or always without cache_sites
+        self.cache_sites = cache_sites
+        self.pushed_sites = None
+        self.sync_lock = threading.Lock()
 
     def vpnaas2vsmSitev3(self, context, site):
-        print site
         s = {
             'name': site['name'],
             'localIP': site['local_endpoint'],
@@ -87,7 +78,7 @@ class VPNAPI():
             s['peerSubnets']['subnets'] = pair['peer_subnets'].split(",")
         return s
 
-    def vpnaas2vsmIPSec(self, context, site):
+    def vpnaas2vsmIPSec(self, context, sites):
         conf = {
             'enabled': 'true',
             'logging': {
@@ -99,34 +90,84 @@ class VPNAPI():
                 'serviceCertificate': None
             },
             'sites': {
-                'sites': [site]
+                'sites': sites
             }
         }
         return conf
 
     def get_site_vseid(self, context, uuid):
-        return uuid2vseid(context, uuid, SiteUuid2Vseid)
-
-    def create_site(self, context, site):
-        uri = self.uriprefix + '/config'
-        s = self.vpnaas2vsmSite(context, site)
-        request = self.vpnaas2vsmIPSec(context, s)
-        header, response = self.vse.vsmconfig('PUT', uri, request)
-        return response
-
-    def update_site(self, context, site):
-        s = self.vpnaas2vsmSite(context, site)
-        request = self.vpnaas2vsmIPSec(context, s)
-        uri = self.uriprefix + '/config'
-        response = self.vse.api('PUT', uri, request)
-        return response
-
-    def delete_site(self, context, site):
-        uri = self.uriprefix + '/config'
-        response = self.vse.api('DELETE', uri)
+        return self.site_vseids.get(context, uuid)
+
+    def diff_sites(self, desired):
+        """Compare desired sites with the ones last pushed to the edge.
+
+        Returns a (added, removed, changed) tuple of site uuid lists.
+        """
+        pushed = self.pushed_sites or {}
+        added = [id for id in desired if id not in pushed]
+        removed = [id for id in pushed if id not in desired]
+        changed = [id for id in desired
+                   if id in pushed and desired[id] != pushed[id]]
+        return added, removed, changed
+
+    def sync_sites(self, context, sites):
+        """Reconcile the edge ipsec config with the full set of its sites.
+
+        sites must hold every site served by the edge, not only the one
+        being changed, since the edge takes the whole site list in one
+        document. Nothing is sent if the sites match the config pushed
+        last time, unless cache_sites is off: then the edge may also be
+        changed by other processes and every sync is pushed.
+        """
+        desired = dict((site['id'], self.vpnaas2vsmSite(context, site))
+                       for site in sites)
+        with self.sync_lock:
+            if self.pushed_sites is not None:
+                added, removed, changed = self.diff_sites(desired)
+                if not (added or removed or changed):
+                    LOG.debug(_("ipsec config of %s is up to date"),
+                              self.vse.get_edgeId())
+                    return None
+                LOG.debug(_("ipsec config of %(edge)s: %(added)d added, "
+                            "%(removed)d removed, %(changed)d changed sites"),
+                          {'edge': self.vse.get_edgeId(),
+                           'added': len(added), 'removed': len(removed),
+                           'changed': len(changed)})
+            uri = self.uriprefix + '/config'
+            try:
+                if desired:
+                    request = self.vpnaas2vsmIPSec(
+                        context, [desired[id] for id in sorted(desired)])
+                    header, response = self.vse.vsmconfig('PUT', uri,
+                                                          request)
+                else:
+                    header, response = self.vse.vsmconfig('DELETE', uri)
+            except Exception:
+                # the edge state is unknown now, push everything next time
+                self.pushed_sites = None
+                raise
+            if self.cache_sites:
+                self.pushed_sites = copy.deepcopy(desired)
         return response
 
-    def get_stats(self, context, site):
+    def check_sites(self, context, sites):
+        """Compare the ipsec sites running on the edge with sites.
+
+        Sites are matched by their endpoints. Returns a (missing, changed,
+        orphaned) tuple of (local ip, peer ip) lists.
+        """
+        desired = dict(((site['local_endpoint'], site['peer_endpoint']),
+                        self.vpnaas2vsmSite(context, site))
+                       for site in sites)
+        config = self.get_vsm_vpn_config() or {}
+        actual = dict(((site.get('localIp'), site.get('peerIp')), site)
+                      for site in (config.get('sites') or {}).get('sites')
+                      or [])
+        # the edge does not return secrets
+        return resync.diff(desired, actual, ignore=('psk', 'certificate'))
+
+    def get_stats(self):
+        """Return the ipsec statistics of every site on the edge."""
         uri = self.uriprefix + '/statistics'
         response = self.vse.api('GET', uri)
         return response
@@ -16,25 +16,30 @@
 #    under the License.
 
 
+import functools
 import re
+from oslo.config import cfg
+from quantum import context as q_context
 from quantum.db import api as qdbapi
 from quantum.db import model_base
 from quantum.db.vpn import vpn_db
 from quantum.extensions import vpn
 from quantum.openstack.common import log as logging
 from quantum.plugins.common import constants
-from vseapi import VseAPI
+from edges import forget_process_state
+from edges import load_edge_registry
+import edgesession
+from instrument import VShieldMetricsMixin
+from resync import EdgeResync
+from tasks import get_task_manager
 from vpnapi import VPNAPI
+from vpnstats import VPNStatsCollector
 
 LOG = logging.getLogger(__name__)
 
-edgeUri = 'https://10.117.35.38'
-edgeId = 'edge-1'
-edgeUser = 'admin'
-edgePasswd = 'default'
 
-
-class VShieldEdgeVPNPlugin(vpn_db.VPNPluginDb):
+class VShieldEdgeVPNPlugin(vpn_db.VPNPluginDb, VShieldMetricsMixin,
+                           edgesession.VShieldProvisionMixin):
 
     """
     Implementation of the Quantum VPN Service Plugin.
@@ -43,93 +48,353 @@ class VShieldEdgeVPNPlugin(vpn_db.VPNPluginDb):
     Most DB related works are implemented in class
     vpn_db.VPNPluginDb.
     """
-    supported_extension_aliases = ["vpnaas"]
+    supported_extension_aliases = ["vpnaas", "vshield-metrics",
+                                   "vshield-provision"]
+    # listings are sorted and paged by the database
+    __native_pagination_support = True
+    __native_sorting_support = True
 
     def __init__(self):
         """
         Do the initialization for the vpn service plugin here.
         """
-        # Hard coded for now
-        vseapi = VseAPI(edgeUri, edgeUser, edgePasswd, edgeId)
-        self.vsevpn = VPNAPI(vseapi)
+        self.edges = load_edge_registry()
+        # edge id -> VPNAPI, which caches the sites pushed to the edge
+        # while this process is the only one pushing them
+        self.vpn_apis = {}
+        self.cache_sites = True
+        self.tasks = get_task_manager()
+        self.stats_collector = VPNStatsCollector(
+            self._fetch_stats, cfg.CONF.vshield.vpn_stats_ttl,
+            cfg.CONF.vshield.vpn_stats_interval)
+        self.stats_collector.start()
+        self.resync = EdgeResync('ipsec', self.edges.get_edges,
+                                 self._check_edge,
+                                 cfg.CONF.vshield.resync_interval)
+        self.resync.start()
         qdbapi.register_models(base=model_base.BASEV2)
 
+    def after_fork(self):
+        """Re-create the state of the plugin in a forked API worker.
+
+        The resync keeps running in the server process only. The workers
+        push to the same edges, so none of them skips a push by the sites
+        it pushed last.
+        """
+        forget_process_state()
+        self.edges.forget_vses()
+        self.vpn_apis = {}
+        self.cache_sites = False
+        self.tasks = get_task_manager()
+        self.stats_collector = VPNStatsCollector(
+            self._fetch_stats, cfg.CONF.vshield.vpn_stats_ttl,
+            cfg.CONF.vshield.vpn_stats_interval)
+        self.stats_collector.start()
+
     def get_plugin_type(self):
         return constants.VPN
 
     def get_plugin_description(self):
         return "Quantum VPN Service Plugin"
 
-    def create_site(self, context, site):
+    def _get_vpn_api(self, edge_id):
+        vpn_api = self.vpn_apis.get(edge_id)
+        if vpn_api is None:
+            vpn_api = VPNAPI(self.edges.get_vse(edge_id), self.cache_sites)
+            self.vpn_apis[edge_id] = vpn_api
+        return vpn_api
+
+    def _fetch_stats(self, edge_id):
+        return self._get_vpn_api(edge_id).get_stats()
+
+    def _get_site_edge(self, context, site):
+        return self.edges.get_edge(context, tenant_id=site['tenant_id'],
+                                   subnet_id=site['subnet_id'])
+
+    def _get_edge_sites(self, context, edge_id):
+        """Return the sites of every tenant served by an edge.
+
+        The edge of a site only depends on its tenant and subnet, so it is
+        looked up once for each pair of them, and only the sites of the
+        pairs served by the edge are read.
+        """
+        query = context.session.query(vpn_db.Site.tenant_id,
+                                      vpn_db.Site.subnet_id).distinct()
+        pairs = set((tenant_id, subnet_id) for tenant_id, subnet_id in query
+                    if self.edges.get_edge(context, tenant_id=tenant_id,
+                                           subnet_id=subnet_id) == edge_id)
+        if not pairs:
+            return []
+        filters = {'tenant_id': list(set(pair[0] for pair in pairs))}
+        subnets = set(pair[1] for pair in pairs)
+        if None not in subnets:
+            filters['subnet_id'] = list(subnets)
+        return [site for site in
+                super(VShieldEdgeVPNPlugin, self).get_sites(context,
+                                                            filters=filters)
+                if (site['tenant_id'], site['subnet_id']) in pairs]
+
+    def _sync_sites(self, edge_id):
+        """Push the sites of the edge and complete their pending states.
+
+        Runs in the background, after the API request has returned. All
+        the sites of the edge go in one document, so a single push settles
+        every site waiting for it: PENDING_CREATE and PENDING_UPDATE sites
+        become ACTIVE and PENDING_DELETE sites are removed, or they all go
+        to ERROR if the edge rejects the change. Returns whether the edge
+        took the sites.
+        """
+        context = q_context.get_admin_context()
+        sites = self._get_edge_sites(context, edge_id)
+        live = [site for site in sites
+                if site['status'] != constants.PENDING_DELETE]
+        vpn_api = self._get_vpn_api(edge_id)
+        try:
+            vpn_api.sync_sites(context, live)
+            status = constants.ACTIVE
+            self.stats_collector.invalidate(edge_id)
+        except Exception:
+            LOG.exception(_("Failed to configure ipsec sites on edge %s"),
+                          edge_id)
+            status = constants.ERROR
+
         with context.session.begin(subtransactions=True):
-            s = super(VShieldEdgeVPNPlugin,
-                      self).create_site(context, site)
-            self.update_status(context, vpn_db.Site, s['id'],
-                               constants.PENDING_CREATE)
-            LOG.debug(_("Create site: %s") % s['id'])
-            self.vsevpn.create_site(context, s)
-            self.update_status(context, vpn_db.Site, s['id'],
-                               constants.ACTIVE)
-
-        # If we adopt asynchronous mode, this method should return immediately
-        # and let client to query the object status. The plugin will listen on
-        # the event from device and update the object status by calling
-        # self.update_state(context, Site, id, ACTIVE/ERROR)
-        #
-        # In synchronous mode, send the request to device here and wait for
-        # response. Eventually update the object status prior to the return.
+            for site in sites:
+                if (site['status'] == constants.PENDING_DELETE and
+                        status == constants.ACTIVE):
+                    super(VShieldEdgeVPNPlugin, self).delete_site(
+                        context, site['id'])
+                    # its vseid mapping goes with it
+                    vpn_api.site_vseids.forget(site['id'])
+                elif site['status'] in (constants.PENDING_CREATE,
+                                        constants.PENDING_UPDATE,
+                                        constants.PENDING_DELETE):
+                    # leave alone sites changed again since the snapshot,
+                    # the operation queued for them will settle them
+                    query = context.session.query(vpn_db.Site).filter_by(
+                        id=site['id'], status=site['status'])
+                    query.update({'status': status},
+                                 synchronize_session=False)
+        return status == constants.ACTIVE
+
+    def _repair_sites(self, edge_id, drifted):
+        # the drifted sites only count as repaired once pushed again
+        if self._sync_sites(edge_id):
+            self.resync.add_repaired(edge_id, drifted)
+
+    def _check_edge(self, edge_id):
+        """Compare the ipsec sites of the edge with the database.
+
+        Run periodically by self.resync. The edge takes all of its sites in
+        one document, so any drift is repaired by pushing them all again;
+        the push is queued and counted as a repair when it has run.
+        """
+        context = q_context.get_admin_context()
+        sites = self._get_edge_sites(context, edge_id)
+        if any(site['status'] in (constants.PENDING_CREATE,
+                                  constants.PENDING_UPDATE,
+                                  constants.PENDING_DELETE)
+               for site in sites):
+            # a sync of the edge is queued already
+            return {}
+        vpn_api = self._get_vpn_api(edge_id)
+        missing, changed, orphaned = vpn_api.check_sites(context, sites)
+        drift = {'missing': len(missing), 'changed': len(changed),
+                 'orphaned': len(orphaned), 'repaired': 0}
+        if missing or changed or orphaned:
+            # forget what was pushed so the sync does not skip the push
+            vpn_api.pushed_sites = None
+            self.tasks.add_unique(edge_id, self._repair_sites, edge_id,
+                                  len(missing) + len(changed) +
+                                  len(orphaned))
+        return drift
+
+    def _live_sites(self, context, edge_id):
+        # the sites of every tenant on the edge, read in the transaction
+        # of the request
+        return [site for site in
+                self._get_edge_sites(context.elevated(), edge_id)
+                if site['status'] != constants.PENDING_DELETE]
+
+    def _push_sites(self, context, edge_id, site_ids):
+        """Push the sites of the edge, created in an edge session, and
+        activate them."""
+        self._get_vpn_api(edge_id).sync_sites(
+            context, self._live_sites(context, edge_id))
+        self.stats_collector.invalidate(edge_id)
+        query = context.session.query(vpn_db.Site).filter(
+            vpn_db.Site.id.in_(site_ids))
+        query.update({'status': constants.ACTIVE},
+                     synchronize_session=False)
+
+    def _unpush_sites(self, context, edge_id, site_ids):
+        self._get_vpn_api(edge_id).sync_sites(
+            context, [site for site in self._live_sites(context, edge_id)
+                      if site['id'] not in site_ids])
+
+    def _queue_sync_sites(self, edge_id):
+        # every edge has a queue of its own, so changes to different edges
+        # are pushed in parallel
+        self.tasks.add_unique(edge_id, self._sync_sites, edge_id)
+
+    def _stage_sites(self, context, session, edge_id, site_ids):
+        # pushed with the other sites of the edge created in the session,
+        # in one document, when the session ends
+        for site_id in site_ids:
+            session.append(
+                edge_id, 'ipsec', site_id,
+                functools.partial(self._push_sites, context, edge_id),
+                undo=functools.partial(self._unpush_sites, context,
+                                       edge_id))
+
+    def _sites_by_edge(self, context, site_ids):
+        sites = super(VShieldEdgeVPNPlugin, self).get_sites(
+            context, filters={'id': site_ids})
+        edges = {}
+        for site in sites:
+            edges.setdefault(self._get_site_edge(context, site),
+                             []).append(site['id'])
+        return edges
+
+    def create_site(self, context, site):
+        s = super(VShieldEdgeVPNPlugin, self).create_site(context, site)
+        LOG.debug(_("Create site: %s") % s['id'])
+
+        edge_id = self._get_site_edge(context, s)
+        session = edgesession.current(context)
+        if session is not None:
+            self._stage_sites(context, session, edge_id, [s['id']])
+            return self.get_site(context, s['id'])
+
+        # The site is created in PENDING_CREATE state and the request
+        # returns immediately; the edge is configured in the background,
+        # after the transaction is committed, and the site then moves to
+        # ACTIVE or ERROR. Clients poll the site status to know when the
+        # tunnel is configured.
+        self._queue_sync_sites(edge_id)
         s_query = self.get_site(context, s['id'])
         return s_query
 
     def update_site(self, context, id, site):
         with context.session.begin(subtransactions=True):
-#            s_query = self.get_site(context, id, fields=["status"])
-#            if s_query['status'] in [constants.PENDING_DELETE,
-#                                     constants.ERROR]:
-#                raise vpn.StateInvalid(id=id, state=s_query['status'])
-
+            old_edge = self._get_site_edge(context,
+                                           self.get_site(context, id))
             s = super(VShieldEdgeVPNPlugin,
                       self).update_site(context, id, site)
             self.update_status(context, vpn_db.Site, id,
                                constants.PENDING_UPDATE)
             LOG.debug(_("Update site: %s"), id)
-            self.vsevpn.update_site(context, s)
-            self.update_status(context, vpn_db.Site, id, constants.ACTIVE)
+            new_edge = self._get_site_edge(context, s)
 
+        # a site moved to a subnet served by another edge is removed from
+        # the edge it was on
+        if old_edge != new_edge:
+            self._queue_sync_sites(old_edge)
+        self._queue_sync_sites(new_edge)
         s_rt = self.get_site(context, id)
         return s_rt
 
     def delete_site(self, context, id):
         with context.session.begin(subtransactions=True):
-            site = self.get_site(context, id)
-            #uuid2vseid = self.vsevpn.get_site_vseid(context, site['id'])
+            site_db = self._get_resource(context, vpn_db.Site, id)
+            self.assert_modification_allowed(site_db)
             self.update_status(context, vpn_db.Site, id,
                                constants.PENDING_DELETE)
             LOG.debug(_("Delete site: %s"), id)
+            edge_id = self._get_site_edge(context, site_db)
 
-            super(VShieldEdgeVPNPlugin, self).delete_site(context, id)
-            #site['vseid'] = uuid2vseid
-            self.vsevpn.delete_site(context, site)
+        # the row is removed once the edge no longer has the site
+        self._queue_sync_sites(edge_id)
 
     def get_site(self, context, id, fields=None):
         res = super(VShieldEdgeVPNPlugin, self).get_site(context, id, fields)
         LOG.debug(_("Get site: %s"), id)
         return res
 
-    def get_sites(self, context, filters=None, fields=None):
+    def get_sites(self, context, filters=None, fields=None, sorts=None,
+                  limit=None, marker=None, page_reverse=False):
         res = super(VShieldEdgeVPNPlugin, self).get_sites(
-            context, filters, fields)
+            context, filters, fields, sorts, limit, marker, page_reverse)
         LOG.debug(_("Get sites"))
         return res
 
-    def stats(self, context, site_id):
-        site = self.get_site(context, site_id)
-        res = self.vsevpn.get_stats(context, site)
+    def create_topology(self, context, topology):
+        t = super(VShieldEdgeVPNPlugin, self).create_topology(context,
+                                                              topology)
+        LOG.debug(_("Create topology: %(id)s with %(sites)d sites"),
+                  {'id': t['id'], 'sites': len(t['site_ids'])})
+
+        # however many sites the topology has, every edge gets all of its
+        # sites in a single push
+        edges = self._sites_by_edge(context, t['site_ids'])
+        session = edgesession.current(context)
+        for edge_id, site_ids in edges.iteritems():
+            if session is not None:
+                self._stage_sites(context, session, edge_id, site_ids)
+            else:
+                self._queue_sync_sites(edge_id)
+        return self.get_topology(context, t['id'])
+
+    def update_topology(self, context, id, topology):
+        # only the name and the description of a topology can change,
+        # nothing is pushed
+        res = super(VShieldEdgeVPNPlugin, self).update_topology(
+            context, id, topology)
+        LOG.debug(_("Update topology: %s"), id)
+        return res
+
+    def delete_topology(self, context, id):
+        with context.session.begin(subtransactions=True):
+            topology = self._get_resource(context, vpn_db.Topology, id)
+            site_ids = [site['id'] for site in topology.sites]
+            edges = self._sites_by_edge(context, site_ids)
+            query = context.session.query(vpn_db.Site).filter(
+                vpn_db.Site.id.in_(site_ids))
+            query.update({'status': constants.PENDING_DELETE},
+                         synchronize_session=False)
+            context.session.delete(topology)
+            LOG.debug(_("Delete topology: %s"), id)
+
+        # the sites are removed once their edges no longer have them
+        for edge_id in edges:
+            self._queue_sync_sites(edge_id)
+
+    def get_topology(self, context, id, fields=None):
+        res = super(VShieldEdgeVPNPlugin, self).get_topology(context, id,
+                                                             fields)
+        LOG.debug(_("Get topology: %s"), id)
+        return res
+
+    def get_topologys(self, context, filters=None, fields=None, sorts=None,
+                      limit=None, marker=None, page_reverse=False):
+        res = super(VShieldEdgeVPNPlugin, self).get_topologys(
+            context, filters, fields, sorts, limit, marker, page_reverse)
+        LOG.debug(_("Get topologys"))
+        return res
+
+    def stats(self, context, site_id=None):
+        # served from the statistics cache, which reads the statistics of
+        # all the sites of an edge at once
+        if site_id is not None:
+            site = self.get_site(context, site_id)
+            return self.stats_collector.get_site_stats(
+                self._get_site_edge(context, site), site)
+        res = {}
+        edges = {}
+        for site in self.get_sites(context):
+            pair = (site['tenant_id'], site['subnet_id'])
+            if pair not in edges:
+                edges[pair] = self._get_site_edge(context, site)
+            res[site['id']] = self.stats_collector.get_site_stats(
+                edges[pair], site)
+        LOG.debug(_("Get stats of %d sites"), len(res))
         return res
 
-    def get_isakmp_policys(self, context, filters=None, fields=None):
+    def get_isakmp_policys(self, context, filters=None, fields=None,
+                           sorts=None, limit=None, marker=None,
+                           page_reverse=False):
         res = super(VShieldEdgeVPNPlugin, self).get_isakmp_policys(
-            context, filters, fields)
+            context, filters, fields, sorts, limit, marker, page_reverse)
         LOG.debug(_("Get isakmp policys"))
         return res
 
@@ -205,15 +470,18 @@ class VShieldEdgeVPNPlugin(vpn_db.VPNPluginDb):
         LOG.debug(_("Get ipsec policy: %s"), id)
         return res
 
-    def get_ipsec_policys(self, context, filters=None, fields=None):
+    def get_ipsec_policys(self, context, filters=None, fields=None, sorts=None,
+                          limit=None, marker=None, page_reverse=False):
         res = super(VShieldEdgeVPNPlugin, self).get_ipsec_policys(
-            context, filters, fields)
+            context, filters, fields, sorts, limit, marker, page_reverse)
         LOG.debug(_("Get ipsec policys"))
         return res
 
-    def get_trust_profiles(self, context, filters=None, fields=None):
+    def get_trust_profiles(self, context, filters=None, fields=None,
+                           sorts=None, limit=None, marker=None,
+                           page_reverse=False):
         res = super(VShieldEdgeVPNPlugin, self).get_trust_profiles(
-                context, filters, fields)
+            context, filters, fields, sorts, limit, marker, page_reverse)
         LOG.debug(_("Get trust profiles"))
         return res
 
@@ -0,0 +1,144 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import time
+
+import eventlet
+from eventlet import semaphore
+
+from quantum.openstack.common import log as logging
+from quantum.openstack.common import loopingcall
+
+LOG = logging.getLogger(__name__)
+
+# an edge is polled as long as its statistics were read within this many
+# polling intervals
+IDLE_POLLS = 10
+
+
+def index_site_stats(stats):
+    """Index the ipsec statistics of an edge by site endpoints.
+
+    The edge reports one entry per site, identified by its local and peer
+    ip addresses; returns a {(local ip, peer ip): entry} dict.
+    """
+    index = {}
+    for entry in (stats or {}).get('siteStatistics') or []:
+        ike = entry.get('ikeStatus') or {}
+        key = (ike.get('localIpAddress'), ike.get('peerIpAddress'))
+        index[key] = entry
+    return index
+
+
+class _EdgeStats(object):
+
+    def __init__(self):
+        # held while the edge is read, so it must yield to other readers
+        self.lock = semaphore.Semaphore()
+        self.index = {}
+        self.updated = None
+        self.last_read = 0
+
+
+class VPNStatsCollector(object):
+    """Cache of the ipsec statistics of the edges.
+
+    The statistics of an edge cover all of its sites, so one GET serves
+    every site on the edge. Reads are served from memory while the cached
+    statistics are younger than ttl, and refreshed at most once for all
+    the concurrent readers otherwise. With an interval set, the edges read
+    recently are also refreshed in the background so readers usually
+    never wait for the edge.
+    """
+
+    def __init__(self, fetch, ttl, interval=0):
+        # fetch(edge_id) returns the raw statistics of an edge
+        self.fetch = fetch
+        self.ttl = ttl
+        self.interval = interval
+        self._edges = {}
+        self._lock = threading.Lock()
+        self._poller = None
+
+    def _get_edge(self, edge_id):
+        with self._lock:
+            edge = self._edges.get(edge_id)
+            if edge is None:
+                edge = _EdgeStats()
+                self._edges[edge_id] = edge
+            return edge
+
+    def _is_fresh(self, edge, now):
+        return edge.updated is not None and now - edge.updated < self.ttl
+
+    def refresh(self, edge_id, force=True):
+        edge = self._get_edge(edge_id)
+        with edge.lock:
+            # another reader may have refreshed it while we waited
+            if not force and self._is_fresh(edge, time.time()):
+                return edge
+            stats = self.fetch(edge_id)
+            edge.index = index_site_stats(stats)
+            edge.updated = time.time()
+        return edge
+
+    def get_edge_stats(self, edge_id):
+        """Return the {(local ip, peer ip): stats} index of an edge."""
+        edge = self._get_edge(edge_id)
+        now = time.time()
+        edge.last_read = now
+        if not self._is_fresh(edge, now):
+            edge = self.refresh(edge_id, force=False)
+        return edge.index
+
+    def get_site_stats(self, edge_id, site):
+        index = self.get_edge_stats(edge_id)
+        return index.get((site['local_endpoint'], site['peer_endpoint']),
+                         {})
+
+    def invalidate(self, edge_id):
+        """Refresh the statistics of an edge on the next read."""
+        self._get_edge(edge_id).updated = None
+
+    def poll(self):
+        """Refresh, in parallel, the edges read recently."""
+        now = time.time()
+        with self._lock:
+            edge_ids = [edge_id for edge_id, edge in self._edges.items()
+                        if now - edge.last_read < self.interval * IDLE_POLLS]
+        pool = eventlet.GreenPool()
+        for edge_id in edge_ids:
+            pool.spawn_n(self._poll_edge, edge_id)
+        pool.waitall()
+
+    def _poll_edge(self, edge_id):
+        try:
+            self.refresh(edge_id)
+        except Exception:
+            LOG.exception(_("Failed to poll ipsec statistics of edge %s"),
+                          edge_id)
+
+    def start(self):
+        if self.interval > 0 and self._poller is None:
+            self._poller = loopingcall.LoopingCall(self.poll)
+            self._poller.start(interval=self.interval,
+                               initial_delay=self.interval)
+
+    def stop(self):
+        if self._poller is not None:
+            self._poller.stop()
+            self._poller = None
@@ -1,8 +1,228 @@
 #!/usr/bin/python
 
+import collections
+import copy
 import json
+import re
+import sys
+import threading
+import time
+
+import eventlet
+from eventlet import event
+from oslo.config import cfg
+
+from quantum.openstack.common import log as logging
+from quantum.plugins.vmware.vshield.common import config  # noqa
+from quantum.plugins.vmware.vshield.common import exceptions
+from instrument import get_instrumentation
+from jobs import collect_job
+from jobs import get_job_poller
+from jobs import job_id
+from retry import get_circuit_breaker
+from retry import get_retry_policy
+from tasks import in_background
+from vsmapi import CONNECTION_ERRORS
 from vsmapi import VsmAPI
 
+LOG = logging.getLogger(__name__)
+
+
+# a PUT to one of the service documents of an edge, or to one of the
+# objects listed in it: <document>/<collection>/<id>
+DOCUMENT_URI = re.compile(r'^(?P<document>/api/4\.0/edges/[^/]+/'
+                          r'(?:ipsec|loadbalancer|firewall)/config)'
+                          r'(?:/(?P<collection>[^/]+)/(?P<id>[^/]+))?$')
+# collection -> (keys of the list of its objects in the service document,
+# key of their id)
+DOCUMENT_OBJECTS = {
+    'pools': (('pool',), 'poolId'),
+    'virtualservers': (('virtualServer',), 'virtualServerId'),
+    'rules': (('firewallRules', 'firewallRules'), 'ruleId'),
+}
+
+
+def split_uri(uri):
+    """Return the (document, collection, id) a PUT to uri changes.
+
+    collection and id are None for the document itself, and a uri out of
+    any service document is a document of its own.
+    """
+    match = DOCUMENT_URI.match(uri)
+    if match is None:
+        return uri, None, None
+    return match.group('document', 'collection', 'id')
+
+
+def merge_objects(document, pushes):
+    """Replace the objects of a service document by the ones pushed on
+    their own, returns False if one of them is not in the document."""
+    for uri, params in pushes:
+        unused, collection, id = split_uri(uri)
+        keys, id_key = DOCUMENT_OBJECTS.get(collection, ((), None))
+        objects = document
+        for key in keys:
+            objects = (objects or {}).get(key)
+        if id_key is None or not isinstance(objects, list):
+            return False
+        for i, obj in enumerate(objects):
+            if unicode(obj.get(id_key)) == id:
+                objects[i] = dict(params, **{id_key: obj[id_key]})
+                break
+        else:
+            return False
+    return True
+
+
+class _PendingPush(object):
+
+    def __init__(self, vse):
+        self.vse = vse
+        self.event = event.Event()
+        self.params = None
+        self.kwargs = {}
+        # False once a PUT of the whole document replaced this object
+        self.merge = True
+
+
+class VsmConfigCoalescer(object):
+    """Collapses the config pushes to the service documents of an edge.
+
+    The ipsec, load balancer and firewall config of an edge are each one
+    document, whose objects can also be replaced one by one. The PUTs to a
+    document, or to its objects, arriving within the window are sent as
+    one PUT of the document with all of their changes, and every caller
+    gets the result of that one request; a PUT replaces the whole object,
+    so of several PUTs to the same uri only the last one counts, and a PUT
+    of the document supersedes the PUTs of its objects made before it. Any
+    other request to the edge first sends the pushes waiting for it, so
+    the edge still sees the changes in order.
+
+    Only the operations run in the background wait for the window, API
+    requests hold a database transaction and are sent at once.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        # (vsm url, edge id) -> {document: {uri: _PendingPush}}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _take(self, key, document):
+        with self._lock:
+            pending = self._pending.get(key) or {}
+            pushes = pending.pop(document, None)
+            if not pending:
+                self._pending.pop(key, None)
+            return pushes
+
+    @staticmethod
+    def _send_one(uri, push, superseded=()):
+        """Send one PUT, the pushes it superseded get its result too."""
+        waiters = [push] + list(superseded)
+        try:
+            result = push.vse.do_vsmconfig('PUT', uri, push.params,
+                                           **push.kwargs)
+        except Exception:
+            exc_info = sys.exc_info()
+            for waiter in waiters:
+                waiter.event.send_exception(*exc_info)
+        else:
+            for waiter in waiters:
+                waiter.event.send(result)
+
+    def _send(self, key, document):
+        pushes = self._take(key, document)
+        if not pushes:
+            # already sent by a flush
+            return
+        if len(pushes) == 1:
+            self._send_one(*pushes.items()[0])
+            return
+        whole = pushes.get(document)
+        objects = [(uri, push) for uri, push in pushes.iteritems()
+                   if uri != document and push.merge]
+        superseded = [push for uri, push in pushes.iteritems()
+                      if uri != document and not push.merge]
+        vse = pushes.values()[-1].vse
+        try:
+            if whole is not None:
+                base = copy.deepcopy(whole.params)
+            else:
+                unused, base = vse.do_vsmconfig('GET', document)
+            if not merge_objects(base, [(uri, push.params)
+                                        for uri, push in objects]):
+                # an object the document does not list, its PUT gets the
+                # answer of the edge on its own, after the document
+                if whole is not None:
+                    self._send_one(document, whole, superseded)
+                for uri, push in objects:
+                    self._send_one(uri, push)
+                return
+            LOG.debug(_("Pushing %(count)d changes to %(document)s at "
+                        "once"), {'count': len(pushes),
+                                  'document': document})
+            result = vse.do_vsmconfig('PUT', document, base)
+        except Exception:
+            exc_info = sys.exc_info()
+            for push in pushes.itervalues():
+                push.event.send_exception(*exc_info)
+        else:
+            for push in pushes.itervalues():
+                push.event.send(result)
+
+    def flush(self, key):
+        with self._lock:
+            documents = list(self._pending.get(key) or ())
+        for document in documents:
+            self._send(key, document)
+
+    def vsmconfig(self, vse, method, uri, params=None, **kwargs):
+        key = (vse.vsmapi.url, vse.get_edgeId())
+        if method != 'PUT' or self.window <= 0 or not in_background():
+            self.flush(key)
+            return vse.do_vsmconfig(method, uri, params, **kwargs)
+        document = split_uri(uri)[0]
+        with self._lock:
+            pending = self._pending.setdefault(key,
+                                               collections.OrderedDict())
+            pushes = pending.get(document)
+            if pushes is None:
+                pushes = pending[document] = collections.OrderedDict()
+                eventlet.spawn_after(self.window, self._send, key,
+                                     document)
+            push = pushes.get(uri)
+            if push is None:
+                push = pushes[uri] = _PendingPush(vse)
+            if uri == document:
+                for other in pushes.itervalues():
+                    other.merge = False
+            push.merge = True
+            push.params = params
+            push.kwargs = kwargs
+        return push.event.wait()
+
+
+_coalescer = None
+
+
+def get_coalescer():
+    """Return the coalescer shared by every VseAPI."""
+    global _coalescer
+    if _coalescer is None:
+        _coalescer = VsmConfigCoalescer(cfg.CONF.vshield.coalesce_window)
+    return _coalescer
+
+
+def forget_coalescer():
+    """Drop the coalescer, the next one is made for this process.
+
+    Meant for a forked process: the pushes held by the coalescer it
+    inherited are sent by its parent.
+    """
+    global _coalescer
+    _coalescer = None
+
 
 class VseAPI():
 
@@ -10,21 +230,108 @@ class VseAPI():
         self.vsmapi = VsmAPI(address, user, password)
         self.edgeId = edgeId
         self.configId = 0
+        self.coalescer = get_coalescer()
+        self.retry = get_retry_policy()
+        self.breaker = get_circuit_breaker(address, edgeId)
+        self.instrument = get_instrumentation()
+        self.jobs = get_job_poller(self)
+
+    def vsmconfig(self, method, uri, params=None, wait=False, **kwargs):
+        """Send a config request.
+
+        A change accepted as a job is only done when the job completes,
+        the shared poller of the edge tells when. The operations run in
+        the background by the task manager wait for it, as do the callers
+        asking to, and VsmJobFailed is raised if it does not complete. API
+        requests hold a database transaction and return as soon as the
+        job is accepted, its future goes to their collect_jobs block.
+        """
+        header, content = self.coalescer.vsmconfig(self, method, uri,
+                                                   params, **kwargs)
+        job = job_id(header)
+        if job is not None:
+            future = self.jobs.register(job)
+            if wait or in_background():
+                future.wait()
+            else:
+                collect_job(future)
+        return header, content
 
-    def vsmconfig(self, method, uri, params=None, **kwargs):
-        print "VseAPI('{}', '{}', '{}')".format(
-            method, uri, json.dumps(params))
-        header, content = self.vsmapi.api(method, uri, params)
-        print "header: '{}'".format(header)
-        print "content: '{}'".format(content)
-        if int(header['status']) / 100 != 2:
-            raise Exception(json.dumps(header) + "\n" + content)
+    def do_vsmconfig(self, method, uri, params=None, **kwargs):
+        """Send a config request, a job it is accepted as is polled from
+        then on."""
+        header, content = self.send(method, uri, params)
+        job = job_id(header)
+        if job is not None:
+            LOG.debug(_("%(method)s %(uri)s accepted as job %(job)s"),
+                      {'method': method, 'uri': uri, 'job': job})
+            self.jobs.register(job)
         if content == '':
             return header, {}
         if kwargs.get('decode', True):
             content = json.loads(content)
         return header, content
 
+    def send(self, method, uri, params=None):
+        """Send a request to the manager, returns its 2xx response.
+
+        Failed requests are retried as the retry policy allows, after a
+        jittered backoff; the requests made outside of the operations run
+        in the background hold a database transaction, and only get a few
+        short retries when rejected. Raises VsmRequestFailed with the
+        last response, or the connection error, once no retry is left, and
+        ManagerUnavailable while the circuit breaker of the edge is open.
+        Every request is recorded by the instrumentation.
+        """
+        # encoded once, for every attempt and for the metrics
+        body = json.dumps(params) if params else None
+        start = time.time() if self.instrument.sample() else None
+        attempt = 0
+        status = content = None
+        background = in_background()
+        try:
+            while True:
+                status = 'unavailable'
+                self.breaker.check()
+                status = 'error'
+                try:
+                    header, content = self.vsmapi.api(method, uri, body=body)
+                except CONNECTION_ERRORS as e:
+                    self.breaker.failure()
+                    if not self.retry.should_retry(method, attempt,
+                                                   background=background):
+                        raise
+                    reason = unicode(e) or e.__class__.__name__
+                else:
+                    status = int(header['status'])
+                    if status / 100 == 2:
+                        self.breaker.success()
+                        return header, content
+                    if status >= 500:
+                        self.breaker.failure()
+                    else:
+                        # the manager is up, the request was wrong or
+                        # rejected
+                        self.breaker.success()
+                    if not self.retry.should_retry(method, attempt, status,
+                                                   background):
+                        raise exceptions.VsmRequestFailed(
+                            method=method, uri=uri, status=status,
+                            content=content)
+                    reason = status
+                delay = self.retry.delay(attempt, background)
+                attempt += 1
+                LOG.debug(_("Retrying %(method)s %(uri)s in %(delay).2f "
+                            "seconds (attempt %(attempt)d) after "
+                            "%(reason)s"),
+                          {'method': method, 'uri': uri, 'delay': delay,
+                           'attempt': attempt, 'reason': reason})
+                eventlet.sleep(delay)
+        finally:
+            elapsed = time.time() - start if start is not None else None
+            self.instrument.record(self.edgeId, method, uri, status, attempt,
+                                   elapsed, body, content)
+
     def api(self, method, uri, params=None):
         header, content = self.vsmconfig(method, uri, params)
         return content
@@ -34,16 +341,10 @@ class VseAPI():
 
     def get_vsm_config(self):
         uri = '/api/3.0/edges/{}'.format(self.edgeId)
-        resp, content = self.vsmapi.api('GET', uri)
-        if int(resp['status']) != 200:
-            raise Exception(json.dumps(resp))
-
+        resp, content = self.send('GET', uri)
         return content
 
     def get_vse_config(self):
         uri = '/api/3.0/edges/{}/json'.format(self.edgeId)
-        resp, content = self.vsmapi.api('GET', uri)
-        if int(resp['status']) / 100 != 2:
-            raise Exception(json.dumps(resp))
-
+        resp, content = self.send('GET', uri)
         return content
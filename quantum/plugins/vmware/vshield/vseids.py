@@ -0,0 +1,170 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import threading
+import weakref
+
+from oslo.config import cfg
+from sqlalchemy import event
+from sqlalchemy import orm
+
+from quantum.plugins.vmware.vshield.common import config  # noqa
+from quantum.plugins.vmware.vshield.common import exceptions as vsh_exc
+
+
+class LRUCache(object):
+
+    def __init__(self, size):
+        self.size = size
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self._items[key] = value
+            return value
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def __len__(self):
+        return len(self._items)
+
+
+# session -> [(cache, uuid)] of the mappings added in its transaction
+_added = weakref.WeakKeyDictionary()
+_added_lock = threading.Lock()
+
+
+def _committed(session):
+    with _added_lock:
+        _added.pop(session, None)
+
+
+def _rolled_back(session):
+    """Drop the cached vseids of the mappings which were rolled back."""
+    with _added_lock:
+        added = _added.pop(session, ())
+    for cache, uuid in added:
+        cache.pop(uuid)
+
+
+event.listen(orm.Session, 'after_commit', _committed)
+event.listen(orm.Session, 'after_rollback', _rolled_back)
+
+
+class VseidMap(object):
+    """Maps the uuids of quantum objects to the ids of their edge objects.
+
+    The map is kept in a table with uuid and vseid columns. The vseid of an
+    object is set once when it is created on the edge and never changes, so
+    lookups are cached in memory; the cache entry is dropped when the
+    mapping is deleted, or when the transaction adding it rolls back.
+    Mappings deleted along with their object must be dropped with
+    forget().
+    """
+
+    def __init__(self, model, cache_size):
+        self.model = model
+        self.cache = LRUCache(cache_size)
+
+    def get(self, context, uuid):
+        """Return the vseid of uuid, or None if it has none."""
+        vseid = self.cache.get(uuid)
+        if vseid is None:
+            row = context.session.query(self.model.vseid).filter(
+                self.model.uuid == uuid).first()
+            if row is None:
+                return None
+            vseid = row.vseid
+            self.cache.put(uuid, vseid)
+        return vseid
+
+    def get_many(self, context, uuids):
+        """Return a {uuid: vseid} dict of the uuids having a vseid.
+
+        The uuids missing from the cache are read in one query.
+        """
+        result = {}
+        missing = []
+        for uuid in uuids:
+            vseid = self.cache.get(uuid)
+            if vseid is None:
+                missing.append(uuid)
+            else:
+                result[uuid] = vseid
+        if missing:
+            query = context.session.query(self.model.uuid, self.model.vseid)
+            for uuid, vseid in query.filter(self.model.uuid.in_(missing)):
+                self.cache.put(uuid, vseid)
+                result[uuid] = vseid
+        return result
+
+    def add(self, context, uuid, vseid):
+        context.session.add(self.model(uuid=uuid, vseid=vseid))
+        with _added_lock:
+            _added.setdefault(context.session, []).append((self.cache, uuid))
+        self.cache.put(uuid, vseid)
+
+    def forget(self, uuid):
+        """Drop the cached vseid of an object whose mapping row is deleted
+        along with the object.
+        """
+        self.cache.pop(uuid)
+
+    def delete(self, context, uuid):
+        self.cache.pop(uuid)
+        count = context.session.query(self.model).filter(
+            self.model.uuid == uuid).delete(synchronize_session=False)
+        if not count:
+            raise vsh_exc.VShieldException(
+                reason=_("%(model)s id for %(uuid)s not found") %
+                {'model': self.model.__name__, 'uuid': uuid})
+
+
+_maps = {}
+_maps_lock = threading.Lock()
+
+
+def get_vseid_map(model):
+    """Return the VseidMap shared by every user of model."""
+    with _maps_lock:
+        vseid_map = _maps.get(model)
+        if vseid_map is None:
+            vseid_map = VseidMap(model, cfg.CONF.vshield.vseid_cache_size)
+            _maps[model] = vseid_map
+        return vseid_map
+
+
+def forget_vseid_maps():
+    """Drop the vseid maps, new ones are made for this process."""
+    with _maps_lock:
+        _maps.clear()
+    with _added_lock:
+        _added.clear()
@@ -1,8 +1,161 @@
 #!/usr/bin/python
 
-import httplib2
-import json
 import base64
+import collections
+import httplib
+import json
+import select
+import socket
+import threading
+import time
+
+import httplib2
+from oslo.config import cfg
+
+from quantum.openstack.common import log as logging
+from quantum.plugins.vmware.vshield.common import config  # noqa
+from quantum.plugins.vmware.vshield import retry
+
+LOG = logging.getLogger(__name__)
+
+# errors which indicate the underlying connection can not be reused
+CONNECTION_ERRORS = (socket.error, httplib.HTTPException,
+                     httplib2.HttpLib2Error)
+
+
+class VsmConnectionPool(object):
+    """Bounded pool of keep-alive httplib2.Http objects for one VSM.
+
+    httplib2.Http keeps the TCP/TLS connection open between requests, but
+    it is not safe to share across threads, so every request checks one
+    out of the pool and returns it when done. At most max_connections
+    objects are handed out at the same time; callers block until one is
+    released.
+    """
+
+    def __init__(self, url, max_connections, idle_timeout, timeout):
+        self.url = url
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._free = collections.deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def _create(self):
+        http = httplib2.Http(timeout=self.timeout)
+        http.disable_ssl_certificate_validation = True
+        return http
+
+    @staticmethod
+    def _close(http):
+        for conn in http.connections.values():
+            try:
+                conn.close()
+            except Exception:
+                pass
+        http.connections.clear()
+
+    @staticmethod
+    def _is_healthy(http):
+        """An idle keep-alive socket must not be readable.
+
+        If it is, the manager either closed the connection or sent
+        something we did not ask for; both mean it can't be reused.
+        """
+        for conn in http.connections.values():
+            sock = getattr(conn, 'sock', None)
+            if sock is None:
+                continue
+            try:
+                readable, _w, _x = select.select([sock], [], [], 0)
+            except (select.error, socket.error, ValueError):
+                return False
+            if readable:
+                return False
+        return True
+
+    def get(self, fresh=False):
+        """Check out a connection, returns a (http, reused) tuple.
+
+        With fresh=True a new connection is always opened instead of
+        reusing a pooled one.
+        """
+        self._slots.acquire()
+        try:
+            now = time.time()
+            while not fresh:
+                with self._lock:
+                    if not self._free:
+                        break
+                    http, last_used = self._free.pop()
+                if (now - last_used < self.idle_timeout and
+                        self._is_healthy(http)):
+                    return http, True
+                LOG.debug(_("Discarding stale connection to %s"), self.url)
+                self._close(http)
+            return self._create(), False
+        except Exception:
+            self._slots.release()
+            raise
+
+    def put(self, http, healthy=True):
+        """Return a connection checked out by get()."""
+        try:
+            if healthy:
+                with self._lock:
+                    self._free.append((http, time.time()))
+            else:
+                self._close(http)
+        finally:
+            self._slots.release()
+        self.evict_idle()
+
+    def evict_idle(self):
+        """Close every pooled connection idle for longer than the timeout."""
+        deadline = time.time() - self.idle_timeout
+        with self._lock:
+            stale = [item for item in self._free if item[1] <= deadline]
+            for item in stale:
+                self._free.remove(item)
+        for http, last_used in stale:
+            self._close(http)
+        return len(stale)
+
+    def close(self):
+        with self._lock:
+            free, self._free = self._free, collections.deque()
+        for http, last_used in free:
+            self._close(http)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(url):
+    """Return the connection pool shared by every VsmAPI for url."""
+    with _pools_lock:
+        pool = _pools.get(url)
+        if pool is None:
+            pool = VsmConnectionPool(
+                url,
+                cfg.CONF.vshield.concurrent_connections,
+                cfg.CONF.vshield.connection_idle_timeout,
+                cfg.CONF.vshield.http_timeout)
+            _pools[url] = pool
+        return pool
+
+
+def forget_connection_pools():
+    """Drop the connection pools, new ones are made for this process.
+
+    Meant for a forked process: the connections it inherited are used by
+    its parent too. Their sockets are only closed in this process when the
+    pools are collected, the parent keeps them open.
+    """
+    with _pools_lock:
+        _pools.clear()
 
 
 class VsmAPI():
@@ -10,6 +163,7 @@ class VsmAPI():
     def __init__(self, url, user, password):
         self.authToken = base64.encodestring(user + ':' + password)
         self.url = url
+        self.pool = get_connection_pool(url)
 
     def _useHeaders(self):
         return {
@@ -18,13 +172,39 @@ class VsmAPI():
             'Authorization': 'Basic ' + self.authToken
         }
 
-    def api(self, method, uri, params=None):
-        url = self.url + uri
-        http = httplib2.Http()
-        http.disable_ssl_certificate_validation = True
-        if params:
+    def _request(self, http, url, method, body):
+        if body:
             return http.request(
-                url, method, body=json.dumps(params),
+                url, method, body=body,
                 headers=self._useHeaders())
         else:
             return http.request(url, method, headers=self._useHeaders())
+
+    def api(self, method, uri, params=None, body=None):
+        """Send a request, the body may be given already JSON encoded."""
+        if body is None and params:
+            body = json.dumps(params)
+        url = self.url + uri
+        http, reused = self.pool.get()
+        healthy = False
+        try:
+            try:
+                result = self._request(http, url, method, body)
+            except CONNECTION_ERRORS:
+                if (not reused or
+                        method.upper() not in retry.IDEMPOTENT_METHODS):
+                    raise
+                # the manager dropped a keep-alive connection while it sat
+                # in the pool, a request which may be sent twice is tried
+                # once more on a fresh one
+                LOG.debug(_("Connection to %s was reset, reconnecting"),
+                          self.url)
+                stale, http = http, None
+                self.pool.put(stale, healthy=False)
+                http, reused = self.pool.get(fresh=True)
+                result = self._request(http, url, method, body)
+            healthy = True
+        finally:
+            if http is not None:
+                self.pool.put(http, healthy=healthy)
+        return result
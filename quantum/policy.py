@@ -19,7 +19,11 @@
 Policy engine for quantum.  Largely copied from nova.
 """
 
+import contextlib
+import re
+
 from oslo.config import cfg
+from sqlalchemy.sql import expression as expr
 
 from quantum.api.v2 import attributes
 from quantum.common import exceptions
@@ -31,14 +35,26 @@ from quantum.openstack.common import policy
 LOG = logging.getLogger(__name__)
 _POLICY_PATH = None
 _POLICY_CACHE = {}
+# (action, names of the attributes set) -> match rule
+_MATCH_RULES = {}
+# the rules the fields below were found in, and rule name -> names of the
+# target fields the rule depends on
+_RULE_FIELDS = (None, {})
+_TARGET_FIELD = re.compile(r'%\(([^)]+)\)s')
+_ONLY_TARGET_FIELD = re.compile(r'^%\(([^)]+)\)s$')
+_MISSING = object()
 cfg.CONF.import_opt('policy_file', 'quantum.common.config')
 
 
 def reset():
     global _POLICY_PATH
     global _POLICY_CACHE
+    global _MATCH_RULES
+    global _RULE_FIELDS
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _MATCH_RULES = {}
+    _RULE_FIELDS = (None, {})
     policy.reset()
 
 
@@ -75,11 +91,20 @@ def _is_attribute_explicitly_set(attribute_name, resource, target):
             target[attribute_name] != resource[attribute_name]['default'])
 
 
-def _build_target(action, original_target, plugin, context):
+def _parent_tenant_field(resource):
+    """Return the target field _build_target adds for the resource."""
+    hierarchy_info = attributes.RESOURCE_HIERARCHY_MAP.get(resource)
+    if hierarchy_info:
+        return '%s_tenant_id' % hierarchy_info['parent'][:-1]
+
+
+def _build_target(action, original_target, plugin, context,
+                  parent_tenants=None):
     """Augment dictionary of target attributes for policy engine.
 
     This routine adds to the dictionary attributes belonging to the
-    "parent" resource of the targeted one.
+    "parent" resource of the targeted one. The tenants of the parents are
+    looked up once per parent id when a parent_tenants dict is given.
     """
     target = original_target.copy()
     resource, _a = get_resource_and_action(action)
@@ -87,15 +112,31 @@ def _build_target(action, original_target, plugin, context):
     if hierarchy_info and plugin:
         # use the 'singular' version of the resource name
         parent_resource = hierarchy_info['parent'][:-1]
-        parent_id = hierarchy_info['identified_by']
-        f = getattr(plugin, 'get_%s' % parent_resource)
-        # f *must* exist, if not found it is better to let quantum explode
-        # Note: we do not use admin context
-        data = f(context, target[parent_id], fields=['tenant_id'])
-        target['%s_tenant_id' % parent_resource] = data['tenant_id']
+        parent_id = target[hierarchy_info['identified_by']]
+        if parent_tenants is None or parent_id not in parent_tenants:
+            f = getattr(plugin, 'get_%s' % parent_resource)
+            # f *must* exist, if not found it is better to let quantum
+            # explode
+            # Note: we do not use admin context
+            data = f(context, parent_id, fields=['tenant_id'])
+            if parent_tenants is None:
+                parent_tenants = {}
+            parent_tenants[parent_id] = data['tenant_id']
+        target['%s_tenant_id' % parent_resource] = parent_tenants[parent_id]
     return target
 
 
+def _explicitly_set_attributes(resource, target):
+    """Names of the attributes with a policy of their own which the target
+    sets to a non-default value."""
+    res_map = attributes.RESOURCE_ATTRIBUTE_MAP.get(resource)
+    if not res_map:
+        return frozenset()
+    return frozenset(name for name, attribute in res_map.iteritems()
+                     if 'enforce_policy' in attribute and
+                     _is_attribute_explicitly_set(name, res_map, target))
+
+
 def _build_match_rule(action, target):
     """Create the rule to match for a given action.
 
@@ -105,27 +146,75 @@ def _build_match_rule(action, target):
     3) add an entry for attributes of a resource for which the action
        is being executed (e.g.: create_network:shared)
 
+    The rule only depends on the action and on which attributes are set,
+    so it is built once for each of them.
     """
 
-    match_rule = policy.RuleCheck('rule', action)
     resource, is_write = get_resource_and_action(action)
+    set_attributes = frozenset()
     if is_write:
-        # assigning to variable with short name for improving readability
-        res_map = attributes.RESOURCE_ATTRIBUTE_MAP
-        if resource in res_map:
-            for attribute_name in res_map[resource]:
-                if _is_attribute_explicitly_set(attribute_name,
-                                                res_map[resource],
-                                                target):
-                    attribute = res_map[resource][attribute_name]
-                    if 'enforce_policy' in attribute and is_write:
-                        attr_rule = policy.RuleCheck('rule', '%s:%s' %
-                                                     (action, attribute_name))
-                        match_rule = policy.AndCheck([match_rule, attr_rule])
+        set_attributes = _explicitly_set_attributes(resource, target)
+    match_rule = _MATCH_RULES.get((action, set_attributes))
+    if match_rule is None:
+        match_rule = policy.RuleCheck('rule', action)
+        res_map = attributes.RESOURCE_ATTRIBUTE_MAP.get(resource, {})
+        for attribute_name in res_map:
+            if attribute_name in set_attributes:
+                attr_rule = policy.RuleCheck('rule', '%s:%s' %
+                                             (action, attribute_name))
+                match_rule = policy.AndCheck([match_rule, attr_rule])
+        _MATCH_RULES[(action, set_attributes)] = match_rule
 
     return match_rule
 
 
+def _check_fields(check, seen=()):
+    """Return the names of the target fields the result of a check depends
+    on, or None if they cannot be told."""
+    if isinstance(check, (policy.TrueCheck, policy.FalseCheck,
+                          policy.RoleCheck)):
+        return frozenset()
+    if isinstance(check, policy.NotCheck):
+        return _check_fields(check.rule, seen)
+    if isinstance(check, (policy.AndCheck, policy.OrCheck)):
+        fields = set()
+        for rule in check.rules:
+            rule_fields = _check_fields(rule, seen)
+            if rule_fields is None:
+                return None
+            fields |= rule_fields
+        return frozenset(fields)
+    if isinstance(check, policy.RuleCheck):
+        return _rule_fields(check.match, seen)
+    if isinstance(check, FieldCheck):
+        return frozenset([check.field])
+    if isinstance(check, policy.GenericCheck):
+        return frozenset(_TARGET_FIELD.findall(check.match))
+    # e.g. http checks, which send the whole target
+    return None
+
+
+def _rule_fields(name, seen=()):
+    global _RULE_FIELDS
+    rules = policy._rules
+    if rules is None:
+        return None
+    if _RULE_FIELDS[0] is not rules:
+        _RULE_FIELDS = (rules, {})
+    cache = _RULE_FIELDS[1]
+    if name not in cache:
+        if name in seen:
+            # a rule referring to itself adds no field
+            return frozenset()
+        try:
+            rule = rules[name]
+        except KeyError:
+            # fails closed, whatever the target
+            return frozenset()
+        cache[name] = _check_fields(rule, seen + (name,))
+    return cache[name]
+
+
 @policy.register('field')
 class FieldCheck(policy.Check):
     def __init__(self, kind, match):
@@ -183,6 +272,171 @@ def check(context, action, target, plugin=None):
     return policy.check(match_rule, real_target, credentials)
 
 
+def filter_allowed(context, action, targets, plugin=None):
+    """Return the targets on which the action is valid in this context.
+
+    Equivalent to calling check() on every target, but the rule is only
+    evaluated once for targets which agree on the fields it depends on,
+    e.g. once per tenant for an admin_or_owner rule, and the parent of a
+    resource is only looked up when the rule depends on its tenant, once
+    per parent.
+
+    :param context: quantum context
+    :param action: string representing the action to be checked
+    :param targets: list of dictionaries representing the objects
+    :param plugin: quantum plugin used to retrieve information required
+        for augmenting the targets
+    """
+    init()
+    resource, _a = get_resource_and_action(action)
+    credentials = context.to_dict()
+    parent_tenants = {}
+    # match rule -> fields, (match rule, values of the fields) -> result
+    rule_fields = {}
+    results = {}
+    allowed = []
+    for target in targets:
+        match_rule = _build_match_rule(action, target)
+        if match_rule not in rule_fields:
+            rule_fields[match_rule] = _check_fields(match_rule)
+        fields = rule_fields[match_rule]
+        if fields is not None and _parent_tenant_field(resource) not in fields:
+            real_target = _build_target(action, target, None, context)
+        else:
+            real_target = _build_target(action, target, plugin, context,
+                                        parent_tenants)
+        key = None
+        if fields is not None:
+            key = (match_rule, tuple(real_target.get(field, _MISSING)
+                                     for field in sorted(fields)))
+            try:
+                hash(key)
+            except TypeError:
+                # targets with unhashable values are checked one by one
+                key = None
+        if key is not None and key in results:
+            result = results[key]
+        else:
+            result = policy.check(match_rule, real_target, credentials)
+            if key is not None:
+                results[key] = result
+        if result:
+            allowed.append(target)
+    return allowed
+
+
+def _check_condition(check, creds, field_condition, seen=()):
+    """Translate a check into a condition on the rows of the targets.
+
+    Returns True or False when the result does not depend on the target,
+    or None if the check cannot be translated.
+    """
+    if isinstance(check, (policy.TrueCheck, policy.FalseCheck,
+                          policy.RoleCheck)):
+        return check({}, creds)
+    if isinstance(check, (policy.AndCheck, policy.OrCheck)):
+        is_and = isinstance(check, policy.AndCheck)
+        conditions = []
+        for rule in check.rules:
+            condition = _check_condition(rule, creds, field_condition, seen)
+            if condition is (not is_and):
+                # decides the result whatever the other rules are
+                return condition
+            if condition is not is_and:
+                conditions.append(condition)
+        if not conditions:
+            return is_and
+        if any(condition is None for condition in conditions):
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return expr.and_(*conditions) if is_and else expr.or_(*conditions)
+    if isinstance(check, policy.RuleCheck):
+        if check.match in seen or policy._rules is None:
+            return None
+        try:
+            rule = policy._rules[check.match]
+        except KeyError:
+            # fails closed, whatever the target
+            return False
+        return _check_condition(rule, creds, field_condition,
+                                seen + (check.match,))
+    if isinstance(check, FieldCheck):
+        return field_condition(check.field, check.value)
+    if isinstance(check, policy.GenericCheck):
+        if not _TARGET_FIELD.search(check.match):
+            return check({}, creds)
+        match = _ONLY_TARGET_FIELD.match(check.match)
+        if not match:
+            return None
+        if check.kind not in creds:
+            return False
+        # the value of the field is compared as a string
+        return field_condition(match.group(1), unicode(creds[check.kind]))
+    # not checks, as NULL values would be negated as SQL does, and e.g.
+    # http checks
+    return None
+
+
+def query_condition(context, action, field_condition):
+    """Translate the rule of a read action into a query condition.
+
+    :param context: quantum context
+    :param action: string representing the read action, e.g. get_network
+    :param field_condition: callable taking the name of a target field and
+        a value, returning the condition for the field of a row to equal
+        the value, or None if the field cannot be queried
+
+    :return: the condition met by the rows of the targets the action is
+        valid on in this context, or None if the rule cannot be
+        translated.
+    """
+    init()
+    match_rule = _build_match_rule(action, {})
+    condition = _check_condition(match_rule, context.to_dict(),
+                                 field_condition)
+    if condition is True:
+        return expr.true()
+    if condition is False:
+        return expr.false()
+    return condition
+
+
+class ListFilter(object):
+    """The read rule of a collection, for the query listing it to apply.
+
+    The rule is applied by the query on the model of the collection when
+    it can be translated, which then marks it as applied: the rows listed
+    need no check of their own.
+    """
+
+    def __init__(self, context, action, collection):
+        self.context = context
+        self.action = action
+        self.collection = collection
+        self.applied = False
+
+
+def current_list_filter(context):
+    """Return the filter of the collection listed with context, if any."""
+    return getattr(context, 'list_filter', None)
+
+
+@contextlib.contextmanager
+def list_filter(context, action, collection):
+    """Set the read rule of collection for the queries made with context
+    to apply while it is listed."""
+    previous = current_list_filter(context)
+    context.list_filter = ListFilter(context, action, collection)
+    try:
+        yield context.list_filter
+    finally:
+        if previous is None:
+            del context.list_filter
+        else:
+            context.list_filter = previous
+
+
 def enforce(context, action, target, plugin=None):
     """Verifies that the action is valid on the target in this context.
 
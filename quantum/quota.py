@@ -20,6 +20,7 @@ from oslo.config import cfg
 import webob
 
 from quantum.common import exceptions
+from quantum.db import quota_db
 from quantum.openstack.common import importutils
 from quantum.openstack.common import log as logging
 
@@ -48,6 +49,19 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default='quantum.quota.ConfDriver',
                help=_('Default driver to use for quota checks')),
+    cfg.BoolOpt('track_quota_usage',
+                default=True,
+                help=_('Keep the usage of the resources stored in the '
+                       'database in a table rather than counting them on '
+                       'every create')),
+    cfg.IntOpt('quota_usage_sync_interval',
+               default=3600,
+               help=_('Seconds after which the usage of a tenant is '
+                      'counted again, to correct any drift')),
+    cfg.IntOpt('reservation_expiration',
+               default=600,
+               help=_('Seconds after which resources reserved for a '
+                      'create which did not end are released')),
 ]
 # Register the configuration options
 cfg.CONF.register_opts(quota_opts, 'QUOTAS')
@@ -280,6 +294,76 @@ class QuotaEngine(object):
         return self._driver.limit_check(context, tenant_id,
                                         self._resources, values)
 
+    def track_usage(self, plugin, collection, resource):
+        """Keep the usage of a resource in the usage table.
+
+        The usage follows the rows created and deleted when the plugin
+        keeps the items of collection in the rows of a model, and has
+        to be tracked before the first of them changes: it is called for
+        every collection of the API as it is loaded.
+
+        :return: The model tracked, None if the usage of the resource is
+                 counted.
+        """
+        if (resource not in self._resources or
+                not cfg.CONF.QUOTAS.track_quota_usage or
+                not getattr(plugin, '_quota_usage_tracked', False)):
+            return None
+        model = quota_db.tracked_model(collection)
+        if model is not None:
+            quota_db.track_usage(model, resource)
+        return model
+
+    def reserve(self, context, tenant_id, plugin, collection, **deltas):
+        """Check the quotas of resources and reserve them for a tenant.
+
+        The resources, given as keyword arguments where the key is the
+        name of the resource and the value the number to reserve, are the
+        items of collection. Their usage is read from the usage table when
+        the plugin keeps them in the rows of a model, otherwise it is
+        counted as count() does and nothing is reserved.
+
+        This method will raise a QuotaResourceUnknown exception if a
+        given resource is unknown, and an OverQuota exception if the
+        reservation would put a resource over its quota.
+
+        :param context: The request context, for access checks.
+        :param tenant_id: The tenant to reserve the resources for.
+        :param plugin: The plugin counting the resources.
+        :param collection: The name of the collection of the resources.
+        :return: The ids of the reservations, to commit once the resources
+                 are created or to roll back if they are not.
+        """
+        unknown = [name for name in deltas if name not in self._resources]
+        if unknown:
+            raise exceptions.QuotaResourceUnknown(unknown=sorted(unknown))
+
+        def count(name):
+            return self.count(context, name, plugin, collection, tenant_id)
+
+        def check(values):
+            self.limit_check(context, tenant_id, **values)
+
+        model = None
+        # the rows of the collection are the usage of a single resource
+        if len(deltas) == 1:
+            model = self.track_usage(plugin, collection, deltas.keys()[0])
+        if model is None:
+            check(dict((name, count(name) + delta)
+                       for name, delta in deltas.iteritems()))
+            return []
+        return quota_db.reserve(context, tenant_id, deltas, count, check,
+                                cfg.CONF.QUOTAS.quota_usage_sync_interval,
+                                cfg.CONF.QUOTAS.reservation_expiration)
+
+    def commit(self, context, reservations):
+        """Commit reservations, once the resources are created."""
+        quota_db.release(context, reservations)
+
+    def rollback(self, context, reservations):
+        """Roll back reservations, if the resources were not created."""
+        quota_db.release(context, reservations)
+
     @property
     def resources(self):
         return self._resources
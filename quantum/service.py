@@ -42,6 +42,10 @@ service_opts = [
                help=_('range of seconds to randomly delay when starting the'
                       ' periodic task scheduler to reduce stampeding.'
                       ' (Disable by setting to 0)')),
+    cfg.IntOpt('api_workers',
+               default=0,
+               help=_('Number of separate worker processes serving the API,'
+                      ' 0 to serve it in the server process')),
 ]
 CONF = cfg.CONF
 CONF.register_opts(service_opts)
@@ -107,7 +111,8 @@ def _run_wsgi(app_name):
         LOG.error(_('No known API applications configured.'))
         return
     server = wsgi.Server("Quantum")
-    server.start(app, cfg.CONF.bind_port, cfg.CONF.bind_host)
+    server.start(app, cfg.CONF.bind_port, cfg.CONF.bind_host,
+                 workers=cfg.CONF.api_workers)
     # Dump all option values here after all options are parsed
     cfg.CONF.log_opt_values(LOG, std_logging.DEBUG)
     LOG.info(_("Quantum service started, listening on %(host)s:%(port)s"),
@@ -257,3 +257,40 @@ class ResourceTestCase(base.BaseTestCase):
         res = resource.post('', params='{"key": "val"}',
                             extra_environ=environ, expect_errors=True)
         self.assertEqual(res.status_int, 200)
+
+    def _test_items_streamed(self, fmt):
+        controller = mock.MagicMock()
+        controller.index = lambda request: {'items': [{'id': i}
+                                                      for i in range(3)]}
+
+        resource = webtest.TestApp(wsgi_resource.Resource(controller))
+
+        environ = {'wsgiorg.routing_args': (None, {'action': 'index',
+                                                   'format': fmt})}
+        res = resource.get('', extra_environ=environ)
+        self.assertEqual(res.status_int, 200)
+        return res
+
+    def test_items_streamed_with_json(self):
+        res = self._test_items_streamed('json')
+        self.assertEqual(wsgi.JSONDeserializer().deserialize(res.body),
+                         {'body': {'items': [{'id': 0}, {'id': 1},
+                                             {'id': 2}]}})
+
+    def test_items_streamed_with_xml(self):
+        res = self._test_items_streamed('xml')
+        self.assertEqual(res.body.count('<item>'), 3)
+
+    def test_item_not_streamed(self):
+        controller = mock.MagicMock()
+        controller.show = lambda request: {'item': {'id': 1}}
+
+        resource = webtest.TestApp(wsgi_resource.Resource(controller))
+
+        environ = {'wsgiorg.routing_args': (None, {'action': 'show',
+                                                   'format': 'json'})}
+        res = resource.get('', extra_environ=environ)
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.content_length, len(res.body))
+        self.assertEqual(wsgi.JSONDeserializer().deserialize(res.body),
+                         {'body': {'item': {'id': 1}}})
@@ -45,3 +45,16 @@ class DBTestCase(base.BaseTestCase):
                 self.assertEqual(mock_log.call_count, 1)
                 args = mock_log.call_args
                 self.assertNotEqual(args.find('sql_connection'), -1)
+
+    def test_forget_connections(self):
+        engine = mock.Mock()
+        pool = engine.pool
+        self.useFixture(fixtures.MonkeyPatch('quantum.db.api._ENGINE',
+                                             engine))
+        self.useFixture(fixtures.MonkeyPatch(
+            'quantum.db.api._INHERITED_POOLS', []))
+        db.forget_connections()
+        # still open for the parent process
+        self.assertFalse(pool.dispose.called)
+        self.assertEqual(engine.pool, pool.recreate.return_value)
+        self.assertEqual(db._INHERITED_POOLS, [pool])
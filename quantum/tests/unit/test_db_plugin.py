@@ -41,7 +41,9 @@ from quantum.db import api as db
 from quantum.db import db_base_plugin_v2
 from quantum.db import models_v2
 from quantum.manager import QuantumManager
+from quantum.openstack.common import policy as common_policy
 from quantum.openstack.common import timeutils
+from quantum import policy
 from quantum.tests import base
 from quantum.tests.unit import test_extensions
 from quantum.tests.unit import testlib_api
@@ -2132,6 +2134,27 @@ class TestNetworksV2(QuantumDbPluginV2TestCase):
                                             (net1, net2, net3),
                                             ('name', 'asc'), 2, 2)
 
+    def test_list_networks_with_pagination_native_and_policy(self):
+        if self._skip_native_pagination:
+            self.skipTest("Skip test for not implemented pagination feature")
+        policy.init()
+        self.addCleanup(policy.reset)
+        # the shared networks of other tenants are not visible
+        common_policy._rules['get_network'] = common_policy.parse_rule(
+            'rule:admin_or_owner')
+        ctx = context.Context('', 'another_tenant')
+        with contextlib.nested(self.network(name='net1', shared=True),
+                               self.network(name='net2', shared=True),
+                               self.network(name='net3',
+                                            tenant_id='another_tenant'),
+                               self.network(name='net4',
+                                            tenant_id='another_tenant')):
+            res = self._list('networks', quantum_context=ctx,
+                             query_params='limit=2&sort_key=name&'
+                                          'sort_dir=asc')
+            self.assertEqual([net['name'] for net in res['networks']],
+                             ['net3', 'net4'])
+
     def test_list_networks_with_pagination_emulated(self):
         helper_patcher = mock.patch(
             'quantum.api.v2.base.Controller._get_pagination_helper',
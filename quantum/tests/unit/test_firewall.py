@@ -15,6 +15,7 @@
 #    under the License.
 
 import json
+import mock
 from oslo.config import cfg
 import testtools
 import webob.exc as webexc
@@ -44,6 +45,9 @@ class FirewallTestPlugin(
     db_base_plugin_v2.QuantumDbPluginV2):
 
     supported_extension_aliases = ["fwaas"]
+    __native_bulk_support = True
+    __native_pagination_support = True
+    __native_sorting_support = True
 
     def get_plugin_type(self):
         return constants.FIREWALL
@@ -74,9 +78,15 @@ class FirewallTestCase(base.BaseTestCase):
         db._MAKER = None
         # Ensure existing ExtensionManager is not used
 
+        self.plugin = FirewallTestPlugin()
+        self._load_api()
+
+        self._tenant_id = "8c70909f-b081-452d-872b-df48e6c355d1"
+
+    def _load_api(self):
         ext_mgr = extensions.PluginAwareExtensionManager(
             extensions_path,
-            {constants.FIREWALL: FirewallTestPlugin()}
+            {constants.FIREWALL: self.plugin}
         )
         extensions.PluginAwareExtensionManager._instance = ext_mgr
         router.APIRouter()
@@ -84,7 +94,10 @@ class FirewallTestCase(base.BaseTestCase):
         app = config.load_paste_app('extensions_test_app')
         self._api = extensions.ExtensionMiddleware(app, ext_mgr=ext_mgr)
 
-        self._tenant_id = "8c70909f-b081-452d-872b-df48e6c355d1"
+    def _enable_native_paging(self):
+        cfg.CONF.set_override('allow_pagination', True)
+        cfg.CONF.set_override('allow_sorting', True)
+        self._load_api()
 
     def _do_request(self, method, path, data=None, params=None, action=None):
         content_type = 'application/json'
@@ -247,6 +260,86 @@ class FirewallTestCase(base.BaseTestCase):
         self.assertEqual(r4['id'], rule4['id'])
         self.assertEqual(r5['id'], rule5['id'])
 
+    def test_rules_create_bulk(self):
+        ipobj = self._ipobj_create()
+        svcobj = self._serviceobj_create()
+        data = {'rules': [
+            {'rule': {'tenant_id': self._tenant_id,
+                      'name': 'rule %d' % i,
+                      'source': {'ipobjs': [ipobj['id']]},
+                      'service': {'serviceobjs': [svcobj['id']]},
+                      'action': 'accept'}}
+            for i in range(3)]}
+        with mock.patch.object(FirewallTestPlugin, 'create_rule') as create:
+            res = self._do_request('POST', _get_path('firewall/rules'), data)
+        # not emulated by creating the rules one by one
+        self.assertFalse(create.called)
+        self.assertEqual([r['name'] for r in res['rules']],
+                         ['rule 0', 'rule 1', 'rule 2'])
+        rules = self._get_resources('rule')
+        self.assertEqual([r['id'] for r in rules],
+                         [r['id'] for r in res['rules']])
+        self.assertEqual(rules[2]['source']['ipobjs'], [ipobj['id']])
+
+    def _simple_rule_create(self, name, location=None):
+        data = {'rule': {'tenant_id': self._tenant_id, 'name': name,
+                         'action': 'accept', 'location': location}}
+        res = self._do_request('POST', _get_path('firewall/rules'), data)
+        return res['rule']
+
+    def test_rules_renumbered_when_no_gap_left(self):
+        with mock.patch.object(fw_db, 'RULE_POSITION_GAP', 2):
+            last = self._simple_rule_create('last')
+            first = self._simple_rule_create('first', last['id'])
+            # each insert halves the gap before the last rule
+            for i in range(4):
+                self._simple_rule_create('middle %d' % i, last['id'])
+        rules = self._get_resources('rule')
+        self.assertEqual([r['name'] for r in rules],
+                         ['first', 'middle 0', 'middle 1', 'middle 2',
+                          'middle 3', 'last'])
+        self.assertEqual(rules[0]['id'], first['id'])
+
+    def test_rules_paged_in_order(self):
+        ids = [self._simple_rule_create('rule %d' % i)['id']
+               for i in range(5)]
+        context = q_context.Context('', self._tenant_id)
+        page = self.plugin.get_rules(context, limit=2, marker=ids[1])
+        self.assertEqual([r['id'] for r in page], ids[2:4])
+        page = self.plugin.get_rules(context, limit=2, marker=ids[3],
+                                     page_reverse=True)
+        self.assertEqual([r['id'] for r in page], ids[1:3])
+
+    def test_rules_listed_in_pages(self):
+        self._enable_native_paging()
+        ids = [self._simple_rule_create('rule %d' % i)['id']
+               for i in range(3)]
+        # a rule inserted before the first one comes first
+        ids.insert(0, self._simple_rule_create('rule 3', ids[0])['id'])
+        res = self._do_request('GET', _get_path('firewall/rules'),
+                               params='limit=3')
+        self.assertEqual([r['id'] for r in res['rules']], ids[:3])
+        res = self._do_request('GET', _get_path('firewall/rules'),
+                               params='limit=3&marker=%s' % ids[2])
+        self.assertEqual([r['id'] for r in res['rules']], ids[3:])
+
+    def test_rules_sorted(self):
+        self._enable_native_paging()
+        for name in ('b', 'c', 'a'):
+            self._simple_rule_create(name)
+        res = self._do_request('GET', _get_path('firewall/rules'),
+                               params='sort_key=name&sort_dir=desc')
+        self.assertEqual([r['name'] for r in res['rules']],
+                         ['c', 'b', 'a'])
+
+    def test_ipobjs_listed_in_pages(self):
+        self._enable_native_paging()
+        ids = sorted(self._ipobj_create()['id'] for i in range(3))
+        res = self._do_request('GET', _get_path('firewall/ipobjs'),
+                               params='limit=2&marker=%s' % ids[2] +
+                               '&page_reverse=True')
+        self.assertEqual([o['id'] for o in res['ipobjs']], ids[:2])
+
     def test_ipobj_create(self):
         ipobj = self._ipobj_create()
         ipobj1 = self._get_resource('ipobj', ipobj['id'])
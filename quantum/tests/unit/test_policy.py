@@ -24,6 +24,7 @@ import mock
 import quantum
 from quantum.common import exceptions
 from quantum import context
+from quantum.db import models_v2
 from quantum.openstack.common import importutils
 from quantum.openstack.common import policy as common_policy
 from quantum import policy
@@ -219,6 +220,8 @@ class QuantumPolicyTestCase(base.BaseTestCase):
                            "rule:shared or "
                            "rule:external",
             "create_port:mac": "rule:admin_or_network_owner",
+            "get_port": "rule:admin_or_network_owner",
+            "get_subnet": "rule:admin_or_owner",
         }.items())
 
         def fakepolicyinit():
@@ -300,3 +303,86 @@ class QuantumPolicyTestCase(base.BaseTestCase):
             target = {'network_id': 'whatever'}
             result = policy.enforce(self.context, action, target, self.plugin)
             self.assertTrue(result)
+
+    def test_match_rule_built_once_per_set_attributes(self):
+        rule = policy._build_match_rule('create_network',
+                                        {'shared': True, 'name': 'net1'})
+        self.assertEqual(str(rule),
+                         '(rule:create_network and '
+                         'rule:create_network:shared)')
+        self.assertIs(policy._build_match_rule('create_network',
+                                               {'shared': True}), rule)
+        self.assertIsNot(policy._build_match_rule('create_network', {}),
+                         rule)
+
+    def test_filter_allowed_checks_once_per_distinct_fields(self):
+        targets = [{'id': i, 'tenant_id': tenant, 'shared': shared}
+                   for i, (tenant, shared) in enumerate(
+                       [('fake', False), ('other', True), ('other', False),
+                        ('fake', False), ('other', True), ('other', False)])]
+        with mock.patch.object(common_policy, 'check',
+                               wraps=common_policy.check) as check:
+            allowed = policy.filter_allowed(self.context, 'get_network',
+                                            targets)
+        self.assertEqual([t['id'] for t in allowed], [0, 1, 3, 4])
+        self.assertEqual(check.call_count, 3)
+
+    def test_filter_allowed_looks_up_parents_once(self):
+        targets = [{'tenant_id': 'other', 'network_id': network_id}
+                   for network_id in ('net1', 'net2', 'net1', 'net1')]
+        tenants = {'net1': 'fake', 'net2': 'other'}
+
+        def fakegetnetwork(context, id, fields=None):
+            return {'tenant_id': tenants[id]}
+
+        with mock.patch.object(self.plugin, 'get_network',
+                               side_effect=fakegetnetwork) as get_network:
+            allowed = policy.filter_allowed(self.context, 'get_port',
+                                            targets, self.plugin)
+            self.assertEqual([t['network_id'] for t in allowed],
+                             ['net1', 'net1', 'net1'])
+            self.assertEqual(get_network.call_count, 2)
+
+            # not looked up when the rule does not need them
+            get_network.reset_mock()
+            allowed = policy.filter_allowed(self.context, 'get_subnet',
+                                            targets, self.plugin)
+            self.assertEqual(allowed, [])
+            self.assertFalse(get_network.called)
+
+    def _query_condition(self, context, action):
+        def field_condition(field, value):
+            if field in ('tenant_id', 'shared'):
+                return getattr(models_v2.Network, field) == value
+        return policy.query_condition(context, action, field_condition)
+
+    def test_query_condition(self):
+        condition = self._query_condition(self.context, 'get_subnet')
+        self.assertEqual(str(condition), 'networks.tenant_id = :tenant_id_1')
+        self.assertEqual(condition.right.value, 'fake')
+        self.rules['get_subnet'] = common_policy.parse_rule(
+            'rule:admin_or_owner or rule:shared')
+        self.assertEqual(str(self._query_condition(self.context,
+                                                   'get_subnet')),
+                         'networks.tenant_id = :tenant_id_1 OR '
+                         'networks.shared = :shared_1')
+
+    def test_query_condition_of_constant_rules(self):
+        admin_context = context.get_admin_context()
+        self.assertEqual(str(self._query_condition(admin_context,
+                                                   'get_network')), 'true')
+        self.rules['get_router'] = common_policy.parse_rule('@')
+        self.assertEqual(str(self._query_condition(self.context,
+                                                   'get_router')), 'true')
+        self.rules['get_router'] = common_policy.parse_rule('rule:admin_only')
+        self.assertEqual(str(self._query_condition(self.context,
+                                                   'get_router')), 'false')
+
+    def test_query_condition_untranslatable(self):
+        # on a field which cannot be queried
+        self.assertIsNone(self._query_condition(self.context, 'get_network'))
+        # on the tenant of the parent
+        self.assertIsNone(self._query_condition(self.context, 'get_port'))
+        self.rules['get_subnet'] = common_policy.parse_rule(
+            'not rule:admin_or_owner')
+        self.assertIsNone(self._query_condition(self.context, 'get_subnet'))
@@ -19,6 +19,7 @@ import os
 import types
 
 import fixtures
+import mock
 
 from oslo.config import cfg
 
@@ -81,3 +82,19 @@ class QuantumManagerTestCase(base.BaseTestCase):
                             "for the same type")
         except Exception as e:
             LOG.debug(str(e))
+
+    def test_after_fork_reaches_plugins_which_have_it(self):
+        cfg.CONF.set_override("core_plugin",
+                              test_config.get('plugin_name_v2',
+                                              DB_PLUGIN_KLASS))
+        cfg.CONF.set_override("service_plugins",
+                              ["quantum.tests.unit.dummy_plugin."
+                               "DummyServicePlugin"])
+        plugin = QuantumManager.get_service_plugins()[constants.DUMMY]
+        plugin.after_fork = mock.Mock()
+        QuantumManager.after_fork()
+        plugin.after_fork.assert_called_once_with()
+
+    def test_after_fork_without_plugins(self):
+        QuantumManager.after_fork()
+        self.assertIsNone(QuantumManager._instance)
@@ -1,3 +1,5 @@
+import datetime
+
 import mock
 from oslo.config import cfg
 import testtools
@@ -5,14 +7,18 @@ import webtest
 
 from quantum.api import extensions
 from quantum.api.v2 import attributes
+from quantum.api.v2 import router
 from quantum.common import config
 from quantum.common import exceptions
 from quantum import context
 from quantum.db import api as db
+from quantum.db import models_v2
+from quantum.db import quota_db
 from quantum import manager
 from quantum.plugins.linuxbridge.db import l2network_db_v2
 from quantum import quota
 from quantum.tests.unit import test_api_v2
+from quantum.tests.unit import test_db_plugin
 from quantum.tests.unit import test_extensions
 from quantum.tests.unit import testlib_api
 
@@ -341,3 +347,82 @@ class QuotaExtensionCfgTestCase(QuotaExtensionTestCase):
 
 class QuotaExtensionCfgTestCaseXML(QuotaExtensionCfgTestCase):
     fmt = 'xml'
+
+
+class QuotaUsageTestCase(test_db_plugin.QuantumDbPluginV2TestCase):
+
+    def setUp(self):
+        super(QuotaUsageTestCase, self).setUp()
+        cfg.CONF.set_override('quota_network', 2, group='QUOTAS')
+        self.context = context.get_admin_context()
+        plugin = manager.QuantumManager.get_plugin()
+        self.count = mock.patch.object(plugin, 'get_networks_count',
+                                       wraps=plugin.get_networks_count)
+        self.count.start()
+        self.addCleanup(self.count.stop)
+
+    def _usage(self):
+        usage = self.context.session.query(quota_db.QuotaUsage).filter_by(
+            tenant_id=self._tenant_id, resource='network').one()
+        self.context.session.refresh(usage)
+        return usage
+
+    def _reservations(self):
+        return self.context.session.query(quota_db.Reservation).count()
+
+    def _create(self, expected_status):
+        res = self._create_network(self.fmt, 'net', True)
+        self.assertEqual(res.status_int, expected_status)
+        return res
+
+    def test_usage_follows_creates_and_deletes(self):
+        self._create(201)
+        net = self.deserialize(self.fmt, self._create(201))
+        usage = self._usage()
+        self.assertEqual((usage.in_use, usage.reserved), (2, 0))
+        self.assertEqual(self._reservations(), 0)
+        # counted only when the usage was first read
+        plugin = manager.QuantumManager.get_plugin()
+        self.assertEqual(plugin.get_networks_count.call_count, 1)
+
+        self._create(409)
+        self._delete('networks', net['network']['id'])
+        self.assertEqual(self._usage().in_use, 1)
+        self._create(201)
+        self.assertEqual(plugin.get_networks_count.call_count, 1)
+
+    def test_usage_tracked_once_api_loaded(self):
+        # before any create, so that no delete is missed
+        with mock.patch.object(quota_db, 'track_usage') as track_usage:
+            router.APIRouter()
+        self.assertIn(mock.call(models_v2.Network, 'network'),
+                      track_usage.call_args_list)
+
+    def test_reservation_rolled_back_when_create_fails(self):
+        plugin = manager.QuantumManager.get_plugin()
+        with mock.patch.object(plugin, 'create_network',
+                               side_effect=exceptions.BadRequest(
+                                   resource='network', msg='failed')):
+            self._create(400)
+        usage = self._usage()
+        self.assertEqual((usage.in_use, usage.reserved), (0, 0))
+        self.assertEqual(self._reservations(), 0)
+
+    def test_drift_corrected_once_usage_stale(self):
+        self._create(201)
+        # e.g. a network deleted without its usage following
+        usage = self._usage()
+        with self.context.session.begin():
+            usage.in_use = 2
+            self.context.session.add(quota_db.Reservation(
+                id='r1', tenant_id=self._tenant_id, resource='network',
+                delta=1, expiration=datetime.datetime(2000, 1, 1)))
+        self._create(409)
+
+        with self.context.session.begin():
+            usage.synced_at = datetime.datetime(2000, 1, 1)
+        self._create(201)
+        usage = self._usage()
+        self.assertEqual((usage.in_use, usage.reserved), (2, 0))
+        # the expired reservation is dropped
+        self.assertEqual(self._reservations(), 0)
@@ -16,6 +16,7 @@
 
 import json
 #import logging
+import mock
 from quantum.openstack.common import log as logging
 from oslo.config import cfg
 import webob.exc as webexc
@@ -24,11 +25,15 @@ import quantum
 from quantum.api import extensions
 from quantum.api.v2 import router
 from quantum.common import config
+from quantum.common import exceptions as q_exc
 from quantum import context as q_context
 from quantum.db import api as db
 from quantum.db import db_base_plugin_v2
+from quantum.plugins.vmware.vshield import edgesession
+from quantum.plugins.vmware.vshield import instrument
 from quantum.plugins.vmware.vshield import vpnplugin
 from quantum.plugins.common import constants
+from quantum import quota
 from quantum.tests import base
 from quantum.tests.unit import test_api_v2
 from quantum.tests.unit import testlib_api
@@ -44,7 +49,10 @@ LOG = logging.getLogger(__name__)
 class VPNTestPlugin(vpnplugin.VShieldEdgeVPNPlugin,
                     db_base_plugin_v2.QuantumDbPluginV2):
 
-    supported_extension_aliases = ["vpnaas"]
+    supported_extension_aliases = ["vpnaas", "vshield-metrics",
+                                   "vshield-provision"]
+    __native_pagination_support = True
+    __native_sorting_support = True
     """
     def create_site(self, context, site, **kwargs):
         r = super(VPNTestPlugin, self).create_site(
@@ -75,6 +83,13 @@ class VPNTestCase(base.BaseTestCase):
         #just stubbing core plugin with VPN plugin
         cfg.CONF.set_override('core_plugin', plugin)
         cfg.CONF.set_override('service_plugins', [plugin])
+        cfg.CONF.set_override('manager_uri', 'https://fake-vsm', 'vshield')
+        cfg.CONF.set_override('default_edge', 'edge-1', 'vshield')
+        cfg.CONF.set_override('vpn_stats_interval', 0, 'vshield')
+        cfg.CONF.set_override('resync_interval', 0, 'vshield')
+        cfg.CONF.set_override('subnet_edge_mappings',
+                              ['7a5a3e5c-e3d0-4cbf-a2b5-b2b5f2e4a001:edge-2'],
+                              'vshield')
         self.addCleanup(cfg.CONF.reset)
 
         # Ensure 'stale' patched copies of the plugin are never returned
@@ -86,9 +101,22 @@ class VPNTestCase(base.BaseTestCase):
         db.configure_db()
         # Ensure existing ExtensionManager is not used
 
+        # edge changes are queued here instead of being pushed in the
+        # background
+        tasks_p = mock.patch.object(vpnplugin, 'get_task_manager')
+        tasks_p.start()
+        self.addCleanup(tasks_p.stop)
+
+        self.plugin = VPNTestPlugin()
+        self._load_api()
+
+        self._tenant_id = "8c70909f-b081-452d-872b-df48e6c355d1"
+        self._subnet_id = "0c798ed8-33ba-11e2-8b28-000c291c4d14"
+
+    def _load_api(self):
         ext_mgr = extensions.PluginAwareExtensionManager(
             extensions_path,
-            {constants.VPN: VPNTestPlugin()}
+            {constants.VPN: self.plugin}
         )
         extensions.PluginAwareExtensionManager._instance = ext_mgr
         router.APIRouter()
@@ -96,8 +124,10 @@ class VPNTestCase(base.BaseTestCase):
         app = config.load_paste_app('extensions_test_app')
         self._api = extensions.ExtensionMiddleware(app, ext_mgr=ext_mgr)
 
-        self._tenant_id = "8c70909f-b081-452d-872b-df48e6c355d1"
-        self._subnet_id = "0c798ed8-33ba-11e2-8b28-000c291c4d14"
+    def _enable_native_paging(self):
+        cfg.CONF.set_override('allow_pagination', True)
+        cfg.CONF.set_override('allow_sorting', True)
+        self._load_api()
 
     def _do_request(self, method, path, data=None, params=None, action=None):
         content_type = 'application/json'
@@ -137,11 +167,12 @@ class VPNTestCase(base.BaseTestCase):
                      ],
                      psk="123",
                      mtu="1500",
-                     location=None):
+                     location=None,
+                     subnet_id=None):
         data = {
             "site": {
                 "tenant_id": self._tenant_id,
-                "subnet_id": self._subnet_id,
+                "subnet_id": subnet_id or self._subnet_id,
                 "name": name,
                 "description": description,
                 "local_endpoint": local_endpoint,
@@ -175,8 +206,11 @@ class VPNTestCase(base.BaseTestCase):
         res = self._do_request('DELETE', _get_path(path), None)
         return res
 
-    def _stats(self, id):
-        path = 'vpn/sites/{0}/stats'.format(id)
+    def _stats(self, id=None):
+        if id is None:
+            path = 'vpn/sites/stats'
+        else:
+            path = 'vpn/sites/{0}/stats'.format(id)
         res = self._do_request('GET', _get_path(path), None)
         return res
 
@@ -337,6 +371,363 @@ class VPNTestCase(base.BaseTestCase):
         self.assertEqual(r1['id'], site1['id'])
         self.assertEqual(r2['id'], site2['id'])
 
+    def test_update_site_pri_networks(self):
+        site = self._site_create(name='site1')
+        pri_networks = [{'local_subnets': "192.168.1.0/24",
+                         'peer_subnets': "192.168.33.0/24"},
+                        {'local_subnets': "192.168.2.0/24, 192.168.3.0/24",
+                         'peer_subnets': "192.168.44.0/24"}]
+        self._site_update(site['id'], {'pri_networks': pri_networks})
+        site = self._get_resource('site', site['id'])
+        self.assertEqual(site['pri_networks'],
+                         [{'local_subnets': "192.168.1.0/24",
+                           'peer_subnets': "192.168.33.0/24"},
+                          {'local_subnets': "192.168.2.0/24,192.168.3.0/24",
+                           'peer_subnets': "192.168.44.0/24"}])
+
+    def test_get_sites_for_subnet(self):
+        site1 = self._site_create(
+            name='site1',
+            pri_networks=[{'local_subnets': "192.168.0.0/16",
+                           'peer_subnets': "10.1.0.0/24"}])
+        site2 = self._site_create(
+            name='site2', peer_endpoint="10.117.35.204",
+            pri_networks=[{'local_subnets': "192.168.1.0/24,10.1.0.0/24",
+                           'peer_subnets': "10.2.0.0/24"}])
+        ctx = q_context.get_admin_context()
+
+        def site_names(cidr, side='local'):
+            sites = self.plugin.get_sites_for_subnet(ctx, cidr, side,
+                                                     fields=['name'])
+            return sorted(site['name'] for site in sites)
+
+        self.assertEqual(site_names("192.168.1.0/24"),
+                         [site1['name'], site2['name']])
+        self.assertEqual(site_names("192.168.2.128/25"), [site1['name']])
+        self.assertEqual(site_names("192.168.0.0/15"), [])
+        self.assertEqual(site_names("10.1.0.0/24"), [site2['name']])
+        self.assertEqual(site_names("10.1.0.0/24", 'peer'), [site1['name']])
+        self.assertRaises(q_exc.InvalidInput, site_names, "10.1.0/33")
+
+    def test_invalid_pri_networks(self):
+        for pri_networks in (
+                [{'local_subnets': "192.168.1.0/33",
+                  'peer_subnets': "192.168.11.0/24"}],
+                [{'local_subnets': "192.168.1.0/24",
+                  'peer_subnets': "192.168.11.0/24,not a cidr"}],
+                [{'local_subnets': "192.168.1.0/24"}],
+                "192.168.1.0/24"):
+            try:
+                self._site_create(name='site1', pri_networks=pri_networks)
+            except webexc.HTTPClientError as e:
+                self.assertEqual(e.code, webexc.HTTPBadRequest.code)
+            else:
+                self.fail(_("site created with %s") % pri_networks)
+        self.assertEqual(self._get_resources('site'), [])
+
+    def _sync_sites(self, side_effect=None, edge_id='edge-1'):
+        vpn_api = self.plugin._get_vpn_api(edge_id)
+        with mock.patch.object(vpn_api, 'sync_sites',
+                               side_effect=side_effect) as sync_sites:
+            self.plugin._sync_sites(edge_id)
+        return sync_sites
+
+    def test_create_site_async(self):
+        site = self._site_create(name='site1')
+        self.assertEqual(site['status'], constants.PENDING_CREATE)
+        self.assertEqual(self.plugin.tasks.add_unique.call_count, 1)
+        sync_sites = self._sync_sites()
+        sites = sync_sites.call_args[0][1]
+        self.assertEqual([s['id'] for s in sites], [site['id']])
+        site = self._get_resource('site', site['id'])
+        self.assertEqual(site['status'], constants.ACTIVE)
+
+    def test_update_site_async(self):
+        site = self._site_create(name='site1')
+        self._sync_sites()
+        site = self._site_update(site['id'], {'name': 'site2'})
+        self.assertEqual(site['status'], constants.PENDING_UPDATE)
+        sync_sites = self._sync_sites()
+        sites = sync_sites.call_args[0][1]
+        self.assertEqual([s['name'] for s in sites], ['site2'])
+        site = self._get_resource('site', site['id'])
+        self.assertEqual(site['status'], constants.ACTIVE)
+
+    def test_delete_site_async(self):
+        site1 = self._site_create(name='site1')
+        site2 = self._site_create(name='site2',
+                                  peer_endpoint="10.117.35.204")
+        self._sync_sites()
+        self._site_delete(site1['id'])
+        site = self._get_resource('site', site1['id'])
+        self.assertEqual(site['status'], constants.PENDING_DELETE)
+        sync_sites = self._sync_sites()
+        sites = sync_sites.call_args[0][1]
+        self.assertEqual([s['id'] for s in sites], [site2['id']])
+        self.assertEqual([s['id'] for s in self._get_resources('site')],
+                         [site2['id']])
+
+    def test_sites_synced_per_edge(self):
+        site1 = self._site_create(name='site1')
+        site2 = self._site_create(
+            name='site2', peer_endpoint="10.117.35.204",
+            subnet_id='7a5a3e5c-e3d0-4cbf-a2b5-b2b5f2e4a001')
+        queued = self.plugin.tasks.add_unique.call_args_list
+        self.assertEqual([(c[0][0], c[0][2]) for c in queued],
+                         [('edge-1', 'edge-1'), ('edge-2', 'edge-2')])
+        sync_sites = self._sync_sites()
+        sites = sync_sites.call_args[0][1]
+        self.assertEqual([s['id'] for s in sites], [site1['id']])
+        sync_sites = self._sync_sites(edge_id='edge-2')
+        sites = sync_sites.call_args[0][1]
+        self.assertEqual([s['id'] for s in sites], [site2['id']])
+
+    def test_edge_looked_up_once_per_subnet(self):
+        self._site_create(name='site1')
+        self._site_create(name='site2', peer_endpoint="10.117.35.204")
+        self._site_create(
+            name='site3', peer_endpoint="10.117.35.205",
+            subnet_id='7a5a3e5c-e3d0-4cbf-a2b5-b2b5f2e4a001')
+        with mock.patch.object(self.plugin.edges, 'get_edge',
+                               wraps=self.plugin.edges.get_edge) as get_edge:
+            sync_sites = self._sync_sites()
+        self.assertEqual(get_edge.call_count, 2)
+        sites = sync_sites.call_args[0][1]
+        self.assertEqual(sorted(s['name'] for s in sites),
+                         ['site1', 'site2'])
+
+    def test_create_site_async_error(self):
+        site = self._site_create(name='site1')
+        self._sync_sites(side_effect=Exception())
+        site = self._get_resource('site', site['id'])
+        self.assertEqual(site['status'], constants.ERROR)
+
+    def _site_body(self, name, peer_endpoint):
+        return {'site': {
+            'tenant_id': self._tenant_id, 'subnet_id': self._subnet_id,
+            'name': name, 'description': '',
+            'local_endpoint': '10.117.35.202', 'local_id': '10.117.35.202',
+            'peer_endpoint': peer_endpoint, 'peer_id': peer_endpoint,
+            'pri_networks': [{'local_subnets': '192.168.1.0/24',
+                              'peer_subnets': '192.168.11.0/24'}],
+            'psk': '123', 'mtu': 1500}}
+
+    def test_sites_pushed_once_by_edge_session(self):
+        context = q_context.Context('', self._tenant_id)
+        vpn_api = self.plugin._get_vpn_api('edge-1')
+        with mock.patch.object(vpn_api, 'sync_sites') as sync_sites:
+            with context.session.begin(subtransactions=True):
+                with edgesession.edge_session(context):
+                    for i, peer in enumerate(('10.117.35.203',
+                                              '10.117.35.204')):
+                        self.plugin.create_site(
+                            context, self._site_body('site%d' % i, peer))
+                    self.assertFalse(sync_sites.called)
+        self.assertEqual(sync_sites.call_count, 1)
+        self.assertEqual(sorted(s['name'] for s in
+                                sync_sites.call_args[0][1]),
+                         ['site0', 'site1'])
+        self.assertFalse(self.plugin.tasks.add_unique.called)
+        self.assertEqual([s['status'] for s in self._get_resources('site')],
+                         [constants.ACTIVE] * 2)
+
+    def test_edge_session_rolled_back(self):
+        context = q_context.Context('', self._tenant_id)
+        vpn_api = self.plugin._get_vpn_api('edge-1')
+        failing = mock.Mock(side_effect=Exception())
+
+        def provision():
+            with context.session.begin(subtransactions=True):
+                with edgesession.edge_session(context) as session:
+                    self.plugin.create_site(
+                        context, self._site_body('site', '10.117.35.203'))
+                    session.stage('edge-1', 'vip', 'vip-1', failing)
+
+        with mock.patch.object(vpn_api, 'sync_sites') as sync_sites:
+            self.assertRaises(Exception, provision)
+        # pushed, then pushed again without the site
+        self.assertEqual([len(c[0][1]) for c in sync_sites.call_args_list],
+                         [1, 0])
+        self.assertEqual(self._get_resources('site'), [])
+
+    def test_provision_pushes_sites_once(self):
+        data = {'vshield_provision': {
+            'tenant_id': self._tenant_id,
+            'sites': [self._site_body('site%d' % i, peer)['site']
+                      for i, peer in enumerate(('10.117.35.203',
+                                                '10.117.35.204'))]}}
+        # served by the plugin the manager loaded
+        with mock.patch.object(vpnplugin.VPNAPI, 'sync_sites') as sync_sites:
+            res = self._do_request('POST', _get_path('vshield_provisions'),
+                                   data)['vshield_provision']
+        self.assertEqual(sync_sites.call_count, 1)
+        self.assertEqual([s['name'] for s in res['sites']],
+                         ['site0', 'site1'])
+        self.assertEqual([s['status'] for s in res['sites']],
+                         [constants.ACTIVE] * 2)
+        self.assertEqual(res['vips'], [])
+
+    def test_provision_validated_before_creating(self):
+        bad = self._site_body('bad', '10.117.35.204')['site']
+        bad['mtu'] = 'big'
+        data = {'vshield_provision': {
+            'tenant_id': self._tenant_id,
+            'sites': [self._site_body('site', '10.117.35.203')['site'],
+                      bad]}}
+        with mock.patch.object(vpnplugin.VPNAPI, 'sync_sites') as sync_sites:
+            self.assertRaises(webexc.HTTPClientError, self._do_request,
+                              'POST', _get_path('vshield_provisions'), data)
+            # no firewall plugin to create the rules
+            data['vshield_provision']['sites'].pop()
+            data['vshield_provision']['rules'] = [{'name': 'r'}]
+            self.assertRaises(webexc.HTTPClientError, self._do_request,
+                              'POST', _get_path('vshield_provisions'), data)
+        self.assertFalse(sync_sites.called)
+        self.assertEqual(self._get_resources('site'), [])
+
+    def test_after_fork(self):
+        self.addCleanup(vpnplugin.forget_process_state)
+        vpn_api = self.plugin._get_vpn_api('edge-1')
+        collector = self.plugin.stats_collector
+        with mock.patch.object(vpnplugin,
+                               'forget_process_state') as forget:
+            self.plugin.after_fork()
+        forget.assert_called_once_with()
+        forked = self.plugin._get_vpn_api('edge-1')
+        self.assertIsNot(forked, vpn_api)
+        self.assertIsNot(forked.vse, vpn_api.vse)
+        # other workers push to the edge too
+        self.assertFalse(forked.cache_sites)
+        self.assertIsNot(self.plugin.stats_collector, collector)
+
+    def _topology_create(self, type='hub_and_spoke', hub=None,
+                         endpoints=None):
+        data = {'topology': {'tenant_id': self._tenant_id,
+                             'name': 'branches', 'type': type,
+                             'hub': hub, 'endpoints': endpoints or [],
+                             'psk': '123'}}
+        res = self._do_request('POST', _get_path('vpn/topologys'), data)
+        return res['topology']
+
+    def _branches(self, count):
+        return [{'endpoint': '10.118.%d.1' % i,
+                 'subnets': '192.168.%d.0/24' % i} for i in range(count)]
+
+    def test_create_hub_and_spoke_topology(self):
+        hub = {'endpoint': '10.117.35.202', 'id': 'hub',
+               'subnet_id': self._subnet_id, 'subnets': '10.1.0.0/16'}
+        topology = self._topology_create(hub=hub,
+                                         endpoints=self._branches(50))
+        self.assertEqual(topology['status'], constants.PENDING_CREATE)
+        self.assertEqual(len(topology['site_ids']), 50)
+        # one push for the 50 sites of the hub
+        queued = self.plugin.tasks.add_unique.call_args_list
+        self.assertEqual([c[0][0] for c in queued], ['edge-1'])
+        sync_sites = self._sync_sites()
+        sites = sync_sites.call_args[0][1]
+        self.assertEqual(len(sites), 50)
+        site = [s for s in sites if s['peer_endpoint'] == '10.118.7.1'][0]
+        self.assertEqual(site['local_id'], 'hub')
+        self.assertEqual(site['pri_networks'],
+                         [{'local_subnets': '10.1.0.0/16',
+                           'peer_subnets': '192.168.7.0/24'}])
+        topology = self._get_resource('topology', topology['id'])
+        self.assertEqual(topology['status'], constants.ACTIVE)
+
+    def test_create_full_mesh_topology(self):
+        endpoints = self._branches(2) + [
+            {'endpoint': '10.117.35.202', 'subnet_id': self._subnet_id,
+             'subnets': '10.1.0.0/24'},
+            {'endpoint': '10.117.36.202',
+             'subnet_id': '7a5a3e5c-e3d0-4cbf-a2b5-b2b5f2e4a001',
+             'subnets': '10.2.0.0/24'}]
+        topology = self._topology_create(type='full_mesh',
+                                         endpoints=endpoints)
+        # both edges are linked to the 3 other endpoints
+        self.assertEqual(len(topology['site_ids']), 6)
+        queued = self.plugin.tasks.add_unique.call_args_list
+        self.assertEqual(sorted(c[0][0] for c in queued),
+                         ['edge-1', 'edge-2'])
+
+    def test_invalid_topology(self):
+        for type, hub, endpoints in (
+                ('hub_and_spoke', None, self._branches(2)),
+                ('full_mesh', self._branches(1)[0], self._branches(2)),
+                ('full_mesh', None, self._branches(3)),
+                ('full_mesh', None, [{'endpoint': 'not an ip',
+                                      'subnets': '10.0.0.0/24'}]),
+                ('full_mesh', None, [{'endpoint': '10.117.35.202',
+                                      'subnets': '10.0.0.0/24'},
+                                     {'endpoint': '10.117.35.203',
+                                      'subnets': '10.0.0/24/8'}])):
+            try:
+                self._topology_create(type=type, hub=hub,
+                                      endpoints=endpoints)
+            except webexc.HTTPClientError as e:
+                self.assertEqual(e.code, webexc.HTTPBadRequest.code)
+            else:
+                self.fail(_("%s topology created") % type)
+        self.assertEqual(self._get_resources('site'), [])
+
+    def test_topology_sites_over_quota(self):
+        quota.QUOTAS.register_resource_by_name('site')
+        self.addCleanup(quota.QUOTAS._resources.pop, 'site')
+        cfg.CONF.set_override('default_quota', 2, 'QUOTAS')
+        hub = {'endpoint': '10.117.35.202', 'subnet_id': self._subnet_id,
+               'subnets': '10.1.0.0/16'}
+        try:
+            self._topology_create(hub=hub, endpoints=self._branches(3))
+        except webexc.HTTPClientError as e:
+            self.assertEqual(e.code, webexc.HTTPConflict.code)
+        else:
+            self.fail(_("topology created over the site quota"))
+        topology = self._topology_create(hub=hub,
+                                         endpoints=self._branches(2))
+        self.assertEqual(len(topology['site_ids']), 2)
+        self.assertEqual(len(self._get_resources('site')), 2)
+
+    def test_delete_topology(self):
+        hub = {'endpoint': '10.117.35.202', 'subnet_id': self._subnet_id,
+               'subnets': '10.1.0.0/16'}
+        topology = self._topology_create(hub=hub,
+                                         endpoints=self._branches(3))
+        site = self._site_create(name='site1', peer_endpoint='10.117.35.9')
+        self._sync_sites()
+        self.plugin.tasks.add_unique.reset_mock()
+        self._do_request('DELETE',
+                         _get_path('vpn/topologys/' + topology['id']))
+        self.assertEqual(self._get_resources('topology'), [])
+        self.assertEqual(self.plugin.tasks.add_unique.call_count, 1)
+        sync_sites = self._sync_sites()
+        self.assertEqual([s['id'] for s in sync_sites.call_args[0][1]],
+                         [site['id']])
+        self.assertEqual([s['id'] for s in self._get_resources('site')],
+                         [site['id']])
+
+    def test_drift_repaired(self):
+        self._site_create(name='site1')
+        self._sync_sites()
+        vpn_api = self.plugin._get_vpn_api('edge-1')
+        vpn_api.pushed_sites = 'pushed'
+        self.plugin.tasks.add_unique.reset_mock()
+        with mock.patch.object(vpn_api, 'get_vsm_vpn_config',
+                               return_value={'sites': {'sites': []}}):
+            drift = self.plugin._check_edge('edge-1')
+        self.assertEqual((drift['missing'], drift['repaired']), (1, 0))
+        self.assertIsNone(vpn_api.pushed_sites)
+        self.assertEqual(self.plugin.tasks.add_unique.call_count, 1)
+        repair_sites, args = (self.plugin.tasks.add_unique.call_args[0][1],
+                              self.plugin.tasks.add_unique.call_args[0][2:])
+        with mock.patch.object(vpn_api, 'sync_sites',
+                               side_effect=Exception('unreachable')):
+            repair_sites(*args)
+        self.assertEqual(self.plugin.resync.totals['repaired'], 0)
+        with mock.patch.object(vpn_api, 'sync_sites'):
+            repair_sites(*args)
+        self.assertEqual(self.plugin.resync.totals['repaired'], 1)
+        self.assertEqual(
+            self.plugin.resync.metrics['edge-1']['repaired'], 1)
+
     def test_stats(self):
         LOG.info("test to get stats of site")
         expected = {
@@ -359,8 +750,38 @@ class VPNTestCase(base.BaseTestCase):
                                  peer_id=expected['peer_id'],
                                  pri_networks=expected['pri_networks']
                                  )
-        res = self._stats(id=site['id'])
-        return
+        site_stats = {'ikeStatus': {'localIpAddress': "10.117.35.202",
+                                    'peerIpAddress': "10.117.35.203",
+                                    'channelStatus': "UP"}}
+        edge_stats = {'siteStatistics': [site_stats]}
+        with mock.patch.object(vpnplugin.VPNAPI, 'get_stats',
+                               return_value=edge_stats) as get_stats:
+            res = self._stats(id=site['id'])
+            self.assertEqual(res, site_stats)
+            res = self._stats()
+            self.assertEqual(res, {site['id']: site_stats})
+        # the edge is read once, then served from the cache
+        self.assertEqual(get_stats.call_count, 1)
+
+    def test_vshield_metrics(self):
+        instrumentation = instrument.Instrumentation(1)
+        instrumentation.record('edge-1', 'GET',
+                               '/api/4.0/edges/edge-1/ipsec/config', 200, 1,
+                               0.02, None, '{}')
+        with mock.patch.object(instrument, '_instrumentation',
+                               instrumentation):
+            req = testlib_api.create_request(
+                _get_path('vshield_metrics'), None, 'application/json',
+                'GET')
+            req.environ['quantum.context'] = q_context.get_admin_context()
+            res = req.get_response(self._api).json['vshield_metrics']
+            self.assertEqual([m['id'] for m in res], ['edge-1'])
+            self.assertEqual(res[0]['retries'], 1)
+            self.assertEqual(res[0]['endpoints'][0]['endpoint'],
+                             '/api/4.0/edges/{edge}/ipsec/config')
+            # admin only
+            res = self._do_request('GET', _get_path('vshield_metrics'))
+            self.assertEqual(res['vshield_metrics'], [])
 
     def _ipsec_policy_create(self, name='ipsec_policy1',
                              enc_alg='aes256', auth_alg='sha1',
@@ -377,6 +798,21 @@ class VPNTestCase(base.BaseTestCase):
         res = self._do_request('POST', _get_path('vpn/ipsec_policys'), data)
         return res['ipsec_policy']
 
+    def test_ipsec_policys_sorted_and_paged(self):
+        self._enable_native_paging()
+        for name in ('b', 'c', 'a'):
+            self._ipsec_policy_create(name=name)
+        path = _get_path('vpn/ipsec_policys')
+        res = self._do_request('GET', path,
+                               params='sort_key=name&sort_dir=asc&limit=2')
+        self.assertEqual([p['name'] for p in res['ipsec_policys']],
+                         ['a', 'b'])
+        marker = res['ipsec_policys'][-1]['id']
+        res = self._do_request('GET', path,
+                               params='sort_key=name&sort_dir=asc&limit=2'
+                               '&marker=%s' % marker)
+        self.assertEqual([p['name'] for p in res['ipsec_policys']], ['c'])
+
     def _ipsec_policy_update(self, id, ipsec_policy=None):
         path = 'vpn/ipsec_policys/{0}'.format(id)
         old_ipsec_policy = self._do_request('GET', _get_path(path), None)
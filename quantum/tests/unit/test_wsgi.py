@@ -28,6 +28,7 @@ import webob.exc
 from quantum.api.v2 import attributes
 from quantum.common import constants
 from quantum.common import exceptions as exception
+from quantum.openstack.common import jsonutils
 from quantum.tests import base
 from quantum import wsgi
 
@@ -92,6 +93,34 @@ class TestWSGIServer(base.BaseTestCase):
                             mock_listen.return_value)
                     ])
 
+    def test_start_workers(self):
+        server = wsgi.Server("test_workers")
+        with mock.patch.object(wsgi.common_service,
+                               'ProcessLauncher') as launcher:
+            server.start(None, 0, host="127.0.0.1", workers=4)
+            launcher.return_value.launch_service.assert_called_once_with(
+                mock.ANY, workers=4)
+            worker = launcher.return_value.launch_service.call_args[0][0]
+            self.assertIsInstance(worker, wsgi.WorkerService)
+            server.wait()
+            launcher.return_value.wait.assert_called_once_with()
+
+        # a forked worker drops the connections and plugin state of its
+        # parent before serving the shared socket
+        with mock.patch.object(wsgi.api, 'forget_connections') as db:
+            with mock.patch.object(wsgi.q_rpc, 'forget_connections') as rpc:
+                with mock.patch.object(wsgi.manager.QuantumManager,
+                                       'after_fork') as after_fork:
+                    with mock.patch.object(wsgi.eventlet, 'spawn') as spawn:
+                        worker.start()
+                        db.assert_called_once_with()
+                        rpc.assert_called_once_with()
+                        after_fork.assert_called_once_with()
+                        spawn.assert_called_once_with(server._run, None,
+                                                      server._socket)
+        worker.stop()
+        server._socket.close()
+
     def test_app(self):
         greetings = 'Hello, World!!!'
 
@@ -602,6 +631,14 @@ class DictSerializerTest(base.BaseTestCase):
         self.assertEqual(
             serializer.serialize({}, 'NonExistantAction'), '')
 
+    def test_serialize_iter_at_once(self):
+        serializer = wsgi.DictSerializer()
+        serializer.default = mock.Mock(return_value='data')
+        self.assertEqual(list(serializer.serialize_iter(
+            {'items': [1, 2], 'links': [3]})), ['data'])
+        serializer.default.assert_called_once_with(
+            {'items': [1, 2], 'links': [3]})
+
 
 class JSONDictSerializerTest(base.BaseTestCase):
 
@@ -632,6 +669,19 @@ class JSONDictSerializerTest(base.BaseTestCase):
 
         self.assertEqual(result, expected_json)
 
+    def test_serialize_iter(self):
+        servers = [{'id': i, 'name': u'\u7f51\u7edc'} for i in range(100)]
+        input_dict = {'servers': servers,
+                      'servers_links': [{'rel': 'next'}]}
+        serializer = wsgi.JSONDictSerializer()
+        serializer.chunk_size = 1024
+        chunks = list(serializer.serialize_iter(input_dict))
+
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(jsonutils.loads(''.join(chunks)),
+                         {'servers': servers,
+                          'servers_links': [{'rel': 'next'}]})
+
 
 class TextDeserializerTest(base.BaseTestCase):
 
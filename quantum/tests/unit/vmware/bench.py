@@ -0,0 +1,297 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Load benchmark of the vshield drivers against a FakeVsm.
+
+Drives the ipsec, load balancer, firewall and ip set drivers at a given
+concurrency and reports their throughput and latency, e.g.:
+
+    python -m quantum.tests.unit.vmware.bench --scenario all \\
+        --ops 2000 --concurrency 50 --edges 4 --latency 20
+
+With --http the FakeVsm is served on localhost, so the requests also go
+through the connection pool of the drivers.
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import sys
+import time
+
+import eventlet.wsgi
+from oslo.config import cfg
+import sqlalchemy as sql
+from sqlalchemy import pool as sql_pool
+
+from quantum import context
+from quantum.db import api as db
+from quantum.db.firewall_db import IPObj
+from quantum.db.firewall_db import Rule
+from quantum.db.loadbalancer.loadbalancer_db import Pool
+from quantum.openstack.common import log as logging
+from quantum.plugins.vmware.vshield import fwapi
+from quantum.plugins.vmware.vshield import lbapi
+from quantum.plugins.vmware.vshield import vpnapi
+from quantum.plugins.vmware.vshield import vseapi
+from quantum.tests.unit.vmware import fake_vsm
+
+SCENARIOS = ('vpn', 'lb', 'fw', 'ipset')
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of values, None if there is none."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(round(fraction * len(values) + 0.5)) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+class Result(object):
+
+    def __init__(self, scenario, ops, concurrency, elapsed, latencies,
+                 failures, requests):
+        self.scenario = scenario
+        self.ops = ops
+        self.concurrency = concurrency
+        self.elapsed = elapsed
+        self.latencies = latencies
+        self.failures = failures
+        self.requests = requests
+
+    @property
+    def ops_per_second(self):
+        return self.ops / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def p50(self):
+        return percentile(self.latencies, 0.5)
+
+    @property
+    def p99(self):
+        return percentile(self.latencies, 0.99)
+
+    def __str__(self):
+        return ('%-6s %6d ops  %4d conc  %9.1f ops/s  p50 %8.2f ms  '
+                'p99 %8.2f ms  %5d failed  %6d requests' %
+                (self.scenario, self.ops, self.concurrency,
+                 self.ops_per_second, (self.p50 or 0) * 1000,
+                 (self.p99 or 0) * 1000, self.failures, self.requests))
+
+
+class Bench(object):
+    """Runs the scenarios against one FakeVsm.
+
+    Every operation runs in a context of its own, as an API request does.
+    The edge ids of the objects are kept in an in-memory sqlite database,
+    whose parent rows are created before the clock starts.
+    """
+
+    def __init__(self, vsm, edges, url=None):
+        self.vsm = vsm
+        self.edges = ['edge-%d' % i for i in range(1, edges + 1)]
+        self.url = url
+        self._vses = {}
+
+    def vse(self, edge_id):
+        vse = self._vses.get(edge_id)
+        if vse is None:
+            if self.url:
+                vse = vseapi.VseAPI(self.url, 'admin', 'default', edge_id)
+            else:
+                vse = vseapi.VseAPI('fake://vsm', 'admin', 'default',
+                                    edge_id)
+                vse.vsmapi = self.vsm.client()
+            self._vses[edge_id] = vse
+        return vse
+
+    @staticmethod
+    def _add(rows):
+        ctx = context.get_admin_context()
+        with ctx.session.begin():
+            for row in rows:
+                ctx.session.add(row)
+
+    def _edge(self, i):
+        return self.edges[i % len(self.edges)]
+
+    def vpn(self, ops):
+        apis = dict((edge, vpnapi.VPNAPI(self.vse(edge)))
+                    for edge in self.edges)
+        sites = dict((edge, [self._site(edge, n) for n in range(4)])
+                     for edge in self.edges)
+
+        def op(i):
+            edge = self._edge(i)
+            edge_sites = list(sites[edge])
+            edge_sites[i % 4] = dict(edge_sites[i % 4], name='site-%d' % i)
+            sites[edge] = edge_sites
+            apis[edge].sync_sites(context.get_admin_context(), edge_sites)
+        return op
+
+    @staticmethod
+    def _site(edge, n):
+        return {'id': '%s-site-%d' % (edge, n), 'name': 'site-%d' % n,
+                'description': '', 'local_id': '10.0.0.1',
+                'local_endpoint': '10.0.0.1', 'peer_id': '10.1.%d.1' % n,
+                'peer_endpoint': '10.1.%d.1' % n, 'mtu': 1500,
+                'psk': 'secret', 'pri_networks': [
+                    {'local_subnets': '192.168.0.0/24',
+                     'peer_subnets': '192.168.%d.0/24' % (n + 1)}]}
+
+    def lb(self, ops):
+        apis = dict((edge, lbapi.LoadBalancerAPI(self.vse(edge)))
+                    for edge in self.edges)
+        # every pool is created on the edge by its first sync and updated
+        # by the next ones
+        pools = max(ops / 4, 1)
+        self._add(Pool(id='pool-%d' % i, tenant_id='bench',
+                       name='pool-%d' % i, subnet_id='subnet',
+                       protocol='HTTP', lb_method='ROUND_ROBIN',
+                       status='ACTIVE', admin_state_up=True)
+                  for i in range(pools))
+
+        def op(i):
+            n = i % pools
+            pool = {'id': 'pool-%d' % n, 'name': 'pool-%d' % n,
+                    'protocol': 'HTTP', 'lb_method': 'ROUND_ROBIN',
+                    'members': [{'address': '10.0.%d.%d' % (n % 250, m),
+                                 'protocol_port': 80, 'status': 'ACTIVE'}
+                                for m in range(1, i % 8 + 2)]}
+            ctx = context.get_admin_context()
+            with ctx.session.begin(subtransactions=True):
+                apis[self._edge(n)].sync_pool(ctx, pool)
+        return op
+
+    def fw(self, ops):
+        apis = dict((edge, fwapi.FirewallAPI(self.vse(edge)))
+                    for edge in self.edges)
+        self._add(Rule(id='rule-%d' % i, tenant_id='bench',
+                       name='rule-%d' % i, action=1, log=False,
+                       enabled=True, position=i)
+                  for i in range(ops))
+
+        def op(i):
+            rule = {'id': 'rule-%d' % i, 'name': 'rule-%d' % i,
+                    'action': 'accept', 'enabled': True,
+                    'source': {'addresses': ['10.0.0.0/8']},
+                    'destination': {'addresses': ['192.168.0.0/16']},
+                    'service': {'services': [
+                        {'protocol': 'tcp', 'ports': [80, 443]}]}}
+            ctx = context.get_admin_context()
+            with ctx.session.begin(subtransactions=True):
+                apis[self._edge(i)].create_rule(ctx, rule)
+        return op
+
+    def ipset(self, ops):
+        apis = dict((edge, fwapi.FirewallAPI(self.vse(edge)))
+                    for edge in self.edges)
+        self._add(IPObj(id='ipobj-%d' % i, tenant_id='bench',
+                        name='ipobj-%d' % i)
+                  for i in range(ops))
+
+        def op(i):
+            ipobj = {'id': 'ipobj-%d' % i, 'name': 'ipobj-%d' % i,
+                     'value': ['10.%d.0.0/16' % (i % 250)]}
+            ctx = context.get_admin_context()
+            with ctx.session.begin(subtransactions=True):
+                apis[self._edge(i)].create_ipset(ctx, ipobj)
+        return op
+
+    def run(self, scenario, ops, concurrency):
+        op = getattr(self, scenario)(ops)
+        latencies = []
+        failures = [0]
+
+        def timed(i):
+            start = time.time()
+            try:
+                op(i)
+            except Exception:
+                failures[0] += 1
+                return
+            latencies.append(time.time() - start)
+
+        requests = sum(self.vsm.requests.values())
+        pool = eventlet.GreenPool(concurrency)
+        start = time.time()
+        for i in range(ops):
+            pool.spawn_n(timed, i)
+        pool.waitall()
+        elapsed = time.time() - start
+        return Result(scenario, ops, concurrency, elapsed, latencies,
+                      failures[0], sum(self.vsm.requests.values()) - requests)
+
+
+def serve(vsm):
+    """Serve vsm over HTTP on a free localhost port, returns its url."""
+    sock = eventlet.listen(('127.0.0.1', 0))
+    log = logging.WritableLogger(logging.getLogger('eventlet.wsgi.server'))
+    eventlet.spawn_n(eventlet.wsgi.server, sock, vsm, log=log)
+    return 'http://127.0.0.1:%d' % sock.getsockname()[1]
+
+
+def setup_db():
+    """Create the tables in an in-memory sqlite database.
+
+    The database is made with a single connection shared by every green
+    thread; with the pool of configure_db() each green thread would get a
+    connection, and so an empty database, of its own.
+    """
+    db._ENGINE = sql.create_engine(
+        'sqlite://', poolclass=sql_pool.StaticPool,
+        connect_args={'check_same_thread': False},
+        listeners=[db.SqliteForeignKeysListener()])
+    db._MAKER = None
+    db.register_models()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',),
+                        default='all')
+    parser.add_argument('--ops', type=int, default=1000,
+                        help='operations per scenario')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--edges', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=10,
+                        help='latency of every VSM request, in ms')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='fraction of VSM requests failing with 503')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--http', action='store_true',
+                        help='serve the fake VSM on localhost')
+    args = parser.parse_args(argv)
+
+    cfg.CONF([], project='quantum')
+    setup_db()
+    try:
+        vsm = fake_vsm.FakeVsm(latency=args.latency / 1000.0,
+                               error_rate=args.error_rate, seed=args.seed)
+        bench = Bench(vsm, args.edges, serve(vsm) if args.http else None)
+        scenarios = (SCENARIOS if args.scenario == 'all'
+                     else (args.scenario,))
+        for scenario in scenarios:
+            print(bench.run(scenario, args.ops, args.concurrency))
+            sys.stdout.flush()
+    finally:
+        db.clear_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import copy
+import json
+import random
+import re
+import threading
+import urlparse
+
+import eventlet
+import webob
+
+from quantum.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+EDGE = r'^/api/4\.0/edges/(?P<edge>[^/]+)'
+SERVICE = r'^/api/2\.0/services/(?P<kind>ipset|application)'
+
+
+class FakeVsm(object):
+    """A stand-in for the REST API of vShield Manager.
+
+    It keeps the ipsec, load balancer and firewall config of every edge
+    and the ip sets and applications in memory, enough for the vshield
+    drivers to run against it. Every request waits latency seconds, and
+    fails with error_status at the given error_rate before it changes
+    anything.
+
+    request() serves the requests in process; a FakeVsm is also a WSGI
+    application so it can be served over HTTP, to go through the
+    connection pool of the drivers as well.
+    """
+
+    def __init__(self, latency=0, error_rate=0, error_status=503,
+                 seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = collections.Counter()
+        # edge id -> {'ipsec': config, 'lb': config, 'fw': OrderedDict}
+        self.edges = {}
+        # 'ipset' and 'application' -> {id: object}
+        self.services = {'ipset': {}, 'application': {}}
+        # (method, path) -> count, failures included
+        self.requests = collections.Counter()
+        self.errors = 0
+        self._routes = [
+            (EDGE + r'/ipsec/config$', self._ipsec_config),
+            (EDGE + r'/ipsec/statistics$', self._ipsec_statistics),
+            (EDGE + r'/loadbalancer/config$', self._lb_config),
+            (EDGE + r'/loadbalancer/config/(?P<kind>pools|virtualservers)'
+             r'(?:/(?P<id>[^/]+))?$', self._lb_object),
+            (EDGE + r'/firewall/config$', self._fw_config),
+            (EDGE + r'/firewall/config/rules(?:/(?P<id>[^/]+))?$',
+             self._fw_rule),
+            (EDGE + r'/jobs$', self._jobs),
+            (SERVICE + r'/(?P<id>[^/]+)$', self._service),
+        ]
+        self._routes = [(re.compile(pattern), handler)
+                        for pattern, handler in self._routes]
+
+    def client(self, url='fake://vsm'):
+        """Return an object to use in place of the VsmAPI of a VseAPI."""
+        return FakeVsmClient(self, url)
+
+    def request(self, method, uri, body=None):
+        """Serve a request, returns a (header, content) tuple as httplib2
+        does."""
+        path, sep, query = uri.partition('?')
+        query = dict(urlparse.parse_qsl(query))
+        self.requests[(method, path)] += 1
+        if self.latency:
+            eventlet.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            return self._response(self.error_status,
+                                  {'errorCode': self.error_status,
+                                   'details': 'injected failure'})
+        params = json.loads(body) if body else None
+        for pattern, handler in self._routes:
+            match = pattern.match(path)
+            if match:
+                with self._lock:
+                    return handler(method, path, params, query,
+                                   **match.groupdict())
+        return self._response(404)
+
+    def __call__(self, environ, start_response):
+        req = webob.Request(environ)
+        header, content = self.request(req.method, req.path_qs,
+                                       req.body or None)
+        res = webob.Response(status=int(header['status']), body=content,
+                             content_type='application/json')
+        if 'location' in header:
+            res.location = header['location']
+        return res(environ, start_response)
+
+    @staticmethod
+    def _response(status, content=None, location=None):
+        header = {'status': str(status)}
+        if location is not None:
+            header['location'] = location
+        if content is None:
+            return header, ''
+        return header, json.dumps(content)
+
+    def _next_id(self, prefix):
+        self._ids[prefix] += 1
+        return '%s-%d' % (prefix, self._ids[prefix])
+
+    def _edge(self, edge_id):
+        edge = self.edges.get(edge_id)
+        if edge is None:
+            edge = self.edges[edge_id] = {
+                'ipsec': {},
+                'lb': {'enabled': False, 'pools': collections.OrderedDict(),
+                       'virtualservers': collections.OrderedDict()},
+                'fw': collections.OrderedDict()}
+        return edge
+
+    def _ipsec_config(self, method, path, params, query, edge):
+        state = self._edge(edge)
+        if method == 'GET':
+            return self._response(200, state['ipsec'])
+        if method == 'PUT':
+            state['ipsec'] = params
+            return self._response(204)
+        if method == 'DELETE':
+            state['ipsec'] = {}
+            return self._response(204)
+        return self._response(405)
+
+    def _ipsec_statistics(self, method, path, params, query, edge):
+        sites = (self._edge(edge)['ipsec'].get('sites') or {}).get(
+            'sites') or []
+        return self._response(200, {'siteStatistics': [
+            {'localIp': site.get('localIp'), 'peerIp': site.get('peerIp'),
+             'ikeStatus': {'channelStatus': 'up'}} for site in sites]})
+
+    def _lb_config(self, method, path, params, query, edge):
+        state = self._edge(edge)['lb']
+        if method == 'GET':
+            return self._response(200, {
+                'enabled': state['enabled'],
+                'pool': state['pools'].values(),
+                'virtualServer': state['virtualservers'].values()})
+        if method == 'PUT':
+            state['enabled'] = params.get('enabled', False)
+            for kind, key, objects in (
+                    ('pools', 'poolId', params.get('pool')),
+                    ('virtualservers', 'virtualServerId',
+                     params.get('virtualServer'))):
+                if objects is not None:
+                    state[kind] = collections.OrderedDict(
+                        (obj[key], copy.deepcopy(obj)) for obj in objects)
+            return self._response(204)
+        return self._response(405)
+
+    def _lb_object(self, method, path, params, query, edge, kind, id=None):
+        objects = self._edge(edge)['lb'][kind]
+        key = 'poolId' if kind == 'pools' else 'virtualServerId'
+        return self._crud(objects, key, kind[:-1], method, path, params, id)
+
+    def _fw_config(self, method, path, params, query, edge):
+        state = self._edge(edge)
+        if method == 'GET':
+            return self._response(200, {'firewallRules': {
+                'firewallRules': state['fw'].values()}})
+        if method == 'PUT':
+            state['fw'] = collections.OrderedDict(
+                (str(rule['ruleId']), copy.deepcopy(rule))
+                for rule in params['firewallRules']['firewallRules'])
+            return self._response(204)
+        return self._response(405)
+
+    def _fw_rule(self, method, path, params, query, edge, id=None):
+        rules = self._edge(edge)['fw']
+        if method == 'POST' and id is None:
+            # rules are appended in a firewallRules list, or inserted above
+            # the rule aboveRuleId; the location is the one of the last rule
+            above = query.get('aboveRuleId')
+            if above is not None and above not in rules:
+                return self._response(404)
+            created = []
+            for rule in params.get('firewallRules') or []:
+                rule = copy.deepcopy(rule)
+                self._ids['rule'] += 1
+                rule['ruleId'] = self._ids['rule']
+                rule['ruleType'] = 'user'
+                created.append((str(rule['ruleId']), rule))
+            if above is None:
+                rules.update(created)
+            else:
+                ordered = []
+                for key, rule in rules.iteritems():
+                    if key == above:
+                        ordered.extend(created)
+                    ordered.append((key, rule))
+                rules.clear()
+                rules.update(ordered)
+            return self._response(201, location='%s/%s' % (
+                path, self._ids['rule']))
+        if id is not None and id not in rules:
+            return self._response(404)
+        if method == 'GET' and id is not None:
+            return self._response(200, rules[id])
+        if method == 'PUT' and id is not None:
+            rule = copy.deepcopy(params)
+            rule['ruleId'] = rules[id]['ruleId']
+            rule['ruleType'] = 'user'
+            rules[id] = rule
+            return self._response(204)
+        if method == 'DELETE' and id is not None:
+            del rules[id]
+            return self._response(204)
+        return self._response(405)
+
+    def _jobs(self, method, path, params, query, edge):
+        # every change is applied before it is answered
+        return self._response(200, {'edgeJob': []})
+
+    def _service(self, method, path, params, query, kind, id):
+        # ip sets and applications are posted to the scope of an edge and
+        # then addressed by their own id
+        if method == 'POST':
+            id = None
+        return self._crud(self.services[kind], 'objectId', kind, method,
+                          path.rsplit('/', 1)[0], params, id)
+
+    def _crud(self, objects, key, prefix, method, path, params, id):
+        if id is None:
+            if method == 'GET':
+                return self._response(200, objects.values())
+            if method != 'POST':
+                return self._response(405)
+            obj = copy.deepcopy(params)
+            obj[key] = self._next_id(prefix)
+            objects[obj[key]] = obj
+            return self._response(201, location='%s/%s' % (path, obj[key]))
+        if id not in objects:
+            return self._response(404)
+        if method == 'GET':
+            return self._response(200, objects[id])
+        if method == 'PUT':
+            obj = copy.deepcopy(params)
+            obj[key] = id
+            objects[id] = obj
+            return self._response(204)
+        if method == 'DELETE':
+            del objects[id]
+            return self._response(204)
+        return self._response(405)
+
+
+class FakeVsmClient(object):
+    """Sends the requests of a VseAPI to a FakeVsm, in process."""
+
+    def __init__(self, vsm, url):
+        self.vsm = vsm
+        self.url = url
+
+    def api(self, method, uri, params=None, body=None):
+        if body is None and params:
+            body = json.dumps(params)
+        return self.vsm.request(method, uri, body)
@@ -0,0 +1,55 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+
+from quantum.plugins.vmware.vshield import batch
+from quantum.plugins.vmware.vshield import tasks
+from quantum.tests import base
+
+
+class TestPoolBatcher(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestPoolBatcher, self).setUp()
+        self.synced = []
+        self.tasks = tasks.EdgeTaskManager(4)
+        self.batcher = batch.PoolBatcher(self.tasks, self._sync, 0.01)
+
+    def _sync(self, edge_id, pool_id):
+        self.synced.append((edge_id, pool_id))
+
+    def _wait(self):
+        eventlet.sleep(0.02)
+        self.tasks.wait()
+
+    def test_changes_pushed_once_per_window(self):
+        self.assertTrue(self.batcher.add('edge-1', 'pool-1'))
+        for i in range(4):
+            self.assertFalse(self.batcher.add('edge-1', 'pool-1'))
+        self.batcher.add('edge-1', 'pool-2')
+        self.assertTrue(self.batcher.is_pending('pool-1'))
+        self._wait()
+        self.assertEqual(sorted(self.synced),
+                         [('edge-1', 'pool-1'), ('edge-1', 'pool-2')])
+        self.assertFalse(self.batcher.is_pending('pool-1'))
+
+    def test_change_after_push_opens_window(self):
+        self.batcher.add('edge-1', 'pool-1')
+        self._wait()
+        self.assertTrue(self.batcher.add('edge-1', 'pool-1'))
+        self._wait()
+        self.assertEqual(self.synced, [('edge-1', 'pool-1')] * 2)
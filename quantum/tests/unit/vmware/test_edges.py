@@ -0,0 +1,129 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo.config import cfg
+
+from quantum.plugins.vmware.vshield.common import exceptions as vsh_exc
+from quantum.plugins.vmware.vshield import edges
+from quantum.tests import base
+
+
+class TestEdgeRegistry(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestEdgeRegistry, self).setUp()
+        self.registry = edges.EdgeRegistry(
+            'https://vsm', 'admin', 'default', default_edge='edge-1',
+            tenant_edges={'tenant-a': 'edge-2'},
+            router_edges={'router-a': 'edge-3'},
+            subnet_edges={'subnet-a': 'edge-4'})
+        self.context = mock.Mock()
+
+    def _router_of_subnet(self, router_id):
+        return mock.patch.object(self.registry, '_get_router_id',
+                                 return_value=router_id)
+
+    def test_subnet_mapping_first(self):
+        with self._router_of_subnet('router-a') as get_router_id:
+            self.assertEqual(self.registry.get_edge(
+                self.context, tenant_id='tenant-a', subnet_id='subnet-a'),
+                'edge-4')
+        self.assertFalse(get_router_id.called)
+
+    def test_router_mapping(self):
+        with self._router_of_subnet('router-a'):
+            self.assertEqual(self.registry.get_edge(
+                self.context, tenant_id='tenant-a', subnet_id='subnet-b'),
+                'edge-3')
+
+    def test_tenant_mapping(self):
+        with self._router_of_subnet(None):
+            self.assertEqual(self.registry.get_edge(
+                self.context, tenant_id='tenant-a', subnet_id='subnet-b'),
+                'edge-2')
+
+    def test_default_edge(self):
+        with self._router_of_subnet(None):
+            self.assertEqual(self.registry.get_edge(
+                self.context, tenant_id='tenant-b', subnet_id='subnet-b'),
+                'edge-1')
+
+    def test_no_edge(self):
+        self.registry.default_edge = None
+        self.assertRaises(vsh_exc.EdgeNotFound, self.registry.get_edge,
+                          self.context, tenant_id='tenant-b')
+
+    def test_vse_per_edge(self):
+        vse1 = self.registry.get_vse('edge-1')
+        self.assertIs(self.registry.get_vse('edge-1'), vse1)
+        vse2 = self.registry.get_vse('edge-2')
+        self.assertEqual(vse2.get_edgeId(), 'edge-2')
+        self.assertIs(vse1.vsmapi.pool, vse2.vsmapi.pool)
+
+    def test_vse_after_fork(self):
+        self.addCleanup(edges.forget_process_state)
+        vse = self.registry.get_vse('edge-1')
+        edges.forget_process_state()
+        self.registry.forget_vses()
+        forked = self.registry.get_vse('edge-1')
+        self.assertIsNot(forked, vse)
+        self.assertIsNot(forked.vsmapi.pool, vse.vsmapi.pool)
+        self.assertIsNot(forked.coalescer, vse.coalescer)
+
+    def test_get_edges(self):
+        self.assertEqual(self.registry.get_edges(),
+                         set(['edge-1', 'edge-2', 'edge-3', 'edge-4']))
+
+
+class TestLoadEdgeRegistry(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestLoadEdgeRegistry, self).setUp()
+        self.addCleanup(cfg.CONF.reset)
+        cfg.CONF.set_override('manager_uri', 'https://vsm', 'vshield')
+
+    def test_load(self):
+        cfg.CONF.set_override('tenant_edge_mappings',
+                              ['tenant-a:edge-2', ' tenant-b : edge-3 '],
+                              'vshield')
+        registry = edges.load_edge_registry()
+        self.assertEqual(registry.tenant_edges,
+                         {'tenant-a': 'edge-2', 'tenant-b': 'edge-3'})
+        self.assertIsNone(registry.default_edge)
+
+    def test_invalid_mapping(self):
+        cfg.CONF.set_override('subnet_edge_mappings', ['subnet-a'],
+                              'vshield')
+        self.assertRaises(vsh_exc.InvalidEdgeConfig,
+                          edges.load_edge_registry)
+
+    def test_duplicate_mapping(self):
+        cfg.CONF.set_override('subnet_edge_mappings',
+                              ['subnet-a:edge-1', 'subnet-a:edge-2'],
+                              'vshield')
+        self.assertRaises(vsh_exc.InvalidEdgeConfig,
+                          edges.load_edge_registry)
+
+    def test_no_edge(self):
+        self.assertRaises(vsh_exc.InvalidEdgeConfig,
+                          edges.load_edge_registry)
+
+    def test_no_manager(self):
+        cfg.CONF.set_override('manager_uri', None, 'vshield')
+        cfg.CONF.set_override('default_edge', 'edge-1', 'vshield')
+        self.assertRaises(vsh_exc.InvalidEdgeConfig,
+                          edges.load_edge_registry)
@@ -0,0 +1,111 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from quantum.plugins.vmware.vshield.common import exceptions
+from quantum.plugins.vmware.vshield import edgesession
+from quantum.tests import base
+
+
+class TestEdgeSession(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestEdgeSession, self).setUp()
+        self.session = edgesession.EdgeSession()
+        self.calls = []
+
+    def _call(self, *args):
+        return lambda *items: self.calls.append(args + items)
+
+    def test_changes_applied_in_dependency_order(self):
+        self.session.stage('edge-1', 'rule', 'r1', self._call('rule'),
+                           after=('ipset',))
+        self.session.stage('edge-1', 'vip', 'v1', self._call('vip'),
+                           after=('pool',))
+        self.session.stage('edge-1', 'ipset', 'i1', self._call('ipset'))
+        self.session.stage('edge-1', 'pool', 'p1', self._call('pool'))
+        self.session.commit()
+        self.assertEqual(self.calls, [('ipset',), ('rule',), ('pool',),
+                                      ('vip',)])
+        self.assertEqual(len(self.session), 0)
+
+    def test_restaged_change_replaces_earlier(self):
+        self.session.stage('edge-1', 'pool', 'p1', self._call('first'))
+        self.session.stage('edge-1', 'pool', 'p1', self._call('second'))
+        self.session.commit()
+        self.assertEqual(self.calls, [('second',)])
+
+    def test_batch_applied_once(self):
+        for rule in ('r1', 'r2', 'r3'):
+            self.session.append('edge-1', 'rule', rule,
+                                self._call('rules'))
+        self.session.append('edge-2', 'rule', 'r4', self._call('rules'))
+        self.session.commit()
+        self.assertEqual(self.calls, [('rules', ['r1', 'r2', 'r3']),
+                                      ('rules', ['r4'])])
+
+    def test_applied_changes_undone_on_failure(self):
+        failing = mock.Mock(side_effect=exceptions.VShieldException(
+            reason='rejected'))
+        self.session.stage('edge-1', 'pool', 'p1', self._call('pool'),
+                           undo=self._call('undo pool'))
+        self.session.append('edge-1', 'rule', 'r1', self._call('rules'),
+                            undo=self._call('undo rules'))
+        self.session.stage('edge-2', 'ipsec', 's1', failing,
+                           undo=self._call('undo ipsec'))
+        self.assertRaises(exceptions.VShieldException, self.session.commit)
+        self.assertEqual(self.calls, [('pool',), ('rules', ['r1']),
+                                      ('undo rules', ['r1']),
+                                      ('undo pool',)])
+
+    def test_circular_dependencies(self):
+        self.session.stage('edge-1', 'a', 1, self._call('a'), after=('b',))
+        self.session.stage('edge-1', 'b', 1, self._call('b'), after=('a',))
+        self.assertRaises(exceptions.VShieldException, self.session.commit)
+        self.assertEqual(self.calls, [])
+
+
+class TestEdgeSessionScope(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestEdgeSessionScope, self).setUp()
+        self.context = mock.Mock(spec=['session'])
+        self.apply = mock.Mock()
+
+    def test_push_without_session_applies_now(self):
+        edgesession.push(self.context, 'edge-1', 'pool', 'p1', self.apply)
+        self.apply.assert_called_once_with()
+
+    def test_push_staged_until_session_ends(self):
+        with edgesession.edge_session(self.context):
+            with edgesession.edge_session(self.context) as inner:
+                edgesession.push(self.context, 'edge-1', 'pool', 'p1',
+                                 self.apply)
+                self.assertEqual(len(inner), 1)
+            self.assertFalse(self.apply.called)
+        self.apply.assert_called_once_with()
+        self.assertIsNone(edgesession.current(self.context))
+
+    def test_nothing_applied_when_request_fails(self):
+        def provision():
+            with edgesession.edge_session(self.context):
+                edgesession.push(self.context, 'edge-1', 'pool', 'p1',
+                                 self.apply)
+                raise ValueError()
+        self.assertRaises(ValueError, provision)
+        self.assertFalse(self.apply.called)
+        self.assertIsNone(edgesession.current(self.context))
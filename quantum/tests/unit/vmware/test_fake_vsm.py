@@ -0,0 +1,113 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+
+import mock
+import webob
+
+from quantum.plugins.vmware.vshield.common import exceptions
+from quantum.plugins.vmware.vshield import fwapi
+from quantum.plugins.vmware.vshield import lbapi
+from quantum.plugins.vmware.vshield import retry
+from quantum.plugins.vmware.vshield import vpnapi
+from quantum.plugins.vmware.vshield import vseapi
+from quantum.tests import base
+from quantum.tests.unit.vmware import fake_vsm
+
+
+class TestFakeVsm(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestFakeVsm, self).setUp()
+        retry._breakers.clear()
+        self.addCleanup(retry._breakers.clear)
+        self.vsm = fake_vsm.FakeVsm()
+        self.vse = vseapi.VseAPI('fake://vsm', 'admin', 'default', 'edge-1')
+        self.vse.vsmapi = self.vsm.client()
+        self.vse.coalescer = vseapi.VsmConfigCoalescer(0)
+        self.vse.retry = retry.RetryPolicy(2, 0, 0)
+        self.context = mock.Mock()
+        register = mock.patch('quantum.db.api.register_models')
+        register.start()
+        self.addCleanup(register.stop)
+
+    def test_rules_appended_and_read_back(self):
+        api = fwapi.FirewallAPI(self.vse)
+        api.rule_vseids = mock.Mock()
+        api.ipobj_vseids = api.serviceobj_vseids = mock.Mock()
+        api.ipobj_vseids.get_many.return_value = {}
+        rules = [{'id': 'rule-%d' % i, 'name': 'rule-%d' % i,
+                  'action': 'accept', 'enabled': True,
+                  'source': {}, 'destination': {}, 'service': {}}
+                 for i in range(3)]
+        api.create_rules(self.context, rules)
+        self.assertEqual(
+            [c[0][1:] for c in api.rule_vseids.add.call_args_list],
+            [('rule-0', '1'), ('rule-1', '2'), ('rule-2', '3')])
+        self.assertEqual(self.vsm.edges['edge-1']['fw'].keys(),
+                         ['1', '2', '3'])
+
+    def test_pool_created_and_load_balancer_enabled(self):
+        api = lbapi.LoadBalancerAPI(self.vse)
+        api.pool_vseids = mock.Mock()
+        api.pool_vseids.get.return_value = None
+        api.sync_pool(self.context, {
+            'id': 'pool-1', 'name': 'web', 'lb_method': 'ROUND_ROBIN',
+            'members': [{'address': '10.0.0.1', 'protocol_port': 80,
+                         'status': 'ACTIVE'}]})
+        api.pool_vseids.add.assert_called_once_with(self.context, 'pool-1',
+                                                    'pool-1')
+        config = api.get_vsm_lb_config()
+        self.assertTrue(config['enabled'])
+        self.assertEqual([pool['poolId'] for pool in config['pool']],
+                         ['pool-1'])
+
+    def test_ipsec_sites_pushed(self):
+        api = vpnapi.VPNAPI(self.vse)
+        api.sync_sites(self.context, [{
+            'id': 'site-1', 'name': 'site', 'description': '',
+            'local_id': '10.0.0.1', 'local_endpoint': '10.0.0.1',
+            'peer_id': '10.1.0.1', 'peer_endpoint': '10.1.0.1', 'mtu': 1500,
+            'psk': 'secret', 'pri_networks': []}])
+        missing, changed, orphaned = api.check_sites(self.context, [])
+        self.assertEqual(orphaned, [('10.0.0.1', '10.1.0.1')])
+        self.assertEqual(len(api.get_stats()['siteStatistics']), 1)
+
+    def test_injected_errors(self):
+        self.vsm.error_rate = 1
+        with mock.patch.object(vseapi, 'in_background', return_value=True):
+            self.assertRaises(exceptions.VsmRequestFailed, self.vse.send,
+                              'GET', '/api/4.0/edges/edge-1/firewall/config')
+        # the first attempt and both retries
+        self.assertEqual(self.vsm.errors, 3)
+
+    def test_unknown_uri(self):
+        header, content = self.vsm.request('GET', '/api/4.0/edges')
+        self.assertEqual(header['status'], '404')
+
+    def test_served_over_wsgi(self):
+        req = webob.Request.blank('/api/2.0/services/ipset/edge-1',
+                                  method='POST',
+                                  body=json.dumps({'name': 'web'}))
+        res = req.get_response(self.vsm)
+        self.assertEqual(res.status_int, 201)
+        self.assertTrue(res.location.endswith('/api/2.0/services/ipset/'
+                                              'ipset-1'))
+        res = webob.Request.blank('/api/2.0/services/ipset/ipset-1',
+                                  method='DELETE').get_response(self.vsm)
+        self.assertEqual(res.status_int, 204)
+        self.assertEqual(self.vsm.services['ipset'], {})
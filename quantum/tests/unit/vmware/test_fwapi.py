@@ -0,0 +1,241 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo.config import cfg
+
+from quantum import context
+from quantum.db import api as db
+from quantum.db import firewall_db
+from quantum.plugins.vmware.vshield.common import exceptions
+from quantum.plugins.vmware.vshield import fwapi
+from quantum.plugins.vmware.vshield import retry
+from quantum.plugins.vmware.vshield import vseapi
+from quantum.tests import base
+from quantum.tests.unit.vmware import fake_vsm
+
+
+def _rule(id, name, ipobjs=None):
+    return {'id': id,
+            'name': name,
+            'description': '',
+            'enabled': True,
+            'action': 'drop',
+            'source': {'ipobjs': ipobjs or []},
+            'destination': {'addresses': ['10.0.0.1']},
+            'service': {}}
+
+
+def _fw_config(*rules):
+    vsmRules = [{'ruleId': 1, 'name': 'internal', 'ruleType': 'internal_high'}]
+    vsmRules += [{'ruleId': id, 'name': name, 'ruleType': 'user'}
+                 for id, name in rules]
+    vsmRules += [{'ruleId': 99, 'name': 'default',
+                  'ruleType': 'default_policy'}]
+    return {'firewallRules': {'firewallRules': vsmRules}}
+
+
+class TestFirewallAPIBulkCreate(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestFirewallAPIBulkCreate, self).setUp()
+        self.vse = mock.Mock()
+        self.vse.get_edgeId.return_value = 'edge-1'
+        self.vse.vsmconfig.return_value = (
+            {'status': '201',
+             'location': '/api/4.0/edges/edge-1/firewall/config/rules/8'},
+            '')
+        with mock.patch.object(fwapi.qdbapi, 'register_models'):
+            self.api = fwapi.FirewallAPI(self.vse)
+        self.api.rule_vseids = mock.Mock()
+        self.api.ipobj_vseids = mock.Mock()
+        self.api.ipobj_vseids.get_many.return_value = {'ip-1': 'ipset-1',
+                                                       'ip-2': 'ipset-2'}
+        self.api.serviceobj_vseids = mock.Mock()
+        self.api.serviceobj_vseids.get_many.return_value = {}
+        self.context = mock.Mock()
+        self.rules = [_rule('r1', 'a', ['ip-1']), _rule('r2', 'b', ['ip-2']),
+                      _rule('r3', 'c', ['ip-1'])]
+
+    def _configs(self, before, after):
+        self.vse.api.side_effect = [_fw_config(*before), _fw_config(*after)]
+
+    def test_rules_created_in_one_request(self):
+        self._configs([(5, 'x')], [(5, 'x'), (6, 'a'), (7, 'b'), (8, 'c')])
+        self.api.create_rules(self.context, self.rules)
+        self.assertEqual(self.vse.vsmconfig.call_count, 1)
+        method, uri, request = self.vse.vsmconfig.call_args[0]
+        self.assertEqual((method, uri),
+                         ('POST', '/api/4.0/edges/edge-1/firewall/config/'
+                                  'rules'))
+        self.assertEqual(
+            [r['source']['groupingObjectId'] for r in
+             request['firewallRules']],
+            [['ipset-1'], ['ipset-2'], ['ipset-1']])
+        self.assertEqual(request['firewallRules'][0]['action'], 'drop')
+        # the ip sets of every rule are resolved at once
+        self.assertEqual(self.api.ipobj_vseids.get_many.call_count, 1)
+        self.assertEqual(self.api.rule_vseids.add.call_args_list,
+                         [mock.call(self.context, 'r1', u'6'),
+                          mock.call(self.context, 'r2', u'7'),
+                          mock.call(self.context, 'r3', u'8')])
+
+    def test_rules_told_apart_from_other_rules(self):
+        # rules of the same names already on the edge, or added by
+        # another request meanwhile, are not mistaken for ours
+        self._configs([(5, 'a')],
+                      [(5, 'a'), (6, 'a'), (7, 'b'), (9, 'x'), (8, 'c')])
+        self.api.create_rules(self.context, self.rules)
+        self.assertEqual(self.api.rule_vseids.add.call_args_list,
+                         [mock.call(self.context, 'r1', u'6'),
+                          mock.call(self.context, 'r2', u'7'),
+                          mock.call(self.context, 'r3', u'8')])
+
+    def test_rules_created_above_location(self):
+        self.api.rule_vseids.get.return_value = '4'
+        self._configs([(4, 'x')], [(6, 'a'), (7, 'b'), (8, 'c'), (4, 'x')])
+        self.api.create_rules(self.context, self.rules, 'r0')
+        self.api.rule_vseids.get.assert_called_once_with(self.context, 'r0')
+        method, uri, request = self.vse.vsmconfig.call_args[0]
+        self.assertEqual((method, uri),
+                         ('POST', '/api/4.0/edges/edge-1/firewall/config/'
+                                  'rules?aboveRuleId=4'))
+        self.assertEqual(self.api.rule_vseids.add.call_count, 3)
+
+    def test_rules_read_back_once_job_completes(self):
+        self.vse.vsmconfig.return_value = (
+            {'status': '202',
+             'location': '/api/4.0/edges/jobs/jobdata-1'}, '')
+        self._configs([], [(6, 'a'), (7, 'b'), (8, 'c')])
+        self.api.create_rules(self.context, self.rules)
+        self.assertTrue(self.vse.vsmconfig.call_args[1]['wait'])
+        self.assertEqual(self.vse.vsmconfig.call_count, 1)
+        self.assertEqual(self.api.rule_vseids.add.call_args_list,
+                         [mock.call(self.context, 'r1', u'6'),
+                          mock.call(self.context, 'r2', u'7'),
+                          mock.call(self.context, 'r3', u'8')])
+
+    def test_rules_without_own_name_created_one_by_one(self):
+        rules = [_rule('r1', 'a'), _rule('r2', 'a'), _rule('r3', '')]
+        self.api.create_rules(self.context, rules)
+        self.assertEqual(self.vse.vsmconfig.call_count, 3)
+        self.assertFalse(self.vse.api.called)
+        self.assertEqual(self.api.rule_vseids.add.call_count, 3)
+
+    def test_location_not_on_edge(self):
+        self.api.rule_vseids.get.return_value = None
+        self.assertRaises(exceptions.VShieldException,
+                          self.api.create_rules, self.context, self.rules,
+                          'r0')
+        self.assertFalse(self.vse.vsmconfig.called)
+
+    def test_created_rules_not_found(self):
+        # the first rule went away before the rules were read back: the
+        # rules which are certainly ours are deleted again
+        self._configs([(4, 'x')], [(4, 'x'), (6, 'b'), (8, 'c')])
+        self.assertRaises(exceptions.VShieldException,
+                          self.api.create_rules, self.context, self.rules)
+        self.assertFalse(self.api.rule_vseids.add.called)
+        uri = '/api/4.0/edges/edge-1/firewall/config/rules/'
+        self.assertEqual(self.vse.vsmconfig.call_args_list[1:],
+                         [mock.call('DELETE', uri + '8'),
+                          mock.call('DELETE', uri + '6')])
+
+
+class TestFirewallAPISharedObjects(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestFirewallAPISharedObjects, self).setUp()
+        cfg.CONF.set_override('sql_connection', 'sqlite://', 'DATABASE')
+        self.addCleanup(cfg.CONF.reset)
+        db._ENGINE = None
+        db._MAKER = None
+        db.configure_db()
+        self.addCleanup(db.clear_db)
+        retry._breakers.clear()
+        self.addCleanup(retry._breakers.clear)
+        self.vsm = fake_vsm.FakeVsm()
+        vse = vseapi.VseAPI('fake://vsm', 'admin', 'default', 'edge-1')
+        vse.vsmapi = self.vsm.client()
+        self.api = fwapi.FirewallAPI(vse)
+        self.context = context.get_admin_context()
+        with self.context.session.begin():
+            for i in range(3):
+                self.context.session.add(firewall_db.IPObj(
+                    id='ip-%d' % i, tenant_id='tenant'))
+                self.context.session.add(firewall_db.ServiceObj(
+                    id='svc-%d' % i, tenant_id='tenant', protocol='tcp'))
+
+    def _create_ipset(self, id, value):
+        with self.context.session.begin():
+            self.api.create_ipset(self.context, {'id': id, 'name': id,
+                                                 'value': value})
+
+    def _delete_ipset(self, id):
+        with self.context.session.begin():
+            self.api.delete_ipset(self.context, {'id': id})
+
+    def test_ipset_shared_by_equal_addresses(self):
+        self._create_ipset('ip-0', ['10.0.0.1', '10.0.0.0/24'])
+        self._create_ipset('ip-1', ['10.0.0.0/24 ', '10.0.0.1'])
+        self._create_ipset('ip-2', ['10.0.0.2'])
+        self.assertEqual(sorted(self.vsm.services['ipset']),
+                         ['ipset-1', 'ipset-2'])
+        vseids = self.api.ipobj_vseids.get_many(
+            self.context, ['ip-0', 'ip-1', 'ip-2'])
+        self.assertEqual(vseids, {'ip-0': 'ipset-1', 'ip-1': 'ipset-1',
+                                  'ip-2': 'ipset-2'})
+
+    def test_ipset_removed_with_last_reference(self):
+        self._create_ipset('ip-0', ['10.0.0.1'])
+        self._create_ipset('ip-1', ['10.0.0.1'])
+        self._delete_ipset('ip-0')
+        self.assertEqual(list(self.vsm.services['ipset']), ['ipset-1'])
+        self._delete_ipset('ip-1')
+        self.assertEqual(self.vsm.services['ipset'], {})
+        self.assertEqual(
+            self.context.session.query(fwapi.GroupingObject).count(), 0)
+
+    def test_application_shared_by_equal_ports(self):
+        for id, ports in (('svc-0', [80, 443]), ('svc-1', ['443', 80]),
+                          ('svc-2', [80])):
+            with self.context.session.begin():
+                self.api.create_application(self.context, {
+                    'id': id, 'name': id, 'protocol': 'TCP',
+                    'ports': ports})
+        self.assertEqual(sorted(self.vsm.services['application']),
+                         ['application-1', 'application-2'])
+        with self.context.session.begin():
+            self.api.delete_application(self.context, {'id': 'svc-1'})
+        self.assertEqual(len(self.vsm.services['application']), 2)
+
+    def test_missing_rule_created_at_its_place(self):
+        rules = [_rule('r1', 'a'), _rule('r2', 'b'), _rule('r3', 'c')]
+        with self.context.session.begin():
+            for position, rule in enumerate(rules):
+                self.context.session.add(firewall_db.Rule(
+                    id=rule['id'], tenant_id='tenant', name=rule['name'],
+                    action=0, log=False, enabled=True, position=position))
+        with self.context.session.begin():
+            self.api.create_rules(self.context, rules)
+        fw = self.vsm.edges['edge-1']['fw']
+        del fw[self.api.rule_vseids.get(self.context, 'r2')]
+        drift = self.api.check_rules(self.context, rules)
+        self.assertEqual((drift['missing'], drift['repaired']), (1, 1))
+        self.assertEqual([rule['name'] for rule in fw.values()],
+                         ['a', 'b', 'c'])
+        self.assertEqual(self.api.rule_vseids.get(self.context, 'r2'),
+                         str(self.vsm._ids['rule']))
@@ -0,0 +1,83 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+
+import mock
+
+from quantum.plugins.vmware.vshield import instrument
+from quantum.tests import base
+
+
+class TestInstrumentation(base.BaseTestCase):
+
+    def test_endpoint(self):
+        self.assertEqual(
+            instrument.endpoint(
+                '/api/4.0/edges/edge-1/loadbalancer/config/pools/pool-3',
+                'edge-1'),
+            '/api/4.0/edges/{edge}/loadbalancer/config/pools/{id}')
+        self.assertEqual(
+            instrument.endpoint('/api/4.0/edges/edge-1/firewall/config/'
+                                'rules/42?ruleId=1', 'edge-1'),
+            '/api/4.0/edges/{edge}/firewall/config/rules/{id}')
+
+    def test_redact(self):
+        body = {'sites': {'sites': [{'name': 'site1', 'psk': 'secret'}]}}
+        self.assertEqual(instrument.redact(body),
+                         {'sites': {'sites': [{'name': 'site1',
+                                               'psk': '***'}]}})
+        self.assertEqual(body['sites']['sites'][0]['psk'], 'secret')
+
+    def test_secrets_not_logged(self):
+        instrumentation = instrument.Instrumentation(1)
+        body = json.dumps({'psk': 'secret'})
+        with mock.patch.object(instrument.LOG, 'isEnabledFor',
+                               return_value=True):
+            with mock.patch.object(instrument.LOG, 'debug') as debug:
+                instrumentation.record('edge-1', 'PUT', '/config', 204, 0,
+                                       0.01, body, '')
+        logged = debug.call_args[0][0] % debug.call_args[0][1]
+        self.assertNotIn('secret', logged)
+
+    def test_histogram(self):
+        histogram = instrument.Histogram()
+        for value in (1, 2, 30, 40, 20000):
+            histogram.observe(value)
+        self.assertEqual(histogram.percentile(50), 50)
+        self.assertEqual(histogram.percentile(99), 20000)
+        self.assertEqual(histogram.to_dict()['buckets']['inf'], 1)
+
+    def test_unsampled_requests_counted(self):
+        instrumentation = instrument.Instrumentation(0)
+        self.assertFalse(instrumentation.sample())
+        instrumentation.record('edge-1', 'GET', '/config', 200, 0)
+        instrumentation.record('edge-1', 'GET', '/config', 503, 2)
+        metrics = instrumentation.get_metrics()['edge-1'][0]
+        self.assertEqual(metrics['requests'], 2)
+        self.assertEqual(metrics['retries'], 2)
+        self.assertEqual(metrics['statuses'], {'200': 1, '503': 1})
+        self.assertEqual(metrics['sampled'], 0)
+
+    def test_slowest_endpoints_first(self):
+        instrumentation = instrument.Instrumentation(1)
+        instrumentation.record('edge-1', 'GET', '/fast', 200, 0, 0.01)
+        instrumentation.record('edge-1', 'GET', '/slow', 200, 0, 1)
+        instrumentation.record('edge-2', 'GET', '/fast', 200, 0, 0.01)
+        metrics = instrumentation.get_metrics('edge-1')
+        self.assertEqual(metrics.keys(), ['edge-1'])
+        self.assertEqual([m['endpoint'] for m in metrics['edge-1']],
+                         ['/slow', '/fast'])
@@ -0,0 +1,129 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+
+import eventlet
+import mock
+
+from quantum.plugins.vmware.vshield.common import exceptions
+from quantum.plugins.vmware.vshield import jobs
+from quantum.tests import base
+
+
+def _jobs(**statuses):
+    return ({'status': '200'},
+            json.dumps({'edgeJob': [{'jobId': job_id, 'status': status}
+                                    for job_id, status in
+                                    statuses.iteritems()]}))
+
+
+class TestJobId(base.BaseTestCase):
+
+    def test_job_id(self):
+        self.assertEqual(jobs.job_id(
+            {'status': '202',
+             'location': '/api/4.0/edges/jobs/jobdata-42'}), 'jobdata-42')
+
+    def test_applied_change_has_no_job(self):
+        self.assertIsNone(jobs.job_id(
+            {'status': '201', 'location': '/config/pools/pool-1'}))
+        self.assertIsNone(jobs.job_id({'status': '204'}))
+
+
+class TestJobPoller(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestJobPoller, self).setUp()
+        self.vse = mock.Mock()
+        self.vse.get_edgeId.return_value = 'edge-1'
+        self.poller = jobs.JobPoller(self.vse, 0.001, 0.004, 60)
+        # lets the poller stop
+        self.addCleanup(self.poller._jobs.clear)
+
+    def test_jobs_polled_together(self):
+        self.vse.send.side_effect = [
+            _jobs(a='RUNNING', b='QUEUED'),
+            _jobs(a='COMPLETED', b='RUNNING'),
+            _jobs(b='COMPLETED')]
+        a = self.poller.register('a')
+        b = self.poller.register('b')
+        self.assertEqual(a.wait(), 'COMPLETED')
+        self.assertEqual(b.wait(), 'COMPLETED')
+        self.assertEqual(self.vse.send.call_count, 3)
+        self.vse.send.assert_called_with(
+            'GET', '/api/4.0/edges/edge-1/jobs?status=all')
+        eventlet.sleep(0.01)
+        self.assertEqual(self.poller.pending(), 0)
+        self.assertFalse(self.poller._running)
+
+    def test_failed_job_raises(self):
+        self.vse.send.return_value = _jobs(a='FAILED')
+        future = self.poller.register('a')
+        e = self.assertRaises(exceptions.VsmJobFailed, future.wait)
+        self.assertEqual(e.status, 'FAILED')
+
+    def test_job_missing_from_list_read_alone(self):
+        self.vse.send.side_effect = [
+            _jobs(), ({'status': '200'}, json.dumps({'jobId': 'a',
+                                                     'status': 'COMPLETED'}))]
+        self.assertEqual(self.poller.register('a').wait(), 'COMPLETED')
+        self.vse.send.assert_called_with('GET', '/api/4.0/edges/jobs/a')
+
+    def test_job_times_out(self):
+        self.poller.timeout = 0
+        self.vse.send.return_value = _jobs(a='RUNNING')
+        future = self.poller.register('a')
+        e = self.assertRaises(exceptions.VsmJobFailed, future.wait)
+        self.assertEqual(e.status, 'TIMEOUT')
+
+    def test_interval_backs_off_while_no_job_ends(self):
+        self.vse.send.return_value = _jobs(a='RUNNING')
+        self.poller.register('a')
+        eventlet.sleep(0.02)
+        self.assertEqual(self.poller.interval, 0.004)
+        self.poller.register('b')
+        self.assertEqual(self.poller.interval, 0.001)
+
+    def test_job_times_out_while_polls_fail(self):
+        self.poller.timeout = 0.01
+        self.vse.send.side_effect = Exception('unreachable')
+        future = self.poller.register('a')
+        e = self.assertRaises(exceptions.VsmJobFailed, future.wait, 1)
+        self.assertEqual(e.status, 'TIMEOUT')
+        self.assertEqual(self.poller.pending(), 0)
+
+    def test_job_read_alone_fails_without_others(self):
+        def send(method, uri):
+            if uri.endswith('/jobs/a'):
+                raise Exception('unreachable')
+            if uri.endswith('/jobs/b'):
+                return {'status': '200'}, json.dumps({'status': 'FAILED'})
+            return _jobs(c='COMPLETED')
+
+        self.vse.send.side_effect = send
+        a = self.poller.register('a')
+        b = self.poller.register('b')
+        c = self.poller.register('c')
+        self.assertEqual(c.wait(), 'COMPLETED')
+        self.assertRaises(exceptions.VsmJobFailed, b.wait)
+        self.assertFalse(a.done())
+
+    def test_wait_times_out(self):
+        self.vse.send.return_value = _jobs(a='RUNNING')
+        future = self.poller.register('a')
+        e = self.assertRaises(exceptions.VsmJobFailed, future.wait, 0.01)
+        self.assertEqual((e.job_id, e.status), ('a', 'TIMEOUT'))
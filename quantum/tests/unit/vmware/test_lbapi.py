@@ -0,0 +1,72 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from quantum.plugins.common import constants
+from quantum.plugins.vmware.vshield import lbapi
+from quantum.tests import base
+
+
+def _pool(*members):
+    return {'id': 'pool-1', 'name': 'web', 'lb_method': 'ROUND_ROBIN',
+            'members': [{'address': address, 'protocol_port': 80,
+                         'status': status} for address, status in members]}
+
+
+class TestLoadBalancerAPISyncPool(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestLoadBalancerAPISyncPool, self).setUp()
+        self.vse = mock.Mock()
+        self.vse.get_edgeId.return_value = 'edge-1'
+        self.vse.vsmconfig.return_value = (
+            {'location': '/config/pools/pool-7'}, '')
+        with mock.patch.object(lbapi.qdbapi, 'register_models'):
+            self.api = lbapi.LoadBalancerAPI(self.vse)
+        self.api.enabled = True
+        self.api.pool_vseids = mock.Mock()
+        self.context = mock.Mock()
+
+    def test_pool_pushed_with_all_members(self):
+        self.api.pool_vseids.get.return_value = 'pool-7'
+        self.api.sync_pool(self.context, _pool(
+            ('10.0.0.1', constants.ACTIVE),
+            ('10.0.0.2', constants.PENDING_CREATE),
+            ('10.0.0.3', constants.PENDING_DELETE)))
+        self.assertEqual(self.vse.api.call_count, 1)
+        method, uri, request = self.vse.api.call_args[0]
+        self.assertEqual((method, uri),
+                         ('PUT', '/api/4.0/edges/edge-1/loadbalancer/config/'
+                                 'pools/pool-7'))
+        self.assertEqual([m['ipAddress'] for m in request['member']],
+                         ['10.0.0.1', '10.0.0.2'])
+
+    def test_pool_created_with_first_member(self):
+        self.api.pool_vseids.get.return_value = None
+        self.api.sync_pool(self.context, _pool(
+            ('10.0.0.1', constants.PENDING_CREATE)))
+        self.assertEqual(self.vse.vsmconfig.call_args[0][0], 'POST')
+        self.api.pool_vseids.add.assert_called_once_with(
+            self.context, 'pool-1', 'pool-7')
+
+    def test_pool_removed_with_last_member(self):
+        self.api.pool_vseids.get.return_value = 'pool-7'
+        self.api.sync_pool(self.context, _pool(
+            ('10.0.0.1', constants.PENDING_DELETE)))
+        self.assertEqual(self.vse.vsmconfig.call_args[0][0], 'DELETE')
+        self.api.pool_vseids.delete.assert_called_once_with(self.context,
+                                                            'pool-1')
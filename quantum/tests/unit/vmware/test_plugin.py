@@ -0,0 +1,170 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from quantum.db.loadbalancer import loadbalancer_db
+from quantum.plugins.common import constants
+from quantum.plugins.vmware.vshield.common import exceptions
+from quantum.plugins.vmware.vshield import edgesession
+from quantum.plugins.vmware.vshield import jobs
+from quantum.plugins.vmware.vshield import plugin
+from quantum.tests import base
+
+
+class TestLBPluginEdgeSession(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestLBPluginEdgeSession, self).setUp()
+        with mock.patch.object(plugin.VShieldEdgeLBPlugin, '__init__',
+                               return_value=None):
+            self.plugin = plugin.VShieldEdgeLBPlugin()
+        self.plugin.edges = mock.Mock()
+        self.plugin.edges.get_edge.return_value = 'edge-1'
+        self.plugin.pool_batcher = mock.Mock(window=0)
+        self.lb_api = mock.Mock()
+        self.lb_api.vse.get_edgeId.return_value = 'edge-1'
+        self.plugin.lb_apis = {'edge-1': self.lb_api}
+        # the pool is on the edge once pushed with its members
+        self.pool_vseids = {}
+        self.lb_api.get_pool_vseid.side_effect = (
+            lambda context, pool_id: self.pool_vseids.get(pool_id))
+        self.lb_api.sync_pool.side_effect = (
+            lambda context, pool: self.pool_vseids.update(p1='pool-1'))
+        self.lb_api.get_vip_vseid.return_value = None
+        self.context = mock.Mock(spec=['session'])
+        self.context.session = mock.MagicMock()
+        query = self.context.session.query.return_value
+        query.filter_by.return_value.all.return_value = []
+        for name, value in (('get_pool', {'tenant_id': 't1',
+                                          'subnet_id': 's1'}),
+                            ('_get_resource', {'id': 'p1', 'members': []}),
+                            ('update_status', None)):
+            patcher = mock.patch.object(self.plugin, name,
+                                        return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.vip = {'id': 'v1', 'pool_id': 'p1'}
+
+    def test_vip_created_after_pool_pushed_by_session(self):
+        with edgesession.edge_session(self.context) as session:
+            # the vip is staged first, the pool is not on the edge yet
+            self.plugin._stage_vip(self.context, session, self.lb_api,
+                                   self.vip)
+            self.plugin._pool_changed(self.context, 'p1')
+            self.assertFalse(self.lb_api.sync_pool.called)
+        # pushed with the request's context, which sees the members it
+        # has not committed
+        self.lb_api.sync_pool.assert_called_once_with(
+            self.context, {'id': 'p1', 'members': []})
+        self.lb_api.create_vip.assert_called_once_with(self.context,
+                                                       self.vip)
+        self.assertFalse(self.plugin.pool_batcher.add.called)
+
+    def test_vip_waits_for_pool_not_pushed(self):
+        with edgesession.edge_session(self.context) as session:
+            self.plugin._stage_vip(self.context, session, self.lb_api,
+                                   self.vip)
+        self.assertFalse(self.lb_api.create_vip.called)
+
+    def test_pool_removed_when_vip_fails(self):
+        self.lb_api.create_vip.side_effect = Exception()
+
+        def provision():
+            with edgesession.edge_session(self.context) as session:
+                self.plugin._pool_changed(self.context, 'p1')
+                self.plugin._stage_vip(self.context, session, self.lb_api,
+                                       self.vip)
+        self.assertRaises(Exception, provision)
+        self.lb_api.delete_pool.assert_called_once_with(self.context,
+                                                        {'id': 'p1'})
+        self.assertFalse(self.lb_api.delete_vip.called)
+
+
+class TestLBPluginAfterFork(base.BaseTestCase):
+
+    def test_state_recreated(self):
+        with mock.patch.object(plugin.VShieldEdgeLBPlugin, '__init__',
+                               return_value=None):
+            lb_plugin = plugin.VShieldEdgeLBPlugin()
+        lb_plugin.edges = mock.Mock()
+        lb_plugin.lb_apis = {'edge-1': mock.Mock()}
+        lb_plugin.pool_batcher = batcher = mock.Mock()
+        with mock.patch.object(plugin, 'forget_process_state') as forget:
+            with mock.patch.object(plugin,
+                                   'get_task_manager') as get_tasks:
+                lb_plugin.after_fork()
+        forget.assert_called_once_with()
+        lb_plugin.edges.forget_vses.assert_called_once_with()
+        self.assertEqual(lb_plugin.lb_apis, {})
+        self.assertIsNot(lb_plugin.pool_batcher, batcher)
+        self.assertIs(lb_plugin.pool_batcher.tasks, get_tasks.return_value)
+
+
+class TestLBPluginJobs(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestLBPluginJobs, self).setUp()
+        with mock.patch.object(plugin.VShieldEdgeLBPlugin, '__init__',
+                               return_value=None):
+            self.plugin = plugin.VShieldEdgeLBPlugin()
+        self.lb_api = mock.Mock()
+        self.lb_api.get_vip_vseid.return_value = None
+        self.lb_api.get_pool_vseid.return_value = 'pool-1'
+        self.context = mock.Mock()
+        self.settle = mock.Mock()
+        mock.patch.object(self.plugin, '_status_settler',
+                          return_value=self.settle).start()
+        self.spawn = mock.patch.object(plugin.eventlet, 'spawn_n').start()
+        self.admin_context = mock.patch.object(
+            plugin.q_context, 'get_admin_context').start().return_value
+        self.addCleanup(mock.patch.stopall)
+        self.vip = {'id': 'v1', 'pool_id': 'p1'}
+
+    def _create_vip(self, future=None):
+        if future is not None:
+            self.lb_api.create_vip.side_effect = (
+                lambda context, vip: jobs.collect_job(future))
+        self.plugin._create_edge_vip(self.context, self.lb_api, self.vip)
+        self.plugin._status_settler.assert_called_once_with(
+            loadbalancer_db.Vip, 'v1', constants.PENDING_CREATE)
+
+    def _run_waiter(self):
+        func, futures, settle = self.spawn.call_args[0]
+        func(futures, settle)
+
+    def test_vip_active_without_job(self):
+        self._create_vip()
+        self.settle.assert_called_once_with(self.context, constants.ACTIVE)
+        self.assertFalse(self.spawn.called)
+
+    def test_vip_pending_until_job_completes(self):
+        future = mock.Mock()
+        self._create_vip(future)
+        self.assertFalse(self.settle.called)
+        self._run_waiter()
+        future.wait.assert_called_once_with()
+        self.settle.assert_called_once_with(self.admin_context,
+                                            constants.ACTIVE)
+
+    def test_vip_error_when_job_fails(self):
+        future = mock.Mock()
+        future.wait.side_effect = exceptions.VsmJobFailed(
+            job_id='j-1', edge_id='edge-1', status='FAILED')
+        self._create_vip(future)
+        self._run_waiter()
+        self.settle.assert_called_once_with(self.admin_context,
+                                            constants.ERROR)
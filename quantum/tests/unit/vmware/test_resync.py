@@ -0,0 +1,74 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from quantum.plugins.vmware.vshield import resync
+from quantum.tests import base
+
+
+class TestDiff(base.BaseTestCase):
+
+    def test_matches_ignores_fields_added_by_edge(self):
+        self.assertTrue(resync.matches(
+            {'name': 'pool1', 'member': [{'port': 80}]},
+            {'name': 'pool1', 'poolId': 'pool-1',
+             'member': [{'port': '80', 'memberId': 'member-1'}]}))
+
+    def test_matches_scalars(self):
+        self.assertTrue(resync.matches({'enabled': True},
+                                       {'enabled': 'true'}))
+        self.assertTrue(resync.matches({'description': None}, {}))
+        self.assertFalse(resync.matches({'member': [{'port': 80}]},
+                                        {'member': []}))
+
+    def test_matches_ignored_fields(self):
+        self.assertTrue(resync.matches({'name': 'site1', 'psk': 'secret'},
+                                       {'name': 'site1'}, ignore=('psk',)))
+
+    def test_diff(self):
+        missing, changed, orphaned = resync.diff(
+            {'a': {'name': 'a'}, 'b': {'name': 'b'}, 'c': {'name': 'c'}},
+            {'b': {'name': 'b'}, 'c': {'name': 'x'}, 'd': {'name': 'd'}})
+        self.assertEqual(missing, ['a'])
+        self.assertEqual(changed, ['c'])
+        self.assertEqual(orphaned, ['d'])
+
+
+class TestEdgeResync(base.BaseTestCase):
+
+    def test_metrics(self):
+        check_edge = mock.Mock(side_effect=[
+            {'missing': 1, 'repaired': 1}, Exception('unreachable')])
+        edge_resync = resync.EdgeResync('ipsec', lambda: ['edge-1'],
+                                        check_edge, 0)
+        edge_resync.run()
+        edge_resync.run()
+        metrics = edge_resync.get_metrics()
+        self.assertEqual(metrics['totals']['missing'], 1)
+        self.assertEqual(metrics['totals']['repaired'], 1)
+        self.assertEqual(metrics['totals']['errors'], 1)
+        self.assertEqual(metrics['edges']['edge-1']['error'], 'unreachable')
+
+    def test_edges_checked(self):
+        check_edge = mock.Mock(return_value={})
+        edge_resync = resync.EdgeResync('ipsec',
+                                        lambda: ['edge-1', 'edge-2'],
+                                        check_edge, 0)
+        edge_resync.run()
+        self.assertEqual(sorted(c[0][0] for c in check_edge.call_args_list),
+                         ['edge-1', 'edge-2'])
+        self.assertEqual(edge_resync.get_metrics()['totals']['changed'], 0)
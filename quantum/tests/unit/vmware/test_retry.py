@@ -0,0 +1,113 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from quantum.plugins.vmware.vshield.common import exceptions
+from quantum.plugins.vmware.vshield import retry
+from quantum.tests import base
+
+
+class TestRetryPolicy(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestRetryPolicy, self).setUp()
+        self.policy = retry.RetryPolicy(3, 0.5, 2, 1)
+
+    def test_rejected_requests_retried(self):
+        for method in ('GET', 'POST', 'PUT', 'DELETE'):
+            self.assertTrue(self.policy.should_retry(method, 0, 503))
+            self.assertTrue(self.policy.should_retry(method, 0, 409))
+
+    def test_failed_requests_retried_if_idempotent(self):
+        self.assertTrue(self.policy.should_retry('PUT', 0, 500))
+        self.assertTrue(self.policy.should_retry('DELETE', 0))
+        self.assertFalse(self.policy.should_retry('POST', 0, 500))
+        self.assertFalse(self.policy.should_retry('POST', 0))
+
+    def test_client_errors_not_retried(self):
+        self.assertFalse(self.policy.should_retry('GET', 0, 400))
+        self.assertFalse(self.policy.should_retry('GET', 0, 404))
+
+    def test_retries_bounded(self):
+        self.assertTrue(self.policy.should_retry('GET', 2, 503))
+        self.assertFalse(self.policy.should_retry('GET', 3, 503))
+
+    def test_foreground_requests_retried_if_rejected(self):
+        self.assertTrue(self.policy.should_retry('POST', 0, 503, False))
+        self.assertFalse(self.policy.should_retry('POST', 1, 503, False))
+        self.assertFalse(self.policy.should_retry('PUT', 0, 500, False))
+        self.assertFalse(self.policy.should_retry('GET', 0, None, False))
+
+    def test_delay(self):
+        with mock.patch('random.uniform', side_effect=lambda a, b: b):
+            self.assertEqual([self.policy.delay(i) for i in range(4)],
+                             [0.5, 1, 2, 2])
+            self.assertEqual([self.policy.delay(i, False) for i in range(2)],
+                             [0.5, 0.5])
+
+
+class TestCircuitBreaker(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestCircuitBreaker, self).setUp()
+        self.breaker = retry.CircuitBreaker('edge-1', 2, 30)
+        self.time = mock.patch('time.time', return_value=1000).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_opens_after_threshold(self):
+        self.breaker.failure()
+        self.breaker.check()
+        self.breaker.failure()
+        self.assertRaises(exceptions.ManagerUnavailable, self.breaker.check)
+
+    def test_success_resets_failures(self):
+        self.breaker.failure()
+        self.breaker.success()
+        self.breaker.failure()
+        self.breaker.check()
+
+    def test_half_open_probe(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.time.return_value = 1030
+        self.breaker.check()
+        # only one probe at a time
+        self.assertRaises(exceptions.ManagerUnavailable, self.breaker.check)
+        self.breaker.failure()
+        self.assertRaises(exceptions.ManagerUnavailable, self.breaker.check)
+        self.time.return_value = 1060
+        self.breaker.check()
+        self.breaker.success()
+        self.breaker.check()
+
+    def test_lost_probe_replaced(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.time.return_value = 1030
+        # the probe never reports back, e.g. its green thread is killed
+        self.breaker.check()
+        self.time.return_value = 1059
+        self.assertRaises(exceptions.ManagerUnavailable, self.breaker.check)
+        self.time.return_value = 1060
+        self.breaker.check()
+        self.assertEqual(self.breaker.state, self.breaker.HALF_OPEN)
+
+    def test_disabled(self):
+        breaker = retry.CircuitBreaker('edge-1', 0, 30)
+        for i in range(5):
+            breaker.failure()
+        breaker.check()
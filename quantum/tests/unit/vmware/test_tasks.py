@@ -0,0 +1,115 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+
+from quantum.plugins.vmware.vshield import tasks
+from quantum.tests import base
+
+
+class TestEdgeTaskManager(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestEdgeTaskManager, self).setUp()
+        self.manager = tasks.EdgeTaskManager(4)
+
+    def test_tasks_run_in_order_per_edge(self):
+        calls = []
+
+        def op(name):
+            eventlet.sleep(0)
+            calls.append(name)
+
+        for i in range(5):
+            self.manager.add('edge-1', op, i)
+        self.assertEqual(self.manager.pending('edge-1'), 5)
+        self.manager.wait()
+        self.assertEqual(calls, range(5))
+        self.assertEqual(self.manager.pending('edge-1'), 0)
+
+    def test_edges_run_in_parallel(self):
+        running = []
+        overlap = []
+
+        def op(edge):
+            running.append(edge)
+            eventlet.sleep(0.01)
+            if len(running) > 1:
+                overlap.append(edge)
+            running.remove(edge)
+
+        self.manager.add('edge-1', op, 'edge-1')
+        self.manager.add('edge-2', op, 'edge-2')
+        self.manager.wait()
+        self.assertTrue(overlap)
+
+    def test_tasks_run_in_background(self):
+        seen = []
+        self.manager.add('edge-1', lambda: seen.append(tasks.in_background()))
+        self.manager.wait()
+        self.assertEqual(seen, [True])
+        self.assertFalse(tasks.in_background())
+
+    def test_one_task_at_a_time_per_edge(self):
+        running = []
+        overlap = []
+
+        def op():
+            running.append(1)
+            eventlet.sleep(0.01)
+            if len(running) > 1:
+                overlap.append(1)
+            running.pop()
+
+        self.manager.add('edge-1', op)
+        self.manager.add('edge-1', op)
+        self.manager.wait()
+        self.assertFalse(overlap)
+
+    def test_failed_task_does_not_stop_queue(self):
+        calls = []
+
+        def fail():
+            raise Exception()
+
+        self.manager.add('edge-1', fail)
+        self.manager.add('edge-1', calls.append, 'done')
+        self.manager.wait()
+        self.assertEqual(calls, ['done'])
+
+    def test_add_unique_skips_waiting_duplicate(self):
+        calls = []
+
+        def op(name):
+            eventlet.sleep(0)
+            calls.append(name)
+
+        self.manager.add_unique('edge-1', op, 'a')
+        self.manager.add_unique('edge-1', op, 'a')
+        self.manager.add_unique('edge-1', op, 'a')
+        self.manager.add_unique('edge-1', op, 'b')
+        self.manager.wait()
+        self.assertEqual(calls, ['a', 'a', 'b'])
+
+
+class TestGetTaskManager(base.BaseTestCase):
+
+    def test_forgotten_after_fork(self):
+        self.addCleanup(tasks.forget_task_manager)
+        manager = tasks.get_task_manager()
+        self.assertIs(tasks.get_task_manager(), manager)
+        tasks.forget_task_manager()
+        self.assertIsNot(tasks.get_task_manager(), manager)
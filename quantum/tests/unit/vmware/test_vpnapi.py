@@ -0,0 +1,98 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from quantum.plugins.vmware.vshield import vpnapi
+from quantum.tests import base
+
+
+def _site(id, name='site', psk='123'):
+    return {'id': id,
+            'name': name,
+            'description': '',
+            'local_endpoint': '10.117.35.202',
+            'local_id': '10.117.35.202',
+            'peer_endpoint': '10.117.35.203',
+            'peer_id': '10.117.35.203',
+            'psk': psk,
+            'mtu': 1500,
+            'pri_networks': [{'local_subnets': '192.168.1.0/24',
+                              'peer_subnets': '192.168.11.0/24'}]}
+
+
+class TestVPNAPISiteSync(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestVPNAPISiteSync, self).setUp()
+        self.vse = mock.Mock()
+        self.vse.get_edgeId.return_value = 'edge-1'
+        self.vse.vsmconfig.return_value = ({'status': '204'}, {})
+        with mock.patch.object(vpnapi.qdbapi, 'register_models'):
+            self.api = vpnapi.VPNAPI(self.vse)
+        self.context = mock.Mock()
+
+    def _pushed_site_names(self):
+        method, uri, request = self.vse.vsmconfig.call_args[0]
+        self.assertEqual(method, 'PUT')
+        self.assertEqual(uri, '/api/4.0/edges/edge-1/ipsec/config')
+        return [s['name'] for s in request['sites']['sites']]
+
+    def test_sync_pushes_all_sites(self):
+        self.api.sync_sites(self.context, [_site('1', 'a'), _site('2', 'b')])
+        self.assertEqual(self.vse.vsmconfig.call_count, 1)
+        self.assertEqual(sorted(self._pushed_site_names()), ['a', 'b'])
+
+    def test_sync_unchanged_is_noop(self):
+        sites = [_site('1', 'a'), _site('2', 'b')]
+        self.api.sync_sites(self.context, sites)
+        self.api.sync_sites(self.context, list(reversed(sites)))
+        self.assertEqual(self.vse.vsmconfig.call_count, 1)
+
+    def test_sync_unchanged_pushed_without_cache(self):
+        self.api.cache_sites = False
+        sites = [_site('1', 'a'), _site('2', 'b')]
+        self.api.sync_sites(self.context, sites)
+        self.api.sync_sites(self.context, sites)
+        self.assertEqual(self.vse.vsmconfig.call_count, 2)
+        self.assertIsNone(self.api.pushed_sites)
+
+    def test_sync_changed_site(self):
+        self.api.sync_sites(self.context, [_site('1', 'a'), _site('2', 'b')])
+        self.api.sync_sites(self.context,
+                            [_site('1', 'a'), _site('2', 'b', psk='456')])
+        self.assertEqual(self.vse.vsmconfig.call_count, 2)
+        self.assertEqual(sorted(self._pushed_site_names()), ['a', 'b'])
+
+    def test_sync_removed_site(self):
+        self.api.sync_sites(self.context, [_site('1', 'a'), _site('2', 'b')])
+        self.api.sync_sites(self.context, [_site('2', 'b')])
+        self.assertEqual(self._pushed_site_names(), ['b'])
+
+    def test_sync_no_sites_deletes_config(self):
+        self.api.sync_sites(self.context, [_site('1', 'a')])
+        self.api.sync_sites(self.context, [])
+        self.vse.vsmconfig.assert_called_with(
+            'DELETE', '/api/4.0/edges/edge-1/ipsec/config')
+
+    def test_sync_failure_resets_cache(self):
+        self.vse.vsmconfig.side_effect = Exception()
+        self.assertRaises(Exception, self.api.sync_sites,
+                          self.context, [_site('1', 'a')])
+        self.assertIsNone(self.api.pushed_sites)
+        self.vse.vsmconfig.side_effect = None
+        self.api.sync_sites(self.context, [_site('1', 'a')])
+        self.assertEqual(self.vse.vsmconfig.call_count, 2)
@@ -0,0 +1,93 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+import mock
+
+from quantum.plugins.vmware.vshield import vpnstats
+from quantum.tests import base
+
+
+def _edge_stats(*endpoints):
+    return {'siteStatistics': [
+        {'ikeStatus': {'localIpAddress': local, 'peerIpAddress': peer}}
+        for local, peer in endpoints]}
+
+
+SITE = {'local_endpoint': '10.0.0.1', 'peer_endpoint': '10.0.0.2'}
+
+
+class TestVPNStatsCollector(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestVPNStatsCollector, self).setUp()
+        self.fetch = mock.Mock(return_value=_edge_stats(
+            ('10.0.0.1', '10.0.0.2'), ('10.0.0.1', '10.0.0.3')))
+        self.collector = vpnstats.VPNStatsCollector(self.fetch, 30, 10)
+        self.time = mock.patch('time.time', return_value=1000).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_site_stats_indexed(self):
+        stats = self.collector.get_site_stats('edge-1', SITE)
+        self.assertEqual(stats['ikeStatus']['peerIpAddress'], '10.0.0.2')
+        self.assertEqual(self.collector.get_site_stats(
+            'edge-1', {'local_endpoint': '10.0.0.1',
+                       'peer_endpoint': '10.0.0.9'}), {})
+        self.fetch.assert_called_once_with('edge-1')
+
+    def test_cached_until_ttl(self):
+        self.collector.get_site_stats('edge-1', SITE)
+        self.time.return_value = 1029
+        self.collector.get_site_stats('edge-1', SITE)
+        self.assertEqual(self.fetch.call_count, 1)
+        self.time.return_value = 1030
+        self.collector.get_site_stats('edge-1', SITE)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_invalidate(self):
+        self.collector.get_site_stats('edge-1', SITE)
+        self.collector.invalidate('edge-1')
+        self.collector.get_site_stats('edge-1', SITE)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_concurrent_readers_share_refresh(self):
+        def fetch(edge_id):
+            eventlet.sleep(0)
+            return _edge_stats(('10.0.0.1', '10.0.0.2'))
+        self.fetch.side_effect = fetch
+        threads = [eventlet.spawn(self.collector.get_site_stats,
+                                  'edge-1', SITE) for i in range(5)]
+        for t in threads:
+            t.wait()
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_poll_recently_read_edges(self):
+        self.collector.get_site_stats('edge-1', SITE)
+        self.time.return_value = 1000 + 10 * vpnstats.IDLE_POLLS - 1
+        self.collector.get_site_stats('edge-2', SITE)
+        self.fetch.reset_mock()
+        self.time.return_value = 1000 + 10 * vpnstats.IDLE_POLLS
+        self.collector.poll()
+        self.fetch.assert_called_once_with('edge-2')
+
+    def test_poll_error_logged(self):
+        self.collector.get_site_stats('edge-1', SITE)
+        self.fetch.side_effect = Exception()
+        self.collector.poll()
+        # the stale statistics are still served
+        self.assertEqual(
+            self.collector.get_site_stats('edge-1', SITE)['ikeStatus']
+            ['peerIpAddress'], '10.0.0.2')
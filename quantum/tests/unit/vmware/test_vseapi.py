@@ -0,0 +1,240 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+
+import eventlet
+import mock
+
+from quantum.plugins.vmware.vshield.common import exceptions
+from quantum.plugins.vmware.vshield import jobs
+from quantum.plugins.vmware.vshield import retry
+from quantum.plugins.vmware.vshield import vseapi
+from quantum.tests import base
+
+
+class TestVsmConfigCoalescer(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestVsmConfigCoalescer, self).setUp()
+        self.coalescer = vseapi.VsmConfigCoalescer(0.01)
+        self.vse = mock.Mock()
+        self.vse.vsmapi.url = 'https://vsm'
+        self.vse.get_edgeId.return_value = 'edge-1'
+        self.vse.do_vsmconfig.return_value = ({'status': '204'}, {})
+        self.in_background = mock.patch.object(vseapi, 'in_background',
+                                               return_value=True).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _push(self, method, uri, params=None):
+        return eventlet.spawn(self.coalescer.vsmconfig,
+                              self.vse, method, uri, params)
+
+    def test_puts_to_same_uri_coalesced(self):
+        threads = [self._push('PUT', '/ipsec/config', {'n': i})
+                   for i in range(5)]
+        results = [t.wait() for t in threads]
+        self.vse.do_vsmconfig.assert_called_once_with(
+            'PUT', '/ipsec/config', {'n': 4})
+        self.assertEqual(results, [({'status': '204'}, {})] * 5)
+
+    def test_puts_to_different_uris_not_coalesced(self):
+        t1 = self._push('PUT', '/pools/1', {'n': 1})
+        t2 = self._push('PUT', '/pools/2', {'n': 2})
+        t1.wait()
+        t2.wait()
+        self.assertEqual(self.vse.do_vsmconfig.call_count, 2)
+
+    def test_object_puts_merged_in_service_document(self):
+        lb = '/api/4.0/edges/edge-1/loadbalancer/config'
+        self.vse.do_vsmconfig.side_effect = [
+            ({'status': '200'}, {'enabled': True, 'pool': [
+                {'poolId': 'pool-1', 'name': 'a'},
+                {'poolId': 'pool-2', 'name': 'b'}]}),
+            ({'status': '204'}, {})]
+        t1 = self._push('PUT', lb + '/pools/pool-1', {'name': 'c'})
+        t2 = self._push('PUT', lb + '/pools/pool-2', {'name': 'd'})
+        self.assertEqual(t1.wait(), ({'status': '204'}, {}))
+        self.assertEqual(t2.wait(), ({'status': '204'}, {}))
+        self.assertEqual(self.vse.do_vsmconfig.call_args_list, [
+            mock.call('GET', lb),
+            mock.call('PUT', lb, {'enabled': True, 'pool': [
+                {'poolId': 'pool-1', 'name': 'c'},
+                {'poolId': 'pool-2', 'name': 'd'}]})])
+
+    def test_objects_not_in_document_pushed_alone(self):
+        lb = '/api/4.0/edges/edge-1/loadbalancer/config'
+        t1 = self._push('PUT', lb, {'enabled': True})
+        t2 = self._push('PUT', lb + '/pools/pool-1', {'name': 'c'})
+        t1.wait()
+        t2.wait()
+        self.assertEqual(self.vse.do_vsmconfig.call_args_list, [
+            mock.call('PUT', lb, {'enabled': True}),
+            mock.call('PUT', lb + '/pools/pool-1', {'name': 'c'})])
+
+    def test_object_puts_older_than_document_dropped(self):
+        lb = '/api/4.0/edges/edge-1/loadbalancer/config'
+        pool = {'poolId': 'pool-1', 'name': 'new'}
+        t1 = self._push('PUT', lb + '/pools/pool-1', {'name': 'old'})
+        eventlet.sleep(0)
+        t2 = self._push('PUT', lb, {'pool': [pool]})
+        eventlet.sleep(0)
+        t3 = self._push('PUT', lb + '/pools/pool-2', {'name': 'c'})
+        for t in (t1, t2, t3):
+            self.assertEqual(t.wait(), ({'status': '204'}, {}))
+        self.assertEqual(self.vse.do_vsmconfig.call_args_list, [
+            mock.call('PUT', lb, {'pool': [pool]}),
+            mock.call('PUT', lb + '/pools/pool-2', {'name': 'c'})])
+
+    def test_object_put_after_document_merged(self):
+        lb = '/api/4.0/edges/edge-1/loadbalancer/config'
+        t1 = self._push('PUT', lb + '/pools/pool-1', {'name': 'old'})
+        eventlet.sleep(0)
+        t2 = self._push('PUT', lb, {'pool': [{'poolId': 'pool-1'}]})
+        eventlet.sleep(0)
+        t3 = self._push('PUT', lb + '/pools/pool-1', {'name': 'new'})
+        for t in (t1, t2, t3):
+            t.wait()
+        self.vse.do_vsmconfig.assert_called_once_with(
+            'PUT', lb, {'pool': [{'poolId': 'pool-1', 'name': 'new'}]})
+
+    def test_api_requests_not_held(self):
+        self.in_background.return_value = False
+        threads = [self._push('PUT', '/ipsec/config', {'n': i})
+                   for i in range(2)]
+        for t in threads:
+            t.wait()
+        self.assertEqual(self.vse.do_vsmconfig.call_count, 2)
+
+    def test_other_request_flushes_pending_puts(self):
+        t1 = self._push('PUT', '/pools/1', {'n': 1})
+        eventlet.sleep(0)
+        self.coalescer.vsmconfig(self.vse, 'DELETE', '/pools/1')
+        t1.wait()
+        self.assertEqual(self.vse.do_vsmconfig.call_args_list,
+                         [mock.call('PUT', '/pools/1', {'n': 1}),
+                          mock.call('DELETE', '/pools/1', None)])
+
+    def test_error_raised_to_every_caller(self):
+        self.vse.do_vsmconfig.side_effect = Exception()
+        threads = [self._push('PUT', '/ipsec/config') for i in range(2)]
+        for t in threads:
+            self.assertRaises(Exception, t.wait)
+        self.assertEqual(self.vse.do_vsmconfig.call_count, 1)
+
+    def test_disabled(self):
+        coalescer = vseapi.VsmConfigCoalescer(0)
+        coalescer.vsmconfig(self.vse, 'PUT', '/ipsec/config')
+        coalescer.vsmconfig(self.vse, 'PUT', '/ipsec/config')
+        self.assertEqual(self.vse.do_vsmconfig.call_count, 2)
+
+
+class TestVseAPI(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestVseAPI, self).setUp()
+        retry._breakers.clear()
+        self.addCleanup(retry._breakers.clear)
+        self.vse = vseapi.VseAPI('https://vsm', 'admin', 'default', 'edge-1')
+        self.vse.retry = retry.RetryPolicy(2, 0.5, 10, 1)
+        self.vse.breaker = retry.CircuitBreaker('edge-1', 3, 30)
+        self.api = mock.patch.object(self.vse.vsmapi, 'api').start()
+        self.sleep = mock.patch('eventlet.sleep').start()
+        self.in_background = mock.patch.object(vseapi, 'in_background',
+                                               return_value=True).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_rejected_request_retried(self):
+        self.api.side_effect = [({'status': '503'}, ''),
+                                ({'status': '201'}, '')]
+        header, content = self.vse.send('POST', '/rules', {})
+        self.assertEqual(header['status'], '201')
+        self.assertEqual(self.api.call_count, 2)
+        self.assertEqual(self.sleep.call_count, 1)
+
+    def test_rejected_request_retried_briefly_in_transaction(self):
+        self.in_background.return_value = False
+        self.api.return_value = ({'status': '503'}, '')
+        with mock.patch('random.uniform', side_effect=lambda a, b: b):
+            self.assertRaises(exceptions.VsmRequestFailed,
+                              self.vse.send, 'POST', '/rules', {})
+        self.assertEqual(self.api.call_count, 2)
+        self.sleep.assert_called_once_with(0.5)
+
+    def test_failed_request_not_retried_in_transaction(self):
+        self.in_background.return_value = False
+        self.api.return_value = ({'status': '500'}, '')
+        self.assertRaises(exceptions.VsmRequestFailed,
+                          self.vse.send, 'GET', '/config')
+        self.api.side_effect = socket.error()
+        self.assertRaises(socket.error, self.vse.send, 'GET', '/config')
+        self.assertEqual(self.api.call_count, 2)
+        self.assertFalse(self.sleep.called)
+
+    def test_error_raised_when_retries_exhausted(self):
+        self.api.return_value = ({'status': '500'}, 'busy')
+        e = self.assertRaises(exceptions.VsmRequestFailed,
+                              self.vse.send, 'PUT', '/config', {})
+        self.assertEqual(e.status, 500)
+        self.assertEqual(self.api.call_count, 3)
+
+    def test_post_not_retried_on_connection_error(self):
+        self.api.side_effect = socket.error()
+        self.assertRaises(socket.error, self.vse.send, 'POST', '/rules', {})
+        self.assertEqual(self.api.call_count, 1)
+
+    def test_client_error_not_retried(self):
+        self.api.return_value = ({'status': '400'}, 'bad')
+        self.assertRaises(exceptions.VsmRequestFailed,
+                          self.vse.send, 'GET', '/config')
+        self.assertEqual(self.api.call_count, 1)
+
+    def test_breaker_fails_fast(self):
+        self.api.side_effect = socket.error()
+        self.assertRaises(socket.error, self.vse.send, 'GET', '/config')
+        self.assertEqual(self.api.call_count, 3)
+        self.assertRaises(exceptions.ManagerUnavailable,
+                          self.vse.send, 'GET', '/config')
+        self.assertEqual(self.api.call_count, 3)
+
+    def test_change_done_once_its_job_completes(self):
+        self.api.return_value = ({'status': '202',
+                                  'location': '/api/4.0/edges/jobs/j-1'}, '')
+        self.vse.jobs = mock.Mock()
+        self.vse.vsmconfig('PUT', '/config', {})
+        self.vse.jobs.register.assert_called_with('j-1')
+        self.vse.jobs.register.return_value.wait.assert_called_once_with()
+
+    def test_request_collects_job(self):
+        self.api.return_value = ({'status': '202',
+                                  'location': '/api/4.0/edges/jobs/j-1'}, '')
+        self.vse.jobs = mock.Mock()
+        self.in_background.return_value = False
+        with jobs.collect_jobs() as futures:
+            self.vse.vsmconfig('PUT', '/config', {})
+        # polled all the same, the caller completes the change once the
+        # job ends
+        self.vse.jobs.register.assert_called_with('j-1')
+        self.assertEqual(futures, [self.vse.jobs.register.return_value])
+        self.assertFalse(self.vse.jobs.register.return_value.wait.called)
+
+    def test_request_waits_for_job_when_asked(self):
+        self.api.return_value = ({'status': '202',
+                                  'location': '/api/4.0/edges/jobs/j-1'}, '')
+        self.vse.jobs = mock.Mock()
+        self.in_background.return_value = False
+        self.vse.vsmconfig('PUT', '/config', {}, wait=True)
+        self.vse.jobs.register.return_value.wait.assert_called_once_with()
@@ -0,0 +1,125 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo.config import cfg
+
+from quantum import context
+from quantum.db import api as db
+from quantum.db.vpn import vpn_db
+from quantum.plugins.vmware.vshield.common import exceptions as vsh_exc
+from quantum.plugins.vmware.vshield import vpnapi
+from quantum.plugins.vmware.vshield import vseids
+from quantum.tests import base
+
+
+class TestLRUCache(base.BaseTestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = vseids.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_disabled(self):
+        cache = vseids.LRUCache(0)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class TestVseidMap(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestVseidMap, self).setUp()
+        cfg.CONF.set_override('sql_connection', 'sqlite://', 'DATABASE')
+        self.addCleanup(cfg.CONF.reset)
+        db._ENGINE = None
+        db._MAKER = None
+        db.configure_db()
+        self.addCleanup(db.clear_db)
+        self.context = context.get_admin_context()
+        self.map = vseids.VseidMap(vpnapi.SiteUuid2Vseid, 10)
+        with self.context.session.begin():
+            for i in range(3):
+                self.context.session.add(vpn_db.Site(
+                    id='site-%d' % i, tenant_id='tenant', local_endpoint='',
+                    peer_endpoint='', local_id='', peer_id='',
+                    status='ACTIVE'))
+            self.context.session.flush()
+            for i in range(3):
+                self.map.add(self.context, 'site-%d' % i, 'vse-%d' % i)
+        self.map.cache = vseids.LRUCache(10)
+        self.query = mock.patch.object(
+            self.context.session, 'query',
+            wraps=self.context.session.query).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_get(self):
+        self.assertEqual(self.map.get(self.context, 'site-1'), 'vse-1')
+        self.assertEqual(self.map.get(self.context, 'site-1'), 'vse-1')
+        self.assertIsNone(self.map.get(self.context, 'site-9'))
+        self.assertEqual(self.query.call_count, 2)
+
+    def test_get_many(self):
+        self.map.get(self.context, 'site-0')
+        self.query.reset_mock()
+        self.assertEqual(
+            self.map.get_many(self.context,
+                              ['site-0', 'site-1', 'site-2', 'site-9']),
+            {'site-0': 'vse-0', 'site-1': 'vse-1', 'site-2': 'vse-2'})
+        self.assertEqual(self.query.call_count, 1)
+        self.map.get_many(self.context, ['site-0', 'site-1', 'site-2'])
+        self.assertEqual(self.query.call_count, 1)
+
+    def test_delete(self):
+        self.map.get(self.context, 'site-1')
+        with self.context.session.begin():
+            self.map.delete(self.context, 'site-1')
+        self.assertIsNone(self.map.get(self.context, 'site-1'))
+        self.assertRaises(vsh_exc.VShieldException, self.map.delete,
+                          self.context, 'site-1')
+
+    def test_rolled_back_mapping_not_cached(self):
+        self.map.cache = vseids.LRUCache(10)
+        try:
+            with self.context.session.begin():
+                self.map.add(self.context, 'site-9', 'vse-9')
+                self.assertEqual(self.map.get(self.context, 'site-9'),
+                                 'vse-9')
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertIsNone(self.map.cache.get('site-9'))
+        self.assertIsNone(self.map.get(self.context, 'site-9'))
+
+    def test_committed_mapping_cached(self):
+        self.map.cache = vseids.LRUCache(10)
+        with self.context.session.begin():
+            self.context.session.add(vpn_db.Site(
+                id='site-9', tenant_id='tenant', local_endpoint='',
+                peer_endpoint='', local_id='', peer_id='', status='ACTIVE'))
+            self.context.session.flush()
+            self.map.add(self.context, 'site-9', 'vse-9')
+        self.assertNotIn(self.context.session, vseids._added)
+        self.assertEqual(self.map.cache.get('site-9'), 'vse-9')
+
+    def test_shared_map(self):
+        self.assertIs(vseids.get_vseid_map(vpnapi.SiteUuid2Vseid),
+                      vseids.get_vseid_map(vpnapi.SiteUuid2Vseid))
@@ -0,0 +1,133 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 VMware, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+import time
+
+import mock
+
+from quantum.plugins.vmware.vshield import vsmapi
+from quantum.tests import base
+
+
+class TestVsmConnectionPool(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestVsmConnectionPool, self).setUp()
+        self.pool = vsmapi.VsmConnectionPool('https://vsm', 2, 60, 10)
+
+    def test_connection_reused(self):
+        http, reused = self.pool.get()
+        self.assertFalse(reused)
+        self.pool.put(http)
+        http2, reused = self.pool.get()
+        self.assertTrue(reused)
+        self.assertIs(http, http2)
+
+    def test_unhealthy_connection_not_reused(self):
+        http, reused = self.pool.get()
+        self.pool.put(http, healthy=False)
+        http2, reused = self.pool.get()
+        self.assertFalse(reused)
+        self.assertIsNot(http, http2)
+
+    def test_idle_connection_evicted(self):
+        http, reused = self.pool.get()
+        with mock.patch('time.time', return_value=0):
+            self.pool.put(http)
+        self.assertEqual(self.pool.evict_idle(), 1)
+        http2, reused = self.pool.get()
+        self.assertFalse(reused)
+
+    def test_pool_is_bounded(self):
+        self.pool.get()
+        self.pool.get()
+        self.assertFalse(self.pool._slots.acquire(False))
+
+    def test_slot_released_when_connect_fails(self):
+        with mock.patch.object(self.pool, '_create',
+                               side_effect=socket.error()):
+            self.assertRaises(socket.error, self.pool.get)
+        self.assertTrue(self.pool._slots.acquire(False))
+        self.assertTrue(self.pool._slots.acquire(False))
+
+    def test_fresh_connection(self):
+        http, reused = self.pool.get()
+        self.pool.put(http)
+        http2, reused = self.pool.get(fresh=True)
+        self.assertFalse(reused)
+        self.assertIsNot(http, http2)
+
+
+class TestVsmAPI(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestVsmAPI, self).setUp()
+        vsmapi._pools.clear()
+        self.addCleanup(vsmapi._pools.clear)
+
+    def test_pool_shared_per_endpoint(self):
+        api1 = vsmapi.VsmAPI('https://vsm', 'admin', 'default')
+        api2 = vsmapi.VsmAPI('https://vsm', 'admin', 'default')
+        api3 = vsmapi.VsmAPI('https://vsm2', 'admin', 'default')
+        self.assertIs(api1.pool, api2.pool)
+        self.assertIsNot(api1.pool, api3.pool)
+        self.assertEqual(len(vsmapi._pools), 2)
+
+    def _stale(self, api):
+        stale = mock.Mock()
+        stale.request.side_effect = socket.error()
+        stale.connections = {}
+        api.pool._free.append((stale, time.time()))
+        return stale
+
+    def test_reconnect_on_stale_connection(self):
+        api = vsmapi.VsmAPI('https://vsm', 'admin', 'default')
+        stale = self._stale(api)
+        with mock.patch.object(api.pool, '_create') as create:
+            create.return_value.request.return_value = (
+                {'status': '200'}, '')
+            resp, content = api.api('GET', '/api/4.0/edges')
+        self.assertEqual(resp['status'], '200')
+        self.assertEqual(stale.request.call_count, 1)
+        self.assertEqual(create.return_value.request.call_count, 1)
+
+    def test_new_connection_error_raised(self):
+        api = vsmapi.VsmAPI('https://vsm', 'admin', 'default')
+        with mock.patch.object(api.pool, '_create') as create:
+            create.return_value.request.side_effect = socket.error()
+            self.assertRaises(socket.error, api.api, 'GET', '/api/4.0/edges')
+        self.assertEqual(create.return_value.request.call_count, 1)
+
+    def test_post_not_resent_on_stale_connection(self):
+        api = vsmapi.VsmAPI('https://vsm', 'admin', 'default')
+        stale = self._stale(api)
+        with mock.patch.object(api.pool, '_create') as create:
+            self.assertRaises(socket.error, api.api, 'POST',
+                              '/api/4.0/edges', params={'a': 1})
+        self.assertEqual(stale.request.call_count, 1)
+        self.assertFalse(create.called)
+        self.assertFalse(api.pool._free)
+
+    def test_slot_released_once_when_reconnect_fails(self):
+        api = vsmapi.VsmAPI('https://vsm', 'admin', 'default')
+        self._stale(api)
+        with mock.patch.object(api.pool, '_create',
+                               side_effect=socket.error()):
+            self.assertRaises(socket.error, api.api, 'GET', '/api/4.0/edges')
+        for i in range(api.pool.max_connections):
+            self.assertTrue(api.pool._slots.acquire(False))
+        self.assertFalse(api.pool._slots.acquire(False))
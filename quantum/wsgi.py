@@ -36,9 +36,13 @@ import webob.exc
 
 from quantum.common import constants
 from quantum.common import exceptions as exception
+from quantum.common import rpc as q_rpc
 from quantum import context
+from quantum.db import api
+from quantum import manager
 from quantum.openstack.common import jsonutils
 from quantum.openstack.common import log as logging
+from quantum.openstack.common import service as common_service
 
 socket_opts = [
     cfg.IntOpt('backlog',
@@ -81,12 +85,50 @@ def run_server(application, port):
     eventlet.wsgi.server(sock, application)
 
 
+class WorkerService(object):
+    """Serves the socket of a Server in a worker process.
+
+    Started by the ProcessLauncher of the server in every process it forks.
+    """
+
+    def __init__(self, service, application):
+        self._service = service
+        self._application = application
+        self._server = None
+
+    def start(self):
+        # The connections to the database and to the message bus were opened
+        # by the parent, a child using them too would mix up its requests
+        # with those of the parent; drop them, still open for the parent,
+        # so the child opens its own.
+        api.forget_connections()
+        q_rpc.forget_connections()
+        # The plugins re-create their green threads and connections too,
+        # those inherited only serve the parent.
+        manager.QuantumManager.after_fork()
+        # out of the pool of the requests, so that stopping the server
+        # lets it wait for the requests in progress
+        self._server = eventlet.spawn(self._service._run,
+                                      self._application,
+                                      self._service._socket)
+
+    def wait(self):
+        self._server.wait()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.kill()
+            self._server = None
+
+
 class Server(object):
     """Server class to manage multiple WSGI sockets and applications."""
 
     def __init__(self, name, threads=1000):
         self.pool = eventlet.GreenPool(threads)
         self.name = name
+        self._launcher = None
+        self._server = None
 
     def _get_socket(self, host, port, backlog):
         bind_addr = (host, port)
@@ -165,8 +207,12 @@ class Server(object):
 
         return sock
 
-    def start(self, application, port, host='0.0.0.0'):
-        """Run a WSGI server with the given application."""
+    def start(self, application, port, host='0.0.0.0', workers=0):
+        """Run a WSGI server with the given application.
+
+        With workers, the socket is served by that many processes forked
+        from this one, which only restarts the workers which die.
+        """
         self._host = host
         self._port = port
         backlog = CONF.backlog
@@ -174,7 +220,13 @@ class Server(object):
         self._socket = self._get_socket(self._host,
                                         self._port,
                                         backlog=backlog)
-        self._server = self.pool.spawn(self._run, application, self._socket)
+        if workers < 1:
+            self._server = self.pool.spawn(self._run, application,
+                                           self._socket)
+        else:
+            self._launcher = common_service.ProcessLauncher()
+            self._server = WorkerService(self, application)
+            self._launcher.launch_service(self._server, workers=workers)
 
     @property
     def host(self):
@@ -185,12 +237,18 @@ class Server(object):
         return self._socket.getsockname()[1] if self._socket else self._port
 
     def stop(self):
+        if self._launcher:
+            # the workers are stopped by the launcher when it is signaled
+            return
         self._server.kill()
 
     def wait(self):
         """Wait until all servers have completed running."""
         try:
-            self.pool.waitall()
+            if self._launcher:
+                self._launcher.wait()
+            else:
+                self.pool.waitall()
         except KeyboardInterrupt:
             pass
 
@@ -326,6 +384,13 @@ class DictSerializer(ActionDispatcher):
     def serialize(self, data, action='default'):
         return self.dispatch(data, action=action)
 
+    def serialize_iter(self, data):
+        """Return an iterator over the serialized data, in chunks.
+
+        By default the data is serialized at once, in a single chunk.
+        """
+        return iter([self.serialize(data)])
+
     def default(self, data):
         return ""
 
@@ -333,11 +398,54 @@ class DictSerializer(ActionDispatcher):
 class JSONDictSerializer(DictSerializer):
     """Default JSON request body serialization"""
 
+    # bytes of JSON written at once by serialize_iter
+    chunk_size = 65536
+
     def default(self, data):
         def sanitizer(obj):
             return unicode(obj)
         return jsonutils.dumps(data, default=sanitizer)
 
+    def serialize_iter(self, data):
+        """Return an iterator over the JSON of data, in chunks.
+
+        The values of data which are lists are encoded one item at a
+        time, so that the whole JSON document is never held at once.
+        """
+        if not isinstance(data, dict):
+            return iter([self.default(data)])
+        return self._chunks(self._encode_dict(data))
+
+    def _encode_dict(self, data):
+        yield '{'
+        for i, (key, value) in enumerate(data.iteritems()):
+            if i:
+                yield ', '
+            yield self.default(key) + ': '
+            if not isinstance(value, list):
+                yield self.default(value)
+                continue
+            yield '['
+            for j, item in enumerate(value):
+                if j:
+                    yield ', '
+                yield self.default(item)
+            yield ']'
+        yield '}'
+
+    def _chunks(self, pieces):
+        chunk = []
+        size = 0
+        for piece in pieces:
+            chunk.append(piece)
+            size += len(piece)
+            if size >= self.chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            yield ''.join(chunk)
+
 
 class XMLDictSerializer(DictSerializer):
 
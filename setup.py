@@ -55,6 +55,7 @@ nec_plugin_config_path = 'etc/quantum/plugins/nec'
 hyperv_plugin_config_path = 'etc/quantum/plugins/hyperv'
 plumgrid_plugin_config_path = 'etc/quantum/plugins/plumgrid'
 midonet_plugin_config_path = 'etc/quantum/plugins/midonet'
+vshield_plugin_config_path = 'etc/quantum/plugins/vmware'
 
 if sys.platform == 'win32':
     # Windows doesn't have an "/etc" directory equivalent
@@ -111,6 +112,8 @@ else:
             ['etc/quantum/plugins/plumgrid/plumgrid.ini']),
         (midonet_plugin_config_path,
             ['etc/quantum/plugins/midonet/midonet.ini']),
+        (vshield_plugin_config_path,
+            ['etc/quantum/plugins/vmware/vshield.ini']),
     ]
 
     ConsoleScripts = [